@@ -192,6 +192,21 @@ class Window(QtWidgets.QWidget):
         # self.popQueryCheckBoxUpdate() ##### BUG: <----- For some reason this breaks ConfigFile.saveConfig
         self.popQueryCheckBox.clicked.connect(self.popQueryCheckBoxUpdate)
 
+        # Multi-level runs: index is the pipelineMode
+        pipelineLabel = QtWidgets.QLabel("Multi-level intermediate files:", self)
+        self.pipelineComboBox = QtWidgets.QComboBox(self)
+        self.pipelineComboBox.addItems(["Write and re-read each level",
+                                        "Pass levels in memory, write in background",
+                                        "Pass levels in memory, write L2 only"])
+        self.pipelineComboBox.setCurrentIndex(int(MainConfig.settings["pipelineMode"]))
+        self.pipelineComboBox.currentIndexChanged.connect(self.pipelineComboBoxUpdate)
+
+        hdfWriteProfileLabel = QtWidgets.QLabel("HDF5 compression:", self)
+        self.hdfWriteProfileComboBox = QtWidgets.QComboBox(self)
+        self.hdfWriteProfileComboBox.addItems(MainConfig.choices["hdfWriteProfile"])
+        self.hdfWriteProfileComboBox.setCurrentText(MainConfig.settings["hdfWriteProfile"])
+        self.hdfWriteProfileComboBox.currentTextChanged.connect(self.hdfWriteProfileComboBoxUpdate)
+
         ########################################################################################
         # Add QtWidgets to the Window
         ########################################################################################
@@ -255,6 +270,16 @@ class Window(QtWidgets.QWidget):
         popQueryBox.addWidget(self.popQueryCheckBox)
         vBox.addLayout(popQueryBox)
 
+        pipelineBox = QtWidgets.QHBoxLayout()
+        pipelineBox.addWidget(pipelineLabel)
+        pipelineBox.addWidget(self.pipelineComboBox)
+        vBox.addLayout(pipelineBox)
+
+        hdfWriteProfileBox = QtWidgets.QHBoxLayout()
+        hdfWriteProfileBox.addWidget(hdfWriteProfileLabel)
+        hdfWriteProfileBox.addWidget(self.hdfWriteProfileComboBox)
+        vBox.addLayout(hdfWriteProfileBox)
+
         # vBox.setContentsMargins(0, 0, 0, 0)
         # vBox.addStretch(1)
         self.setLayout(vBox)
@@ -639,6 +664,14 @@ class Window(QtWidgets.QWidget):
         MainConfig.settings["popQuery"] = int(self.popQueryCheckBox.isChecked())
         MainConfig.saveConfig(MainConfig.fileName)
 
+    def pipelineComboBoxUpdate(self):
+        MainConfig.settings["pipelineMode"] = self.pipelineComboBox.currentIndex()
+        MainConfig.saveConfig(MainConfig.fileName)
+
+    def hdfWriteProfileComboBoxUpdate(self):
+        MainConfig.settings["hdfWriteProfile"] = self.hdfWriteProfileComboBox.currentText()
+        MainConfig.saveConfig(MainConfig.fileName)
+
     # def saveButtonClicked(self):
     #     print("Main - saveButtonClicked")
     #     MainConfig.saveConfig(MainConfig.fileName)
@@ -0,0 +1,176 @@
+''' Local store of gridded ancillary model fields (MERRA2, CAMS) indexed by time, latitude and longitude '''
+import os
+import numpy as np
+import h5py
+import xarray as xr
+
+import Source.utils.caching as caching
+
+
+class AncStore:
+    ''' Model files are ingested once into compact arrays kept in a Store directory beside them, so a
+        directory populated ahead of time serves whole ship tracks without network access.
+
+        A grid is a dict holding the 'time' (datetime64[s], start of each model period), 'lat' and 'lon'
+        axes, the 'units' and 'long_name' of each variable, and one (time, lat, lon) array per variable
+        with the dtype of the file. '''
+
+    @staticmethod
+    def _readHDF5(filePath, variables):
+        ''' Raw (unscaled) fields of a netCDF4/HDF5 file, as HDFRoot.readHDF5 reads them '''
+        grid = {}
+        with h5py.File(filePath, 'r') as f:
+            grid['lat'] = f['lat'][:]
+            grid['lon'] = f['lon'][:]
+            for name in variables:
+                if name not in f:
+                    continue
+                grid[name] = f[name][:]
+                for attr in ('units', 'long_name'):
+                    value = f[name].attrs.get(attr, '')
+                    grid[f'{name}.{attr}'] = value.decode('utf-8') if isinstance(value, bytes) else str(value)
+        return grid
+
+    @staticmethod
+    def _readNetCDF(filePath, variables):
+        ''' Decoded fields of a netCDF file, as xarray reads them '''
+        grid = {}
+        with xr.open_dataset(filePath, engine='netcdf4') as ds:
+            grid['lat'] = ds['latitude' if 'latitude' in ds.variables else 'lat'].values
+            grid['lon'] = ds['longitude' if 'longitude' in ds.variables else 'lon'].values
+            for name in variables:
+                if name not in ds:
+                    continue
+                grid[name] = ds[name].values
+                for attr in ('units', 'long_name'):
+                    grid[f'{name}.{attr}'] = str(ds[name].attrs.get(attr, ''))
+        return grid
+
+    @staticmethod
+    def _read(filePath, variables, stamp, engine):
+        if engine == 'h5py':
+            fields = AncStore._readHDF5(filePath, variables)
+        else:
+            fields = AncStore._readNetCDF(filePath, variables)
+
+        grid = {'time': np.array([stamp], dtype='datetime64[s]'),
+                'lat': np.atleast_1d(fields['lat']), 'lon': np.atleast_1d(fields['lon'])}
+        shape = (1, grid['lat'].size, grid['lon'].size)
+        found = [name for name in variables if name in fields]
+        for name in found:
+            # Leading singleton axes (time, forecast period, ...) are dropped; the first field is the one requested
+            grid[name] = fields[name].reshape((-1,) + shape[1:])[:1].reshape(shape)
+        grid['variables'] = np.array(found, dtype=str)
+        grid['units'] = np.array([fields[f'{name}.units'] for name in found], dtype=str)
+        grid['long_name'] = np.array([fields[f'{name}.long_name'] for name in found], dtype=str)
+        return grid
+
+    @staticmethod
+    def ingest(filePath, variables, stamp, engine='h5py', storeDir=None):
+        ''' Grid of one model file whose fields are valid from stamp. The file is read on the first request
+            only; later requests (in any process) load the stored arrays. Variables missing from the file
+            are left out of the grid. engine is 'h5py' for raw values or 'netcdf4' for decoded values. '''
+        stat = os.stat(filePath)
+        key = ('AncStore', os.path.basename(filePath), stat.st_size, stat.st_mtime_ns,
+               tuple(variables), str(np.datetime64(stamp, 's')), engine)
+        if storeDir is None:
+            storeDir = os.path.join(os.path.dirname(filePath), 'Store')
+        return caching.getLUT(key, lambda: caching.getStored(
+            storeDir, key, lambda: AncStore._read(filePath, variables, stamp, engine)))
+
+    @staticmethod
+    def stack(grids):
+        ''' Concatenate grids on the same lat/lon axes along time, in time order '''
+        grids = sorted(grids, key=lambda grid: grid['time'][0])
+        first = grids[0]
+        for grid in grids[1:]:
+            if not (np.array_equal(grid['lat'], first['lat']) and np.array_equal(grid['lon'], first['lon'])):
+                raise ValueError('Ancillary grids do not share the same lat/lon axes')
+        names = [str(name) for name in first['variables'] if all(name in grid for grid in grids)]
+        result = {'time': np.concatenate([grid['time'] for grid in grids]), 'lat': first['lat'], 'lon': first['lon'],
+                  'variables': np.array(names, dtype=str)}
+        index = [list(first['variables']).index(name) for name in names]
+        result['units'] = first['units'][index]
+        result['long_name'] = first['long_name'][index]
+        for name in names:
+            result[name] = np.concatenate([grid[name] for grid in grids])
+        return result
+
+    @staticmethod
+    def nearest(axis, x):
+        ''' Index of the node of a monotonic axis nearest to each x; comparing.find_nearest for many values
+            (ties go to the first node). NaN values get -1. '''
+        axis = np.asarray(axis, dtype=np.float64)
+        x = np.asarray(x, dtype=np.float64)
+        n = axis.size
+        if n == 1:
+            return np.where(np.isnan(x), -1, 0)
+        descending = axis[0] > axis[-1]
+        ascending = axis[::-1] if descending else axis
+        i = np.clip(np.searchsorted(ascending, x), 1, n - 1)
+        lower = np.abs(x - ascending[i - 1])
+        upper = np.abs(ascending[i] - x)
+        if descending:
+            index = n - 1 - np.where(upper <= lower, i, i - 1)
+        else:
+            index = np.where(lower <= upper, i - 1, i)
+        return np.where(np.isnan(x), -1, index)
+
+    @staticmethod
+    def _bilinearNodes(axis, x, periodic=False):
+        ''' Indices of the two nodes around each x and the weight of the second. x is clamped to the axis
+            unless periodic (a longitude axis covering the globe), where it wraps past the last node. '''
+        axis = np.asarray(axis, dtype=np.float64)
+        n = axis.size
+        if n == 1:
+            zeros = np.zeros(np.shape(x), dtype=int)
+            return zeros, zeros, np.zeros(np.shape(x))
+        order = np.argsort(axis)
+        ascending = axis[order]
+        if periodic:
+            x = ascending[0] + np.mod(x - ascending[0], 360.0)
+            ascending = np.append(ascending, ascending[0] + 360.0)
+            order = np.append(order, order[0])
+        x = np.clip(x, ascending[0], ascending[-1])
+        i = np.clip(np.searchsorted(ascending, x, side='right') - 1, 0, ascending.size - 2)
+        weight = (x - ascending[i]) / (ascending[i + 1] - ascending[i])
+        return order[i], order[i + 1], weight
+
+    @staticmethod
+    def lookup(grid, stamps, lat, lon, method='nearest', period=np.timedelta64(1, 'h')):
+        ''' Fields at each (stamp, lat, lon) of a track, as {variable: float64 array}. Each record takes the
+            model time whose period contains it; records outside every period or without a position are NaN.
+            method is 'nearest' (the grid cell nearest the position) or 'bilinear'. '''
+        stamps = np.asarray(stamps, dtype='datetime64[ms]')
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        times = grid['time'].astype('datetime64[ms]')
+
+        it = np.searchsorted(times, stamps, side='right') - 1
+        valid = (it >= 0) & ~np.isnat(stamps) & ~np.isnan(lat) & ~np.isnan(lon)
+        it = np.clip(it, 0, len(times) - 1)
+        valid &= stamps < times[it] + period
+
+        result = {}
+        if method == 'nearest':
+            ilat = np.clip(AncStore.nearest(grid['lat'], lat), 0, None)
+            ilon = np.clip(AncStore.nearest(grid['lon'], lon), 0, None)
+            for name in grid['variables']:
+                result[str(name)] = grid[name][it, ilat, ilon].astype(np.float64)
+        elif method == 'bilinear':
+            gridLon = np.asarray(grid['lon'], dtype=np.float64)
+            periodic = gridLon.size > 1 and np.isclose(gridLon.size * abs(gridLon[1] - gridLon[0]), 360.0)
+            lat0, lat1, wLat = AncStore._bilinearNodes(grid['lat'], np.nan_to_num(lat))
+            lon0, lon1, wLon = AncStore._bilinearNodes(gridLon, np.nan_to_num(lon), periodic)
+            for name in grid['variables']:
+                field = grid[name]
+                result[str(name)] = ((1 - wLat) * (1 - wLon) * field[it, lat0, lon0] +
+                                     (1 - wLat) * wLon * field[it, lat0, lon1] +
+                                     wLat * (1 - wLon) * field[it, lat1, lon0] +
+                                     wLat * wLon * field[it, lat1, lon1])
+        else:
+            raise ValueError(f'Unknown ancillary lookup method: {method}')
+
+        for values in result.values():
+            values[~valid] = np.nan
+        return result
@@ -1,8 +1,9 @@
 '''# Reads SeaBASS ancillary data file and returns an HDFDataset'''
+import numpy as np
 import pytz
 
 from Source.HDFDataset import HDFDataset
-from Source.SB_support import readSB
+from Source.SB_support import readSBCached
 import Source.utils.loggingHCP as logging
 
 class AncillaryReader:
@@ -13,7 +14,7 @@ class AncillaryReader:
 
         try:
             print('This may take a moment on large SeaBASS files...')
-            ancData=readSB(fp, no_warn=True)
+            ancData=readSBCached(fp, no_warn=True)
         except IOError:
             logging.writeLogFileAndPrint("Unable to read ancillary data file. Make sure it is in SeaBASS format.")
             return None
@@ -56,7 +57,10 @@ class AncillaryReader:
         for ds in ancData.data:
             if ds in dsTranslation:
                 logging.writeLogFileAndPrint(f'Found data: {ds}')
-                ancillaryData.appendColumn(dsTranslation[ds][0], ancData.data[ds])
+                column = ancData.data[ds]
+                # The parsed file is shared with later reads: hand the dataset its own list
+                column = column.tolist() if isinstance(column, np.ndarray) else list(column)
+                ancillaryData.appendColumn(dsTranslation[ds][0], column)
                 ancillaryData.attributes[dsTranslation[ds][1]]=ancData.variables[ds][1]
                 if ds == 'aot':
                     if len(ds) == 3:
@@ -77,7 +81,7 @@ class AncillaryReader:
 
         try:
             print('This may take a moment on large SeaBASS files...')
-            ancData=readSB(fp, no_warn=True)
+            ancData=readSBCached(fp, no_warn=True)
         except IOError:
             logging.writeLogFileAndPrint("Unable to read ancillary data file. Make sure it is in SeaBASS format.")
             return None
@@ -22,6 +22,10 @@ class CalibrationFile:
         self.frameType = ""
         self.sensorType = ""
         self.CalibrationDate = ""
+        # Precompiled RawSeaBirdReader.FrameLayout, built on first use
+        self.frameLayout = None
+        # OPTIC3 coefficient arrays per immersion flag (ProcessL1b_FactoryCal.compileOPTIC3), built on first use
+        self.optic3Arrays = {}
 
 
     def printd(self):
@@ -99,6 +99,8 @@ class ConfigFile:
         ConfigFile.settings["fL1aqcAnomalyStep"] = 20
 
         ConfigFile.settings["bL1bGetAnc"] = 0
+        ConfigFile.settings["bL1bGetAncOffline"] = 0 # Only use model files already in Data/Anc; never contact the servers
+        ConfigFile.settings["bL1bGetAncBilinear"] = 0 # Interpolate MERRA2 fields bilinearly to the ship position; 0 takes the nearest grid cell
         ConfigFile.settings["fL1bDefaultWindSpeed"] = 5.0
         ConfigFile.settings["fL1bDefaultAOD"] = 0.2
         ConfigFile.settings["fL1bDefaultAirT"] = 26.0
@@ -150,10 +152,15 @@ class ConfigFile:
         ConfigFile.settings["fL2TimeInterval"] = 300
         ConfigFile.settings["bL2EnablePercentLt"] = 1
         ConfigFile.settings["fL2PercentLt"] = 10 # 5% Hooker et al. 2002, Hooker and Morel 2003; <10% IOCCG Protocols
+        ConfigFile.settings["fL2EnsembleWorkers"] = 1 # Processes used for L2 ensembles; 1 processes them serially
+        ConfigFile.settings["fL2MCSeed"] = -1 # Seed of the uncertainty Monte Carlo draws of each ensemble; -1 leaves them unseeded
+        ConfigFile.settings["fL2MCTolerance"] = 0 # Draw until the relative change in uncertainty is below this; 0 uses fixed draws
+        ConfigFile.settings["fL2MCMaxDraws"] = 1000 # Most draws of one propagation when fL2MCTolerance is set
 
         ConfigFile.settings["bL2B26Rho"] = 0 # D'Alimonte et al. in progress
         ConfigFile.settings["bL23CRho"] = 0
         ConfigFile.settings["bL2Z17Rho"] = 0
+        ConfigFile.settings["bL2Z17Fast"] = 0 # Interpolate Z17 rho in a grid precomputed from the Z17 LUTs
         ConfigFile.settings["bL2M99Rho"] = 1
 
         ConfigFile.settings["bL2RhoUnc10"] = 0 # GZ recommends using flat 10% uncertainty for rho...
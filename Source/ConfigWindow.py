@@ -234,6 +234,12 @@ class ConfigWindow(QtWidgets.QDialog):
         self.l1bGetAncCheckBox1.clicked.connect(lambda: self.l1bGetAncCheckBoxUpdate('NASA_Earth_Data'))
         self.l1bGetAncCheckBox2.clicked.connect(lambda: self.l1bGetAncCheckBoxUpdate('ECMWF_ADS'))
 
+        # Model files already in Data/Anc only, and MERRA2 interpolation to the ship position
+        self.l1bGetAncOfflineCheckBox = QtWidgets.QCheckBox("Offline (local files only)", self)
+        self.l1bGetAncOfflineCheckBox.setChecked(int(ConfigFile.settings["bL1bGetAncOffline"]) == 1)
+        self.l1bGetAncBilinearCheckBox = QtWidgets.QCheckBox("Bilinear (MERRA2)", self)
+        self.l1bGetAncBilinearCheckBox.setChecked(int(ConfigFile.settings["bL1bGetAncBilinear"]) == 1)
+
         self.l1bDefaultWindSpeedLabel = QtWidgets.QLabel("          Wind (m/s)", self)
         self.l1bDefaultWindSpeedLineEdit = QtWidgets.QLineEdit(self)
         self.l1bDefaultWindSpeedLineEdit.setText(str(ConfigFile.settings["fL1bDefaultWindSpeed"]))
@@ -468,6 +474,8 @@ class ConfigWindow(QtWidgets.QDialog):
         # Case: NO ancillary selected (disable Zhang before config window pops-up)
         if int(ConfigFile.settings["bL1bGetAnc"]) == 0:
             self.l1bGetAncResetButton.setDisabled(True)
+            self.l1bGetAncOfflineCheckBox.setDisabled(True)
+            self.l1bGetAncBilinearCheckBox.setDisabled(True)
             self.RhoRadioButtonZhang.setChecked(0)
             self.RhoRadioButtonZhang.setDisabled(1)
             self.RhoRadioButton3C.setChecked(0)
@@ -796,6 +804,10 @@ class ConfigWindow(QtWidgets.QDialog):
         # l1bGetAncHBox1.addWidget(l1bSublabel4)
         l1bGetAncHBox1.addWidget(self.l1bGetAncCheckBox2)
         VBox2.addLayout(l1bGetAncHBox1)
+        l1bGetAncHBox2 = QtWidgets.QHBoxLayout()
+        l1bGetAncHBox2.addWidget(self.l1bGetAncOfflineCheckBox)
+        l1bGetAncHBox2.addWidget(self.l1bGetAncBilinearCheckBox)
+        VBox2.addLayout(l1bGetAncHBox2)
         VBox2.addWidget(self.l1bGetAncResetButton)
         VBox2.addWidget(l1bSublabel6)
 
@@ -1470,6 +1482,8 @@ class ConfigWindow(QtWidgets.QDialog):
         # NB: This is not the same as an "if not ancillarySource": bL1bGetAnc = 0 is set after "l1bGetAncUntickIfNoCredentials" is triggered.
         if ConfigFile.settings["bL1bGetAnc"] == 0:
             self.l1bGetAncResetButton.setDisabled(True)
+            self.l1bGetAncOfflineCheckBox.setDisabled(True)
+            self.l1bGetAncBilinearCheckBox.setDisabled(True)
             self.RhoRadioButtonZhang.setChecked(True)
             self.RhoRadioButtonZhang.setDisabled(True)
             self.RhoRadioButton3C.setChecked(False)
@@ -1520,6 +1534,8 @@ class ConfigWindow(QtWidgets.QDialog):
         # Disable reset credentials if everything unticked
         if ConfigFile.settings["bL1bGetAnc"] == 0:
             self.l1bGetAncResetButton.setDisabled(True)
+            self.l1bGetAncOfflineCheckBox.setDisabled(True)
+            self.l1bGetAncBilinearCheckBox.setDisabled(True)
             self.RhoRadioButtonZhang.setChecked(False)
             self.RhoRadioButtonZhang.setDisabled(True)
             self.RhoRadioButton3C.setChecked(False)
@@ -1536,6 +1552,8 @@ class ConfigWindow(QtWidgets.QDialog):
             ConfigFile.settings["bL2M99Rho"] = 1
         else:
             self.l1bGetAncResetButton.setDisabled(False)
+            self.l1bGetAncOfflineCheckBox.setDisabled(False)
+            self.l1bGetAncBilinearCheckBox.setDisabled(False)
 
     def l1bCalCharButtonPressed(self):
         # print("OC Products Dialogue")
@@ -1936,6 +1954,8 @@ class ConfigWindow(QtWidgets.QDialog):
             ConfigFile.settings["bL1bGetAnc"] = 2
         else:
             ConfigFile.settings["bL1bGetAnc"] = 0
+        ConfigFile.settings["bL1bGetAncOffline"] = int(self.l1bGetAncOfflineCheckBox.isChecked())
+        ConfigFile.settings["bL1bGetAncBilinear"] = int(self.l1bGetAncBilinearCheckBox.isChecked())
         ConfigFile.settings["fL1bDefaultWindSpeed"] = float(self.l1bDefaultWindSpeedLineEdit.text())
         ConfigFile.settings["fL1bDefaultAOD"] = float(self.l1bDefaultAODLineEdit.text())
         ConfigFile.settings["fL1bDefaultSalt"] = float(self.l1bDefaultSaltLineEdit.text())
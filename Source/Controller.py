@@ -3,6 +3,7 @@ import os
 import datetime
 import collections
 import threading
+import concurrent.futures
 import numpy as np
 
 from Source import PATH_TO_CONFIG, PACKAGE_DIR
@@ -34,9 +35,70 @@ class Controller:
 
     trios_L1A_files = []
 
+    # Pipeline mode (MainConfig.settings["pipelineMode"]) within processFilesMultiLevel: roots handed to the
+    #   next level in memory, keyed on the file they stand in for, and intermediate files still being written
+    pipelineActive = False
+    pipelineRoots = {}
+    pipelineWrites = {}
+    pipelineWriter = None
+
+    @staticmethod
+    def writeLevel(root, outFilePath):
+        ''' Write an intermediate level, or hand it to the next level in pipeline mode '''
+        mode = int(MainConfig.settings["pipelineMode"])
+        if not Controller.pipelineActive or mode == 0:
+            root.writeHDF5(outFilePath, MainConfig.settings["hdfWriteProfile"])
+            return
+        outFilePath = os.path.abspath(outFilePath)
+        Controller.waitForWrites(outFilePath)
+        # The next level gets an independent copy, so the original can be written while it is processed
+        Controller.pipelineRoots[outFilePath] = root.snapshot()
+        if mode == 1:
+            if Controller.pipelineWriter is None:
+                Controller.pipelineWriter = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+            Controller.pipelineWrites[outFilePath] = Controller.pipelineWriter.submit(root.writeHDF5, outFilePath, MainConfig.settings["hdfWriteProfile"])
+
+    @staticmethod
+    def readLevel(inFilePath):
+        ''' The root handed over by the previous level, or else the root read from file '''
+        inFilePath = os.path.abspath(inFilePath)
+        root = Controller.pipelineRoots.pop(inFilePath, None)
+        if root is None:
+            Controller.waitForWrites(inFilePath)
+            root = HDFRoot.readHDF5(inFilePath)
+        return root
+
+    @staticmethod
+    def inLevel(inFilePath):
+        ''' True if the previous level was handed over in memory '''
+        return os.path.abspath(inFilePath) in Controller.pipelineRoots
+
+    @staticmethod
+    def checkOutputFiles(outFilePath):
+        if Controller.inLevel(outFilePath):
+            logging.writeLogFileAndPrint(f'Process Single Level: {outFilePath} - SUCCESSFUL')
+        else:
+            filing.checkOutputFiles(outFilePath)
+
+    @staticmethod
+    def waitForWrites(fp=None):
+        ''' Block until the background write of fp (or of every file if fp is None) is finished '''
+        if fp is None:
+            paths = list(Controller.pipelineWrites)
+        else:
+            paths = [os.path.abspath(fp)] if os.path.abspath(fp) in Controller.pipelineWrites else []
+        for path in paths:
+            try:
+                Controller.pipelineWrites.pop(path).result()
+            except Exception:
+                msg = f'**********************Unable to write {path}. It may be open in another program.**********************'
+                logging.writeLogFileAndPrint(msg)
+
     @staticmethod
     def writeReport(fileName, pathOut, outFilePath, level, inFilePath):
         print('Writing PDF Report...')
+        # Failure reports fall back on the files of lower levels
+        Controller.waitForWrites()
         numLevelDict = {'L1A':1,'L1AQC':2,'L1B':3,'L1BQC':4,'L2':5}
         numLevel = numLevelDict[level]
 
@@ -334,9 +396,9 @@ class Controller:
             try:
                 if ConfigFile.settings["SensorType"].lower() not in ["trios", "trios es only"]:
                     # TriOS L1a files are written in ProcessL1aTriOS
-                    root.writeHDF5(outFFPs)
-            except Exception:
-                msg = '**********************Unable to write L1A file. It may be open in another program.**********************'
+                    Controller.writeLevel(root, outFFPs)
+            except Exception as err:
+                msg = f'**********************Unable to write L1A file ({err}). It may be open in another program.**********************'
                 if MainConfig.settings["popQuery"] == 0 and os.getenv('HYPERINSPACE_CMD') != 'TRUE':
                     logging.errorWindow("File Error", msg)
                 logging.writeLogFileAndPrint(msg)
@@ -354,14 +416,14 @@ class Controller:
     def processL1aqc(inFilePath, outFilePath, calibrationMap, ancillaryData):
         root = None
         # test = Utilities.checkInputFiles(inFilePath)
-        test = filing.checkInputFiles(inFilePath)
+        test = Controller.inLevel(inFilePath) or filing.checkInputFiles(inFilePath)
         if test is False:
             return None
 
         # Process the data
         print("ProcessL1aqc")
         try:
-            root = HDFRoot.readHDF5(inFilePath)
+            root = Controller.readLevel(inFilePath)
         except FileNotFoundError:
             msg = "Unable to open file. May be open in another application."
             logging.errorWindow("File Error", msg)
@@ -376,7 +438,7 @@ class Controller:
         # Write output file
         if root is not None:
             try:
-                root.writeHDF5(outFilePath)
+                Controller.writeLevel(root, outFilePath)
             except Exception:
                 msg = "Controller.processL1aqc: Unable to open HDF file. May be open in another application."
                 if MainConfig.settings["popQuery"] == 0 and os.getenv('HYPERINSPACE_CMD') != 'TRUE':
@@ -395,14 +457,14 @@ class Controller:
     @staticmethod
     def processL1b(inFilePath, outFilePath):
         root = None
-        if not os.path.isfile(inFilePath):
+        if not Controller.inLevel(inFilePath) and not os.path.isfile(inFilePath):
             print('No such input file: ' + inFilePath)
             return None
 
         # Process the data
         logging.writeLogFileAndPrint(f"ProcessL1b: {inFilePath}")
         try:
-            root = HDFRoot.readHDF5(inFilePath)
+            root = Controller.readLevel(inFilePath)
         except FileNotFoundError:
             msg = "Controller.processL1b: Unable to open HDF file. May be open in another application."
             logging.errorWindow("File Error", msg)
@@ -418,9 +480,9 @@ class Controller:
         # Write output file
         if root is not None:
             try:
-                root.writeHDF5(outFilePath)
-            except Exception:
-                msg = "**********************Controller.ProcessL1b: Unable to write file. May be open in another application.**********************"
+                Controller.writeLevel(root, outFilePath)
+            except Exception as err:
+                msg = f"**********************Controller.ProcessL1b: Unable to write file ({err}). May be open in another application.**********************"
                 logging.errorWindow("File Error", msg)
                 logging.writeLogFileAndPrint(msg)
                 return None
@@ -437,14 +499,14 @@ class Controller:
     def processL1bqc(inFilePath, outFilePath):
         root = None
 
-        if not os.path.isfile(inFilePath):
+        if not Controller.inLevel(inFilePath) and not os.path.isfile(inFilePath):
             print('No such input file: ' + inFilePath)
             return None
 
         # Process the data
         print("ProcessL1bqc")
         try:
-            root = HDFRoot.readHDF5(inFilePath)
+            root = Controller.readLevel(inFilePath)
         except FileNotFoundError:
             msg = "Unable to open file. May be open in another application."
             logging.errorWindow("File Error", msg)
@@ -457,9 +519,9 @@ class Controller:
         # Write output file
         if root is not None:
             try:
-                root.writeHDF5(outFilePath)
-            except Exception:
-                msg = "**********************Unable to write file. May be open in another application.**********************"
+                Controller.writeLevel(root, outFilePath)
+            except Exception as err:
+                msg = f"**********************Unable to write file ({err}). May be open in another application.**********************"
                 logging.errorWindow("File Error", msg)
                 logging.writeLogFileAndPrint(msg)
                 return None
@@ -537,14 +599,26 @@ class Controller:
 
         # Write output file
         if node is not None:
+            # Format SeaBASS from memory, so the L2 HDF is written once, with the SeaBASS file name base
+            sbFiles = None
+            if int(ConfigFile.settings["bL2SaveSeaBASS"]) == 1:
+                sbFiles = SeaBASSWriter.formatTXT_Type2(outFilePath, node)
+                if sbFiles is not None:
+                    # Root attribute with the SeaBASS filename base (i.e., not rrs or es)
+                    sbFileName = sbFiles[-1]['headerBlock']['data_file_name']
+                    node.attributes['SeaBASS_File_Name_Base'] = sbFileName[0:sbFileName.find('L2')-1]
             try:
-                node.writeHDF5(outFilePath)
-                return node
-            except Exception:
-                msg = "**********************Unable to write file. May be open in another application.**********************"
+                node.writeHDF5(outFilePath, MainConfig.settings["hdfWriteProfile"])
+            except Exception as err:
+                msg = f"**********************Unable to write file ({err}). May be open in another application.**********************"
                 logging.errorWindow("File Error", msg)
                 logging.writeLogFileAndPrint(msg)
                 return None
+            # Only once the HDF is written, so a failed write leaves no SeaBASS files behind
+            if sbFiles is not None:
+                logging.writeLogFileAndPrint(f'Output SeaBASS for HDF: \n{outFilePath}')
+                SeaBASSWriter.outputTXT_Type2(outFilePath, files=sbFiles)
+            return node
         else:
             msg = "L2 processing failed. Nothing to output."
             if MainConfig.settings["popQuery"] == 0 and os.getenv('HYPERINSPACE_CMD') != 'TRUE':
@@ -619,7 +693,7 @@ class Controller:
                 root, outFFPs = Controller.processL1a(inFilePath, outFilePath, calibrationMap)
                 if not flag_Trios:
                     # Checked in TriosL1A for TriOS
-                    filing.checkOutputFiles(outFilePath)
+                    Controller.checkOutputFiles(outFilePath)
                 else:
                     # Set the class variable for use in moving on from L1A trios
                     Controller.trios_L1A_files = outFFPs
@@ -664,22 +738,22 @@ class Controller:
                 else:
                     logging.writeLogFileAndPrint('No deglitching will be performed.')
                 root = Controller.processL1aqc(inFilePath, outFilePath, calibrationMap, ancillaryData)
-                filing.checkOutputFiles(outFilePath)
+                Controller.checkOutputFiles(outFilePath)
 
             elif level == "L1B":
                 root = Controller.processL1b(inFilePath, outFilePath)
-                filing.checkOutputFiles(outFilePath)
+                Controller.checkOutputFiles(outFilePath)
 
             elif level == "L1BQC":
                 root = Controller.processL1bqc(inFilePath, outFilePath)
-                filing.checkOutputFiles(outFilePath)
+                Controller.checkOutputFiles(outFilePath)
 
         elif level == "L2":
             # Ancillary data from metadata have been read in at L1C,
             # and will be extracted from the ANCILLARY_METADATA group later
 
             root = None
-            if not os.path.isfile(inFilePath):
+            if not Controller.inLevel(inFilePath) and not os.path.isfile(inFilePath):
                 print('No such input file: ' + inFilePath)
                 return False#None, outFilePath
 
@@ -687,7 +761,7 @@ class Controller:
             try:
                 # root variable is replaced by L2 node unless station extraction, in which case
                 #   it is retained and node is returned from ProcessL2
-                root = HDFRoot.readHDF5(inFilePath)
+                root = Controller.readLevel(inFilePath)
                 root.attributes['L1BQC_FILE_NAME'] = inFileName
                 del root.attributes["In_Filepath"]
             except FileNotFoundError:
@@ -758,27 +832,13 @@ class Controller:
                         filing.checkOutputFiles(outFilePathStation)
 
                         if os.path.isfile(outFilePathStation):
-                            # Ensure that the L2 on file is recent before continuing with
-                            # SeaBASS files or reports
+                            # Ensure that the L2 on file is recent before continuing with reports
+                            # (SeaBASS files are written with it by processL2)
                             modTime = os.path.getmtime(outFilePathStation)
                             nowTime = datetime.datetime.now()
                             if nowTime.timestamp() - modTime < 60:
                                 logging.writeLogFileAndPrint(f'{level} file produced: \n{outFilePathStation}')
 
-                                # Write SeaBASS
-                                if int(ConfigFile.settings["bL2SaveSeaBASS"]) == 1:
-                                    logging.writeLogFileAndPrint(f'Output SeaBASS for HDF: \n{outFilePathStation}')
-                                    sbFileName = SeaBASSWriter.outputTXT_Type2(outFilePathStation)
-
-                                    # If this is being output to SeaBASS later, add a root attribute
-                                    # with the SeaBASS filename base (i.e., not rrs or es)
-                                    baseName = sbFileName[0:sbFileName.find('L2')-1]
-                                    # Need to reopen the station L2 to update the attribute
-                                    stationRoot = HDFRoot.readHDF5(outFilePathStation)
-                                    stationRoot.attributes['SeaBASS_File_Name_Base'] = baseName
-                                    stationRoot.writeHDF5(outFilePathStation)
-                                # return True
-
                         # Write L2 report for each station, regardless of pass/fail
                         if ConfigFile.settings["bL2WriteReport"] == 1:
                             Controller.writeReport(fileName, pathOut, outFilePathStation, level, inFilePath)
@@ -793,24 +853,13 @@ class Controller:
                 filing.checkOutputFiles(outFilePath)
 
                 if os.path.isfile(outFilePath):
-                    # Ensure that the L2 on file is recent before continuing with
-                    # SeaBASS files or reports
+                    # Ensure that the L2 on file is recent before continuing with reports
+                    # (SeaBASS files are written with it by processL2)
                     modTime = os.path.getmtime(outFilePath)
                     nowTime = datetime.datetime.now()
                     if nowTime.timestamp() - modTime < 60:
                         logging.writeLogFileAndPrint(f'{level} file produced: \n{outFilePath}')
 
-                        # Write SeaBASS
-                        if int(ConfigFile.settings["bL2SaveSeaBASS"]) == 1:
-                            logging.writeLogFileAndPrint(f'Output SeaBASS for HDF: \n{outFilePath}')
-                            sbFileName = SeaBASSWriter.outputTXT_Type2(outFilePath)
-
-                            # If this is being output to SeaBASS later, add a root attribute
-                            # with the SeaBASS filename base (i.e., not rrs or es)
-                            baseName = sbFileName[0:sbFileName.find('L2')-1]
-                            root.attributes['SeaBASS_File_Name_Base'] = baseName
-                            root.writeHDF5(outFilePath)
-
         # If the process failed at any level, write a report and return
         if root is None and ConfigFile.settings["bL2Stations"] == 0:
             if ConfigFile.settings["bL2WriteReport"] == 1:
@@ -829,48 +878,55 @@ class Controller:
     @staticmethod
     def processFilesMultiLevel(pathOut,inFiles, calibrationMap):
         print("processFilesMultiLevel")
-
-        L1A_complete = False
-        if ConfigFile.settings["SensorType"].lower() in ["trios", "trios es only"]:
-            # TriOS Raw files are triplets. Process all to L1A and then continue normally
-            if Controller.processSingleLevel(pathOut, inFiles, calibrationMap, 'L1A'):
-                L1A_complete = True
-                inFiles = Controller.trios_L1A_files
-
-        for fp in inFiles:
-            print("Processing: " + fp)
-
-            if not ConfigFile.settings["SensorType"].lower() in ["trios", "trios es only"]:
-                # Process to L1A unless it's trios, which is handled above
-                L1A_complete = False
-                if Controller.processSingleLevel(pathOut, fp, calibrationMap, 'L1A'):
+        Controller.pipelineActive = True
+        try:
+            L1A_complete = False
+            if ConfigFile.settings["SensorType"].lower() in ["trios", "trios es only"]:
+                # TriOS Raw files are triplets. Process all to L1A and then continue normally
+                if Controller.processSingleLevel(pathOut, inFiles, calibrationMap, 'L1A'):
                     L1A_complete = True
+                    inFiles = Controller.trios_L1A_files
+
+            for fp in inFiles:
+                print("Processing: " + fp)
+                # Nothing handed over from the previous file is needed any more
+                Controller.pipelineRoots.clear()
 
-            if L1A_complete:
+                if not ConfigFile.settings["SensorType"].lower() in ["trios", "trios es only"]:
+                    # Process to L1A unless it's trios, which is handled above
+                    L1A_complete = False
+                    if Controller.processSingleLevel(pathOut, fp, calibrationMap, 'L1A'):
+                        L1A_complete = True
+
+                if L1A_complete:
 
-                inFileName = os.path.split(fp)[1]
-                if ConfigFile.settings["SensorType"].lower() in ["trios", "trios es only"]:
-                    # For TriOS, need to parse the L1A names, not L0
-                    fileName = os.path.join('L1A',f'{os.path.splitext(inFileName)[0]}'+'.hdf')
-                elif ConfigFile.settings["SensorType"].lower() == 'sorad':
-                    fileName = os.path.join('L1A', fp.split('/')[-1][0:-7] + '_L1A.hdf')
-                else:
-                    # Going from L0 to L1A, need to account for the underscore
-                    fileName = os.path.join('L1A',f'{os.path.splitext(inFileName)[0]}'+'_L1A.hdf')
-                fp = os.path.join(os.path.abspath(pathOut),fileName)
-                if Controller.processSingleLevel(pathOut, fp, calibrationMap, 'L1AQC'):
                     inFileName = os.path.split(fp)[1]
-                    fileName = os.path.join('L1AQC',f"{os.path.splitext(inFileName)[0].rsplit('_',1)[0]}"+'_L1AQC.hdf')
+                    if ConfigFile.settings["SensorType"].lower() in ["trios", "trios es only"]:
+                        # For TriOS, need to parse the L1A names, not L0
+                        fileName = os.path.join('L1A',f'{os.path.splitext(inFileName)[0]}'+'.hdf')
+                    elif ConfigFile.settings["SensorType"].lower() == 'sorad':
+                        fileName = os.path.join('L1A', fp.split('/')[-1][0:-7] + '_L1A.hdf')
+                    else:
+                        # Going from L0 to L1A, need to account for the underscore
+                        fileName = os.path.join('L1A',f'{os.path.splitext(inFileName)[0]}'+'_L1A.hdf')
                     fp = os.path.join(os.path.abspath(pathOut),fileName)
-                    if Controller.processSingleLevel(pathOut, fp, calibrationMap, 'L1B'):
+                    if Controller.processSingleLevel(pathOut, fp, calibrationMap, 'L1AQC'):
                         inFileName = os.path.split(fp)[1]
-                        fileName = os.path.join('L1B',f"{os.path.splitext(inFileName)[0].rsplit('_',1)[0]}"+'_L1B.hdf')
+                        fileName = os.path.join('L1AQC',f"{os.path.splitext(inFileName)[0].rsplit('_',1)[0]}"+'_L1AQC.hdf')
                         fp = os.path.join(os.path.abspath(pathOut),fileName)
-                        if Controller.processSingleLevel(pathOut, fp, calibrationMap, 'L1BQC'):
+                        if Controller.processSingleLevel(pathOut, fp, calibrationMap, 'L1B'):
                             inFileName = os.path.split(fp)[1]
-                            fileName = os.path.join('L1BQC',f"{os.path.splitext(inFileName)[0].rsplit('_',1)[0]}"+'_L1BQC.hdf')
+                            fileName = os.path.join('L1B',f"{os.path.splitext(inFileName)[0].rsplit('_',1)[0]}"+'_L1B.hdf')
                             fp = os.path.join(os.path.abspath(pathOut),fileName)
-                            Controller.processSingleLevel(pathOut, fp, calibrationMap, 'L2')
+                            if Controller.processSingleLevel(pathOut, fp, calibrationMap, 'L1BQC'):
+                                inFileName = os.path.split(fp)[1]
+                                fileName = os.path.join('L1BQC',f"{os.path.splitext(inFileName)[0].rsplit('_',1)[0]}"+'_L1BQC.hdf')
+                                fp = os.path.join(os.path.abspath(pathOut),fileName)
+                                Controller.processSingleLevel(pathOut, fp, calibrationMap, 'L2')
+        finally:
+            Controller.pipelineActive = False
+            Controller.pipelineRoots.clear()
+            Controller.waitForWrites()
         print("processFilesMultiLevel - DONE")
 
 
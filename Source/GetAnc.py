@@ -1,25 +1,54 @@
 ''' API to retrieve atmospheric MERRA2 model data'''
 import os
+import datetime
 import numpy as np
 from PyQt5 import QtWidgets
 
 from Source.HDFRoot import HDFRoot
+from Source.AncStore import AncStore
+from Source.ConfigFile import ConfigFile
 from Source import OBPGSession, PATH_TO_DATA
 import Source.utils.loggingHCP as logging
 import Source.utils.dating as dating
-import Source.utils.comparing as comparing
 
 class GetAnc:
     '''API object for retrieving MERRA2'''
 
     @staticmethod
-    def getAnc(inputGroup):
-        ''' Retrieve model data and save in Data/Anc and in ModData '''
+    def getFile(fileName, ancPath):
+        ''' Locate a MERRA2 file in ancPath, retrieving it from the server if missing. Returns the HTTP status
+            (200 if found locally), or None if it is missing and bL1bGetAncOffline is set. '''
         server = 'oceandata.sci.gsfc.nasa.gov'
-        # cwd = os.getcwd()
+        if os.path.exists(os.path.join(ancPath, fileName)):
+            msg = f'Ancillary file found locally: {fileName}'
+            print(msg)
+            logging.writeLogFile(msg)
+            return 200
 
-        if not os.path.exists(os.path.join(PATH_TO_DATA, 'Anc')):
-            os.makedirs(os.path.join(PATH_TO_DATA, 'Anc'))
+        if ConfigFile.settings["bL1bGetAncOffline"]:
+            logging.writeLogFileAndPrint(f'Ancillary file not found locally and working offline: {fileName}')
+            return None
+
+        # request = f"/cgi/getfile/{fileName}"
+        request = f"/ob/getfile/{fileName}"
+        msg = f'Retrieving anchillary file from server: {fileName}'
+        print(msg)
+        logging.writeLogFile(msg)
+
+        return OBPGSession.httpdl(server, request, localpath=ancPath,
+            outputfilename=fileName, uncompress=False, verbose=2)
+
+    @staticmethod
+    def getAnc(inputGroup, method=None):
+        ''' Retrieve model data and save in Data/Anc and in ModData.
+            Each MERRA2 file is ingested once into the ancillary store (see AncStore) and the whole track is
+            looked up in the hourly fields, in the nearest grid cell or bilinearly (method='bilinear').
+            method defaults to the bL1bGetAncBilinear setting. '''
+        if method is None:
+            method = 'bilinear' if ConfigFile.settings["bL1bGetAncBilinear"] else 'nearest'
+        ancPath = os.path.join(PATH_TO_DATA, 'Anc')
+        if not os.path.exists(ancPath):
+            os.makedirs(ancPath)
 
         # Get the dates, times, and locations from the input group
         latDate = inputGroup.getDataset('LATITUDE').data["Datetag"]
@@ -27,60 +56,18 @@ class GetAnc:
         lat = inputGroup.getDataset('LATITUDE').data["NONE"]
         lon = inputGroup.getDataset('LONGITUDE').data["NONE"]
 
-        modWind = []
-        modAirT = []
-        modAOD = []
-
-        # Loop through the input group and extract model data for each element
-        oldFile,ancLat,ancLon,ancUwind,ancVwind,ancLatAer,ancLonAer,ancAirT = None,None,None,None,None,None,None,None
-        for index, dateTag in enumerate(latDate):
-            dateTagNew = dating.dateTagToDate(dateTag)
-            year = int(str(int(dateTagNew))[0:4])
-            month = int(str(int(dateTagNew))[4:6])
-            day = int(str(int(dateTagNew))[6:8])
-            # doy = int(str(int(dateTag))[4:7])
-            # Casting below can push hr to 24. Truncate the hr decimal using
-            # int() so the script always calls from within the hour in question,
-            # and no rounding occurs.
-            hr = int(dating.timeTag2ToSec(latTime[index])/60/60)
-
-            file1 = f"GMAO_MERRA2.{year}{month:02.0f}{day:02.0f}T{hr:02.0f}0000.MET.nc"
-
-            if oldFile != file1:
-                ancPath = os.path.join(PATH_TO_DATA, 'Anc')
-                filePath1 = os.path.join(PATH_TO_DATA, 'Anc', file1)
-                if not os.path.exists(filePath1):
-                    # request = f"/cgi/getfile/{file1}"
-                    request = f"/ob/getfile/{file1}"
-                    msg = f'Retrieving anchillary file from server: {file1}'
-                    print(msg)
-                    logging.writeLogFile(msg)
+        # Records are taken from the file of the hour they fall in (truncated, never rounded up)
+        stamps, _ = dating.tagsToDatetime64(latDate, latTime)
+        hours = np.unique(stamps[~np.isnat(stamps)].astype('datetime64[h]'))
 
-                    status = OBPGSession.httpdl(server, request, localpath=ancPath,
-                        outputfilename=file1, uncompress=False, verbose=2)
-                else:
-                    status = 200
-                    msg = f'Ancillary file found locally: {file1}'
-                    print(msg)
-                    logging.writeLogFile(msg)
-
-                file2 = f"GMAO_MERRA2.{year}{month:02.0f}{day:02.0f}T{hr:02.0f}0000.AER.nc"
-                filePath2 = os.path.join(PATH_TO_DATA, 'Anc', file2)
-                if not os.path.exists(filePath2):
-                    # request = f"/cgi/getfile/{file2}"
-                    request = f"/ob/getfile/{file2}"
-                    msg = f'Retrieving anchillary file from server: {file2}'
-                    print(msg)
-                    logging.writeLogFile(msg)
-
-                    status = OBPGSession.httpdl(server, request, localpath=ancPath,
-                        outputfilename=file2, uncompress=False, verbose=2)
-                else:
-                    status = 200
-                    msg = f'Ancillary file found locally: {file2}'
-                    print(msg)
-                    logging.writeLogFile(msg)
+        metGrids, aerGrids = [], []
+        for hour in hours:
+            tag = hour.astype(datetime.datetime).strftime('%Y%m%dT%H')
+            file1 = f"GMAO_MERRA2.{tag}0000.MET.nc"
+            file2 = f"GMAO_MERRA2.{tag}0000.AER.nc"
 
+            for fileName in (file1, file2):
+                status = GetAnc.getFile(fileName, ancPath)
                 if status in (400, 401, 403, 404, 416):
                     msg = f'Request error: {status}'
                     print(msg)
@@ -95,75 +82,26 @@ class GetAnc:
                                     the third week of the following month.')
                     alert.exec_()
                     return
+            if not (os.path.exists(os.path.join(ancPath, file1)) and os.path.exists(os.path.join(ancPath, file2))):
+                continue
 
-                # GMAO Atmospheric model data
-                node = HDFRoot.readHDF5(filePath1)
-                root = HDFRoot()
-                root.copyAttributes(node)
-
-                # dataset are read into root level
-                gmaoGroup = root.addGroup('GMAO')
-                for ds in node.datasets:
-                    name = ds.id
-                    newds = gmaoGroup.addDataset(name)
-                    newds.columns["None"] = ds.data[:].tolist()
-                    newds.columnsToDataset()
-                    newds.attributes['units'] = ds.attributes['units']
-
-                # extract and return ancillary data from netcdf4 files....
-                ancLat = np.array(gmaoGroup.getDataset("lat").data.tolist())
-                ancLon = np.array(gmaoGroup.getDataset("lon").data.tolist())
-
-                # AirTemp
-                ancAirT = gmaoGroup.getDataset("T10M") # Air temp at 10 m [K]
-
-                # Wind
-                ancUwind = gmaoGroup.getDataset("U10M") # Eastward at 10m [m/s]
-                ancVwind = gmaoGroup.getDataset("V10M") # Northward
-
-                # Aerosols
-                node = HDFRoot.readHDF5(filePath2)
-                root = HDFRoot()
-                root.copyAttributes(node)
-
-                # dataset are read into root level
-                aerGroup = root.addGroup('AEROSOLS')
-                for ds in node.datasets:
-                    name = ds.id
-                    newds = aerGroup.addDataset(name)
-                    newds.columns["None"] = ds.data[:].tolist()
-                    newds.columnsToDataset()
-                    newds.attributes['units'] = ds.attributes['units']
-
-
-                # extract and return ancillary data from netcdf4 files....
-                ancLatAer = np.array(aerGroup.getDataset("lat").data.tolist())
-                ancLonAer = np.array(aerGroup.getDataset("lon").data.tolist())
-
-                # Total Aerosol Extinction AOT 550 nm, same as AOD(550)
-                ancTExt = aerGroup.getDataset("TOTEXTTAU")
-                ancTExt.attributes['wavelength'] = '550 nm'
-
-            oldFile = file1
-
-            # Locate the relevant cell            
-            latInd = comparing.find_nearest(ancLat,lat[index])
-            lonInd = comparing.find_nearest(ancLon,lon[index])
-
-            # position retrieval index has been confirmed manually in SeaDAS
-            uWind = ancUwind.data["None"][latInd][lonInd]
-            vWind = ancVwind.data["None"][latInd][lonInd]
-            modWind.append(np.sqrt(uWind*uWind + vWind*vWind)) # direction not needed
+            # GMAO Atmospheric model data: air temp at 10 m [K], eastward and northward wind at 10 m [m/s]
+            metGrids.append(AncStore.ingest(os.path.join(ancPath, file1), ['T10M', 'U10M', 'V10M'], hour))
+            # Aerosols: Total Aerosol Extinction AOT 550 nm, same as AOD(550)
+            aerGrids.append(AncStore.ingest(os.path.join(ancPath, file2), ['TOTEXTTAU'], hour))
 
-            aTemp = ancAirT.data["None"][latInd][lonInd]
-            modAirT.append(aTemp - 273.15) # [C]
+        if not metGrids:
+            logging.writeLogFileAndPrint('GetAnc: No MERRA2 model data available for these records')
+            return None
 
-            # Locate the relevant cell
-            latInd = comparing.find_nearest(ancLatAer,lat[index])
-            lonInd = comparing.find_nearest(ancLonAer,lon[index])
+        # position retrieval index has been confirmed manually in SeaDAS
+        met = AncStore.stack(metGrids)
+        metData = AncStore.lookup(met, stamps, lat, lon, method)
+        aerData = AncStore.lookup(AncStore.stack(aerGrids), stamps, lat, lon, method)
 
-            # position confirmed in SeaDAS
-            modAOD.append(ancTExt.data["None"][latInd][lonInd])
+        modWind = np.sqrt(metData['U10M']**2 + metData['V10M']**2).tolist() # direction not needed
+        modAirT = (metData['T10M'] - 273.15).tolist() # [C]
+        modAOD = aerData['TOTEXTTAU'].tolist()
 
         modData = HDFRoot()
         modGroup = modData.addGroup('MERRA2_model')
@@ -180,9 +118,9 @@ class GetAnc:
         modGroup.datasets['AOD'] = modAOD
         modGroup.datasets['Wind'] = modWind
         modGroup.datasets['AirTemp'] = modAirT
-        modGroup.attributes['Wind units'] = ancUwind.attributes['units']
+        modGroup.attributes['Wind units'] = str(met['units'][list(met['variables']).index('U10M')])
         modGroup.attributes['Air Temp. units'] = 'C'
-        modGroup.attributes['AOD wavelength'] = ancTExt.attributes['wavelength']
+        modGroup.attributes['AOD wavelength'] = '550 nm'
         print('GetAnc: Model data retrieved')
 
         return modData
@@ -4,11 +4,12 @@ import datetime
 import decimal
 
 import numpy as np
-import xarray as xr
 import cdsapi
 
 from Source import PATH_TO_DATA
 from Source.HDFRoot import HDFRoot
+from Source.AncStore import AncStore
+from Source.ConfigFile import ConfigFile
 from Source.GetAnc_credentials import GetAnc_credentials
 import Source.utils.loggingHCP as logging
 import Source.utils.dating as dating
@@ -76,6 +77,8 @@ class GetAnc_ecmwf:
 
         if os.path.exists(pathOut):
             pass
+        elif ConfigFile.settings["bL1bGetAncOffline"]:
+            logging.writeLogFileAndPrint(f'CAMS file not found locally and working offline: {pathOut}')
         else:
             url,key = GetAnc_credentials.read_user_credentials('ECMWF_ADS')
 
@@ -146,8 +149,6 @@ class GetAnc_ecmwf:
         '2m_temperature': 't2m'
         }
 
-        CAMSnc = {}
-
         latEff, lonEff, latLonTag, dateStrRounded, timeStrRounded = \
             GetAnc_ecmwf.ECMWF_latLonTimeTags(lat, lon, timeStamp, latRes=latRes, lonRes=lonRes, timeResHours=timeResHours)
 
@@ -155,24 +156,26 @@ class GetAnc_ecmwf:
 
         GetAnc_ecmwf.CAMS_download_ensembles(latEff, lonEff, dateStrRounded, timeStrRounded, CAMS_variables, pathOut)
 
+        # Each CAMS file holds one cell and hour; it is ingested once into the ancillary store
         try:
-            CAMSnc['reanalysis'] = xr.open_dataset(pathOut,engine='netcdf4')
+            grid = AncStore.ingest(pathOut, list(CAMS_variables.values()),
+                                   np.datetime64(f'{dateStrRounded}T{timeStrRounded}'), engine='netcdf4')
             CAMS_flag = True
-        except:
+        except Exception:
             CAMS_flag = False
             logging.writeLogFileAndPrint('CAMS data missing. Skipping...')
 
         if CAMS_flag:
-            try:
-                for CAMS_variable, shortName in CAMS_variables.items():
-                    var = CAMSnc['reanalysis'][shortName]
-                    ancillary[CAMS_variable] = {}
-                    ancillary[CAMS_variable]['value']      = var.values[0][0][0][0]
-                    ancillary[CAMS_variable]['units']      = var.units
-                    ancillary[CAMS_variable]['long_name']  = var.long_name
-                    ancillary[CAMS_variable]['source']     = 'CAMS (ECMWF). https://ads.atmosphere.copernicus.eu/cdsapp#!/dataset/cams-global-atmospheric-composition-forecasts?tab=overview'
-            except:
-                logging.writeLogFileAndPrint('Problem processing CAMS data. Skipping...')
+            variables = list(grid['variables'])
+            for CAMS_variable, shortName in CAMS_variables.items():
+                if shortName not in variables:
+                    continue
+                index = variables.index(shortName)
+                ancillary[CAMS_variable] = {}
+                ancillary[CAMS_variable]['value']      = grid[shortName][0, 0, 0]
+                ancillary[CAMS_variable]['units']      = str(grid['units'][index])
+                ancillary[CAMS_variable]['long_name']  = str(grid['long_name'][index])
+                ancillary[CAMS_variable]['source']     = 'CAMS (ECMWF). https://ads.atmosphere.copernicus.eu/cdsapp#!/dataset/cams-global-atmospheric-composition-forecasts?tab=overview'
 
         # Check for recent addition of 2m temp data
         if '2m_temperature' not in ancillary:
@@ -195,24 +198,35 @@ class GetAnc_ecmwf:
         lat = inputGroup.getDataset('LATITUDE').data["NONE"]
         lon = inputGroup.getDataset('LONGITUDE').data["NONE"]
 
-        modWind = []
-        modAirT = []
-        modAOD = []
-
-        # Loop through the input group and extract model data for each element
-        for index, dateTag in enumerate(latDate):
-            dateTagNew = dating.dateTagToDateTime(dateTag)
-            timeStamp = dating.timeTag2ToDateTime(dateTagNew,latTime[index])
-
-            ancillary = GetAnc_ecmwf.get_ancillary_main(lat[index], lon[index], timeStamp, ancPath)
+        # Records sharing a CAMS cell and hour are served by one file, so each is retrieved once
+        latRes, lonRes, timeResHours = 0.4, 0.4, 1
+        stamps, valid = dating.tagsToDatetime64(latDate, latTime)
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        valid &= ~np.isnan(lat) & ~np.isnan(lon)
+        cells = np.column_stack([np.round(lat / latRes), np.round(lon / lonRes),
+            np.floor(stamps.astype('datetime64[s]').astype(np.float64) / (3600 * timeResHours))])
+        cells, first, inverse = np.unique(cells[valid], axis=0, return_index=True, return_inverse=True)
+
+        values = np.full((len(cells), 3), np.nan)
+        for c, index in enumerate(np.flatnonzero(valid)[first]):
+            timeStamp = dating.datetime64ToDatetime(stamps[index:index+1])[0]
+            ancillary = GetAnc_ecmwf.get_ancillary_main(lat[index], lon[index], timeStamp, ancPath,
+                latRes=latRes, lonRes=lonRes, timeResHours=timeResHours)
 
             # position retrieval index has been confirmed manually in SeaDAS
-            uWind = ancillary['10m_u_component_of_wind']['value']
-            vWind = ancillary['10m_v_component_of_wind']['value']
-            modWind.append(np.sqrt(uWind*uWind + vWind*vWind)) # direction not needed
-            #ancAOD = aerGroup.getDataset("TOTEXTTAU")
-            modAOD.append(ancillary['total_aerosol_optical_depth_550nm']['value'])
-            modAirT.append(ancillary['2m_temperature']['value'] - 273.15) # [C]
+            if '10m_u_component_of_wind' in ancillary and '10m_v_component_of_wind' in ancillary:
+                uWind = ancillary['10m_u_component_of_wind']['value']
+                vWind = ancillary['10m_v_component_of_wind']['value']
+                values[c, 0] = np.sqrt(uWind*uWind + vWind*vWind) # direction not needed
+            if 'total_aerosol_optical_depth_550nm' in ancillary:
+                values[c, 1] = ancillary['total_aerosol_optical_depth_550nm']['value']
+            if '2m_temperature' in ancillary:
+                values[c, 2] = ancillary['2m_temperature']['value'] - 273.15 # [C]
+
+        track = np.full((len(valid), 3), np.nan)
+        track[valid] = values[inverse.reshape(-1)]
+        modWind, modAOD, modAirT = (track[:, k].tolist() for k in range(3))
 
         modData = HDFRoot()
         modGroup = modData.addGroup('ECMWF')
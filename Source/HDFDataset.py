@@ -3,6 +3,15 @@ import sys
 
 import numpy as np
 
+# HDF5 write profiles: the filters applied to every dataset written. Filtered datasets are chunked along
+#   the time axis (whole records), so reading a span of records decompresses only the chunks holding it.
+WRITE_PROFILES = collections.OrderedDict([
+    ('none', None),
+    ('fast', {'compression': 'gzip', 'compression_opts': 1, 'shuffle': True}),
+    ('max', {'compression': 'gzip', 'compression_opts': 9, 'shuffle': True}),
+])
+CHUNK_BYTES = 256 * 1024
+
 class HDFDataset:
     def __init__(self):
         self.id = ""
@@ -47,13 +56,27 @@ class HDFDataset:
         # print("Dataset:", name)
         # print("Data:", self.data.dtype)
 
-    def write(self, f):
+    @staticmethod
+    def writeOptions(data, profile='none'):
+        ''' create_dataset keywords for data under a write profile (see WRITE_PROFILES). Chunks hold whole
+            records, about CHUNK_BYTES each; empty and scalar datasets are written unfiltered. '''
+        if profile not in WRITE_PROFILES:
+            raise ValueError(f'Unknown HDF5 write profile: {profile}')
+        filters = WRITE_PROFILES[profile]
+        if filters is None or data.ndim == 0 or data.size == 0:
+            return {}
+        recordBytes = max(1, data.dtype.itemsize * int(np.prod(data.shape[1:])))
+        rows = int(min(len(data), max(1, CHUNK_BYTES // recordBytes)))
+        return dict(filters, chunks=(rows,) + data.shape[1:])
+
+    def write(self, f, profile='none'):
         #print("id:", self.id)
         #print("columns:", self.columns)
         #print("data:", self.data)
 
         if self.data is not None:
-            dset = f.create_dataset(self.id, data=self.data, dtype=self.data.dtype)
+            dset = f.create_dataset(self.id, data=self.data, dtype=self.data.dtype,
+                                    **HDFDataset.writeOptions(np.asarray(self.data), profile))
             # f = f.create_group(self.id)
             # Write attributes
             for k in self.attributes:
@@ -74,15 +97,67 @@ class HDFDataset:
             self.columns[name].append(val)
         return self.columns[name]
 
-    def datasetToColumns(self):
-        ''' Converts numpy array into columns (stored as a dictionary) '''
+    def datasetToColumns(self, columnar=False):
+        ''' Converts numpy array into columns (stored as a dictionary)
+            columnar=True keeps each column as a numpy view into the structured array
+            (no copy, no per-element boxing). Use columnToList to materialize a list
+            only where list semantics (append, del) are actually needed. '''
         if self.data is None:
             print("Warning - datasetToColumns: data is empty")
             return
         self.columns = collections.OrderedDict()
         for k in self.data.dtype.names:
             #print("type",type(ltData.data[k]))
-            self.columns[k] = self.data[k].tolist()
+            if columnar:
+                self.columns[k] = self.data[k]
+            else:
+                self.columns[k] = self.data[k].tolist()
+
+    def columnToList(self, name):
+        ''' Lazily materialize a single (columnar) column as a Python list in place '''
+        col = self.columns.get(name)
+        if isinstance(col, np.ndarray):
+            col = col.tolist()
+            self.columns[name] = col
+        return col
+
+    def isColumnarView(self):
+        ''' True when every column is an untouched view of a field of self.data, in order '''
+        if self.data is None or self.data.dtype.names is None:
+            return False
+        if tuple(self.columns.keys()) != self.data.dtype.names:
+            return False
+        address = self.data.__array_interface__['data'][0]
+        for k, v in self.columns.items():
+            if not isinstance(v, np.ndarray) or v.shape != self.data.shape or v.dtype != self.data.dtype[k]:
+                return False
+            if v.strides != self.data.strides or \
+                    v.__array_interface__['data'][0] != address + self.data.dtype.fields[k][1]:
+                return False
+        return True
+
+    @staticmethod
+    def _arrayColumnDtype(name, col):
+        ''' dtype for an ndarray column, normalized to what the element-wise rules below give
+            the same column as a list (datasetToColumns() without columnar): integers become
+            float64, other numeric FLAG columns int, and float32 float64. Byte strings keep the
+            width of the array, where the list rules take the length of the first item.
+            Other kinds return None and use the element-wise rules. '''
+        kind = col.dtype.kind
+        if kind == 'b':
+            return bool
+        # Note: hdf4 only supports 32 bit int, convert to float64
+        if kind in 'iu':
+            return np.float64
+        if name.endswith('FLAG') and kind in 'fc':
+            return int
+        if kind == 'f':
+            return np.float64
+        if kind == 'c':
+            return np.complex128
+        if kind == 'S':
+            return col.dtype
+        return None
 
     def columnsToDataset(self):
         ''' Converts columns into numpy array '''
@@ -100,7 +175,14 @@ class HDFDataset:
             if sys.version_info[0] < 3:
                 name = name.encode('utf-8')
 
-            if self.id == "MESSAGE": # For SATMSG strings, buffer the data type for stings longer than the first one
+            arrayDtype = None
+            if isinstance(self.columns[name], np.ndarray):
+                arrayDtype = self._arrayColumnDtype(name, self.columns[name])
+
+            if arrayDtype is not None:
+                # Columnar path: dtype comes straight from the array, no per-element inspection
+                dtype.append((name, arrayDtype))
+            elif self.id == "MESSAGE": # For SATMSG strings, buffer the data type for stings longer than the first one
                 maxlength = 0
                 for item in self.columns[name]:
                     length = len(item)
@@ -126,7 +208,11 @@ class HDFDataset:
                 else:
                     dtype.append((name, type(item)))
 
-        shape = (len(list(self.columns.values())[0]), )
+        # Untouched columnar views of the current data need no rebuild (zero-copy)
+        if self.isColumnarView() and np.dtype(dtype) == self.data.dtype:
+            return True
+
+        shape = (len(next(iter(self.columns.values()))), )
         #print("Id:", self.id)
         #print("Dtype:", dtype)
         #print("Shape:", shape)
@@ -114,7 +114,7 @@ class HDFGroup:
                 self.datasets[k] = ds
                 ds.read(item)
 
-    def write(self, f):
+    def write(self, f, profile='none'):
         #print("Group:", self.id)
         try:
             f = f.create_group(self.id)
@@ -125,7 +125,7 @@ class HDFGroup:
             # Write datasets
             for key,ds in self.datasets.items():
                 #f.create_dataset(ds.id, data=np.asarray(ds.data))
-                ds.write(f)
+                ds.write(f, profile)
         except:
             e = sys.exc_info()[0]
             print(e)
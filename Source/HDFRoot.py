@@ -1,10 +1,11 @@
 
 import collections
+import io
 import h5py
 import numpy as np
 
 from Source.HDFGroup import HDFGroup
-from Source.HDFDataset import HDFDataset
+from Source.HDFDataset import HDFDataset, WRITE_PROFILES
 
 class HDFRoot:
     def __init__(self):
@@ -55,6 +56,72 @@ class HDFRoot:
         for gp in self.groups:
             gp.printd()
 
+    @staticmethod
+    def _snapshotAttributes(attributes):
+        ''' Attributes as they read back after being written with np.bytes_ '''
+        copied = collections.OrderedDict()
+        for k in sorted(attributes):
+            stored = np.bytes_(attributes[k])
+            if isinstance(stored, bytes):
+                copied[k] = stored.rstrip(b"\x00").decode("utf-8")
+            elif isinstance(stored, np.ndarray) and stored.dtype.kind == 'S' and stored.size > 0:
+                copied[k] = stored.copy()
+            else:
+                raise ValueError(f'Attribute {k} has no exact in-memory copy')
+        return copied
+
+    @staticmethod
+    def _snapshotDtype(dtype):
+        ''' True for packed, native dtypes that h5py reads back unchanged '''
+        if dtype.names is not None:
+            offset = 0
+            for name in dtype.names:
+                fieldType, fieldOffset = dtype.fields[name][:2]
+                if fieldOffset != offset or not HDFRoot._snapshotDtype(fieldType):
+                    return False
+                offset += fieldType.itemsize
+            return offset == dtype.itemsize
+        if dtype.subdtype is not None:
+            return HDFRoot._snapshotDtype(dtype.subdtype[0])
+        return dtype.kind in 'biufS' and dtype.isnative
+
+    def snapshot(self):
+        ''' Copy of this root as readHDF5 would return it after writeHDF5, without serializing it.
+            Content that may not survive the round trip unchanged is sent through an in-memory HDF5 file instead. '''
+        try:
+            root = HDFRoot()
+            root.id = "/"
+            root.attributes = HDFRoot._snapshotAttributes(self.attributes)
+            groups = {}
+            for gp in self.groups:
+                if gp.id in groups or not gp.id or '/' in gp.id:
+                    raise ValueError(f'Group {gp.id} has no exact in-memory copy')
+                newGP = HDFGroup()
+                newGP.id = gp.id
+                newGP.attributes = HDFRoot._snapshotAttributes(gp.attributes)
+                datasets = {}
+                for ds in gp.datasets.values():
+                    if ds.data is None:
+                        print("Dataset.write(): Data is None")
+                        continue
+                    if ds.id in datasets or not ds.id or '/' in ds.id or not isinstance(ds.data, np.ndarray) \
+                            or ds.data.ndim == 0 or not HDFRoot._snapshotDtype(ds.data.dtype):
+                        raise ValueError(f'Dataset {gp.id}/{ds.id} has no exact in-memory copy')
+                    newDS = HDFDataset()
+                    newDS.id = ds.id
+                    newDS.attributes = HDFRoot._snapshotAttributes(ds.attributes)
+                    newDS.data = np.array(ds.data, copy=True, order='C')
+                    datasets[ds.id] = newDS
+                for k in sorted(datasets):
+                    newGP.datasets[k] = datasets[k]
+                groups[gp.id] = newGP
+            root.groups = [groups[k] for k in sorted(groups)]
+        except (ValueError, UnicodeError):
+            buffer = io.BytesIO()
+            self.writeHDF5(buffer)
+            root = HDFRoot.readHDF5(buffer)
+        return root
+
     @staticmethod
     def readHDF5(fp):
         root = HDFRoot()
@@ -98,7 +165,11 @@ class HDFRoot:
         return root
 
     # Writing to HDF5 file
-    def writeHDF5(self, fp):
+    def writeHDF5(self, fp, profile='none'):
+        ''' Write to fp (a path or file-like object). profile selects the compression of every dataset:
+            'none', 'fast' (lossless, quick) or 'max' (smallest files); see HDFDataset.WRITE_PROFILES. '''
+        if profile not in WRITE_PROFILES:
+            raise ValueError(f'Unknown HDF5 write profile: {profile}')
         with h5py.File(fp, "w") as f:
             #print("Root:", self.id)
             # Write attributes
@@ -110,4 +181,4 @@ class HDFRoot:
                 #f.attrs[k+"__GLOSDS"] = np.string_(self.attributes[k])
             # Write groups
             for gp in self.groups:
-                gp.write(f)
+                gp.write(f, profile)
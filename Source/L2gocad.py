@@ -42,8 +42,7 @@ def L2gocad(Rrs443, Rrs488, Rrs531, Rrs547, SAL, fill=-9999):
         ag[:,n] = np.exp( beta[n,0] + beta[n,1]*np.log(Rrs443) + beta[n,2]* np.log(Rrs488) + \
             beta[n,3]*np.log(Rrs531) + beta[n,4]*np.log(Rrs547) )
 
-    for n in range(0, n_spectra):
-        ag[n, ag[n,:] > ag_lim] = fill
+    ag[ag > ag_lim] = fill
 
 
     # Sg
@@ -63,9 +62,8 @@ def L2gocad(Rrs443, Rrs488, Rrs531, Rrs547, SAL, fill=-9999):
             beta[n,3]*np.log(Rrs531) + beta[n,4]*np.log(Rrs547) )
 
     # Set Sg outside limits to thresholds
-    for n in range(0, n_spectra):
-        Sg[n, Sg[n,:] < sg_lim[:,0]] = sg_lim[Sg[n,:] < sg_lim[:,0],0]
-        Sg[n, Sg[n,:] > sg_lim[:,1]] = sg_lim[Sg[n,:] > sg_lim[:,1],1]
+    Sg = np.where(Sg < sg_lim[:,0], sg_lim[:,0], Sg)
+    Sg = np.where(Sg > sg_lim[:,1], sg_lim[:,1], Sg)
 
 
     # DOC (MLR2)
@@ -73,13 +71,8 @@ def L2gocad(Rrs443, Rrs488, Rrs531, Rrs547, SAL, fill=-9999):
     # # These are the 2nd and 98th percentiles of GOCAD 
     doc_lim = [47.2383,  223.7900]
 
-    doc = np.empty([n_spectra, ])
-    for n in range(0, n_spectra):
-        doc[n] = beta[0] + beta[1] * ag[n,2] + beta[2] * SAL[n]
-
-    for n in range(0, n_spectra):
-        if doc[n] < doc_lim[0] or doc[n] > doc_lim[1]:
-            doc[n] = fill
+    doc = beta[0] + beta[1] * ag[:,2] + beta[2] * np.asarray(SAL, dtype=float)
+    doc[(doc < doc_lim[0]) | (doc > doc_lim[1])] = fill
 
     return ag, Sg, doc
 
@@ -19,6 +19,29 @@ def L2qaa(Rrs412, Rrs443, Rrs488, Rrs555, Rrs667, RrsHyper, wavelength, SST, SAL
     Outputs:
     a, adg, aph, b, bb, bbp, c: (1D lists) hyperspectral inherent optical properties
 
+    Single spectrum wrapper of L2qaaBatch'''
+
+    result = L2qaaBatch([Rrs412], [Rrs443], [Rrs488], [Rrs555], [Rrs667], \
+        np.asarray(RrsHyper, dtype=float)[np.newaxis, :], wavelength, [SST], [SAL])
+    msg = result[-1]
+    for msg1 in msg:
+        print(msg1)
+    return tuple(iop[0] for iop in result[:-1]) + (msg,)
+
+
+def L2qaaBatch(Rrs412, Rrs443, Rrs488, Rrs555, Rrs667, RrsHyper, wavelength, SST, SAL):
+    ''' QAA_v6 as in L2qaa for many spectra at once
+
+    Inputs:
+      RrsXXX: (1D array) above water remote sensing reflectance at XXX nm, one per spectrum
+      RrsHyper: (2D numpy array) hyperspectral Rrs, one row per spectrum
+      wavelength: (1D array) columns of RrsHyper; will be truncated to Pope&Fry/Smith&Baker pure water
+      SST, SAL: (1D array) sea surface temperature and salinity, one per spectrum
+
+    Outputs:
+    a, adg, aph, b, bb, bbp, c: (2D arrays) hyperspectral inherent optical properties, one row per spectrum
+    msg: (list) one message per spectrum with Rrs(667) adjusted
+
     # eta: powerlaw slope of bbp
     # S: CDOM base slope'''
 
@@ -27,18 +50,18 @@ def L2qaa(Rrs412, Rrs443, Rrs488, Rrs555, Rrs667, RrsHyper, wavelength, SST, SAL
 
     # Maximum range based on P&F/S&B
     minMax = [380, 800]
-    if min(wavelength) < minMax[0] or max(wavelength) > minMax[1]:
-        waveTemp = []
-        RrsHyperTemp = []
-        for i, wl in enumerate(wavelength):
-            if wl >= minMax[0] and wl <= minMax[1]:
-                waveTemp.append(wl)
-                RrsHyperTemp.append(RrsHyper[i])
-        wavelength = np.array(waveTemp)
-        RrsHyper = np.array(RrsHyperTemp)
+    wavelength = np.asarray(wavelength, dtype=float)
+    RrsHyper = np.asarray(RrsHyper, dtype=float)
+    inRange = (wavelength >= minMax[0]) & (wavelength <= minMax[1])
+    wavelength = wavelength[inRange]
+    RrsHyper = RrsHyper[:, inRange]
 
     # Screen hyperspectral Rrs for zeros
-    RrsHyper[RrsHyper < 1e-5] = 1e-5
+    RrsHyper = np.where(RrsHyper < 1e-5, 1e-5, RrsHyper)
+
+    # One row per spectrum, to broadcast against wavelength
+    Rrs412, Rrs443, Rrs488, Rrs555, Rrs667 = \
+        [np.asarray(x, dtype=float).reshape(-1, 1) for x in (Rrs412, Rrs443, Rrs488, Rrs555, Rrs667)]
 
     # Step 1
     g0 = 0.08945
@@ -52,25 +75,18 @@ def L2qaa(Rrs412, Rrs443, Rrs488, Rrs555, Rrs667, RrsHyper, wavelength, SST, SAL
 
     # Pure seawater. Pope & Fry adjusted for S&T using Sullivan et al. 2006.
     #   (Now considering using inverted values from Lee et al. 2015...)
+    #   One pass over the table for the four bands and the hyperspectral grid.
     fp = os.path.join(PATH_TO_DATA, 'Water_Absorption.sb') # <--- Set path to P&F water
-    a_sw412, bb_sw412 = water_iops(fp, [412], SST, SAL)
-    a_sw443, bb_sw443 = water_iops(fp, [443], SST, SAL)
-    a_sw555, bb_sw555 = water_iops(fp, [555], SST, SAL)
-    a_sw667, bb_sw667 = water_iops(fp, [667], SST, SAL)
-    a_sw, bb_sw = water_iops(fp, wavelength, SST, SAL)
-
+    a_sw_all, bb_sw_all = water_iops(fp, np.concatenate(([412, 443, 555, 667], wavelength)), SST, SAL)
+    a_sw412, a_sw443, a_sw555, a_sw667 = [a_sw_all[:, [i]] for i in range(4)]
+    bb_sw412, bb_sw443, bb_sw555, bb_sw667 = [bb_sw_all[:, [i]] for i in range(4)]
+    a_sw, bb_sw = a_sw_all[:, 4:], bb_sw_all[:, 4:]
 
-    msg = []
     # Pretest on Rrs(670) from QAAv5
-    if Rrs667 > 20 * np.power(Rrs555, 1.5) or \
-        Rrs667 < 0.9 * np.power(Rrs555, 1.7):
-
-        msg1 = "L2qaa: Rrs(667) out of bounds, adjusting."
-        print(msg1)
-        msg.append(msg1)
-
-        Rrs667 = 1.27 * np.power(Rrs555, 1.47) + 0.00018 * np.power(Rrs488/Rrs555, -3.19)
-
+    outOfBounds = (Rrs667 > 20 * np.power(Rrs555, 1.5)) | \
+        (Rrs667 < 0.9 * np.power(Rrs555, 1.7))
+    msg = ["L2qaa: Rrs(667) out of bounds, adjusting."] * int(np.count_nonzero(outOfBounds))
+    Rrs667 = np.where(outOfBounds, 1.27 * np.power(Rrs555, 1.47) + 0.00018 * np.power(Rrs488/Rrs555, -3.19), Rrs667)
 
     # Step 0
     rrs =   RrsHyper / (0.52 + 1.7 * RrsHyper)
@@ -87,21 +103,18 @@ def L2qaa(Rrs412, Rrs443, Rrs488, Rrs555, Rrs667, RrsHyper, wavelength, SST, SAL
     u555 = (np.sqrt(g0*g0 + 4.0 * g1 * rrs555) - g0) / (2.0 * g1)
     u667 = (np.sqrt(g0*g0 + 4.0 * g1 * rrs667) - g0) / (2.0 * g1)
 
-    # Switch, Step 2
-    if Rrs667 < 0.0015:
+    # Switch, Step 2. Both branches are evaluated; each spectrum keeps its own.
+    with np.errstate(divide='ignore', invalid='ignore'):
         chi = np.log10( (rrs443 + rrs488) / (rrs555 + 5 * rrs667/rrs488 * rrs667) )
-        lamb0 = 555
         a555 = a_sw555 + np.power(10.0, (h0 + h1*chi + h2*chi*chi))
-
-        # Step 3
-        bbp0 = u555*a555 / (1 - u555) - bb_sw555
-
-    else:
-        lamb0 = 667
         a667 = np.power(a_sw667 + 0.39*( Rrs667 / (Rrs443 + Rrs488) ), 1.14)
 
         # Step 3
-        bbp0 = u667*a667 / (1 - u667) - bb_sw667
+        bbp0_555 = u555*a555 / (1 - u555) - bb_sw555
+        bbp0_667 = u667*a667 / (1 - u667) - bb_sw667
+    lowRed = Rrs667 < 0.0015
+    lamb0 = np.where(lowRed, 555, 667)
+    bbp0 = np.where(lowRed, bbp0_555, bbp0_667)
 
     # Step 4
     eta =  2*( 1 - 1.2 * np.exp( -0.9*rrs443/rrs555 ))
@@ -135,7 +148,3 @@ def L2qaa(Rrs412, Rrs443, Rrs488, Rrs555, Rrs667, RrsHyper, wavelength, SST, SAL
     c = a + b
 
     return a, adg, aph, b, bb, bbp, c, msg
-
-
-
-
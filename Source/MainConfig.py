@@ -6,12 +6,15 @@ import time
 import threading
 
 from Source import PATH_TO_CONFIG
+from Source.HDFDataset import WRITE_PROFILES
 # from Source.ConfigFile import ConfigFile
 
 class MainConfig:
     '''Class to hold Main window configurations'''
     fileName = "main.config"
     settings = collections.OrderedDict()
+    # Values accepted for the settings chosen from a list in the Main window
+    choices = {"pipelineMode": [0, 1, 2], "hdfWriteProfile": list(WRITE_PROFILES)}
 
     # Saves the cfg file
     @staticmethod
@@ -32,6 +35,7 @@ class MainConfig:
 
         # Load the default values first to insure all settings are present, then populate with saved values where possible
         MainConfig.createDefaultConfig(fileName,version)
+        defaults = dict(MainConfig.settings)
 
         configPath = os.path.join(PATH_TO_CONFIG, fileName)
         if os.path.isfile(configPath):
@@ -47,6 +51,12 @@ class MainConfig:
 
                     for key, value in fullCollection.items():
                         MainConfig.settings[key] = value
+
+        for key, choices in MainConfig.choices.items():
+            if MainConfig.settings[key] not in choices:
+                print(f'MainConfig loadConfig: {key} must be one of {choices}, not {MainConfig.settings[key]!r}. '
+                      f'Using {defaults[key]!r}.')
+                MainConfig.settings[key] = defaults[key]
         # else:
         #     MainConfig.createDefaultConfig(fileName, version)
 
@@ -64,3 +74,10 @@ class MainConfig:
         MainConfig.settings["ancFile"] = ""
         MainConfig.settings["popQuery"] = 0
         MainConfig.settings["deleteConfig"] = False
+        # Multi-level runs: 0 writes and re-reads each level's HDF file; 1 hands each level to the next in memory
+        #   and writes intermediate files in the background; 2 hands over in memory and writes only L2
+        MainConfig.settings["pipelineMode"] = 0
+        # Compression of the HDF files written: 'none', 'fast' (lossless, quick) or 'max' (smallest files)
+        MainConfig.settings["hdfWriteProfile"] = 'none'
+        # Directory for a memory-mapped store of the Z17 LUTs (~2.5 GB, written on first use); '' reads them into memory
+        MainConfig.settings["z17StoreDir"] = ''
@@ -20,6 +20,7 @@ from Source.Weight_RSR import Weight_RSR
 # PIU
 from Source.PIU.Uncertainty_Analysis import Propagate
 from Source.PIU.PIUDataStore import PIUDataStore
+from Source.PIU.UncertaintyContext import UncertaintyContext
 from Source.PIU.Breakdown_CB import PlotMaths
 from Source.PIU.Breakdown_FRM import SolveLPU
 from Source.PIU.MeasurementFunctions import MeasurementFunctions as mf
@@ -109,19 +110,9 @@ class BaseInstrument(ABC):  # Inheriting ABC allows for more function decorators
             # filter nans
             rawGrp = None
 
-            from os import path
-            from Source import PATH_TO_CONFIG
-            from Source.ConfigFile import ConfigFile
-            from Source.CalibrationFileReader import CalibrationFileReader
-            
             if ConfigFile.settings['SensorType'].lower() == "seabird":
                 gp = root.getGroup(f"{s_type}_LIGHT_L1AQC")
-                calPath = path.join(
-                    PATH_TO_CONFIG,
-                    f"{path.splitext(ConfigFile.filename)[0]}_Calibration"
-                )
-
-                cf = CalibrationFileReader.read(calPath)[gp.attributes['CalFileName']]
+                cf = PIUDataStore.read_calibration_map()[gp.attributes['CalFileName']]
                 cal_int_time = np.array(
                     [float(cd.coefficients[3]) if len(cd.coefficients) >= 4 else np.nan for cd in cf.data]
                 )
@@ -252,7 +243,7 @@ class BaseInstrument(ABC):  # Inheriting ABC allows for more function decorators
         """
 
         # create object for running uncertainty propagation, M means number of monte carlo draws
-        Prop_CB = Propagate(M=PDS.mDraws, cores=0)
+        Prop_CB = UncertaintyContext.propagator(M=PDS.mDraws, cores=0)
 
         # put cal_int and int_time into propagate object to save having to pass arguments through punpy
         Prop_CB.cal_int  = {sensor: PDS.coeff[sensor]['cal_int'] for sensor in stats.keys()}
@@ -309,8 +300,22 @@ class BaseInstrument(ABC):  # Inheriting ABC allows for more function decorators
             np.array( PDS.uncs['ES']['cos'][PDS.l1ACommonCalPix]),
         ]
 
-        # generate uncertainties using Monte Carlo Propagation object
-        es_unc, li_unc, lt_unc = Prop_CB.propagate_Instrument_Uncertainty(means, uncertainties)
+        # perturbation uncertainty
+        pert_uncs = np.zeros_like(np.asarray(uncertainties))
+        pert_uncs[0:6] = [
+            um.convertToAbsolute(stats['ES']["Signal_std"][PDS.l1ACommonCalPix], stats['ES']['ave_Light'][PDS.l1ACommonCalPix]),
+            zeroes,
+            um.convertToAbsolute(stats['LI']["Signal_std"][PDS.l1ACommonCalPix], stats['LI']['ave_Light'][PDS.l1ACommonCalPix]) if 'LI' in PDS.uncs else zeroes,
+            zeroes,
+            um.convertToAbsolute(stats['LT']["Signal_std"][PDS.l1ACommonCalPix], stats['LT']['ave_Light'][PDS.l1ACommonCalPix]) if 'LT' in PDS.uncs else zeroes,
+            zeroes
+        ]
+
+        # generate uncertainties using Monte Carlo Propagation object: the total, the class based breakdown (can set
+        #   to be cumulative spectral plots) and the perturbation are propagated in batches (see PlotMaths.propagateSets)
+        BD_UNCS = PlotMaths.classBased(Prop_CB, means, uncertainties, cul=False,
+                                       others={'pert': pert_uncs, 'total': uncertainties})
+        es_unc, li_unc, lt_unc = [BD_UNCS[sensor].pop('total') for sensor in ['ES', 'LI', 'LT']]
 
         # NOTE: Debugging check
         # is_negative = np.any([ x < 0 for x in means])
@@ -324,9 +329,6 @@ class BaseInstrument(ABC):  # Inheriting ABC allows for more function decorators
 
         es, li, lt = Prop_CB.instruments(*means)
 
-        # can set to be cumulative spectral plots
-        BD_UNCS = PlotMaths.classBased(Prop_CB, means, uncertainties, cul=False)
-
         # # check if negative signal for any pixels
         # is_negative = np.any([ x < 0 for x in means])
         # if is_negative:
@@ -344,22 +346,6 @@ class BaseInstrument(ABC):  # Inheriting ABC allows for more function decorators
             # LI_unc = li_unc / np.abs(li)
             # LT_unc = lt_unc / np.abs(lt)
 
-            # then propagate perturbation uncertainty
-            pert_uncs = np.zeros_like(np.asarray(uncertainties))
-            pert_uncs[0:6] = [
-                um.convertToAbsolute(stats['ES']["Signal_std"][PDS.l1ACommonCalPix], stats['ES']['ave_Light'][PDS.l1ACommonCalPix]),
-                zeroes,
-                um.convertToAbsolute(stats['LI']["Signal_std"][PDS.l1ACommonCalPix], stats['LI']['ave_Light'][PDS.l1ACommonCalPix]) if 'LI' in PDS.uncs else zeroes,
-                zeroes,
-                um.convertToAbsolute(stats['LT']["Signal_std"][PDS.l1ACommonCalPix], stats['LT']['ave_Light'][PDS.l1ACommonCalPix]) if 'LT' in PDS.uncs else zeroes,
-                zeroes
-            ]
-            (
-                BD_UNCS['ES']['pert'],
-                BD_UNCS['LI']['pert'],
-                BD_UNCS['LT']['pert'],
-            ) = Prop_CB.propagate_Instrument_Uncertainty(means, pert_uncs)
-
             BD_UNCS['ES'] = {k: um.convertToRelative(BD_UNCS['ES'][k], es) for k in BD_UNCS['ES']}  # convert all to relative units
             BD_UNCS['LI'] = {k: um.convertToRelative(BD_UNCS['LI'][k], li) for k in BD_UNCS['LI']}
             BD_UNCS['LT'] = {k: um.convertToRelative(BD_UNCS['LT'][k], lt) for k in BD_UNCS['LT']}
@@ -460,7 +446,7 @@ class BaseInstrument(ABC):  # Inheriting ABC allows for more function decorators
         """
 
         # create object for running uncertainty propagation, M means number of monte carlo draws
-        Prop_CB = Propagate(M=PDS.mDraws, cores=0)
+        Prop_CB = UncertaintyContext.propagator(M=PDS.mDraws, cores=0)
         # L2 bands to use as common pixels for all
         l2Wavelength = np.array(waveSubset, dtype=float)  # convert waveSubset to numpy array
 
@@ -566,7 +552,6 @@ class BaseInstrument(ABC):  # Inheriting ABC allows for more function decorators
             PDSL2['LIpol'],
             PDSL2['LIpol']
         ]
-        lwAbsUnc = Prop_CB.Propagate_Lw_HYPER(lw_means, lw_uncertainties)
 
         rrs_means = [
             statsL2['LTave_Light'], statsL2['LTave_Dark'],
@@ -606,14 +591,10 @@ class BaseInstrument(ABC):  # Inheriting ABC allows for more function decorators
             PDSL2['EScos']
         ]
 
-        # rrs_test = Prop_CB.RRS(*rrs_means)
-        rrsAbsUnc = Prop_CB.Propagate_RRS_HYPER(rrs_means, rrs_uncertainties)
-        BD_UNCS, BD_VALS = PlotMaths.classBasedL2(Prop_CB, lw_means, rrs_means, lw_uncertainties, rrs_uncertainties, cul=False)
-
-        # then propagate perturbation uncertainty
+        # perturbation uncertainty
         zeroes = np.zeros_like(ones)
-        pert_uncs = np.zeros_like(np.asarray(lw_uncertainties))
-        pert_uncs[0:5] = [
+        lw_pert_uncs = np.zeros_like(np.asarray(lw_uncertainties))
+        lw_pert_uncs[0:5] = [
             np.abs(statsL2['LTSignal_std']) * np.abs(statsL2['LTave_Light']) if 'LT' in PDS.uncs else zeroes,
             zeroes,
             zeroes,
@@ -621,10 +602,8 @@ class BaseInstrument(ABC):  # Inheriting ABC allows for more function decorators
             zeroes,
         ]
 
-        BD_UNCS['Lw']['pert'] = Prop_CB.Propagate_Lw_HYPER(lw_means, pert_uncs)
-
-        pert_uncs = np.zeros_like(np.asarray(rrs_uncertainties))
-        pert_uncs[0:7] = [
+        rrs_pert_uncs = np.zeros_like(np.asarray(rrs_uncertainties))
+        rrs_pert_uncs[0:7] = [
             np.abs(statsL2['LTSignal_std']) * np.abs(statsL2['LTave_Light']) if 'LT' in PDS.uncs else zeroes,
             np.zeros_like(ones),
             np.zeros_like(ones),
@@ -634,7 +613,13 @@ class BaseInstrument(ABC):  # Inheriting ABC allows for more function decorators
             np.zeros_like(ones),
         ]
 
-        BD_UNCS['Rrs']['pert'] = Prop_CB.Propagate_RRS_HYPER(rrs_means, pert_uncs)
+        # the total, the class based breakdown and the perturbation of each measurand are propagated in batches
+        # rrs_test = Prop_CB.RRS(*rrs_means)
+        BD_UNCS, BD_VALS = PlotMaths.classBasedL2(Prop_CB, lw_means, rrs_means, lw_uncertainties, rrs_uncertainties, cul=False,
+                                                  lw_others={'pert': lw_pert_uncs, 'total': lw_uncertainties},
+                                                  rrs_others={'pert': rrs_pert_uncs, 'total': rrs_uncertainties})
+        lwAbsUnc = BD_UNCS['Lw'].pop('total')
+        rrsAbsUnc = BD_UNCS['Rrs'].pop('total')
 
         # convert to relative in order to avoid a complex unit conversion process in ProcessL2.
         lw  = Prop_CB.Lw(*lw_means)
@@ -728,7 +713,7 @@ class BaseInstrument(ABC):  # Inheriting ABC allows for more function decorators
             if ConfigFile.settings[sensor_value['config']]:
                 sensor_name = sensor_value['name']
                 RSR_Bands = sensor_value['Weight_RSR']
-                prop_Band_CB = Propagate(M=100, cores=1)  # propagate band convolved uncertainties class based
+                prop_Band_CB = UncertaintyContext.propagator(M=100, cores=1)  # propagate band convolved uncertainties class based
                 esDeltaBand = prop_Band_CB.band_Conv_Uncertainty(
                     [np.asarray(list(xSlice['es'].values()), dtype=float).flatten(), waveSubset],
                     [esUNC_band, None],
@@ -813,7 +798,7 @@ class BaseInstrument(ABC):  # Inheriting ABC allows for more function decorators
 
         # initialise punpy propagation object
         mdraws = esSampleXSlice.shape[0]  # keep no. of monte carlo draws consistent
-        UNC_Obj_FRM = Propagate(mdraws, cores=1)  # punpy.MCPropagation(mdraws, parallel_cores=1)
+        UNC_Obj_FRM = UncertaintyContext.propagator(mdraws, cores=1)  # punpy.MCPropagation(mdraws, parallel_cores=1)
 
         # get sample for rho
         sample_rho = cm.generate_sample(mdraws, rho, rhoDelta, "syst")
@@ -887,7 +872,7 @@ class BaseInstrument(ABC):  # Inheriting ABC allows for more function decorators
 
         # initialise punpy propagation object
         mdraws = esSampleXSlice.shape[0]  # keep no. of monte carlo draws consistent
-        MCP_obj = Propagate(mdraws, cores=1)  # punpy.MCPropagation(mdraws, parallel_cores=1)
+        MCP_obj = UncertaintyContext.propagator(mdraws, cores=1)  # punpy.MCPropagation(mdraws, parallel_cores=1)
 
         sample_wavelengths = cm.generate_sample(mdraws, np.array(waveSubset), None, None)
 
@@ -898,8 +883,9 @@ class BaseInstrument(ABC):  # Inheriting ABC allows for more function decorators
             if ConfigFile.settings[self._SATELLITES[sensor_key]['config']]:
                 sensor_name = self._SATELLITES[sensor_key]['name']
                 RSR_Bands = self._SATELLITES[sensor_key]['Weight_RSR']
-                sample_es_conv = MCP_obj.MCP.run_samples(MCP_obj.def_sensor_mfunc(sensor_key),
-                                                         [esSample, sample_wavelengths])
+                sample_es_conv = MCP_obj.drop_failed_draws(
+                    MCP_obj.band_Conv(esSample, sample_wavelengths[0], sensor_key)
+                )
                 esDeltaBand = MCP_obj.MCP.process_samples(None, sample_es_conv)
                 # put in expected format (converted from punpy conpatible outputs) and put in output dictionary which will
                 # be returned to ProcessingL2 and used to update xSlice/xUNC
@@ -950,44 +936,29 @@ class BaseInstrument(ABC):  # Inheriting ABC allows for more function decorators
         if ConfigFile.settings[self._SATELLITES[sensor_key]['config']]:
             sensor_name = self._SATELLITES[sensor_key]['name']
             RSR_Bands = self._SATELLITES[sensor_key]['Weight_RSR']
-            prop_Band_CB = Propagate(M=100, cores=1)  # propagate band convolved uncertainties class based
+            prop_Band_CB = UncertaintyContext.propagator(M=100, cores=1)  # propagate band convolved uncertainties class based
             Band_Convolved_UNC = {}
-            esDeltaBand = prop_Band_CB.band_Conv_Uncertainty(
-                [np.asarray(list(xSlice['es'].values()), dtype=float).flatten(), waveSubset],
-                [esUNC, None],
-                sensor_key  # used to choose correct band convolution measurement function in uncertainty_analysis.py
+            # Es, Li, Lt and rho share the band convolution measurement function, so are propagated as one batch
+            esDeltaBand, liDeltaBand, ltDeltaBand, rhoDeltaBand = prop_Band_CB.propagate_batch(
+                prop_Band_CB.def_sensor_mfunc(sensor_key),  # sensor_key matches the keys in def_sensor_mfunc
+                [np.stack([np.asarray(list(xSlice['es'].values()), dtype=float).flatten(),
+                           np.asarray(list(xSlice['li'].values()), dtype=float).flatten(),
+                           np.asarray(list(xSlice['lt'].values()), dtype=float).flatten(),
+                           np.asarray(rho, dtype=float)]),
+                 waveSubset],
+                [np.stack([esUNC, liUNC, ltUNC, rhoUNC]), None],
+                ['syst', None]
             )
-            # band_Conv_Uncertainty uses def_sensor_mfunc(sensor_key) to select the correct measurement function
-            # per satellite. sensor_key refers to the keys of the _SATELLITE dict which were chosen to match the keys
-            # in def_sensor_mfunc.
 
             Band_Convolved_UNC[f"esUNC_{sensor_name}"] = {
                 str(k): [val] for k, val in zip(RSR_Bands, esDeltaBand)
             }
-
-            liDeltaBand = prop_Band_CB.band_Conv_Uncertainty(
-                [np.asarray(list(xSlice['li'].values()), dtype=float).flatten(), waveSubset],
-                [liUNC, None],
-                sensor_key
-            )
             Band_Convolved_UNC[f"liUNC_{sensor_name}"] = {
                 str(k): [val] for k, val in zip(RSR_Bands, liDeltaBand)
             }
-
-            ltDeltaBand = prop_Band_CB.band_Conv_Uncertainty(
-                [np.asarray(list(xSlice['lt'].values()), dtype=float).flatten(), waveSubset],
-                [ltUNC, None],
-                sensor_key
-            )
             Band_Convolved_UNC[f"ltUNC_{sensor_name}"] = {
                 str(k): [val] for k, val in zip(RSR_Bands, ltDeltaBand)
             }
-
-            rhoDeltaBand = prop_Band_CB.band_Conv_Uncertainty(
-                [rho, waveSubset],
-                [rhoUNC, None],
-                sensor_key
-            )
             Band_Convolved_UNC[f"rhoUNC_{sensor_name}"] = {
                 str(k): [val] for k, val in zip(RSR_Bands, rhoDeltaBand)
             }
@@ -1030,12 +1001,13 @@ class BaseInstrument(ABC):  # Inheriting ABC allows for more function decorators
             RSR_Bands = self._SATELLITES[sensor_key]['Weight_RSR']
             Band_Convolved_UNC = {}
 
-            sample_es_conv = MCP_obj.MCP.run_samples(MCP_obj.def_sensor_mfunc(sensor_key), [esSample, sample_wavelengths])
-            sample_li_conv = MCP_obj.MCP.run_samples(MCP_obj.def_sensor_mfunc(sensor_key), [liSample, sample_wavelengths])
-            sample_lt_conv = MCP_obj.MCP.run_samples(MCP_obj.def_sensor_mfunc(sensor_key), [ltSample, sample_wavelengths])
-
-            sample_rho_conv = MCP_obj.MCP.run_samples(MCP_obj.def_sensor_mfunc(sensor_key), [rhoSample, sample_wavelengths])
-            sample_f0_conv  = MCP_obj.MCP.run_samples(MCP_obj.def_sensor_mfunc(sensor_key), [f0_sample, sample_wavelengths])
+            # convolve all draws of all five samples at once (wavelengths carry no uncertainty)
+            sample_conv = MCP_obj.band_Conv(
+                np.stack([esSample, liSample, ltSample, rhoSample, f0_sample], axis=1), sample_wavelengths[0], sensor_key
+            )
+            sample_es_conv, sample_li_conv, sample_lt_conv, sample_rho_conv, sample_f0_conv = [
+                MCP_obj.drop_failed_draws(sample_conv[:, i]) for i in range(sample_conv.shape[1])
+            ]
 
             esDeltaBand = MCP_obj.MCP.process_samples(None, sample_es_conv)
             liDeltaBand = MCP_obj.MCP.process_samples(None, sample_li_conv)
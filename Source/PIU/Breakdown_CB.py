@@ -495,8 +495,29 @@ class PlotMaths:
         pass
 
     @staticmethod
-    def classBased(prop: MCPropagation, vals: list, uncs: list, cul: bool = False):
-        """ """
+    def propagateSets(propagate, vals: list, sets: list, keys: list, others: dict = None) -> dict:
+        """ propagate the uncertainty set of each class (named by keys) as one batch, and the named uncertainty sets
+        in others (e.g. the total or the perturbation) as another. If the classes fail with the correlation between
+        inputs, each is propagated on its own and only those that fail again are propagated without it """
+        try:
+            results = propagate(vals, sets)
+        except ValueError:
+            results = []
+            for key, unc in zip(keys, sets):
+                try:
+                    results.extend(propagate(vals, [unc]))
+                except ValueError as err:
+                    writeLogFileAndPrint(f"Error in Class Based Breakdown - {key}: {err}")
+                    results.extend(propagate(vals, [unc], corr_between=False))
+        results = dict(zip(keys, results))
+        if others:
+            results.update(zip(others, propagate(vals, list(others.values()))))
+        return results
+
+    @staticmethod
+    def classBased(prop: MCPropagation, vals: list, uncs: list, cul: bool = False, others: dict = None):
+        """ Es, Li and Lt uncertainty of each class, and of the named uncertainty sets in others (e.g. the total or
+        the perturbation), the classes propagated in one batch and others in another (see propagateSets) """
         keys = dict(
             ES=["noise", "radcal", "stab", "clin", "cSL", "ct", "cosine"],
             LI=["noise", "radcal", "stab", "clin", "cSL", "ct", "pol"],
@@ -504,6 +525,7 @@ class PlotMaths:
         )
         UNCS = {"ES": {}, "LI": {}, "LT": {}}
         p_uncs = np.zeros_like(np.asarray(uncs))
+        sets = []
 
         # Add uncertainty elements incrementally. Indexes refer to elements listed in keys above, as they appear in vals and uncs
         for indx, i in enumerate([0, 6, 9, 12, 15, 18, 21]):  # len(uncs) = 21
@@ -511,28 +533,16 @@ class PlotMaths:
                 p_uncs[0:6] = uncs[0:6]
             else:
                 p_uncs[i : i + 3] = uncs[i : i + 3]
-            try:
-                (
-                    UNCS["ES"][keys["ES"][indx]],
-                    UNCS["LI"][keys["LI"][indx]],
-                    UNCS["LT"][keys["LT"][indx]],
-                ) = prop.propagate_Instrument_Uncertainty(vals, p_uncs)
-            except ValueError as err:
-                # from Source.utils.loggingHCP import writeLogFileAndPrint
-                writeLogFileAndPrint(
-                    f"Error in Class Based Breakdown - {keys['ES'][indx]}: {err}"
-                )
-                (
-                    UNCS["ES"][keys["ES"][indx]],
-                    UNCS["LI"][keys["LI"][indx]],
-                    UNCS["LT"][keys["LT"][indx]],
-                ) = prop.propagate_Instrument_Uncertainty(
-                    vals, p_uncs, corr_between=False
-                )
+            sets.append(p_uncs.copy())
 
             if not cul:
                 p_uncs = np.zeros_like(np.asarray(uncs))  # reset uncertaitnies
 
+        results = PlotMaths.propagateSets(prop.propagate_Instrument_Uncertainty_Batch, vals, sets, keys["ES"], others)
+        names = list(zip(keys["ES"], keys["LI"], keys["LT"])) + [(k, k, k) for k in others or {}]
+        for (es_key, li_key, lt_key), (es_unc, li_unc, lt_unc) in zip(names, results.values()):
+            UNCS["ES"][es_key], UNCS["LI"][li_key], UNCS["LT"][lt_key] = es_unc, li_unc, lt_unc
+
         return UNCS
 
     @staticmethod
@@ -543,8 +553,11 @@ class PlotMaths:
         lw_uncs: list,
         rrs_uncs: list,
         cul: bool = False,
+        lw_others: dict = None,
+        rrs_others: dict = None,
     ):
-        # generate class based uncertaitnies from 0 and adding each contribution in turn
+        # generate class based uncertaitnies from 0 and adding each contribution in turn. Each measurand propagates its
+        #   classes in one batch, and the named uncertainty sets in lw_others/rrs_others in another
         UNCS = {"Lw": {}, "Rrs": {}}
         VALS = {}
 
@@ -552,6 +565,7 @@ class PlotMaths:
         keys_lw = ["noise", "radcal", "stab", "clin", "cSL", "ct", "pol", "rho"]
         VALS["Lw"] = prop.Lw(*lw_vals)
         uLw = np.zeros_like(np.asarray(lw_uncs))
+        sets = []
         # indexes for if we do light - dark in L2
         for indx, i in enumerate([0, 5, 7, 9, 11, 13, 15, 2]):
         # for indx, i in enumerate([0, 3, 5, 7, 9, 11, 13, 2]):
@@ -562,22 +576,17 @@ class PlotMaths:
                 uLw[2] = lw_uncs[2]  # add rho
             else:
                 uLw[i : i + 2] = lw_uncs[i : i + 2]
+            sets.append(uLw.copy())
 
-            try:
-                UNCS["Lw"][keys_lw[indx]] = prop.Propagate_Lw_HYPER(lw_vals, uLw)
-            except ValueError as err:
-                writeLogFileAndPrint(
-                    f"Error in Class Based Breakdown - {keys_lw[indx]}: {err}"
-                )
-                UNCS["Lw"][keys_lw[indx]] = prop.Propagate_Lw_HYPER(
-                    lw_vals, uLw, corr_between=False
-                )
             if not cul:
                 uLw = np.zeros_like(np.asarray(lw_uncs))  # reset uncertaitnies
 
+        UNCS["Lw"] = PlotMaths.propagateSets(prop.Propagate_Lw_HYPER_Batch, lw_vals, sets, keys_lw, lw_others)
+
         # Get RRS uncertainty contributions
         keys_rrs = ["noise", "radcal", "stab", "clin", "cSL", "ct", "pol", "cosine", "rho"]
         uRrs = np.zeros_like(np.asarray(rrs_uncs))
+        sets = []
         VALS["Rrs"] = prop.RRS(*rrs_vals)  # get values to make uncs relative
         # for indx, i in enumerate([0, 7, 10, 13, 16, 19, 21, 24, 2]):
         for indx, i in enumerate([0, 7, 10, 13, 16, 19, 21, 24, 2]):
@@ -590,17 +599,13 @@ class PlotMaths:
                 uRrs[i] = rrs_uncs[i]
             else:
                 uRrs[i : i + 3] = rrs_uncs[i : i + 3]
+            sets.append(uRrs.copy())
 
-            try:
-                UNCS["Rrs"][keys_rrs[indx]] = prop.Propagate_RRS_HYPER(rrs_vals, uRrs)
-            except ValueError as err:
-                writeLogFileAndPrint(f"Error in Class Based Breakdown - {keys_rrs[indx]}: {err}")
-                UNCS["Rrs"][keys_rrs[indx]] = prop.Propagate_RRS_HYPER(
-                    rrs_vals, uRrs, corr_between=False
-                )
             if not cul:
                 uRrs = np.zeros_like(np.asarray(rrs_uncs))  # reset uncertaitnies
 
+        UNCS["Rrs"] = PlotMaths.propagateSets(prop.Propagate_RRS_HYPER_Batch, rrs_vals, sets, keys_rrs, rrs_others)
+
         # screen negative values (they can result in negative relative uncertainties)
         for meas in ["Lw", "Rrs"]:
             for i, val in enumerate(VALS[meas]):
@@ -10,7 +10,6 @@ from collections import OrderedDict
 
 # maths
 import numpy as np
-import punpy
 import comet_maths as cm
 
 # Source
@@ -20,6 +19,7 @@ from Source.ProcessL1b_FRMCal import ProcessL1b_FRMCal
 from Source.ConfigFile import ConfigFile
 from Source.PIU.BaseInstrument import BaseInstrument
 from Source.PIU.PIUDataStore import PIUDataStore as pds
+from Source.PIU.UncertaintyContext import UncertaintyContext
 from Source.PIU.MeasurementFunctions import MeasurementFunctions as mf
 from Source.PIU.Breakdown_FRM import SolveLPU
 
@@ -135,7 +135,7 @@ class HyperOCR(BaseInstrument):
 
             # set up uncertainty propagation
             mDraws = 100  # number of monte carlo draws
-            prop = punpy.MCPropagation(mDraws, parallel_cores=1)  # TODO make parallel cores 0
+            prop = UncertaintyContext.propagator(mDraws, cores=1).MCP  # shared by every ensemble of the run
 
             LPU = SolveLPU(prop)
             DATA = PDS.coeff[s_type]  # retrieve dictionaries for speed
@@ -21,6 +21,7 @@ from Source.HDFDataset import HDFDataset
 
 # PIU
 from Source.PIU.utils import utils
+from Source.PIU.UncertaintyContext import UncertaintyContext
 
 # Utilities
 from Source.utils.loggingHCP import writeLogFileAndPrint
@@ -102,12 +103,7 @@ class PIUDataStore:
             if ConfigFile.settings['SensorType'].lower() == "seabird":
                 gp = root.getGroup(f"{s}_LIGHT_L1AQC")
 
-                calPath = path.join(
-                    PATH_TO_CONFIG,
-                    f"{path.splitext(ConfigFile.filename)[0]}_Calibration"
-                )
-
-                cf = CalibrationFileReader.read(calPath)[gp.attributes['CalFileName']]
+                cf = self.read_calibration_map()[gp.attributes['CalFileName']]
                 cal_int_time = np.array(
                     [float(cd.coefficients[3]) if len(cd.coefficients) >= 4 else np.nan for cd in cf.data]
                 )
@@ -287,75 +283,12 @@ class PIUDataStore:
         self.uncs[s_type]['stab'] = np.ones_like(self.coeff[s_type]['ind_nocal']) * stab_unc # 1% stability uncertainty estimate for class based
 
         if s_type.upper() == "ES":
-            raw_zen = uncGrp.getDataset(s_type + "_ANGDATA_COSERROR").attributes["COLUMN_NAMES"].split('\t')[2:]
-            zenith_ang = np.asarray([float(x) for x in raw_zen])
-
-            self.coeff[s_type]['cos'] = np.asarray(pd.DataFrame(uncGrp.getDataset(s_type+"_ANGDATA_COSERROR").data))[1:, 2:]
-            self.uncs[s_type]['cos'] = (np.asarray(pd.DataFrame(uncGrp.getDataset(s_type + "_ANGDATA_UNCERTAINTY").data))[1:, 2:] / 100) * np.abs(self.coeff[s_type]['cos'])
-            self.coeff[s_type]['cos_90'] = np.asarray(pd.DataFrame(uncGrp.getDataset(s_type+"_ANGDATA_COSERROR_AZ90").data))[1:, 2:]
-            self.uncs[s_type]['cos_90'] = (np.asarray(pd.DataFrame(uncGrp.getDataset(s_type + "_ANGDATA_UNCERTAINTY_AZ90").data))[1:, 2:] / 100) * np.abs(self.coeff[s_type]['cos_90'])
-
-            # get indexes for first and last radiometric calibration wavelengths in range [300-1000]
-            i1 = np.argmin(np.abs(radcal_wvl - 300))
-            i2 = np.argmin(np.abs(radcal_wvl - 1000))
-
-            # comparing cos_error for 2 azimuth to check for asymmetry (ideally would be 0)
-            azi_avg_coserr = (self.coeff[s_type]['cos'] + self.coeff[s_type]['cos_90']) / 2.
-            # each value has 4 numbers azi = 0, azi = 90, -zen, +zen which need their TU uncertainties combining
-            total_coserror_err = np.sqrt(
-                self.uncs[s_type]['cos']**2 +
-                self.uncs[s_type]['cos_90']**2 # +  # i think this is double counting
-                # self.uncs[s_type]['cos'][:, ::-1]**2 +
-                # self.uncs[s_type]['cos_90'][:, ::-1]**2
+            # The cosine response only depends on the characterisation, so is shared by all ensembles
+            coeff, uncs = UncertaintyContext.get(
+                ('cosineResponse', s_type), lambda: self.readCosineResponse(uncGrp, s_type, radcal_wvl), uncGrp
             )
-
-            # comparing cos_error for symetric zenith (ideally would be 0)
-            zen_avg_coserr = (azi_avg_coserr + azi_avg_coserr[:, ::-1]) / 2.
-
-            # get total error due to asymmetry  todo: find a smart way to do this without for loops
-            tot_asymmetry_err = np.zeros(self.coeff[s_type]['cos'].shape, float)
-            for i in range(255):
-                for j in range(45):
-                    tot_asymmetry_err[i, j] = np.std(
-                        [self.coeff[s_type]['cos'][i, j], self.coeff[s_type]['cos_90'][i, j],
-                            self.coeff[s_type]['cos'][i, -j], self.coeff[s_type]['cos_90'][i, -j]]
-                    )  # get std across the 4 measurements azi_0, azi_90, zen, -zen
-
-            zen_unc = np.sqrt(total_coserror_err**2 + tot_asymmetry_err**2)
-
-            # cut indexes that are out of range
-            zen_avg_coserr[0:i1, :] = 0
-            zen_avg_coserr[i2:, :] = 0
-            zen_unc[0:i1, :] = 0
-            zen_unc[i2:, :] = 0
-
-            # Compute full hemisperical coserror
-            zen0 = np.argmin(np.abs(zenith_ang))
-            zen90 = np.argmin(np.abs(zenith_ang - 90))
-            deltaZen = zenith_ang[1::] - zenith_ang[:-1]
-            full_hemi_coserror = np.zeros(zen_avg_coserr.shape[0])
-            sensitivity_coeff = np.zeros(zen_avg_coserr.shape[0])
-            zen_unc_sum = np.zeros(zen_avg_coserr.shape[0])
-            for i in range(zen_avg_coserr.shape[0]):
-                full_hemi_coserror[i] = np.sum(
-                    zen_avg_coserr[i, zen0:zen90] *
-                    np.sin(2 * np.pi * zenith_ang[zen0:zen90] / 180) * deltaZen[zen0:zen90] * np.pi / 180
-                )
-                # calculate the sensitivity coefficient from the LPU
-                sensitivity_coeff[i] = np.sum(
-                    np.cos(2 * np.pi * zenith_ang[zen0:zen90] / 180) * deltaZen[zen0:zen90] * np.pi / 180
-                )  # sin(x) differentiates to cos(x)
-
-                zen_unc_sum[i] = np.sum(zen_unc[i, zen0:zen90])
-
-            # get full hemispherical uncertainty using the LPU
-            self.coeff[s_type]['fhemi'] = full_hemi_coserror
-            self.uncs[s_type]['fhemi']  = np.sqrt(sensitivity_coeff**2 * zen_unc_sum**2)
-
-            # save coeffs to self for access by FRM processing
-            self.coeff[s_type]['zenith_ang'] =     zenith_ang
-            self.uncs[s_type]['zenith_ang'] =      zen_unc
-            self.coeff[s_type]['zen_avg_coserr'] = zen_avg_coserr
+            self.coeff[s_type].update({k: v.copy() for k, v in coeff.items()})
+            self.uncs[s_type].update({k: v.copy() for k, v in uncs.items()})
 
             res_sixS = self.read_sixS_model(root)
             self.coeff[s_type]['solar_zenith'] =  np.mean(res_sixS['solar_zenith'], axis=0)
@@ -390,6 +323,77 @@ class PIUDataStore:
         self.ind_rad_wvl[s_type] = ind_rad_wvl
         self.wvl[s_type] = np.array(radcal.columns['1'])
 
+    @staticmethod
+    def readCosineResponse(uncGrp: HDFGroup, s: str, radcal_wvl: np.array) -> tuple[dict, dict]:
+        """ cosine error coefficients and uncertainties of the irradiance sensor, including the full hemispherical
+            cosine error, from the FRM characterisation """
+        coeff, uncs = {}, {}
+        raw_zen = uncGrp.getDataset(s + "_ANGDATA_COSERROR").attributes["COLUMN_NAMES"].split('\t')[2:]
+        zenith_ang = np.asarray([float(x) for x in raw_zen])
+
+        coeff['cos'] = np.asarray(pd.DataFrame(uncGrp.getDataset(s+"_ANGDATA_COSERROR").data))[1:, 2:]
+        uncs['cos'] = (np.asarray(pd.DataFrame(uncGrp.getDataset(s + "_ANGDATA_UNCERTAINTY").data))[1:, 2:] / 100) * np.abs(coeff['cos'])
+        coeff['cos_90'] = np.asarray(pd.DataFrame(uncGrp.getDataset(s+"_ANGDATA_COSERROR_AZ90").data))[1:, 2:]
+        uncs['cos_90'] = (np.asarray(pd.DataFrame(uncGrp.getDataset(s + "_ANGDATA_UNCERTAINTY_AZ90").data))[1:, 2:] / 100) * np.abs(coeff['cos_90'])
+
+        # get indexes for first and last radiometric calibration wavelengths in range [300-1000]
+        i1 = np.argmin(np.abs(radcal_wvl - 300))
+        i2 = np.argmin(np.abs(radcal_wvl - 1000))
+
+        # comparing cos_error for 2 azimuth to check for asymmetry (ideally would be 0)
+        azi_avg_coserr = (coeff['cos'] + coeff['cos_90']) / 2.
+        # each value has 4 numbers azi = 0, azi = 90, -zen, +zen which need their TU uncertainties combining
+        total_coserror_err = np.sqrt(
+            uncs['cos']**2 +
+            uncs['cos_90']**2 # +  # i think this is double counting
+            # uncs['cos'][:, ::-1]**2 +
+            # uncs['cos_90'][:, ::-1]**2
+        )
+
+        # comparing cos_error for symetric zenith (ideally would be 0)
+        zen_avg_coserr = (azi_avg_coserr + azi_avg_coserr[:, ::-1]) / 2.
+
+        # get total error due to asymmetry: std across the 4 measurements azi_0, azi_90, zen, -zen
+        tot_asymmetry_err = utils.cos_asymmetry_err(coeff['cos'], coeff['cos_90'])
+
+        zen_unc = np.sqrt(total_coserror_err**2 + tot_asymmetry_err**2)
+
+        # cut indexes that are out of range
+        zen_avg_coserr[0:i1, :] = 0
+        zen_avg_coserr[i2:, :] = 0
+        zen_unc[0:i1, :] = 0
+        zen_unc[i2:, :] = 0
+
+        # Compute full hemisperical coserror
+        zen0 = np.argmin(np.abs(zenith_ang))
+        zen90 = np.argmin(np.abs(zenith_ang - 90))
+        deltaZen = zenith_ang[1::] - zenith_ang[:-1]
+        full_hemi_coserror = np.zeros(zen_avg_coserr.shape[0])
+        sensitivity_coeff = np.zeros(zen_avg_coserr.shape[0])
+        zen_unc_sum = np.zeros(zen_avg_coserr.shape[0])
+        for i in range(zen_avg_coserr.shape[0]):
+            full_hemi_coserror[i] = np.sum(
+                zen_avg_coserr[i, zen0:zen90] *
+                np.sin(2 * np.pi * zenith_ang[zen0:zen90] / 180) * deltaZen[zen0:zen90] * np.pi / 180
+            )
+            # calculate the sensitivity coefficient from the LPU
+            sensitivity_coeff[i] = np.sum(
+                np.cos(2 * np.pi * zenith_ang[zen0:zen90] / 180) * deltaZen[zen0:zen90] * np.pi / 180
+            )  # sin(x) differentiates to cos(x)
+
+            zen_unc_sum[i] = np.sum(zen_unc[i, zen0:zen90])
+
+        # get full hemispherical uncertainty using the LPU
+        coeff['fhemi'] = full_hemi_coserror
+        uncs['fhemi']  = np.sqrt(sensitivity_coeff**2 * zen_unc_sum**2)
+
+        # save coeffs for access by FRM processing
+        coeff['zenith_ang'] =     zenith_ang
+        uncs['zenith_ang'] =      zen_unc
+        coeff['zen_avg_coserr'] = zen_avg_coserr
+
+        return coeff, uncs
+
     def readHyperCal(self, grp, uncGrp, raw_slices, s_type):
         radcal_raw = self.read_cal(uncGrp, s_type, '_RADCAL_CAL', '2', return_df=True)
         self.coeff[s_type]['light'] = np.asarray(list(raw_slices[s_type]['LIGHT']['data'].values())).transpose()
@@ -610,6 +614,12 @@ class PIUDataStore:
             msg = "cannot mask straylight"
             print(msg)  # to cover for potential coding errors, should not be hit in normal use
 
+    @staticmethod
+    def read_calibration_map() -> OrderedDict:
+        """ calibrationMap of the configured calibration files, read once per L2 run """
+        calPath = path.join(PATH_TO_CONFIG, f"{path.splitext(ConfigFile.filename)[0]}_Calibration")
+        return UncertaintyContext.get(('calibrationMap', calPath), lambda: CalibrationFileReader.read(calPath))
+
     @staticmethod
     def extract_factory_cal(node: HDFGroup, radcal: np.array, s: str) -> tuple[np.array, np.array]:
         """
@@ -622,9 +632,7 @@ class PIUDataStore:
         """
 
         cal = np.asarray(list(radcal.columns['unc']))
-        calFolder = path.splitext(ConfigFile.filename)[0] + "_Calibration"
-        calPath = path.join(PATH_TO_CONFIG, calFolder)
-        calibrationMap = CalibrationFileReader.read(calPath)
+        calibrationMap = PIUDataStore.read_calibration_map()
 
         if ConfigFile.settings['SensorType'].lower() == "dalec":
             _, coef = ProcessL1b_FactoryCal.extract_calibration_coeff_dalec(calibrationMap, s)
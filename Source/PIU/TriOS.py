@@ -5,7 +5,6 @@ from typing import Union
 # maths
 import pandas as pd
 import numpy as np
-import punpy
 import comet_maths as cm
 
 # Source files
@@ -18,6 +17,7 @@ from Source.PIU.Breakdown_FRM import SolveLPU
 from Source.PIU.BaseInstrument import BaseInstrument
 from Source.PIU.MeasurementFunctions import MeasurementFunctions as mf
 from Source.PIU.PIUDataStore import PIUDataStore as pds
+from Source.PIU.UncertaintyContext import UncertaintyContext
 
 # UTILITIES
 from Source.utils.loggingHCP import writeLogFileAndPrint
@@ -142,7 +142,7 @@ class TriOS(BaseInstrument):
 
             # set up uncertainty propagation
             mDraws = 100  # number of monte carlo draws
-            prop = punpy.MCPropagation(mDraws, parallel_cores=1)
+            prop = UncertaintyContext.propagator(mDraws, cores=1).MCP  # shared by every ensemble of the run
             LPU = SolveLPU(prop)
             DATA = PDS.coeff[s_type]  # retrieve dictionaries for speed
             UNC = PDS.uncs[s_type]
@@ -0,0 +1,103 @@
+''' Ensemble-invariant uncertainty inputs shared by all ensembles of an L2 run '''
+import time
+
+from Source.PIU.Uncertainty_Analysis import Propagate
+
+# Utilities
+from Source.utils.loggingHCP import writeLogFileAndPrint
+
+
+class UncertaintyContext:
+    """
+    Holds the inputs of the uncertainty propagation that do not change from one ensemble to the next (calibration
+    maps, the cosine response of the irradiance sensor, Propagate objects) so they are built once per L2 file.
+
+    ProcessL2 opens a context before its ensembles and closes it after them. Outside an open context every request
+    is built afresh, as before. Entries are dropped when an input derived from another uncertainty group is requested.
+    Callers share entries with every later ensemble: copy arrays before modifying them.
+    """
+    active: bool = False
+    source = None  # RAW_UNCERTAINTIES group the entries were derived from
+    entries: dict = {}
+    counts: dict = {}  # {kind: {'built': n, 'reused': n, 'seconds': time spent building}}
+
+    @staticmethod
+    def begin() -> None:
+        """ Open an empty context with zeroed counters """
+        UncertaintyContext.active = True
+        UncertaintyContext.source = None
+        UncertaintyContext.entries = {}
+        UncertaintyContext.counts = {}
+
+    @staticmethod
+    def end() -> dict:
+        """ Close the context, log how much setup was skipped and return the counters (see stats) """
+        result = UncertaintyContext.stats()
+        total = result['total']
+        if total['reused']:
+            writeLogFileAndPrint(f"Uncertainty setup reused {total['reused']} times across ensembles "
+                                 f"({total['built']} built, ~{total['seconds']:.1f} s skipped).")
+        UncertaintyContext.active = False
+        UncertaintyContext.source = None
+        UncertaintyContext.entries = {}
+        return result
+
+    @staticmethod
+    def collect() -> dict:
+        """ Return the counters and zero them, keeping the entries. Pool workers hand their counters to the parent
+        process this way after each task, and the parent adds them to its own context (see merge) before end. """
+        counts = UncertaintyContext.counts
+        UncertaintyContext.counts = {}
+        return counts
+
+    @staticmethod
+    def merge(counts: dict) -> None:
+        """ Add counters returned by collect to those of this context """
+        for kind, count in counts.items():
+            total = UncertaintyContext.counts.setdefault(kind, {'built': 0, 'reused': 0, 'seconds': 0.0})
+            for k, v in count.items():
+                total[k] += v
+
+    @staticmethod
+    def get(key: tuple, build, source=None):
+        """
+        Return the entry registered under key, calling build() to make it on the first request.
+
+        :param key: tuple whose first element names the kind of entry, e.g. ('calibrationMap', calPath)
+        :param build: function of no arguments returning the entry
+        :param source: uncertainty group the entry is derived from, if any
+        """
+        if not UncertaintyContext.active:
+            return build()
+
+        if source is not None and source is not UncertaintyContext.source:
+            if UncertaintyContext.source is not None:
+                UncertaintyContext.entries.clear()
+            UncertaintyContext.source = source
+
+        count = UncertaintyContext.counts.setdefault(key[0], {'built': 0, 'reused': 0, 'seconds': 0.0})
+        if key in UncertaintyContext.entries:
+            count['reused'] += 1
+            return UncertaintyContext.entries[key]
+
+        tic = time.perf_counter()
+        entry = build()
+        count['built'] += 1
+        count['seconds'] += time.perf_counter() - tic
+        UncertaintyContext.entries[key] = entry
+        return entry
+
+    @staticmethod
+    def propagator(M: int = 100, cores: int = 1) -> Propagate:
+        """ Propagate object for M draws. Its state (cal_int, wavebands, ...) is set by each call that uses it. """
+        return UncertaintyContext.get(('Propagate', M, cores), lambda: Propagate(M=M, cores=cores))
+
+    @staticmethod
+    def stats() -> dict:
+        """ Built and reused counts per kind of entry, plus totals. seconds estimates the build time skipped by reuse. """
+        result = {}
+        for kind, count in UncertaintyContext.counts.items():
+            mean = count['seconds'] / count['built'] if count['built'] else 0.0
+            result[kind] = {'built': count['built'], 'reused': count['reused'], 'seconds': mean * count['reused']}
+        result['total'] = {k: sum(entry[k] for entry in result.values()) for k in ['built', 'reused', 'seconds']}
+        return result
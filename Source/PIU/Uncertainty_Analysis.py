@@ -3,6 +3,7 @@ import numpy as np
 
 # for analysis NPL developed packages
 import punpy
+import comet_maths as cm
 from Source.Weight_RSR import Weight_RSR
 
 # zhangWrapper
@@ -10,17 +11,89 @@ import collections
 from Source import ZhangRho, PATH_TO_DATA
 from Source.RhoCorrections import RhoCorrections
 
-# M99 Rho
-from Source.HDFRoot import HDFRoot
-
 # Utilities
 from Source.utils.loggingHCP import writeLogFileAndPrint
 from Source.utils.comparing import find_nearest
+import Source.utils.caching as caching
 
 import warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
 
+class AdaptiveMCPropagation(punpy.MCPropagation):
+    """
+    punpy MCPropagation with optional convergence control. With a tolerance, propagations draw in batches of steps
+    until the largest relative change in the output standard deviation from one batch to the next falls below the
+    tolerance, or max_draws are used. With tolerance 0 (default) every propagation uses steps draws, as MCPropagation.
+
+    Settings are shared by all instances and set with configure. seed restarts the numpy random generator used by
+    punpy and comet_maths, so an ensemble seeded with the same key draws the same samples in any run or process.
+    """
+    seed_value: int = -1  # negative: leave the random generator unseeded
+    tolerance: float = 0.0
+    max_draws: int = 1000
+    draws: list = []  # draws used by each propagation since the last seed
+
+    @staticmethod
+    def configure(seed: int = -1, tolerance: float = 0.0, max_draws: int = 1000) -> None:
+        """ Set the seed, the convergence tolerance (0 for fixed draws) and the most draws of one propagation """
+        AdaptiveMCPropagation.seed_value = int(seed)
+        AdaptiveMCPropagation.tolerance = float(tolerance)
+        AdaptiveMCPropagation.max_draws = int(max_draws)
+
+    @staticmethod
+    def seed(*keys: int) -> None:
+        """ Seed the random generator from the configured seed and keys (e.g. the first record of an ensemble, or
+        a step after the ensembles and its own key) """
+        AdaptiveMCPropagation.draws = []
+        if AdaptiveMCPropagation.seed_value >= 0:
+            np.random.seed([AdaptiveMCPropagation.seed_value, *(int(key) for key in keys or (0,))])
+
+    @staticmethod
+    def draws_used() -> dict:
+        """ Number of propagations and their total, smallest and largest draws since the last seed """
+        draws = AdaptiveMCPropagation.draws
+        return {'propagations': len(draws), 'total': sum(draws),
+                'min': min(draws, default=0), 'max': max(draws, default=0)}
+
+    @staticmethod
+    def relative_change(u_old, u_new) -> float:
+        """ Largest relative change between two uncertainty estimates (arrays, or one array per output) """
+        old = np.concatenate([np.ravel(np.asarray(u, dtype=float)) for u in np.atleast_1d(u_old)])
+        new = np.concatenate([np.ravel(np.asarray(u, dtype=float)) for u in np.atleast_1d(u_new)])
+        valid = np.isfinite(old) & np.isfinite(new) & (new != 0)
+        if not valid.any():
+            return 0.0
+        return float(np.max(np.abs(new[valid] - old[valid]) / np.abs(new[valid])))
+
+    def propagate_standard(self, func, x, u_x, corr_x, param_fixed=None, corr_between=None, samples=None,
+                           return_corr=False, return_samples=False, repeat_dims=-99, **kwargs):
+        """ MCPropagation.propagate_standard, drawing in batches until converged when a tolerance is set """
+        args = (func, x, u_x, corr_x, param_fixed, corr_between, samples, return_corr, return_samples, repeat_dims)
+        adaptive = AdaptiveMCPropagation.tolerance > 0 and samples is None and repeat_dims == -99 \
+            and not return_corr and not return_samples
+        if not adaptive:
+            AdaptiveMCPropagation.draws.append(self.MCsteps)
+            return super().propagate_standard(*args, **kwargs)
+
+        steps = self.MCsteps
+        sample_y, u_y, drawn = [], None, 0
+        while True:
+            result = super().propagate_standard(func, x, u_x, corr_x, param_fixed, corr_between,
+                                                return_samples=True, **kwargs)
+            if result[0] is None:  # no uncertainties to propagate
+                return None
+            drawn += steps
+            sample_y.append(result[1])
+            u_old, u_y = u_y, self.process_samples(None, np.concatenate(sample_y),
+                                                   output_vars=kwargs.get('output_vars', 1))
+            if drawn + steps > AdaptiveMCPropagation.max_draws or \
+                    (u_old is not None and self.relative_change(u_old, u_y) < AdaptiveMCPropagation.tolerance):
+                break
+        AdaptiveMCPropagation.draws.append(drawn)
+        return u_y
+
+
 class Propagate:
     """
     Class to contain all uncertainty analysis to be used in HyperInSPACE
@@ -31,6 +104,7 @@ class Propagate:
     path: Str - output path for results to be written too
     M: Int - number of monte carlo draws
     cores: Int - punpy parallel_cores option (see documentation) Set None to ignore, 1 is default.
+    Draws are made by an AdaptiveMCPropagation, so M is the batch size when a convergence tolerance is configured.
     """
 
     corr_matrix_Default_Instruments = np.array([
@@ -108,17 +182,32 @@ class Propagate:
         [0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 1.0]
     ], dtype=np.float64)
 
+    # error correlation of each input along wavelength for the instruments, Lw and RRS measurement functions
+    corr_x_Instruments: list = ['rand'] * 6 + ['syst'] * 18
+    corr_x_Lw: list = ['rand', 'rand', 'syst', 'rand', 'rand'] + ['syst'] * 12
+    corr_x_RRS: list = ['rand', 'rand', 'syst', 'rand', 'rand', 'rand', 'rand'] + ['syst'] * 18
+
+    # Weight_RSR mission and sensor for each satellite (keys match BaseInstrument._SATELLITES)
+    _BAND_CONV: dict = {
+        'S3A': ('Sentinel3', 'A'),
+        'S3B': ('Sentinel3', 'B'),
+        'MOD-A': ('MODIS', 'A'),
+        'MOD-T': ('MODIS', 'T'),
+        'VIIRS-J': ('VIIRS', 'J'),
+        'VIIRS-N': ('VIIRS', 'N'),
+    }
+
     def __init__(self, M: int = 100, cores: int = 1):
-        self.MCP: punpy.MCPropagation = None  # declare expected type
+        self.MCP: AdaptiveMCPropagation = None  # declare expected type
         self._platform: str = ''  # internally used variable to store platform string to use in L2 conv products
         self._wavebands: np.array = None  # stores wavebands for convolution
         self.cal_int: dict = {s: {} for s in ['ES','LI','LT']}
         self.int_time: dict = {s: {} for s in ['ES','LI','LT']}
         
         if isinstance(cores, int):
-            self.MCP = punpy.MCPropagation(M, parallel_cores=cores)
+            self.MCP = AdaptiveMCPropagation(M, parallel_cores=cores)
         else:
-            self.MCP = punpy.MCPropagation(M)
+            self.MCP = AdaptiveMCPropagation(M)
 
     # Main functions
     def propagate_Instrument_Uncertainty(self, mean_vals: list[np.array], uncertainties: list[np.array], corr_between=True) -> np.array:
@@ -138,8 +227,7 @@ class Propagate:
         :Return: absolute uncertainty [es, li, lt]
         """
 
-        corr_list = ['rand', 'rand', 'rand', 'rand', 'rand', 'rand', 'syst', 'syst', 'syst', 'syst', 'syst', 'syst',
-                     'syst', 'syst', 'syst', 'syst', 'syst', 'syst', 'syst', 'syst', 'syst', 'syst', 'syst', 'syst',]
+        corr_list = self.corr_x_Instruments
         if corr_between:
             corr_between = self.corr_matrix_Default_Instruments
         else:
@@ -178,12 +266,7 @@ class Propagate:
         :return: Lw uncertainty
         """
 
-        corr_list = [
-            'rand', 'rand', 'syst', 'rand', 'rand', 
-            'syst', 'syst', 'syst', 'syst', 'syst', 
-            'syst', 'syst', 'syst', 'syst', 'syst', 
-            'syst', 'syst'
-        ]
+        corr_list = self.corr_x_Lw
         if corr_between:
             corr_between = self.corr_matrix_Default_Lw
         else:
@@ -270,12 +353,7 @@ class Propagate:
 
             will be replaced in the near future - for pixel by pixel method """
 
-        corr_list = [
-            'rand', 'rand', 'syst', 'rand', 'rand', 'rand', 'rand', 
-            'syst', 'syst', 'syst', 'syst', 'syst', 'syst', 'syst',
-            'syst', 'syst', 'syst', 'syst', 'syst', 'syst', 'syst', 
-            'syst', 'syst', 'syst', 'syst'
-        ]
+        corr_list = self.corr_x_RRS
         if corr_between:
             corr_between = self.corr_matrix_Default_RRS
         else:
@@ -402,6 +480,137 @@ class Propagate:
                                            uncertainties,
                                            corr_x=['syst', None])
 
+    def propagate_batch(self, func, mean_vals: list, uncertainties: list, corr_x: list,
+                        corr_between: np.array = None, output_vars: int = 1):
+        """
+        Propagate uncertainties through func for a batch of inputs at once (e.g. Es, Li, Lt and rho, or several
+        sets of uncertainties, see propagate_sets) instead of once per member. All draws are generated together and
+        func is evaluated once, on samples shaped (draws, batch, ...), so it must be vectorised over leading axes.
+        With a convergence tolerance configured, the whole batch is drawn again until every member has converged
+        (see AdaptiveMCPropagation).
+
+        Each member gets the uncertainty it would get propagated on its own. Inputs correlated as 'syst' share
+        their error between members, which does not change the distribution of any one member.
+
+        :param mean_vals: list of input means, shaped (batch, ...) or, for fixed inputs (e.g. wavelengths), as func expects them
+        :param uncertainties: list of input uncertainties matching mean_vals, None for fixed inputs
+        :param corr_x: 'rand' or 'syst' for each input with an uncertainty, None for fixed inputs
+        :param corr_between: correlation matrix between the inputs with an uncertainty (all of the same shape),
+            defaults to None
+        :param output_vars: number of outputs of func
+
+        :return: uncertainty of each member, shaped (batch, ...), or a list of them, one per output of func
+        """
+        varied = [i for i, unc in enumerate(uncertainties) if unc is not None]
+
+        def draw() -> list[np.array]:
+            samples = self.MCP.generate_MC_sample(
+                [np.asarray(mean_vals[i], dtype=float) for i in varied],
+                [np.asarray(uncertainties[i], dtype=float) for i in varied],
+                [corr_x[i] for i in varied],
+            )
+            if corr_between is not None:
+                samples = self.correlate_samples(samples, corr_between)
+            args = list(mean_vals)
+            for i, sample in zip(varied, samples):
+                args[i] = sample
+            sample_y = func(*args)
+            return [np.asarray(y, dtype=float) for y in (sample_y if output_vars > 1 else [sample_y])]
+
+        def std(sample_y: list[np.array]) -> list[np.array]:
+            # failed draws are dropped member by member, over all leading axes (e.g. sets and ensembles)
+            members = [y.reshape(len(y), -1, y.shape[-1]) if y.ndim > 2 else y[..., None] for y in sample_y]
+            return [np.array([np.std(self.drop_failed_draws(m[:, i]), axis=0) for i in range(m.shape[1])]).reshape(y.shape[1:])
+                    for y, m in zip(sample_y, members)]
+
+        steps = self.MCP.MCsteps
+        sample_y = draw()
+        drawn, u_y = steps, std(sample_y)
+        while AdaptiveMCPropagation.tolerance > 0 and drawn + steps <= AdaptiveMCPropagation.max_draws:
+            sample_y = [np.concatenate(pair) for pair in zip(sample_y, draw())]
+            drawn += steps
+            u_old, u_y = u_y, std(sample_y)
+            if AdaptiveMCPropagation.relative_change(u_old, u_y) < AdaptiveMCPropagation.tolerance:
+                break
+        AdaptiveMCPropagation.draws.append(drawn)
+        return u_y if output_vars > 1 else u_y[0]
+
+    def propagate_sets(self, func, mean_vals: list, uncertainty_sets: list, corr_x: list,
+                       corr_between: np.array = None, output_vars: int = 1):
+        """
+        Propagate several sets of uncertainties (e.g. the total, the perturbation and each class of the class based
+        breakdown) for the same input means as one batch of propagate_batch: one Monte Carlo sample and one
+        evaluation of func for all sets. Means may be stacked along leading axes (e.g. several ensembles, shaped
+        (ensembles, ...)), which are carried through to the result.
+
+        :param mean_vals: list of input means
+        :param uncertainty_sets: list of sets of input uncertainties, each matching mean_vals
+        :param corr_x: 'rand' or 'syst' for each input
+        :param corr_between: correlation matrix between the inputs, defaults to None
+        :param output_vars: number of outputs of func
+
+        :return: uncertainty for each set, shaped (sets, ...), or a list of them, one per output of func
+        """
+        n = len(uncertainty_sets)
+        means = [np.repeat(np.asarray(x, dtype=float)[None], n, axis=0) for x in mean_vals]
+        uncertainties = [np.stack([np.asarray(u[i], dtype=float) for u in uncertainty_sets]) for i in range(len(mean_vals))]
+        with warnings.catch_warnings():
+            warnings.filterwarnings("ignore", category=UserWarning)
+            warnings.filterwarnings("ignore", category=RuntimeWarning)
+            return self.propagate_batch(func, means, uncertainties, corr_x, corr_between, output_vars)
+
+    def propagate_Instrument_Uncertainty_Batch(self, mean_vals: list[np.array], uncertainty_sets: list,
+                                               corr_between=True) -> list[tuple]:
+        """ propagate_Instrument_Uncertainty for each of several sets of uncertainties, drawn together (see propagate_sets)
+
+        :return: absolute uncertainty (es, li, lt) for each set
+        """
+        es, li, lt = self.propagate_sets(self.instruments, mean_vals, uncertainty_sets, self.corr_x_Instruments,
+                                         self.corr_matrix_Default_Instruments if corr_between else None,
+                                         output_vars=3)
+        return list(zip(es, li, lt))
+
+    def Propagate_Lw_HYPER_Batch(self, mean_vals: list[np.array], uncertainty_sets: list, corr_between=True) -> np.array:
+        """ Propagate_Lw_HYPER for each of several sets of uncertainties, drawn together (see propagate_sets)
+
+        :return: Lw uncertainty for each set
+        """
+        return self.propagate_sets(self.Lw, mean_vals, uncertainty_sets, self.corr_x_Lw,
+                                   self.corr_matrix_Default_Lw if corr_between else None)
+
+    def Propagate_RRS_HYPER_Batch(self, mean_vals: list[np.array], uncertainty_sets: list, corr_between=True) -> np.array:
+        """ Propagate_RRS_HYPER for each of several sets of uncertainties, drawn together (see propagate_sets)
+
+        :return: Rrs uncertainty for each set
+        """
+        return self.propagate_sets(self.RRS, mean_vals, uncertainty_sets, self.corr_x_RRS,
+                                   self.corr_matrix_Default_RRS if corr_between else None)
+
+    @staticmethod
+    def correlate_samples(samples: list[np.array], corr_between: np.array) -> list[np.array]:
+        """
+        Correlate independent samples of inputs, each shaped (draws, ...), with corr_between, as
+        comet_maths.correlate_sample_corr does element by element, but for all elements at once. Each element is
+        normalised with its sample mean and std before the Cholesky factor is applied; inputs with no spread at an
+        element are left unchanged and take no part in the correlation there.
+        """
+        try:
+            L = np.linalg.cholesky(corr_between)
+        except np.linalg.LinAlgError:
+            L = cm.nearestPD_cholesky(corr_between, corr=True)
+        x = np.stack(samples)  # (inputs, draws, ...)
+        mean = np.mean(x, axis=1, keepdims=True)
+        std = np.std(x, axis=1, keepdims=True)
+        spread = std != 0
+        z = np.divide(x - mean, std, out=np.zeros_like(x), where=spread)
+        return list(np.where(spread, np.tensordot(L, z, axes=1) * std + mean, x))
+
+    @staticmethod
+    def drop_failed_draws(sample: np.array) -> np.array:
+        """ Remove the draws of a (draws, ...) sample that are all NaN, as punpy does before taking the std """
+        valid = np.isfinite(sample.reshape(len(sample), -1)).any(axis=1)
+        return sample[valid] if valid.any() else sample
+
     # Rho propagation methods
     def M99_Rho_Uncertainty(self, mean_vals: list[np.array], uncertainties: list[np.array]) -> np.array:
         """
@@ -487,65 +696,41 @@ class Propagate:
             ltSignal,  # * (self.cal_int["LT"]/self.int_time["LT"])
         )
 
+    @staticmethod
+    def band_Conv(Hyperspec, Wavelengths, platform: str) -> np.array:
+        """ band convolution of spectra (..., wavelengths) for platform, as Source.Weight_RSR, over any leading axes """
+        mission, sensor = Propagate._BAND_CONV[platform]
+        return Weight_RSR.convolveMatrix(Hyperspec, [str(k) for k in Wavelengths], mission, sensor)[1]
+
     @staticmethod
     def band_Conv_Sensor_S3A(Hyperspec, Wavelengths) -> np.array:
         """ band convolution of Rrs for S3A using Source.Weight_RSR"""
-
-        hyperspec_as_dict = {str(k): [val] for k, val in zip(Wavelengths, Hyperspec)}
-        rad_band = Weight_RSR.processSentinel3Bands(
-            hyperspec_as_dict, sensor='A'
-        )
-        return np.array([value[0] for value in rad_band.values()])  # convert back to np.array for correct punpy return
+        return Propagate.band_Conv(Hyperspec, Wavelengths, 'S3A')
 
     @staticmethod
     def band_Conv_Sensor_S3B(Hyperspec, Wavelengths) -> np.array:
         """ band convolution of Rrs for S3B using Source.Weight_RSR"""
-
-        hyperspec_as_dict = {str(k): [val] for k, val in zip(Wavelengths, Hyperspec)}
-        rad_band = Weight_RSR.processSentinel3Bands(
-            hyperspec_as_dict, sensor='B'
-        )
-        return np.array([value[0] for value in rad_band.values()])  # return np.array for punpy
+        return Propagate.band_Conv(Hyperspec, Wavelengths, 'S3B')
 
     @staticmethod
     def band_Conv_Sensor_AQUA(Hyperspec, Wavelengths) -> np.array:
         """ band convolution of Rrs for EOS-AQUA Modis using Source.Weight_RSR"""
-
-        hyperspec_as_dict = {str(k): [val] for k, val in zip(Wavelengths, Hyperspec)}
-        rad_band = Weight_RSR.processMODISBands(
-            hyperspec_as_dict, sensor='A'
-        )
-        return np.array([value[0] for value in rad_band.values()])  # return as np.array for punpy
+        return Propagate.band_Conv(Hyperspec, Wavelengths, 'MOD-A')
 
     @staticmethod
     def band_Conv_Sensor_TERRA(Hyperspec, Wavelengths) -> np.array:
         """ band convolution of Rrs for EOS-Terra Modis using Source.Weight_RSR"""
-
-        hyperspec_as_dict = {str(k): [val] for k, val in zip(Wavelengths, Hyperspec)}
-        rad_band = Weight_RSR.processMODISBands(
-            hyperspec_as_dict, sensor='T'
-        )
-        return np.array([value[0] for value in rad_band.values()])
+        return Propagate.band_Conv(Hyperspec, Wavelengths, 'MOD-T')
 
     @staticmethod
     def band_Conv_Sensor_NOAA_J(Hyperspec, Wavelengths) -> np.array:
         """ band convolution of Rrs for NOAA Virrs using Source.Weight_RSR"""
-
-        hyperspec_as_dict = {str(k): [val] for k, val in zip(Wavelengths, Hyperspec)}
-        rad_band = Weight_RSR.processVIIRSBands(
-            hyperspec_as_dict, sensor='J'  # uses else to identify, string does not matter
-        )
-        return np.array([value[0] for value in rad_band.values()])
+        return Propagate.band_Conv(Hyperspec, Wavelengths, 'VIIRS-J')
 
     @staticmethod
     def band_Conv_Sensor_NOAA_N(Hyperspec, Wavelengths) -> np.array:
         """ band convolution of Rrs for NOAA Virrs using Source.Weight_RSR"""
-
-        hyperspec_as_dict = {str(k): [val] for k, val in zip(Wavelengths, Hyperspec)}
-        rad_band = Weight_RSR.processVIIRSBands(
-            hyperspec_as_dict, sensor='N'
-        )
-        return np.array([value[0] for value in rad_band.values()])
+        return Propagate.band_Conv(Hyperspec, Wavelengths, 'VIIRS-N')
 
     @staticmethod
     def no_Conv(Hyperspec, *args, **kwargs) -> np.array:
@@ -645,11 +830,7 @@ class Propagate:
 
         # load in the LUT HDF file
         inFilePath = os.path.join(PATH_TO_DATA, 'rhoTable_AO1999.hdf')
-        lut = HDFRoot.readHDF5(inFilePath)
-        lutData = lut.groups[0].datasets['LUT'].data
-
-        # convert to a 2D array
-        lut = np.array(lutData.tolist())
+        lut = caching.getLUT(inFilePath, lambda: RhoCorrections.readM99LUT(inFilePath))
 
         # match to the row
         row = lut[(lut[:, 0] == wind) & (lut[:, 1] == sza) & \
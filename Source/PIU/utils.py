@@ -71,6 +71,24 @@ class utils:
         else:
             return new_y
 
+    @staticmethod
+    def cos_asymmetry_err(cos, cos_90):
+        """
+        std of the cosine error across the 4 measurements azi_0, azi_90, zen, -zen of each pixel and zenith angle,
+        for the first 255 pixels and 45 zenith angles (the remainder are 0)
+
+        :param cos: cosine error at azimuth 0 (pixels x zenith angles)
+        :param cos_90: cosine error at azimuth 90
+
+        :return: total error due to asymmetry
+        """
+        tot_asymmetry_err = np.zeros(cos.shape, float)
+        mirror = -np.arange(45)  # column -j as indexed for zenith angle j (so 0 for j = 0)
+        tot_asymmetry_err[:255, :45] = np.std(
+            np.stack([cos[:255, :45], cos_90[:255, :45], cos[:255, mirror], cos_90[:255, mirror]]), axis=0
+        )
+        return tot_asymmetry_err
+
     @staticmethod
     def interpolateSamples(Columns, waves, newWavebands):
         '''
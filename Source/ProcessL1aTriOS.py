@@ -231,7 +231,7 @@ class ProcessL1aTriOS:
 
                 try:
                     # root.writeHDF5(new_name)
-                    root.writeHDF5(outFFP[-1])
+                    root.writeHDF5(outFFP[-1], MainConfig.settings["hdfWriteProfile"])
 
                 except Exception:
                     msg = 'Unable to write L1A file. It may be open in another program.'
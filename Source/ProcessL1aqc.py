@@ -2,9 +2,7 @@
 import math
 import datetime
 import copy
-import bisect
 import numpy as np
-from pysolar.solar import get_azimuth, get_altitude
 
 from Source.HDFDataset import HDFDataset
 from Source.ProcessL1aqc_deglitch import ProcessL1aqc_deglitch
@@ -12,6 +10,8 @@ from Source.ConfigFile import ConfigFile
 import Source.utils.loggingHCP as logging
 import Source.utils.dating as dating
 import Source.utils.comparing as comparing
+import Source.utils.filtering as filtering
+import Source.utils.solaring as solaring
 
 class ProcessL1aqc:
     ''' Process L1A to L1AQC '''
@@ -72,20 +72,7 @@ class ProcessL1aqc:
         #   between instruments, so badTimes may have entries not found in timeStamp.
         # badTimes = Utilities.catConsecutiveBadTimes(badTimes, timeStamp)#.tolist())
 
-        rowsToDelete = []
-        for badTime in badTimes:
-            # find the index of the first and last elements within the date range
-            start_index = bisect.bisect_left(timeStamp, badTime[0])
-            end_index = bisect.bisect_right(timeStamp, badTime[1])
-
-            if end_index - start_index > 0:
-                # end_index is non-inclusive
-                newList = list(range(start_index,end_index))
-                [rowsToDelete.append(x) for x in newList]
-
-        finalCount = len(rowsToDelete)
-        if rowsToDelete:
-            group.datasetDeleteRow(rowsToDelete)
+        finalCount = filtering.deleteBadTimes(group, timeStamp, filtering.badTimeIntervals(badTimes))
 
         logging.writeLogFileAndPrint(f'   Length of records removed from dataset: {finalCount}')
 
@@ -103,29 +90,13 @@ class ProcessL1aqc:
         startLength = len(timeStamp)
         logging.writeLogFileAndPrint(f'   Length of dataset prior to removal {startLength} long')
 
-        # Delete the records in badTime ranges from each dataset in the group
+        # Delete the records in badTime ranges from each dataset in the group in one pass
         finalCount = 0
         originalLength = len(timeStamp)
-        for dateTime in badTimes:
-            # Need to reinitialize for each loop
-            startLength = len(timeStamp)
-            newTimeStamp = []
-
-            start = dateTime[0]
-            stop = dateTime[1]
-
-            if startLength > 0:
-                rowsToDelete = []
-                for i in range(startLength):
-                    if start <= timeStamp[i] and stop >= timeStamp[i]:
-                        rowsToDelete.append(i)
-                        finalCount += 1
-                    else:
-                        newTimeStamp.append(timeStamp[i])
-                group.datasetDeleteRow(rowsToDelete)
-            else:
-                logging.writeLogFileAndPrint('Data group is empty. Continuing.')
-            timeStamp = newTimeStamp.copy()
+        if originalLength > 0:
+            finalCount = filtering.deleteBadTimes(group, timeStamp, filtering.badTimeIntervals(badTimes))
+        else:
+            logging.writeLogFileAndPrint('Data group is empty. Continuing.')
 
         logging.writeLogFileAndPrint(f'   Length of records removed from dataset: {finalCount}')
 
@@ -310,11 +281,9 @@ class ProcessL1aqc:
                 # Solar geometry is preferentially acquired from SunTracker or pySAS
                 # Otherwise resorts to ancillary data. Otherwise processing fails.
                 # Run Pysolar to obtain solar geometry.
-                sunAzimuthAnc = []
-                sunZenithAnc = []
-                for i, dt_utc in enumerate(gpsDateTime):
-                    sunAzimuthAnc.append(get_azimuth(ancLat[i],ancLon[i],dt_utc,0)) # ancLat ancLon from GPS, not ancillary file
-                    sunZenithAnc.append(90 - get_altitude(ancLat[i],ancLon[i],dt_utc,0))
+                # ancLat ancLon from GPS, not ancillary file
+                sunAzimuthAnc, sunZenithAnc = solaring.sunPosition(ancLat[:len(gpsDateTime)], ancLon[:len(gpsDateTime)], gpsDateTime)
+                sunAzimuthAnc, sunZenithAnc = sunAzimuthAnc.tolist(), sunZenithAnc.tolist()
 
                 # SATTHS fluxgate compass on SAS
                 if compass is None:
@@ -370,11 +339,8 @@ class ProcessL1aqc:
             # Solar geometry is preferentially acquired from SunTracker
             # Otherwise resorts to ancillary data. Otherwise processing fails.
             # Run Pysolar to obtain solar geometry.
-            sunAzimuthAnc = []
-            sunZenithAnc = []
-            for i, dt_utc in enumerate(timeStamp):
-                sunAzimuthAnc.append(get_azimuth(ancLat[i],ancLon[i],dt_utc,0))
-                sunZenithAnc.append(90 - get_altitude(ancLat[i],ancLon[i],dt_utc,0))
+            sunAzimuthAnc, sunZenithAnc = solaring.sunPosition(ancLat[:len(timeStamp)], ancLon[:len(timeStamp)], timeStamp)
+            sunAzimuthAnc, sunZenithAnc = sunAzimuthAnc.tolist(), sunZenithAnc.tolist()
 
             # relAzAnc either from ancillary relZz, ancillary sensorAz, (or THS compass above ^^)
             relAzAnc,sasAzAnc  = None,None
@@ -850,11 +816,8 @@ class ProcessL1aqc:
 
                     # I have added solar azimuth and solar zenith angle to 'SunTracker_sorad' group
                     # We can re use gps Lat and Lon fields as they are on same time grid
-                    sunAzimuth = []
-                    sunZenith = []
-                    for i, dt_utc in enumerate(gpsDateTime):
-                        sunAzimuth.append(get_azimuth(gpsLat.data[i],gpsLon.data[i],dt_utc,0))
-                        sunZenith.append(90 - get_altitude(gpsLat.data[i],gpsLon.data[i],dt_utc,0))
+                    sunAzimuth, sunZenith = solaring.sunPosition(
+                        np.asarray(gpsLat.data)[:len(gpsDateTime)], np.asarray(gpsLon.data)[:len(gpsDateTime)], gpsDateTime)
 
                     gp.addDataset("SOLAR_AZ")
                     gp.datasets["SOLAR_AZ"].data = np.array(sunAzimuth, dtype=[('NONE', '<f8')])
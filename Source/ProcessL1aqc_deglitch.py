@@ -122,6 +122,31 @@ class ProcessL1aqc_deglitch:
                         badIndex[i] = False # this is redundant
         return badIndex
 
+    @staticmethod
+    def deglitchColumns(columns, window, sigma, lightDark, minRad, maxRad, minMaxBand):
+        ''' Deglitch all bands within the deglitching range as one (time x band) matrix.
+            Returns the first pass, second pass and threshold bad indexes collapsed across wavebands
+            (for plotting) and the combined index of timestamps to delete '''
+        nTime = len(next(iter(columns.values())))
+        bands = [float(k) for k in columns.keys()]
+        keep = [ConfigFile.minDeglitchBand < band < ConfigFile.maxDeglitchBand for band in bands]
+        bands = [band for band, k in zip(bands, keep) if k]
+        if not bands:
+            noBad = [False]*nTime
+            return list(noBad), list(noBad), list(noBad), np.zeros(nTime, dtype=bool)
+
+        radiometry2D = np.column_stack([np.asarray(v, dtype=np.float64) for v, k in zip(columns.values(), keep) if k])
+        badIndex, badIndex2, badIndex3 = filtering.deglitchBands(
+            bands, radiometry2D, window, sigma, lightDark, minRad, maxRad, minMaxBand)
+
+        # Collapse the badIndexes from all wavebands into one timeseries for each pass
+        globBad = badIndex.any(axis=1)
+        globBad2 = badIndex2.any(axis=1)
+        globBad3 = badIndex3.any(axis=1)
+        gIndex = globBad | globBad2 | globBad3
+
+        return globBad.tolist(), globBad2.tolist(), globBad3.tolist(), gIndex
+
     @staticmethod
     def processDataDeglitching(node, sensorType):
         logging.writeLogFileAndPrint(f'{sensorType}')
@@ -178,38 +203,8 @@ class ProcessL1aqc_deglitch:
             columns = darkData.columns
             dateTime = darkDateTime
 
-            globalBadIndex = []
-            globBad, globBad2, globBad3 = None, None, None
-            index = 0
-            # Loop over bands to populate globBads
-            for timeSeries in columns.items():
-                if index==0:
-                    # Initialize boolean lists for capturing global badIndex conditions across all wavebands
-                    globBad = [False]*len(timeSeries[1])
-                    globBad2 = [False]*len(timeSeries[1])
-                    globBad3 = [False]*len(timeSeries[1])
-                band = float(timeSeries[0])
-                if band > ConfigFile.minDeglitchBand and band < ConfigFile.maxDeglitchBand:
-                    # if index % step == 0:
-                    radiometry1D = timeSeries[1]
-                    badIndex, badIndex2, badIndex3 = filtering.deglitchBand(\
-                        band,radiometry1D, windowDark, sigmaDark, lightDark, minDark, maxDark,minMaxBandDark)
-
-                    # for the plotting routine:
-                    globBad[:] = (True if val2 else val1 for (val1,val2) in zip(globBad,badIndex))
-                    globBad2[:] = (True if val2 else val1 for (val1,val2) in zip(globBad2,badIndex2))
-                    globBad3[:] = (True if val2 else val1 for (val1,val2) in zip(globBad3,badIndex3))
-
-                    # For the deletion routine:
-                    globalBadIndex.append(badIndex) # First pass
-                    globalBadIndex.append(badIndex2) # Second pass
-                    globalBadIndex.append(badIndex3) # Thresholds
-
-                index +=1
-
-            # Collapse the badIndexes from all wavebands into one timeseries
-            # Convert to an array and test along the columns (i.e. each timestamp)
-            gIndex = np.any(np.array(globalBadIndex), 0)
+            globBad, globBad2, globBad3, gIndex = ProcessL1aqc_deglitch.deglitchColumns(
+                columns, windowDark, sigmaDark, lightDark, minDark, maxDark, minMaxBandDark)
             percentLoss = 100*(sum(gIndex)/len(gIndex))
             # badIndexDark = ProcessL1aqc.darkDataDeglitching(darkData, sensorType, windowDark, sigmaDark)
             logging.writeLogFileAndPrint(f'Data reduced by {sum(gIndex)} ({round(percentLoss)}%)')
@@ -235,36 +230,8 @@ class ProcessL1aqc_deglitch:
             lightDark = 'Light'
             dateTime = lightDateTime
 
-            globalBadIndex = []
-
-            index = 0
-            # Loop over bands to populate globBads
-            for timeSeries in columns.items():
-                if index==0:
-                    # Initialize boolean lists for capturing global badIndex conditions across all wavebands
-                    globBad = [False]*len(timeSeries[1])
-                    globBad2 = [False]*len(timeSeries[1])
-                    globBad3 = [False]*len(timeSeries[1])
-                band = float(timeSeries[0])
-                if band > ConfigFile.minDeglitchBand and band < ConfigFile.maxDeglitchBand:
-                    radiometry1D = timeSeries[1]
-                    badIndex, badIndex2, badIndex3 = filtering.deglitchBand(\
-                        band,radiometry1D, windowLight, sigmaLight, lightDark, minLight, maxLight,minMaxBandLight)
-
-                    # For plotting:
-                    globBad[:] = (True if val2 else val1 for (val1,val2) in zip(globBad,badIndex))
-                    globBad2[:] = (True if val2 else val1 for (val1,val2) in zip(globBad2,badIndex2))
-                    globBad3[:] = (True if val2 else val1 for (val1,val2) in zip(globBad3,badIndex3))
-
-                    # For deletion:
-                    globalBadIndex.append(badIndex)
-                    globalBadIndex.append(badIndex2)
-                    globalBadIndex.append(badIndex3)
-                index +=1
-
-            # Collapse the badIndexes from all wavebands into one timeseries
-            # Convert to an array and test along the columns (i.e. each timestamp)
-            gIndex = np.any(np.array(globalBadIndex), 0)
+            globBad, globBad2, globBad3, gIndex = ProcessL1aqc_deglitch.deglitchColumns(
+                columns, windowLight, sigmaLight, lightDark, minLight, maxLight, minMaxBandLight)
             percentLoss = 100*(sum(gIndex)/len(gIndex))
             # NOTE: if you similarly collapse globBads 1-3, you should get the same result as gIndex
             # NOTE: Confirmed that plotted AnomAnal deletions correspond to gIndex
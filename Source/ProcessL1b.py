@@ -434,7 +434,7 @@ class ProcessL1b:
 
         # Convert ancillary date time
         if ancGroup is not None:
-            ancGroup.datasets['LATITUDE'].datasetToColumns()
+            ancGroup.datasets['LATITUDE'].datasetToColumns(columnar=True)
             ancTime = ancGroup.datasets['LATITUDE'].columns['Timetag2']
             ancSeconds = []
             ancDatetime = []
@@ -680,14 +680,18 @@ class ProcessL1b:
         newSensorData = newGroup.addDataset(newDatasetName)
 
         # Datetag, Timetag2, and Datetime columns added to sensor data array
-        newSensorData.columns["Datetag"] = dateData.data["NONE"].tolist()
-        newSensorData.columns["Timetag2"] = timeData.data["NONE"].tolist()
+        newSensorData.columns["Datetag"] = np.asarray(dateData.data["NONE"], dtype=np.float64)
+        newSensorData.columns["Timetag2"] = np.asarray(timeData.data["NONE"], dtype=np.float64)
         newSensorData.columns["Datetime"] = dateTimeData.data
 
         # Copies over the sensor dataset from original group to newGroup
+        #   Columns stay as numpy arrays (no list round trip); integers still go to float64 for hdf
         for k in dataset.data.dtype.names: # For each waveband (or vector data for other groups)
             #print("type",type(esData.data[k]))
-            newSensorData.columns[k] = dataset.data[k].tolist()
+            col = dataset.data[k]
+            if col.dtype.kind in ('i', 'u'):
+                col = col.astype(np.float64)
+            newSensorData.columns[k] = col
         newSensorData.columnsToDataset()
 
     @staticmethod
@@ -1,6 +1,7 @@
 ''' L1AQC to L1B for Full-FRM or Class-based '''
 import logging # Is this necessary?
 import os
+import importlib.metadata
 import concurrent.futures
 from datetime import datetime as dt
 import numpy as np
@@ -11,12 +12,99 @@ from scipy import interpolate
 from j6s import SixS
 
 # internal files
+from Source import PATH_TO_DATA
 from Source.ConfigFile import ConfigFile
 import Source.utils.loggingHCP as loggingHCP
+import Source.utils.caching as caching
 
 class ProcessL1b_FRMCal:
     ''' L1AQC to L1B for Full-FRM or Class-based '''
 
+    # 6S inputs are rounded to these decimals, so that bins with (nearly) the same geometry and aerosol
+    # share a run. Runs are kept in SIXS_CACHE_DIR and reused when the same data are processed again.
+    SIXS_ANGLE_DECIMALS = 1 # 0.1 degree
+    SIXS_AOD_DECIMALS = 3
+    SIXS_CACHE_DIR = os.path.join(PATH_TO_DATA, 'SixS_Cache')
+
+    @staticmethod
+    def sixSInputs(sunZenith, sunAzimuth, relAz, dateTime, aod, wvl):
+        ''' Rounded 6S inputs of one bin. Also the key of the run in SIXS_CACHE_DIR, so includes the j6s version. '''
+        try:
+            version = importlib.metadata.version('j6s')
+        except importlib.metadata.PackageNotFoundError:
+            version = 'unknown'
+        return (version,
+                round(float(sunZenith), ProcessL1b_FRMCal.SIXS_ANGLE_DECIMALS),
+                round(float(sunAzimuth), ProcessL1b_FRMCal.SIXS_ANGLE_DECIMALS),
+                round(float(relAz), ProcessL1b_FRMCal.SIXS_ANGLE_DECIMALS),
+                dateTime.month, dateTime.day,
+                round(float(aod), ProcessL1b_FRMCal.SIXS_AOD_DECIMALS),
+                tuple(float(w) for w in wvl))
+
+    @staticmethod
+    def runSixS(inputs, wvl):
+        ''' Run 6S at each wavelength for the inputs of ProcessL1b_FRMCal.sixSInputs '''
+        _, sunZenith, sunAzimuth, relAz, month, day, aod, _ = inputs
+        s = SixS()
+        s.geometry(
+            sun_zen=sunZenith,
+            sun_azi=sunAzimuth,
+            view_zen=180,
+            view_azi=relAz,
+            month=month,
+            day=day
+        )
+        s.gas()
+        s.aerosol(aot_550=aod)
+        s.target_altitude()
+        s.sensor_altitude()
+
+        s.to_be_implemented()
+
+        run = {name: np.zeros(len(wvl)) for name in
+               ['percent_direct', 'percent_diffuse', 'direct', 'diffuse', 'environmental']}
+
+        # Determine the number of workers to use
+        num_workers = os.cpu_count()
+        logging.info(f"Running on {num_workers} threads")
+        iterations_per_worker = len(wvl) // num_workers
+        logging.info(f"{iterations_per_worker} iteration per threads")
+
+        # Create the function for 6s that will be run by each worker
+        def run_model_and_accumulate(start, end):
+            for i in range(start, end):
+                wavelength = wvl[i]
+                s.wavelength(wavelength)
+
+                temp = s.run()
+
+                # TODO: provide warning (with wavelength) if any of the values are NaN
+
+                # Clamp negative values to 0 as they are unphysical
+                run['percent_direct'][i] = max(float(temp["percent_of_direct_solar_irradiance_at_target"]), 0)
+                run['percent_diffuse'][i] = max(float(temp["percent_of_diffuse_atmospheric_irradiance_at_target"]), 0)
+                run['direct'][i] = float(temp["direct_solar_irradiance_at_target_[W m-2 um-1]"])
+                run['diffuse'][i] = float(temp["diffuse_atmospheric_irradiance_at_target_[W m-2 um-1]"])
+                run['environmental'][i] = float(temp["environement_irradiance_at_target_[W m-2 um-1]"])
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
+            futures = []
+            for i in range(num_workers):
+                # Calculate the start and end indices for this worker
+                start = i * iterations_per_worker
+                end = (
+                    start + iterations_per_worker
+                    if i != num_workers - 1
+                    else len(wvl)
+                )
+
+                # Start the worker
+                futures.append(executor.submit(run_model_and_accumulate, start, end))
+
+        # Wait for all workers to finish
+        concurrent.futures.wait(futures)
+        return run
+
     @staticmethod
     def get_direct_irradiance_ratio(node: object, sensortype: object, called_L2: bool = False) -> object:
         ''' Used for both SeaBird and TriOS L1b
@@ -104,121 +192,25 @@ class ProcessL1b_FRMCal:
         environmental_irradiance = np.zeros((n_bin, nband))
         solar_zenith = np.zeros(n_bin)
 
-        # Instanciate the class only once outside the loop
-        s = SixS()
-
+        # Bins with the same (quantized) 6S inputs share one run, which is also kept on disk
+        sixSRuns = {}
         for n in range(n_bin):
             # find ancillary point that match the 1st mesure of the 3min ensemble
             ind_anc = np.argmin(np.abs(np.array(anc_datetime)-irr_datetime[n*n_min]))
 
             solar_zenith[n] = sun_zenith[ind_anc]
 
-            s.geometry(
-                sun_zen=sun_zenith[ind_anc],
-                sun_azi=sun_azimuth[ind_anc],
-                view_zen=180,
-                view_azi=rel_az[ind_anc],
-                month=irr_datetime[ind_anc].month,
-                day=irr_datetime[ind_anc].day
-            )
-            s.gas()
-            s.aerosol(aot_550=aod[ind_anc])
-            s.target_altitude()
-            s.sensor_altitude()
-
-            s.to_be_implemented()
-
-            # Create placeholder to contain the values
-            # percent_direct_solar_irradiance = [0] * len(wvl)
-            # percent_diffuse_solar_irradiance = [0] * len(wvl)
-            # direct_solar_irradiance = [0] * len(wvl)
-            # diffuse_solar_irradiance = [0] * len(wvl)
-            # environmental_irradiance = [0] * len(wvl)
-
-            # Determine the number of workers to use
-            num_workers = os.cpu_count()
-            logging.info(f"Running on {num_workers} threads")
-            iterations_per_worker = len(wvl) // num_workers
-            logging.info(f"{iterations_per_worker} iteration per threads")
-
-            # Create the function for 6s that will be run by each worker
-            def run_model_and_accumulate(
-                    n,
-                    start,
-                    end,
-                    s,
-                    wvl,
-                    percent_direct_solar_irradiance,
-                    percent_diffuse_solar_irradiance,
-                    direct_solar_irradiance,
-                    diffuse_solar_irradiance,
-                    environmental_irradiance
-            ):
-                for i in range(start, end):
-                    wavelength = wvl[i]
-                    s.wavelength(wavelength)
-
-                    temp = s.run()
-
-                    # if math.isnan(float(temp["atmospheric_reflectance_at_sensor"])):
-                    #     print("atmospheric_path_radiance is NaN ...")
-
-                    # TODO: provide warning (with wavelength) if any of the values are NaN
-
-                    percent_direct_solar_irradiance[n,i] = float(
-                        temp["percent_of_direct_solar_irradiance_at_target"]
-                    )
-                    # Clamp negative values to 0 as they are unphysical
-                    if percent_direct_solar_irradiance[n,i] < 0:
-                        percent_direct_solar_irradiance[n,i] = 0
-                    percent_diffuse_solar_irradiance[n,i] = float(
-                        temp["percent_of_diffuse_atmospheric_irradiance_at_target"]
-                    )
-                    # Clamp negative values to 0 as they are unphysical
-                    if percent_diffuse_solar_irradiance[n, i] < 0:
-                        percent_diffuse_solar_irradiance[n, i] = 0
-                    direct_solar_irradiance[n,i] = float(
-                        temp["direct_solar_irradiance_at_target_[W m-2 um-1]"]
-                    )
-                    diffuse_solar_irradiance[n,i] = float(
-                        temp["diffuse_atmospheric_irradiance_at_target_[W m-2 um-1]"]
-                    )
-                    environmental_irradiance[n,i] = float(
-                        temp["environement_irradiance_at_target_[W m-2 um-1]"]
-                    )
-
-                return
-
-            with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
-                futures = []
-                for i in range(num_workers):
-                    # Calculate the start and end indices for this worker
-                    start = i * iterations_per_worker
-                    end = (
-                        start + iterations_per_worker
-                        if i != num_workers - 1
-                        else len(wvl)
-                    )
-
-                    # Start the worker
-                    futures.append(
-                        executor.submit(
-                            run_model_and_accumulate,
-                            n,
-                            start,
-                            end,
-                            s,
-                            wvl,
-                            percent_direct_solar_irradiance,
-                            percent_diffuse_solar_irradiance,
-                            direct_solar_irradiance,
-                            diffuse_solar_irradiance,
-                            environmental_irradiance
-                        )
-                    )
-
-            # Wait for all workers to finish
-            concurrent.futures.wait(futures)
+            inputs = ProcessL1b_FRMCal.sixSInputs(sun_zenith[ind_anc], sun_azimuth[ind_anc], rel_az[ind_anc],
+                                                  irr_datetime[ind_anc], aod[ind_anc], wvl)
+            if inputs not in sixSRuns:
+                sixSRuns[inputs] = caching.getStored(ProcessL1b_FRMCal.SIXS_CACHE_DIR, inputs,
+                                                     lambda: ProcessL1b_FRMCal.runSixS(inputs, wvl))
+            run = sixSRuns[inputs]
+            percent_direct_solar_irradiance[n] = run['percent_direct']
+            percent_diffuse_solar_irradiance[n] = run['percent_diffuse']
+            direct_solar_irradiance[n] = run['direct']
+            diffuse_solar_irradiance[n] = run['diffuse']
+            environmental_irradiance[n] = run['environmental']
 
             if np.isnan(percent_direct_solar_irradiance).any():
                 logging.debug("direct contains NaN values at: %s", wvl[np.isnan(percent_direct_solar_irradiance)[n]])
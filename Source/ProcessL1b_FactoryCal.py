@@ -58,8 +58,7 @@ class ProcessL1b_FactoryCal:
         a1 = float(cd.coefficients[1])
         im = float(cd.coefficients[2]) if immersed else 1.0
         k = cd.id
-        for x in range(ds.data.shape[0]):
-            ds.data[k][x] = im * a1 * (ds.data[k][x] - a0)
+        ds.data[k] = im * a1 * (ds.data[k] - a0)
 
     @staticmethod
     def processOPTIC3(ds, cd, immersed, inttime):
@@ -70,28 +69,75 @@ class ProcessL1b_FactoryCal:
             a1 = float(cd.coefficients[1])
             im = float(cd.coefficients[2]) if immersed else 1.0
             cint = float(cd.coefficients[3])
-            #print(inttime.data.shape[0], self.data.shape[0])
-
-            #print(cint, aint)
-            #print(cd.id)
-            for x in range(ds.data.shape[0]):
-                aint = inttime.data[cd.type][x]
-                # ds.data[k][x] = im * a1 * (ds.data[k][x] - a0) * (cint/aint)
-                ##############################################################
-                #   When applying calibration to the dark current corrected
-                #   radiometry, a0 cancels (see ProSoftUserManual7.7 11.1.1.5 Eqns 5-6)
-                #   presuming light and dark factory cals are equivalent (which they are).
-                ##############################################################
-                ds.data[k][x] = im * a1 * (ds.data[k][x]) * (cint/aint)
+            aint = inttime.data[cd.type]
+            # ds.data[k] = im * a1 * (ds.data[k] - a0) * (cint/aint)
+            ##############################################################
+            #   When applying calibration to the dark current corrected
+            #   radiometry, a0 cancels (see ProSoftUserManual7.7 11.1.1.5 Eqns 5-6)
+            #   presuming light and dark factory cals are equivalent (which they are).
+            ##############################################################
+            ds.data[k] = im * a1 * (ds.data[k]) * (cint/aint)
         else:
             # Set uncalibrated pixels to 0
             # for x in range(ds.data.shape[0]):
             # ds.data[k][x] = 0
             # Drop uncalibrated data
-            ds.datasetToColumns()
+            ds.datasetToColumns(columnar=True)
             del ds.columns[k]
             ds.columnsToDataset()
 
+    @staticmethod
+    def compileOPTIC3(cf, immersed=False):
+        ''' Compile the OPTIC3 paragraphs of a calibration file into coefficient arrays per dataset type.
+            Cached on the CalibrationFile so it is built once per calibration file. '''
+        cache = cf.optic3Arrays
+        if immersed in cache:
+            return cache[immersed]
+
+        blocks = {}
+        for cd in cf.data:
+            if cd.fitType != "OPTIC3":
+                continue
+            block = blocks.setdefault(cd.type, {'names': [], 'dummy': [], 'a1': [], 'im': [], 'cint': []})
+            block['names'].append(cd.id)
+            block['dummy'].append(cd.dummy != 0)
+            if cd.dummy == 0:
+                block['a1'].append(float(cd.coefficients[1]))
+                block['im'].append(float(cd.coefficients[2]) if immersed else 1.0)
+                block['cint'].append(float(cd.coefficients[3]))
+            else:
+                block['a1'].append(np.nan)
+                block['im'].append(np.nan)
+                block['cint'].append(np.nan)
+        for block in blocks.values():
+            for key in ('dummy', 'a1', 'im', 'cint'):
+                block[key] = np.asarray(block[key])
+        cache[immersed] = blocks
+        return blocks
+
+    @staticmethod
+    def processOPTIC3Block(ds, block, inttime):
+        ''' OPTIC3 over the whole (time x pixel) block of a dataset, with dummy (uncalibrated)
+            pixels dropped in a single step. Same result as processOPTIC3 column by column. '''
+        present = [name in ds.data.dtype.names for name in block['names']]
+        calibrated = np.array(present) & ~block['dummy']
+        calNames = [name for name, c in zip(block['names'], calibrated) if c]
+        if len(calNames) > 0:
+            counts = np.column_stack([ds.data[name] for name in calNames])
+            aint = np.asarray(inttime.data[ds.id], dtype=np.float64)
+            # See processOPTIC3: a0 cancels for dark current corrected radiometry
+            calData = (block['im'][calibrated] * block['a1'][calibrated]) * counts * \
+                (block['cint'][calibrated][None, :] / aint[:, None])
+            for j, name in enumerate(calNames):
+                ds.data[name] = calData[:, j]
+
+        dummyNames = [name for name, p, d in zip(block['names'], present, block['dummy']) if p and d]
+        if len(dummyNames) > 0:
+            ds.datasetToColumns(columnar=True)
+            for name in dummyNames:
+                del ds.columns[name]
+            ds.columnsToDataset()
+
     @staticmethod
     def processOPTIC4(ds, cd, immersed):
         a0 = float(cd.coefficients[0])
@@ -100,8 +146,7 @@ class ProcessL1b_FactoryCal:
         cint = float(cd.coefficients[3])
         k = cd.id
         aint = 1
-        for x in range(ds.data.shape[0]):
-            ds.data[k][x] = im * a1 * (ds.data[k][x] - a0) * (cint/aint)
+        ds.data[k] = im * a1 * (ds.data[k] - a0) * (cint/aint)
 
     # Process THERM1 - not implemented
     #   THERMAL_RESPONSE dataset of HyperOCR groups is all zeroes,
@@ -116,28 +161,27 @@ class ProcessL1b_FactoryCal:
         a1 = float(cd.coefficients[1])
         im = float(cd.coefficients[2]) if immersed else 1.0
         k = cd.id
-        for x in range(ds.data.shape[0]):
-            ds.data[k][x] = im * pow(10, ((ds.data[k][x]-a0)/a1))
+        ds.data[k] = im * np.power(10.0, ((ds.data[k]-a0)/a1))
 
     @staticmethod
     def processPOLYU(ds, cd):
         k = cd.id
-        for x in range(ds.data.shape[0]):
-            num = 0
-            for i, coeff in enumerate(cd.coefficients):
-                a = float(coeff)
-                num += a * pow(ds.data[k][x],i)
-            ds.data[k][x] = num
+        x = ds.data[k]
+        num = 0
+        for i, coeff in enumerate(cd.coefficients):
+            a = float(coeff)
+            num = num + a * np.power(x, i, dtype=np.float64)
+        ds.data[k] = num
 
     @staticmethod
     def processPOLYF(ds, cd):
         a0 = float(cd.coefficients[0])
         k = cd.id
-        for x in range(ds.data.shape[0]):
-            num = a0
-            for a in cd.coefficients[1:]:
-                num *= (ds.data[k][x] - float(a))
-            ds.data[k][x] = num
+        x = ds.data[k]
+        num = a0
+        for a in cd.coefficients[1:]:
+            num = num * (x - float(a))
+        ds.data[k] = num
 
 
     # Used to calibrate raw data (from L1a to L1b)
@@ -153,9 +197,15 @@ class ProcessL1b_FactoryCal:
                 ProcessL1b_FactoryCal.processDataset(ds, cd)
                 inttime = ds
 
+        # Radiometry (OPTIC3) is applied to each dataset as one block
+        optic3 = ProcessL1b_FactoryCal.compileOPTIC3(cf)
+        for dsType, block in optic3.items():
+            if gp.getDataset(dsType) and dsType != "INTTIME":
+                ProcessL1b_FactoryCal.processOPTIC3Block(gp.getDataset(dsType), block, inttime)
+
         for cd in cf.data:
             # process each dataset in the cal file list of data, except INTTIME
-            if gp.getDataset(cd.type) and cd.type != "INTTIME":
+            if gp.getDataset(cd.type) and cd.type != "INTTIME" and cd.fitType != "OPTIC3":
                 #print("Dataset:", cd.type)
                 ds = gp.getDataset(cd.type)
                 ProcessL1b_FactoryCal.processDataset(ds, cd, inttime)
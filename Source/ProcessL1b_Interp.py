@@ -1,13 +1,10 @@
 ''' Interpolate L1b data '''
 import collections
 import datetime as dt
-import time
 import warnings
 from inspect import currentframe, getframeinfo
 
-from pysolar.solar import get_azimuth, get_altitude
 import numpy as np
-import scipy as sp
 
 from Source.HDFRoot import HDFRoot
 from Source.ConfigFile import ConfigFile
@@ -16,6 +13,7 @@ import Source.utils.comparing as comparing
 import Source.utils.loggingHCP as logging
 import Source.utils.interpolating as interpolating
 import Source.utils.dating as dating
+import Source.utils.solaring as solaring
 
 class ProcessL1b_Interp:
     '''Class for interpolation of timestamps and wavelengths for all instrument types'''
@@ -338,45 +336,35 @@ class ProcessL1b_Interp:
         # List of datasets requiring fill instead of interpolation
         fillList = ['STATION']
 
-        for k in xData.data.dtype.names:
-            if k == "Datetag" or k == "Timetag2" or k == "Datetime":
-                continue
-            # print(k)
-            x = list(xTimer)
-            new_x = list(yTimer)
-            y = np.copy(xData.data[k]).tolist()
-
-            # Because x is now a list of datetime tuples, they'll need to be
-            # converted to Unix timestamp values
-            # # BUG: This conversion got the wrong result pre v1.2.13:
-            # xTS = [calendar.timegm(xDT.utctimetuple()) + xDT.microsecond / 1E6 for xDT in x]
-            # newXTS = [calendar.timegm(xDT.utctimetuple()) + xDT.microsecond / 1E6 for xDT in new_x]
-            xTS = [time.mktime(xDT.timetuple()) for xDT in x]
-            newXTS = [time.mktime(xDT.timetuple()) for xDT in new_x]
-            # # Test conversion reversal
-            # from datetime import datetime
-            # datetime_object = [datetime.fromtimestamp(x) for x in xTS]
-
-            if dataName in angList:
-
-                newXData.columns[k] = interpolating.interpAngular(xTS, y, newXTS, fill_value=0)
+        names = [k for k in xData.data.dtype.names if k not in ("Datetag", "Timetag2", "Datetime")]
+
+        # Because x is a list of datetime tuples, they'll need to be converted to
+        #   Unix timestamp values, once for all columns
+        # # BUG: This conversion got the wrong result pre v1.2.13:
+        # xTS = [calendar.timegm(xDT.utctimetuple()) + xDT.microsecond / 1E6 for xDT in x]
+        xTS = interpolating.timeStamps(xTimer)
+        newXTS = interpolating.timeStamps(yTimer)
+
+        if dataName in angList:
+            for k in names:
+                newXData.columns[k] = interpolating.interpAngular(xTS, np.copy(xData.data[k]), newXTS, fill_value=0)
 
                 # Some angular measurements (like SAS pointing) are + and -, and get converted
                 # to all +. Convert them back to - for 180-359
                 if dataName == "POINTING":
-                    pointingData = newXData.columns[k]
-                    for i, angle in enumerate(pointingData):
-                        if angle > 180:
-                            pointingData[i] = angle - 360
+                    pointingData = np.asarray(newXData.columns[k])
+                    newXData.columns[k] = np.where(pointingData > 180, pointingData - 360, pointingData)
 
-            elif dataName in fillList:
-                newXData.columns[k] = interpolating.interpFill(xTS,y,newXTS, fillValue=np.nan)
+        elif dataName in fillList:
+            for k in names:
+                newXData.columns[k] = interpolating.interpFill(xTS, xData.data[k], newXTS, fillValue=np.nan)
 
-            else:
-                if kind == 'cubic':
-                    newXData.columns[k] = interpolating.interpSpline(xTS, y, newXTS)
-                else:
-                    newXData.columns[k] = interpolating.interp(xTS,y,newXTS, fill_value=np.nan)
+        elif names:
+            # The whole (time x band) matrix at once
+            y = np.column_stack([np.asarray(xData.data[k], dtype=np.float64) for k in names])
+            newY = interpolating.interpMatrix(xTS, y, newXTS, kind='cubic' if kind == 'cubic' else 'linear', fill_value=np.nan)
+            for j, k in enumerate(names):
+                newXData.columns[k] = newY[:, j]
 
         if ConfigFile.settings["bL1bPlotTimeInterp"] == 1 and dataName != 'T':
             print('Plotting time interpolations ' +dataName)
@@ -427,14 +415,18 @@ class ProcessL1b_Interp:
         newSensorData = newGroup.addDataset(newDatasetName)
 
         # Datetag, Timetag2, and Datetime columns added to sensor data array
-        newSensorData.columns["Datetag"] = dateData.data["NONE"].tolist()
-        newSensorData.columns["Timetag2"] = timeData.data["NONE"].tolist()
+        newSensorData.columns["Datetag"] = np.asarray(dateData.data["NONE"], dtype=np.float64)
+        newSensorData.columns["Timetag2"] = np.asarray(timeData.data["NONE"], dtype=np.float64)
         newSensorData.columns["Datetime"] = dateTimeData.data
 
         # Copies over the sensor dataset from original group to newGroup
+        #   Columns stay as numpy arrays (no list round trip); integers still go to float64 for hdf
         for k in dataset.data.dtype.names: # For each waveband (or vector data for other groups)
             #print("type",type(esData.data[k]))
-            newSensorData.columns[k] = dataset.data[k].tolist()
+            col = dataset.data[k]
+            if col.dtype.kind in ('i', 'u'):
+                col = col.astype(np.float64)
+            newSensorData.columns[k] = col
         newSensorData.columnsToDataset()
 
         newSensorData.attributes = group.attributes.copy()
@@ -488,22 +480,12 @@ class ProcessL1b_Interp:
 
         # Perform interpolation on full hyperspectral time series
         #   In the case of solar geometries, calculate to new times, don't interpolate
-        if dataName == 'SOLAR_AZ':
-            sunAzimuthAnc = []
-
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore", category=UserWarning)
-                for i, dt_utc in enumerate(yDatetime):
-                    sunAzimuthAnc.append(get_azimuth(latData.columns['NONE'][i],lonData.columns['NONE'][i],dt_utc,0))
-            xData.columns['NONE'] = sunAzimuthAnc
-        elif dataName == 'SZA':
-            sunZenithAnc = []
-
+        if dataName in ('SOLAR_AZ', 'SZA'):
             with warnings.catch_warnings():
                 warnings.simplefilter("ignore", category=UserWarning)
-                for i, dt_utc in enumerate(yDatetime):
-                    sunZenithAnc.append(90 - get_altitude(latData.columns['NONE'][i],lonData.columns['NONE'][i],dt_utc,0))
-            xData.columns['NONE'] = sunZenithAnc
+                sunAzimuthAnc, sunZenithAnc = solaring.sunPosition(\
+                    latData.columns['NONE'][:len(yDatetime)], lonData.columns['NONE'][:len(yDatetime)], yDatetime)
+            xData.columns['NONE'] = sunAzimuthAnc.tolist() if dataName == 'SOLAR_AZ' else sunZenithAnc.tolist()
         else:
             ProcessL1b_Interp.interpolateL1b_InterpTime(xData, xDatetime, yDatetime, xData, dataName, 'linear', fileName)
 
@@ -521,8 +503,8 @@ class ProcessL1b_Interp:
             of all sensors, the minimum highest wavelength, and the interval
             set in the Configuration Window. '''
 
-        # Copy dataset to dictionary
-        ds.datasetToColumns()
+        # Copy dataset to dictionary (numpy views, no list conversion)
+        ds.datasetToColumns(columnar=True)
         columns = ds.columns
         saveDatetag = columns.pop("Datetag")
         saveTimetag2 = columns.pop("Timetag2")
@@ -534,29 +516,21 @@ class ProcessL1b_Interp:
             wavelength.append(float(k))
 
         x = np.asarray(wavelength)
+        # (time x band) block of the spectra
+        spectra = np.column_stack([np.asarray(columns[k], dtype=np.float64) for k in columns])
 
         newColumns = collections.OrderedDict()
         newColumns["Datetag"] = saveDatetag
         newColumns["Timetag2"] = saveTimetag2
         # Can leave Datetime off at this point
 
-        for i in range(newWavebands.shape[0]):
-            # limit to one decimal place
-            newColumns[str(round(10*newWavebands[i])/10)] = []
-
-        # Perform interpolation for each timestamp
-        for timeIndex in range(len(saveDatetag)):
-            values = []
+        # Regrid all timestamps at once with the cubic spline operator from x to newWavebands
+        #   (equivalent to an InterpolatedUnivariateSpline(x, spectrum, k=3) per timestamp)
+        newSpectra = spectra @ interpolating.splineOperator(x, newWavebands).T
 
-            for k in columns:
-                values.append(columns[k][timeIndex])
-
-            y = np.asarray(values)
-            #new_y = sp.interpolate.interp1d(x, y)(newWavebands)
-            new_y = sp.interpolate.InterpolatedUnivariateSpline(x, y, k=3)(newWavebands)
-
-            for waveIndex in range(newWavebands.shape[0]):
-                newColumns[str(round(10*newWavebands[waveIndex])/10)].append(new_y[waveIndex])
+        for waveIndex in range(newWavebands.shape[0]):
+            # limit to one decimal place
+            newColumns[str(round(10*newWavebands[waveIndex])/10)] = newSpectra[:, waveIndex]
 
         newDS.columns = newColumns
         newDS.columnsToDataset()
@@ -632,7 +606,7 @@ class ProcessL1b_Interp:
             newLTData.attributes = esData.attributes.copy()
 
         # Es dataset to dictionary
-        esData.datasetToColumns()
+        esData.datasetToColumns(columnar=True)
         columns = esData.columns
         columns.pop("Datetag")
         columns.pop("Timetag2")
@@ -651,7 +625,7 @@ class ProcessL1b_Interp:
 
         if 'LI' in radiance_group_ids:
             # Li dataset to dictionary
-            liData.datasetToColumns()
+            liData.datasetToColumns(columnar=True)
             columns = liData.columns
             columns.pop("Datetag")
             columns.pop("Timetag2")
@@ -666,7 +640,7 @@ class ProcessL1b_Interp:
 
         if 'LT' in radiance_group_ids:
             # Lt dataset to dictionary
-            ltData.datasetToColumns()
+            ltData.datasetToColumns(columnar=True)
             columns = ltData.columns
             columns.pop("Datetag")
             columns.pop("Timetag2")
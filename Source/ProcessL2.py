@@ -5,6 +5,9 @@ import warnings
 import time
 import datetime
 import copy
+import functools
+import multiprocessing
+import multiprocessing.util
 import numpy as np
 import scipy as sp
 from PyQt5 import QtWidgets
@@ -13,14 +16,16 @@ from tqdm import tqdm
 # Source
 from Source.HDFRoot import HDFRoot
 from Source.ConfigFile import ConfigFile
+from Source.MainConfig import MainConfig
 from Source.RhoCorrections import RhoCorrections
 from Source.Weight_RSR import Weight_RSR
 from Source.ProcessL2OCproducts import ProcessL2OCproducts
 from Source.ProcessL2BRDF import ProcessL2BRDF
 
 # PIU
-from Source.PIU.Uncertainty_Analysis import Propagate
+from Source.PIU.Uncertainty_Analysis import AdaptiveMCPropagation
 from Source.PIU.PIUDataStore import PIUDataStore
+from Source.PIU.UncertaintyContext import UncertaintyContext
 from Source.PIU.HyperOCR import HyperOCR, HyperOCRUtils
 from Source.PIU.TriOS import TriOS
 from Source.PIU.DALEC import Dalec
@@ -33,6 +38,9 @@ from Source.utils import comparing
 from Source.utils import F0ing
 from Source.utils.uncertainties import unc_management as um
 
+# Per-process inputs of the ensemble workers (see ProcessL2.ensemblesParallel)
+_ensembleContext = {}
+
 
 class ProcessL2:
     ''' Process L2 '''
@@ -1080,6 +1088,46 @@ class ProcessL2:
         '''Calculate the lowest X% Lt(780). Check for Nans in Li, Lt, Es, or wind. Send out for
         meteorological quality flags. Perform glint corrections. Calculate the Rrs. Correct for NIR
         residuals.'''
+        ensemble = ProcessL2.ensembleAverages(node, sasGroup, refGroup, ancGroup, uncGroup,
+                                              esRawGroup, liRawGroup, ltRawGroup, sixSGroup, start, end)
+        if ensemble is False:
+            return False
+        return ProcessL2.ensembleProducts(node, sasGroup, refGroup, ancGroup, uncGroup,
+                                          esRawGroup, liRawGroup, ltRawGroup, sixSGroup, ensemble)
+
+    @staticmethod
+    def ensembleRawGroups(groups, esRawGroup, liRawGroup, ltRawGroup):
+        ''' Active raw groups (based on data available in groups, required to get std).
+            NOTE: "raw" here refers to pre-calibration L1AQC datasets '''
+        map_raw_groups = {'ES': esRawGroup, 'LI': liRawGroup, 'LT': ltRawGroup}
+        if ConfigFile.settings['SensorType'].lower() == "seabird":
+            return {k: {t: map_raw_groups[k][t] for t in ['LIGHT', 'DARK']} for k in groups}
+        return {k: map_raw_groups[k] for k in groups}
+
+    @staticmethod
+    def ensembleRawSlices(raw_groups, start, end):
+        ''' Slices of the active raw groups (ensembleRawGroups) '''
+        if ConfigFile.settings['SensorType'].lower() == "seabird":
+            raw_slices = {k: {t: {'datetime': grp[t].datasets['DATETIME'].data[start:end],
+                                  'data': ProcessL2.columnToSlice(grp[t].datasets[k].columns, start, end)}
+                              for t in ['LIGHT', 'DARK']} for k, grp in raw_groups.items()}
+        elif ConfigFile.settings['SensorType'].lower() == "dalec":
+            raw_slices = {k: {'datetime': grp.datasets['DATETIME'].data[start:end],
+                                'light': ProcessL2.columnToSlice(grp.datasets[k].columns, start, end),
+                              'dark': ProcessL2.columnToSlice(grp.datasets['DARK_CNT'].columns, start, end)}
+                            for k, grp in raw_groups.items()}
+        else:
+            raw_slices = {k: {'datetime': grp.datasets['DATETIME'].data[start:end],
+                              'data': ProcessL2.columnToSlice(grp.datasets[k].columns, start, end)}
+                          for k, grp in raw_groups.items()}
+        return raw_slices
+
+    @staticmethod
+    def ensembleAverages(node, sasGroup, refGroup, ancGroup, uncGroup,
+                         esRawGroup, liRawGroup, ltRawGroup, sixSGroup, start, end):
+        '''First part of ensemblesReflectance: calculate the lowest X% Lt(780), check for Nans in Li, Lt
+        or Es, and average the ensemble. The ancillary and 6S averages are added to node. Returns the
+        averages and sensor statistics ensembleProducts continues from, or False.'''
 
         # %% Get dataset
         if ConfigFile.settings["SensorType"].lower() == "trios es only":
@@ -1106,30 +1154,12 @@ class ProcessL2:
             return False
 
         # %% Get active raw groups (based on data available in groups, required to get std)
-        # NOTE: "raw" here refers to pre-calibration L1AQC datasets
-        map_raw_groups = {'ES': esRawGroup, 'LI': liRawGroup, 'LT': ltRawGroup}
-        if ConfigFile.settings['SensorType'].lower() == "seabird":
-            raw_groups = {k: {t: map_raw_groups[k][t] for t in ['LIGHT', 'DARK']} for k in groups}
-            raw_slices = {k: {t: {'datetime': grp[t].datasets['DATETIME'].data[start:end],
-                                  'data': ProcessL2.columnToSlice(grp[t].datasets[k].columns, start, end)}
-                              for t in ['LIGHT', 'DARK']} for k, grp in raw_groups.items()}
-        elif ConfigFile.settings['SensorType'].lower() == "dalec":
-            raw_groups = {k: map_raw_groups[k] for k in groups}
-            raw_slices = {k: {'datetime': grp.datasets['DATETIME'].data[start:end],
-                                'light': ProcessL2.columnToSlice(grp.datasets[k].columns, start, end),
-                              'dark': ProcessL2.columnToSlice(grp.datasets['DARK_CNT'].columns, start, end)}
-                            for k, grp in raw_groups.items()}
-        else:
-            raw_groups = {k: map_raw_groups[k] for k in groups}
-            raw_slices = {k: {'datetime': grp.datasets['DATETIME'].data[start:end],
-                              'data': ProcessL2.columnToSlice(grp.datasets[k].columns, start, end)}
-                          for k, grp in raw_groups.items()}
+        raw_groups = ProcessL2.ensembleRawGroups(groups, esRawGroup, liRawGroup, ltRawGroup)
+        raw_slices = ProcessL2.ensembleRawSlices(raw_groups, start, end)
 
         # %% Get Configuration
         enable_percent_lt = float(ConfigFile.settings["bL2EnablePercentLt"])
         percent_lt = float(ConfigFile.settings["fL2PercentLt"])
-        three_c_rho = int(ConfigFile.settings["bL23CRho"])
-        zhang_rho = int(ConfigFile.settings["bL2Z17Rho"])
         if ConfigFile.settings["SensorType"].lower() == "dalec":
             sensor, sensor_type = Dalec(), 'Dalec'
         elif ConfigFile.settings["SensorType"].lower() in ["sorad", "trios", "trios es only"]:
@@ -1169,22 +1199,22 @@ class ProcessL2:
         # %% Convolve to satellite bands
         convolve_to_satellite, satellite_bands = {}, {}
         if ConfigFile.settings['bL2WeightMODISA']:
-            convolve_to_satellite['MODISA'] = lambda sliceData: Weight_RSR.processMODISBands(sliceData, sensor='A')
+            convolve_to_satellite['MODISA'] = functools.partial(Weight_RSR.processMODISBands, sensor='A')
             satellite_bands['MODIS'] = Weight_RSR.MODISBands()
         if ConfigFile.settings['bL2WeightMODIST']:
-            convolve_to_satellite['MODIST'] = lambda sliceData: Weight_RSR.processMODISBands(sliceData, sensor='T')
+            convolve_to_satellite['MODIST'] = functools.partial(Weight_RSR.processMODISBands, sensor='T')
             satellite_bands['MODIS'] = Weight_RSR.MODISBands()
         if ConfigFile.settings['bL2WeightVIIRSN']:
-            convolve_to_satellite['VIIRSN'] = lambda sliceData: Weight_RSR.processVIIRSBands(sliceData, sensor='N')
+            convolve_to_satellite['VIIRSN'] = functools.partial(Weight_RSR.processVIIRSBands, sensor='N')
             satellite_bands['VIIRS'] = Weight_RSR.VIIRSBands()
         if ConfigFile.settings['bL2WeightVIIRSJ']:
-            convolve_to_satellite['VIIRSJ'] = lambda sliceData: Weight_RSR.processVIIRSBands(sliceData, sensor='J')
+            convolve_to_satellite['VIIRSJ'] = functools.partial(Weight_RSR.processVIIRSBands, sensor='J')
             satellite_bands['VIIRS'] = Weight_RSR.VIIRSBands()
         if ConfigFile.settings['bL2WeightSentinel3A']:
-            convolve_to_satellite['Sentinel3A'] = lambda sliceData: Weight_RSR.processSentinel3Bands(sliceData, sensor='A')
+            convolve_to_satellite['Sentinel3A'] = functools.partial(Weight_RSR.processSentinel3Bands, sensor='A')
             satellite_bands['Sentinel3'] = Weight_RSR.Sentinel3Bands()
         if ConfigFile.settings['bL2WeightSentinel3B']:
-            convolve_to_satellite['Sentinel3B'] = lambda sliceData: Weight_RSR.processSentinel3Bands(sliceData, sensor='B')
+            convolve_to_satellite['Sentinel3B'] = functools.partial(Weight_RSR.processSentinel3Bands, sensor='B')
             satellite_bands['Sentinel3'] = Weight_RSR.Sentinel3Bands()
 
         satellite_slice = {satellite: {k: convolve_to_satellite[satellite](sliceData) for k, sliceData in data_slice.items()}
@@ -1313,6 +1343,32 @@ class ProcessL2:
         newAncGroup = node.getGroup("ANCILLARY")  # Just populated above
         newAncGroup.attributes['ANC_SOURCE_FLAGS'] = ['0: Undetermined, 1: Field, 2: Model, 3: Fallback']
 
+        return {'start': start, 'end': end, 'es_only': es_only, 'sensor': sensor, 'stats': stats,
+                'wavelengths': wavelengths, 'timestamp_dict': timestamp_dict,
+                'slice_mean': slice_mean, 'slice_median': slice_median, 'slice_remaining': slice_remaining,
+                'convolve_to_satellite': convolve_to_satellite, 'satellite_bands': satellite_bands,
+                'satellite_slice_mean': satellite_slice_mean, 'satellite_slice_median': satellite_slice_median,
+                'satellite_slice_remaining': satellite_slice_remaining, 'satellite_slice_std': satellite_slice_std,
+                # FRM uncertainties read the raw slices as the sensor statistics left them (NaN scans removed)
+                'raw_slices': raw_slices if ConfigFile.settings["fL1bCal"] == 3 else None}
+
+    @staticmethod
+    def ensembleProducts(node, sasGroup, refGroup, ancGroup, uncGroup,
+                         esRawGroup, liRawGroup, ltRawGroup, sixSGroup, ensemble):
+        '''Second part of ensemblesReflectance, from the averages of ensembleAverages (whose ancillary
+        averages are the last in node): perform glint corrections, calculate the Rrs, propagate
+        uncertainties and correct for NIR residuals.'''
+        start = ensemble['start']
+        es_only, sensor, stats = ensemble['es_only'], ensemble['sensor'], ensemble['stats']
+        wavelengths, timestamp_dict = ensemble['wavelengths'], ensemble['timestamp_dict']
+        slice_mean, slice_median, slice_remaining = ensemble['slice_mean'], ensemble['slice_median'], ensemble['slice_remaining']
+        convolve_to_satellite, satellite_bands = ensemble['convolve_to_satellite'], ensemble['satellite_bands']
+        satellite_slice_mean, satellite_slice_median = ensemble['satellite_slice_mean'], ensemble['satellite_slice_median']
+        satellite_slice_remaining, satellite_slice_std = ensemble['satellite_slice_remaining'], ensemble['satellite_slice_std']
+        three_c_rho = int(ConfigFile.settings["bL23CRho"])
+        zhang_rho = int(ConfigFile.settings["bL2Z17Rho"])
+        newAncGroup = node.getGroup("ANCILLARY")
+
         anc_slice = {}
         for param in ['WINDSPEED', 'SZA', 'SST', 'SALINITY', 'REL_AZ', 'AOD']:
             if param in newAncGroup.datasets:
@@ -1338,6 +1394,9 @@ class ProcessL2:
             else:
                 anc_slice[param] = None
 
+        # Monte Carlo draws from here on depend only on the seed and the ensemble, not on the ensembles before it
+        AdaptiveMCPropagation.seed(start)
+
         # %% Calculate rho_sky for the ensemble
         if es_only:
             rho_scalar, rho_vec, rho_unc = None, None, None
@@ -1480,7 +1539,9 @@ class ProcessL2:
 
         elif ConfigFile.settings["fL1bCal"] == 3:  # FRM-Sensor Specific
 
-            PDS = PIUDataStore(node, uncGroup, raw_groups, raw_slices)
+            groups = ['ES'] if es_only else ['ES', 'LI', 'LT']
+            raw_groups = ProcessL2.ensembleRawGroups(groups, esRawGroup, liRawGroup, ltRawGroup)
+            PDS = PIUDataStore(node, uncGroup, raw_groups, ensemble['raw_slices'])
 
             l1b_unc, x_breakdown_corr, x_breakdown_unc = sensor.FRM(PDS, stats, wavelengths)
             x_slice['f0'] = F0_hyper
@@ -1491,8 +1552,12 @@ class ProcessL2:
             else:
                 x_unc = sensor.FRML2(PDS, rho_scalar, rho_vec, rho_unc, wavelengths, x_slice, x_breakdown_unc)
 
-        # log uncertainty processing time
+        # log uncertainty processing time and Monte Carlo draws
         logging.writeLogFileAndPrint(f"ProcessL2.ensemblesReflectance: Uncertainty Update Elapsed Time: {time.process_time() - tic:.1f} s")
+        draws = AdaptiveMCPropagation.draws_used()
+        if draws['propagations']:
+            logging.writeLogFileAndPrint(f"ProcessL2.ensemblesReflectance: {draws['total']} Monte Carlo draws in "
+                                         f"{draws['propagations']} propagations ({draws['min']}-{draws['max']} each)")
 
         # Move uncertainties to x_unc and drop samples form x_slice
         if x_unc is not None:
@@ -1599,7 +1664,7 @@ class ProcessL2:
 
             if ConfigFile.settings["bL2RhoUnc10"] == 0:
                 # reduced number of draws because of how computationally intensive the Zhang method is
-                rho_uncertainty_obj = Propagate(M=10, cores=1)
+                rho_uncertainty_obj = UncertaintyContext.propagator(M=10, cores=1)
             else:
                 rho_uncertainty_obj = None
 
@@ -1635,7 +1700,7 @@ class ProcessL2:
         elif method == "mobley_rho":
             if ConfigFile.settings["bL2RhoUnc10"] == 0:
                 # Full Mobley 1999 model from LUT
-                rho_uncertainty_obj = Propagate(M=100, cores=1)  # Standard number of draws for reasonable uncertainty estimates
+                rho_uncertainty_obj = UncertaintyContext.propagator(M=100, cores=1)  # Standard number of draws for reasonable uncertainty estimates
             else:
                 rho_uncertainty_obj = None
             if 'AOD' in anc_slice:
@@ -1660,6 +1725,262 @@ class ProcessL2:
 
         return rhoScalar, rhoVec, rhoUNC, np.array(wavelengths)
 
+    @staticmethod
+    def ensembleSchedule(timeStamp, interval):
+        ''' Start and stop indexes of the ensembles in processing order, as (start, stop, afterFailure).
+            afterFailure marks the closing ensemble that is only processed if the one before it failed. '''
+        esLength = len(timeStamp)
+        if interval == 0:
+            # Here, take the complete time series
+            return [(i, i+1, False) for i in range(0, esLength-1)]
+
+        schedule = []
+        startEnsIndx = 0
+        stopEnsTime = timeStamp[0] + datetime.timedelta(0,interval)
+        endFileTime = timeStamp[-1]
+        EndOfFileFlag = False
+        afterFailure = False
+        # stopEnsTime is theoretical based on interval
+        if stopEnsTime > endFileTime:
+            stopEnsTime = endFileTime
+            EndOfFileFlag = True # In case the whole file is shorter than the selected interval
+
+        for i in range(0, esLength):
+            timei = timeStamp[i]
+            if (timei > stopEnsTime) or EndOfFileFlag: # end of ensemble reached
+                if EndOfFileFlag:
+                    schedule.append((startEnsIndx, esLength-1, afterFailure)) # include all remaining spectra
+                    break # End of file reached. Safe to break
+
+                stopEnsTime = timei + datetime.timedelta(0,interval) # increment for the next bin loop
+                stopEnsIndx = i # end of the slice is up to and not including...so -1 is not needed
+                if stopEnsTime > endFileTime:
+                    stopEnsTime = endFileTime
+                    EndOfFileFlag = True
+
+                schedule.append((startEnsIndx, stopEnsIndx, False))
+                startEnsIndx = i
+                # Once the end of file is in this ensemble, processing only continues if it fails
+                afterFailure = EndOfFileFlag
+
+        # For the rare case where end of record is reached at, but not exceeding, stopEnsTime...
+        if not EndOfFileFlag:
+            schedule.append((startEnsIndx, i+1, False)) # i is the index of end of record; plus one to include i due to -1 list slicing
+        return schedule
+
+
+    @staticmethod
+    def ensemblesSerial(node, inputGroups, schedule):
+        ''' Run ensemblesReflectance over the schedule, one ensemble after the other '''
+        succeeded = True
+        for start, stop, afterFailure in tqdm(schedule, unit='ensemble'):
+            if afterFailure and succeeded:
+                continue
+            succeeded = ProcessL2.ensemblesReflectance(node, *inputGroups, start, stop)
+            if not succeeded:
+                logging.writeLogFileAndPrint(f'ProcessL2.ensemblesReflectance failed for records {start}:{stop}. Continue.')
+
+
+    @staticmethod
+    def ensemblesParallel(node, inputGroups, schedule, workers):
+        ''' Run ensemblesReflectance over the schedule in a pool of worker processes and merge the results
+            into node in time order. The output is the same as ensemblesSerial:
+            ensembles read the ancillary and 6S averages of the ensembles before them (PIUDataStore), so
+            ensembleAverages runs for every ensemble in a first pass, and ensembleProducts continues from
+            its averages in a second pass, once the ancillary averages of all ensembles are known. '''
+        parallel = [(start, stop) for start, stop, afterFailure in schedule if not afterFailure]
+        initargs = (node, inputGroups, ConfigFile.settings, ConfigFile.products, ConfigFile.filename, MainConfig.settings)
+        logging.writeLogFileAndPrint(f'Processing {len(parallel)} ensembles with {workers} worker processes.')
+
+        with multiprocessing.Pool(workers, initializer=ProcessL2._initEnsembleWorker, initargs=initargs) as pool:
+            averages = pool.map(ProcessL2._ensembleAveragesWorker, parallel, chunksize=1)
+            pool.close()
+            pool.join()
+        for *_, counts in averages:
+            UncertaintyContext.merge(counts)
+        averages = [result for *result, counts in averages]
+        ancillaryRows = [rows for ensemble, rows, percentLt, content in averages]
+
+        succeeded = True
+        with multiprocessing.Pool(workers, initializer=ProcessL2._initEnsembleWorker,
+                                  initargs=initargs + (ancillaryRows,)) as pool:
+            tasks = [(index, ensemble, percentLt, content)
+                     for index, (ensemble, rows, percentLt, content) in enumerate(averages) if ensemble is not False]
+            results = pool.imap(ProcessL2._ensembleProductsWorker, tasks, chunksize=1)
+            converted = set()
+            for (start, stop), (ensemble, rows, percentLt, content) in tqdm(zip(parallel, averages),
+                                                                           total=len(parallel), unit='ensemble'):
+                succeeded = ensemble is not False
+                if succeeded:
+                    # Products hold the averaging datasets too, as they ran on a node holding them
+                    succeeded, content, counts = next(results)
+                    UncertaintyContext.merge(counts)
+                if not succeeded:
+                    logging.writeLogFileAndPrint(f'ProcessL2.ensemblesReflectance failed for records {start}:{stop}. Continue.')
+                ProcessL2._mergeEnsemble(node, percentLt, content, converted)
+            pool.close()
+            pool.join()
+
+        for groupID in ('ANCILLARY', 'SIXS_MODEL'):
+            ProcessL2._appendAncillary(node.addGroup(groupID),
+                                       [rows[groupID] for rows in ancillaryRows if groupID in rows])
+        for groupID, dsID in converted:
+            node.getGroup(groupID).getDataset(dsID).columnsToDataset()
+
+        # The closing ensemble depends on the outcome of the one before it, so runs on the merged node
+        start, stop, afterFailure = schedule[-1]
+        if afterFailure and not succeeded:
+            if not ProcessL2.ensemblesReflectance(node, *inputGroups, start, stop):
+                logging.writeLogFileAndPrint(f'ProcessL2.ensemblesReflectance failed for records {start}:{stop}. Continue.')
+
+
+    @staticmethod
+    def _initEnsembleWorker(template, inputGroups, settings, products, filename, mainSettings, ancillaryRows=None):
+        ''' Pool initializer. ConfigFile and MainConfig are not inherited by spawned processes, so they are passed in too. '''
+        ConfigFile.settings = settings
+        ConfigFile.products = products
+        ConfigFile.filename = filename
+        MainConfig.settings = mainSettings
+        _ensembleContext.update(template=template, inputGroups=inputGroups, ancillaryRows=ancillaryRows)
+        # The worker's context serves all of its tasks and closes when the pool is closed. Its counters go to
+        # the parent process with each task result (UncertaintyContext.collect), so end() has nothing left to log.
+        ProcessL2._beginUncertainty()
+        multiprocessing.util.Finalize(None, UncertaintyContext.end, exitpriority=0)
+
+
+    @staticmethod
+    def _beginUncertainty():
+        ''' Open the uncertainty context of the ensembles and apply the Monte Carlo settings '''
+        UncertaintyContext.begin()
+        AdaptiveMCPropagation.configure(ConfigFile.settings["fL2MCSeed"], ConfigFile.settings["fL2MCTolerance"],
+                                        ConfigFile.settings["fL2MCMaxDraws"])
+
+
+    @staticmethod
+    def _ensembleNode(template):
+        ''' Empty output node for one ensemble. L1AQC groups are shared, as ensembles only read them. '''
+        node = HDFRoot()
+        node.copyAttributes(template)
+        for gp in template.groups:
+            if gp.id.endswith('_L1AQC'):
+                node.groups.append(gp)
+            else:
+                node.addGroup(gp.id).copy(gp)
+        return node
+
+
+    @staticmethod
+    def _ensembleContent(node):
+        ''' PERCENT_LT state of an ensemble node and the datasets added to it, but the ancillary averages '''
+        percentLt = None
+        if 'PERCENT_LT_GLITTER_CORRECTION' in node.attributes:
+            # Ensemble_N is appended right after PERCENT_LT, once the sensor statistics are generated
+            percentLt = (node.attributes['PERCENT_LT'], 'Ensemble_N' in node.getGroup('IRRADIANCE').datasets)
+
+        content = []
+        for gp in node.groups:
+            if gp.id.endswith('_L1AQC'):
+                continue
+            datasets = collections.OrderedDict()
+            if gp.id not in ('ANCILLARY', 'SIXS_MODEL'): # Merged from the averaging pass
+                for dsID, ds in gp.datasets.items():
+                    datasets[dsID] = (ds.attributes, ds.columns, ds.data is not None)
+            content.append((gp.id, gp.attributes, datasets))
+        return percentLt, content
+
+
+    @staticmethod
+    def _ensembleAveragesWorker(bounds):
+        ''' ensembleAverages of one ensemble. Returns its averages (or False), its ancillary and 6S
+            averages as {group: {dataset: columns}}, its PERCENT_LT state, the datasets it added and
+            the uncertainty context counters of the worker (UncertaintyContext.collect). '''
+        start, stop = bounds
+        node = ProcessL2._ensembleNode(_ensembleContext['template'])
+        ensemble = ProcessL2.ensembleAverages(node, *_ensembleContext['inputGroups'], start, stop)
+        rows = {}
+        for groupID in ('ANCILLARY', 'SIXS_MODEL'):
+            gp = node.getGroup(groupID)
+            if gp is not None and gp.datasets:
+                rows[groupID] = collections.OrderedDict((dsID, ds.columns) for dsID, ds in gp.datasets.items())
+        percentLt, content = ProcessL2._ensembleContent(node)
+        return ensemble, rows, percentLt, content, UncertaintyContext.collect()
+
+
+    @staticmethod
+    def _ensembleProductsWorker(task):
+        ''' ensembleProducts of one ensemble, on a node holding its averages and the ancillary averages of
+            the ensembles up to it. Returns whether it succeeded, the datasets of the node and the
+            uncertainty context counters of the worker. '''
+        index, ensemble, percentLt, content = task
+        node = ProcessL2._ensembleNode(_ensembleContext['template'])
+        rows = _ensembleContext['ancillaryRows'][:index+1]
+        for groupID in ('ANCILLARY', 'SIXS_MODEL'):
+            ProcessL2._appendAncillary(node.addGroup(groupID), [ensembleRows[groupID] for ensembleRows in rows if groupID in ensembleRows])
+        converted = set()
+        ProcessL2._mergeEnsemble(node, percentLt, content, converted)
+        for groupID, dsID in converted:
+            node.getGroup(groupID).getDataset(dsID).columnsToDataset()
+
+        succeeded = ProcessL2.ensembleProducts(node, *_ensembleContext['inputGroups'], ensemble)
+        return succeeded, ProcessL2._ensembleContent(node)[1], UncertaintyContext.collect()
+
+
+    @staticmethod
+    def _appendAncillary(group, rows):
+        ''' Add the ancillary averages of consecutive ensembles to group, as sliceAveOther would have:
+            the first ensemble's columns as they are, then np.append for the others '''
+        columns = collections.OrderedDict()
+        for ensembleRows in rows:
+            for dsID, dsColumns in ensembleRows.items():
+                columns.setdefault(dsID, []).append(dsColumns)
+
+        for dsID, dsColumnsList in columns.items():
+            newDS = group.getDataset(dsID) or group.addDataset(dsID)
+            if newDS.columns:
+                dsColumnsList = [newDS.columns] + dsColumnsList
+            if len(dsColumnsList) == 1:
+                newDS.columns = collections.OrderedDict(dsColumnsList[0])
+            else:
+                newDS.columns = collections.OrderedDict(
+                    (item, np.concatenate([np.ravel(dsColumns[item]) for dsColumns in dsColumnsList]))
+                    for item in dsColumnsList[0])
+            newDS.columns.move_to_end('Timetag2', last=False)
+            newDS.columns.move_to_end('Datetag', last=False)
+            newDS.columns.move_to_end('Datetime', last=False)
+            newDS.columnsToDataset()
+
+
+    @staticmethod
+    def _mergeEnsemble(node, percentLt, content, converted):
+        ''' Append the datasets added by one ensemble to node. Datasets are converted
+            (columnsToDataset) once all ensembles are merged; converted collects which. '''
+        if percentLt is not None:
+            value, statsGenerated = percentLt
+            if 'PERCENT_LT_GLITTER_CORRECTION' not in node.attributes:
+                node.attributes.update(PERCENT_LT_GLITTER_CORRECTION='ON')
+                node.attributes.update(PERCENT_LT=value)
+            elif statsGenerated:
+                node.attributes['PERCENT_LT'] = ','.join([node.attributes['PERCENT_LT'], value])
+
+        for groupID, attributes, datasets in content:
+            gp = node.addGroup(groupID)
+            gp.attributes.update(attributes)
+            for dsID, (dsAttributes, dsColumns, dsConverted) in datasets.items():
+                ds = gp.getDataset(dsID)
+                if ds is None:
+                    ds = gp.addDataset(dsID)
+                ds.attributes.update(dsAttributes)
+                for k, v in dsColumns.items():
+                    if k not in ds.columns:
+                        ds.columns[k] = v
+                    elif isinstance(ds.columns[k], list):
+                        ds.columns[k].extend(v)
+                    else:
+                        ds.columns[k] = np.append(ds.columns[k], v)
+                if dsConverted:
+                    converted.add((groupID, dsID))
+
+
     @staticmethod
     def stationsEnsemblesReflectance(node, root, station=None):
         ''' Extract stations if requested, then pass to ensemblesReflectance for ensemble
@@ -1805,7 +2126,6 @@ class ProcessL2:
         esData = referenceGroup.getDataset("ES")
         esColumns = esData.columns
         timeStamp = esColumns["Datetime"]
-        esLength = len(list(esColumns.values())[0])
         interval = float(ConfigFile.settings["fL2TimeInterval"])
 
         # interpolate Light/Dark data for Raw groups if HyperOCR data is being processed
@@ -1816,72 +2136,26 @@ class ProcessL2:
                         HyperOCRUtils.darkToLightTimer(ltRawGroup, 'LT')]):
                 logging.writeLogFileAndPrint("failed to interpolate dark data to light data timer")
         if interval == 0:
-            # Here, take the complete time series
             print("No time binning. This can take a moment.")
-            progressBar = tqdm(total=esLength, unit_scale=True, unit_divisor=1)
-            for i in range(0, esLength-1):
-                progressBar.update(1)
-                startEnsIndx = i
-                stopEnsIndx = i+1
-
-                if not ProcessL2.ensemblesReflectance(node, sasGroup, referenceGroup, ancGroup,
-                                                    uncGroup, esRawGroup,liRawGroup, ltRawGroup,
-                                                    sixSGroup, startEnsIndx, stopEnsIndx):
-                    logging.writeLogFileAndPrint('ProcessL2.ensemblesReflectance unsliced failed. Abort.')
-                    continue
         else:
             logging.writeLogFileAndPrint('Binning datasets to ensemble time interval.')
-
-            # Iterate over the time ensembles
-            startEnsIndx = 0
-            stopEnsTime = timeStamp[0] + datetime.timedelta(0,interval)
-            endFileTime = timeStamp[-1]
-            EndOfFileFlag = False
-            # stopEnsTime is theoretical based on interval
-            if stopEnsTime > endFileTime:
-                stopEnsTime = endFileTime
-                EndOfFileFlag = True # In case the whole file is shorter than the selected interval
-
-            for i in range(0, esLength):
-                timei = timeStamp[i]
-                if (timei > stopEnsTime) or EndOfFileFlag: # end of ensemble reached
-                    if EndOfFileFlag:
-                        stopEnsIndx = len(timeStamp)-1 # File shorter than interval; include all spectra
-                        if not ProcessL2.ensemblesReflectance(node, sasGroup, referenceGroup, ancGroup,
-                                                            uncGroup, esRawGroup,liRawGroup, ltRawGroup,
-                                                            sixSGroup, startEnsIndx, stopEnsIndx):
-                            logging.writeLogFileAndPrint('ProcessL2.ensemblesReflectance with slices failed. Continue.')
-                            break # End of file reached. Safe to break
-
-                        break # End of file reached. Safe to break
-                    else:
-                        stopEnsTime = timei + datetime.timedelta(0,interval) # increment for the next bin loop
-                        stopEnsIndx = i # end of the slice is up to and not including...so -1 is not needed
-
-                    if stopEnsTime > endFileTime:
-                        stopEnsTime = endFileTime
-                        EndOfFileFlag = True
-
-                    if not ProcessL2.ensemblesReflectance(node, sasGroup, referenceGroup, ancGroup,
-                                                            uncGroup, esRawGroup,liRawGroup, ltRawGroup,
-                                                            sixSGroup, startEnsIndx, stopEnsIndx):
-                        logging.writeLogFileAndPrint('ProcessL2.ensemblesReflectance with slices failed. Continue.')
-
-                        startEnsIndx = i
-                        continue # End of ensemble reached. Continue.
-                    startEnsIndx = i
-
-                    if EndOfFileFlag:
-                        # No need to continue incrementing; all records captured in one ensemble
-                        break
-
-            # For the rare case where end of record is reached at, but not exceeding, stopEnsTime...
-            if not EndOfFileFlag:
-                stopEnsIndx = i+1 # i is the index of end of record; plus one to include i due to -1 list slicing
-                if not ProcessL2.ensemblesReflectance(node, sasGroup, referenceGroup, ancGroup,
-                                                            uncGroup, esRawGroup,liRawGroup, ltRawGroup,
-                                                            sixSGroup, startEnsIndx, stopEnsIndx):
-                    logging.writeLogFileAndPrint('ProcessL2.ensemblesReflectance ender clause failed.')
+        schedule = ProcessL2.ensembleSchedule(timeStamp, interval)
+        inputGroups = (sasGroup, referenceGroup, ancGroup, uncGroup, esRawGroup, liRawGroup, ltRawGroup, sixSGroup)
+
+        workers = int(ConfigFile.settings["fL2EnsembleWorkers"])
+        if workers > 1 and multiprocessing.current_process().daemon:
+            # Files are already being processed in a pool (e.g. run_Sample_Data), which cannot have children
+            logging.writeLogFileAndPrint('Running in a worker process. Ensembles will be processed serially.')
+            workers = 1
+        # Ensemble-invariant uncertainty inputs are built by the first ensemble and reused by the rest
+        ProcessL2._beginUncertainty()
+        try:
+            if workers > 1 and len(schedule) > 1:
+                ProcessL2.ensemblesParallel(node, inputGroups, schedule, workers)
+            else:
+                ProcessL2.ensemblesSerial(node, inputGroups, schedule)
+        finally:
+            UncertaintyContext.end()
 
         #####################################
         #
@@ -2043,20 +2317,20 @@ class ProcessL2:
             logging.writeLogFileAndPrint("Calculating derived geophysical and inherent optical properties "
                                            "is not supported for Trios ES only. Skipping.")
         elif ConfigFile.settings["bL2BRDF"]:
+            BRDF_options = []
             if ConfigFile.settings['bL2BRDF_fQ']:
                 logging.writeLogFileAndPrint("Applying iterative Morel et al. 2002 BRDF correction to Rrs and nLw")
-                ProcessL2BRDF.procBRDF(node, BRDF_option='M02')
-                # brdf_unc = node.getGroup("REFLECTANCE").getDataset("Rrs_HYPER_unc_M02").columns
-
+                BRDF_options.append('M02')
             if ConfigFile.settings['bL2BRDF_IOP']:
                 logging.writeLogFileAndPrint("Applying Lee et al. 2011 BRDF correction to Rrs and nLw")
-                ProcessL2BRDF.procBRDF(node, BRDF_option='L11')
-                # brdf_unc = node.getGroup("REFLECTANCE").getDataset("Rrs_HYPER_unc_L11").columns
-
+                BRDF_options.append('L11')
             if ConfigFile.settings['bL2BRDF_O25']:
                 logging.writeLogFileAndPrint("Applying Pitarch et al. 2025 BRDF correction to Rrs and nLw")
-                ProcessL2BRDF.procBRDF(node, BRDF_option='O25')
-                # brdf_unc = node.getGroup("REFLECTANCE").getDataset("Rrs_HYPER_unc_O25").columns
+                BRDF_options.append('O25')
+            if BRDF_options:
+                # Keyed apart from every ensemble, so the draws do not depend on where the ensembles ran
+                AdaptiveMCPropagation.seed(0, 0)
+                ProcessL2BRDF.procBRDF(node, BRDF_option=BRDF_options)
 
             # BD_ds = node.getGroup("BREAKDOWN").addDataset("BRDF")
             # BD_ds.columns['BRDF'] = brdf_unc
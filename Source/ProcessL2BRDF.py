@@ -2,7 +2,6 @@
 import logging
 
 import numpy as np
-import xarray as xr
 import Source.ocbrdf.ocbrdf_main as oc_brdf
 from Source.ConfigFile import ConfigFile
 from Source.utils.loggingHCP import writeLogFileAndPrint
@@ -24,15 +23,21 @@ class ProcessL2BRDF():
     # 2024.07.10: adapted for HyperCP by Juan Gossn (EUMETSAT) from Constant Mazeran's BRDF Python tool (BRDF4OLCI project)'''
 
     @staticmethod
-
-    def procBRDF(root,BRDF_option='M02'):
+    def procBRDF(root, BRDF_option='M02'):
         '''
         Purpose: read all the necessary inputs to perform BRDF correction
         root: an HDF object containing all the necessary ancillary info + already computed radiometric quantities
             These are the directional Rrs and nLw
-        BRDF_option: a string, a tag for the selected BRDF scheme
+        BRDF_option: a string, a tag for the selected BRDF scheme, or a list of them to apply together
             M02: Morel et al. 2002 scheme
+            L11: Lee et al. 2011 scheme
+            O25: Pitarch et al. 2025 scheme
+        All ensembles (rows) of each Rrs dataset are corrected at once, for every option in a single call.
         '''
+        BRDF_options = [BRDF_option] if isinstance(BRDF_option, str) else list(BRDF_option)
+        for option in BRDF_options:
+            if option not in ['L11', 'O25', 'M02', 'M02_SeaDAS']:
+                raise ValueError('BRDF option %s not supported.' % option)
 
         # Assuming that measurement protocol is well followed, then sensor should be pointing towards 40 degrees from nadir
         #   NOTE: Juan, can this work with viewz of 30? We should check what is set in the GUI.
@@ -51,6 +56,10 @@ class ProcessL2BRDF():
                 aod = gp.datasets["AOD"].columns["AOD"]
                 wind = gp.datasets["WINDSPEED"].columns["WINDSPEED"]
 
+        # Uncertainties are propagated for FRM/class-based regimes and SeaBird
+        withUnc = ConfigFile.settings['fL1bCal'] >= 2 or ConfigFile.settings['SensorType'].lower() == 'seabird'
+        timeKeys = ['Datetime', 'Datetag', 'Timetag2']
+
         for gp in root.groups:
             if (gp.id == "REFLECTANCE"):
                 # NB: BRDF Morel must be applied over Rrs and not nLw because of the iterative process to update chl.
@@ -62,66 +71,35 @@ class ProcessL2BRDF():
                         # Can't change datasets in this loop, so make a list
                         if not (ds.endswith("_uncorr") or ds.endswith("_O25") or ds.endswith("_L11") or ds.endswith("_M02") or ds.endswith("_unc") or ds.endswith("_sd")):
                             Rrs_list.append(ds)
-                
+
                 # ensure hyperspectral dataset is the first in the loop
                 Rrs_list.insert(0, Rrs_list.pop(Rrs_list.index("Rrs_HYPER")))
-                
-                # I have refactored this to loop through Rrs and nLw at the same time as it makes managing variables for the uncertainty easier
 
-                # dicts to store hyperspectral info for convolving BRDF uncs
-                brdf_unc = {} 
-                hyperspec = {}
+                # Per option: BRDF corrected hyperspectral Rrs and nLw and their BRDF uncertainties (n x bands),
+                #   convolved to the satellite bands for the uncertainties of the satellite datasets
+                hyperspec = {option: {} for option in BRDF_options}
+                outputs = {option: [] for option in BRDF_options}
+                prop = None
 
-                # Extract the spectrla information
                 for ds in Rrs_list:  # Rrs_list = [Rrs_HYPER, Rrs_MODISA, Rrs_Sentinel3A, etc.]
-                    Rrs_ds = gp.getDataset(ds)
-                    Rrs = Rrs_ds.columns
-                    
-                    # Store BRDF corrected rrs
-                    Rrs_BRDF = Rrs.copy()
+                    Rrs = gp.getDataset(ds).columns
+                    nLw = gp.getDataset(ds.replace('Rrs','nLw')).columns
+                    wv_str = [k for k in Rrs if k not in timeKeys]
+                    wavelength = np.array([float(k) if '.' in k else int(k) for k in wv_str])
 
-                    # Apply same factors to corresponding nLw
-                    nLw_ds = gp.getDataset(ds.replace('Rrs','nLw'))
-                    nLw = nLw_ds.columns
-
-                    nLw_BRDF = nLw.copy()
-                    
+                    Rrs_unc, nLw_unc = None, None
                     try:
-                        # get uncertainty datasets and columns for Rrs and nLw, passig with AttributeError if they do not exits.
-                        Rrs_unc_ds = gp.getDataset(f"{ds}_unc")
-                        Rrs_unc = Rrs_unc_ds.columns
-                        Rrs_BRDF_unc = Rrs_unc.copy()
-
-                        nLw_unc_ds = gp.getDataset(f"{ds.replace('Rrs','nLw')}_unc")
-                        nLw_unc = nLw_unc_ds.columns
-                        nLw_BRDF_unc = nLw_unc.copy()
+                        # get uncertainty datasets and columns for Rrs and nLw, passing with AttributeError if they do not exist.
+                        Rrs_unc = gp.getDataset(f"{ds}_unc").columns
+                        nLw_unc = gp.getDataset(f"{ds.replace('Rrs','nLw')}_unc").columns
                     except AttributeError:  # faster to ask forgiveness than permission
-                        if ConfigFile.settings['fL1bCal'] >= 2 or ConfigFile.settings['SensorType'].lower() == 'seabird':
+                        if withUnc:
                             writeLogFileAndPrint("Uncertainty group(s) not found")
-                        else:
-                            pass  # expected for TriOS factory  # no uncertainties, continue without them
-
-                    wavelength=[]
-                    wv_str=[]
-                    for k in Rrs:
-                        if (k != 'Datetime') and (k != 'Datetag') and (k != 'Timetag2'):
-                            if '.' in k:
-                                wavelength.append(float(k))
-                            else:
-                                wavelength.append(int(k))
-                            wv_str.append(k)
-
-                    wavelength = np.array(wavelength)
 
-                    # Compile all necessary inputs into an input dictionary "I"
-                    I = {}
-                    # Transform Rrs to np.array
-                    I['Rrs'] = np.array([v for k,v in Rrs.items() if k not in ['Datetime','Datetag','Timetag2']]).T
-                    I['wavelengths'] = wavelength
-                    # I['chl'] = np.array(chl)
-                    I['sza'] = np.array(solz)
-                    # give oza the same dimension as the other ancillary inputs!
-                    I['oza'] = viewz * np.ones(np.shape(I['sza']))
+                    # (n x bands) matrices; stations are rows
+                    RrsMatrix = np.array([Rrs[k] for k in wv_str], dtype=float).T
+                    nLwMatrix = np.array([nLw[k] for k in wv_str], dtype=float).T
+                    sza = np.atleast_1d(np.array(solz, dtype=float))
 
                     # relaz [-180;180] follows the convention "A", i.e.:
                     # relaz is the azimuth angle between:
@@ -129,176 +107,90 @@ class ProcessL2BRDF():
                     #     ii) vector pointing from the sensor (your location) to Sun
                     # BRDF LUT follow convention "B", or "OLCI" convention, see https://www.eumetsat.int/media/50720, Fig. 6.
                     # Additionally, BRDF LUTs are have azimuth ranged [0-180] due to azimuthal symmetry w.r.t. solar plane
-
-                    I['raa'] = np.array(180-np.abs(relaz)) # relaz converted to convention "B" + azimuthal symmetry w.r.t. solar plane
-                    I['aot'] = np.array(aod)
-                    I['wind'] = np.array(wind)
-
-                    # Reshape to (1,N) in case of single cast
-                    for k,v in I.items():
-                        if np.shape(v) == ():
-                            I[k] = I[k].reshape((1,))
-                            
-                    # Calculate BRDF correction for Lee11 or O25
-                    if BRDF_option in ['L11','O25','M02','M02_SeaDAS']:
-                        # fomating input into xarray wanted by OLCI-BRDF code
-                        xr_ds = xr.Dataset({
-                            'Rw': xr.DataArray(
-                                        data   = I['Rrs']*np.pi,
-                                        dims   = ['n', 'bands'],
-                                        coords = {'n':range(len(I['sza'])), 'bands':wavelength}),
-                            'sza': xr.DataArray(
-                                        data = I['sza'],
-                                        dims   = ['n']),
-                            'raa': xr.DataArray(
-                                        data = I['raa'],
-                                        dims   = ['n']),
-                            'vza': xr.DataArray(
-                                        data = I['oza'],
-                                        dims   = ['n']),
-                            'wind': xr.DataArray(
-                                        data=I['wind'],
-                                        dims=['n']),
-                            'aot': xr.DataArray(
-                                        data=I['aot'],
-                                        dims=['n']),
-                            } )
-                        
-                        # Compute and apply BRDF
-                        OC_BRDF = oc_brdf.brdf_prototype(xr_ds, brdf_model=BRDF_option)
-                        stations = range(OC_BRDF.n.shape[0])
-                        # create n x bands dataset
-                        # nLw Rrs, etc is wvl x len n []
-                        # wvls is len n
-                        if ConfigFile.settings['fL1bCal'] >= 2 or ConfigFile.settings['SensorType'].lower() == 'seabird':
-
-                            if "hyper" not in ds.lower():
-                                from Source.PIU.Uncertainty_Analysis import Propagate
-                                prop = Propagate(100, cores=1)  # TODO: add mDraws to config
-                                for meas in ["Rrs","nLw"]:
-                                    brdf_unc_vals = np.zeros_like(I['Rrs'])
-                                    for station in stations:
-                                        brdf_unc_vals[station, :] = prop.conv_hyper_unc(
-                                            hyperspec["wvl_hyper"], # hyperspec wavelengths
-                                            hyperspec[f"{meas}_hyper"][station], # reflectance signal
-                                            np.array(list(brdf_unc[f"{meas}_hyper"].values()))[:, station], # BRDF unc in refltectance units
-                                            platform=ds.split('_')[1]  # which satellite's bands we are integratng to
-                                        )
-                                    brdf_unc[f"{meas}_{ds.split('_')[1].lower()}"] = {str(k): v if not isinstance(v, np.ndarray) else list(v) for k, v in zip(wavelength, brdf_unc_vals.T)}  # put in dictionary
-                            else:
+                    OC_BRDF = oc_brdf.brdf_correct(
+                        RrsMatrix * np.pi, wavelength,
+                        sza=sza,
+                        vza=viewz * np.ones(np.shape(sza)),  # give oza the same dimension as the other ancillary inputs!
+                        raa=np.atleast_1d(180 - np.abs(np.array(relaz, dtype=float))),  # convention "B" + azimuthal symmetry
+                        wind=np.atleast_1d(np.array(wind, dtype=float)),
+                        aot=np.atleast_1d(np.array(aod, dtype=float)),
+                        brdf_models=BRDF_options)
+
+                    for option in BRDF_options:
+                        C_brdf = OC_BRDF[option]['C_brdf']
+
+                        Rrs_BRDF = Rrs.copy()
+                        nLw_BRDF = nLw.copy()
+                        Rrs_BRDF_unc = Rrs_unc.copy() if Rrs_unc is not None else None
+                        nLw_BRDF_unc = nLw_unc.copy() if nLw_unc is not None else None
+                        for j, k in enumerate(wv_str):
+                            Rrs_BRDF[k] = OC_BRDF[option]['nrrs'][:, j].tolist()
+                            nLw_BRDF[k] = (nLwMatrix[:, j] * C_brdf[:, j]).tolist()
+
+                        if withUnc and Rrs_unc is not None:
+                            if "hyper" in ds.lower():
                                 # hyperspectral case must come first
-                                hyperspec["wvl_hyper"] = wavelength  # 1 x 165
-                                hyperspec["Rrs_hyper"] = I['Rrs']  # n x bands
-                                hyperspec["nLw_hyper"] = np.array([v for k,v in nLw.items() if k not in ['Datetime','Datetag','Timetag2']]).T  # n x bands
-                                # 5 x 165
-                                for meas in ["Rrs","nLw"]:
+                                hyperspec[option]["wvl_hyper"] = wavelength
+                                for meas, matrix in [("Rrs", RrsMatrix), ("nLw", nLwMatrix)]:
                                     # convert to Rrs/nLw units by applying cs1 = Rrs or cs1 = nLw
-                                    meas_uncs = np.zeros_like(hyperspec[f"{meas}_hyper"])
-                                    for station in stations:  # for station in n
-                                        hyperspec[f"{meas}_hyper"][station, :] = hyperspec[f"{meas}_hyper"][station,:] * OC_BRDF.C_brdf.isel(n=station).values
-                                        meas_uncs[station, :] = np.sqrt(np.array(OC_BRDF.brdf_unc.isel(n=station).values)**2 * hyperspec[f"{meas}_hyper"][station, :]**2)
-                                    brdf_unc[f"{meas}_hyper"] = {
-                                        str(k): list(v) for k, v in zip(wavelength, np.array(meas_uncs).T)
-                                    }  # turn BRDF uncs into dict so we can convolve uncs
-
-                        for k in Rrs:
-                            if (k != 'Datetime') and (k != 'Datetag') and (k != 'Timetag2'):
-                                Rrs_BRDF[k] = np.array(OC_BRDF.nrrs.sel(bands=float(k))).tolist()
-                                nLw_BRDF[k] = (np.array(nLw[k])*np.array(OC_BRDF.C_brdf.sel(bands=float(k)))).tolist()
-
-                                if ConfigFile.settings['fL1bCal'] >= 2 or ConfigFile.settings['SensorType'].lower() == 'seabird':
-                                    platform = ds.split('_')[1].lower()
-                                    Rrs_BRDF_unc[k] = []
-                                    nLw_BRDF_unc[k] = []
-                                    for station in stations:
-                                        # cs1 = Rrs (applied in lines: 166-169), cs2 = BRDF correction factor
-                                        Rrs_BRDF_unc[k].append(
-                                            np.sqrt(
-                                                brdf_unc[f"Rrs_{platform}"][k][station]**2 +
-                                                (np.array(Rrs_unc[k][station])**2 * OC_BRDF.C_brdf.sel(bands=float(k), n=station).values**2)
-                                            )
-                                        )
-
-                                        # cs1 = nLw (applied in lines: 166-169), cs2 = BRDF correction factor
-                                        nLw_BRDF_unc[k].append(
-                                            np.sqrt(
-                                                brdf_unc[f"nLw_{platform}"][k][station]**2 + 
-                                                (np.array(nLw_unc[k][station])**2 * OC_BRDF.C_brdf.sel(bands=float(k), n=station).values**2)
-                                            )
-                                        )
-
-                                    # uncs not saved as list, perhaps numpy bug?
-                                    Rrs_BRDF_unc[k] = Rrs_BRDF_unc[k] if isinstance(Rrs_BRDF_unc[k], list) else [Rrs_BRDF_unc[k]] 
-                                    nLw_BRDF_unc[k] = nLw_BRDF_unc[k] if isinstance(nLw_BRDF_unc[k], list) else [nLw_BRDF_unc[k]]
-                                else:
-                                    # add in datetime datetag and timetag2 for consistency with other datasets
-                                    Rrs_BRDF[k] = Rrs[k]
-                                    nLw_BRDF[k] = Rrs[k]
-                                    Rrs_BRDF_unc[k] = Rrs[k]
-                                    nLw_BRDF_unc[k] = Rrs[k]
-
-                        if 'HYPER' in ds:                            
-                            try:
-                                # save to breakdown groups
-                                bd_grp = root.getGroup("BREAKDOWN")
-                                if 'BRDF_method' not in bd_grp.attributes or not bd_grp.attributes['BRDF_method']:
-                                    bd_grp.attributes['BRDF_method'] = [BRDF_option]
-                                elif BRDF_option not in bd_grp.attributes['BRDF_method']:
-                                    bd_grp.attributes['BRDF_method'].append(BRDF_option)
-                                
-                                bd_rrs = bd_grp.addDataset(f"{ds}_BRDF")
-                                bd_rrs.columns = {k: v if isinstance(v, list) else [v] for k,v in brdf_unc["Rrs_hyper"].items()}
-                                bd_rrs.columnsToDataset()
-
-                                bd_nlw = bd_grp.addDataset(f"{ds.replace('Rrs','nLw')}_BRDF")
-                                bd_nlw.columns = {k: v if isinstance(v, list) else [v] for k,v in brdf_unc["nLw_hyper"].items()} 
-                                bd_nlw.columnsToDataset()
-
-                            except AttributeError:  # faster to ask forgiveness than permission
-                                if ConfigFile.settings['fL1bCal'] >= 2 or ConfigFile.settings['SensorType'].lower() == 'seabird':
-                                    writeLogFileAndPrint("BREAKDOWN group not found")
-                                else:
-                                    pass  # expected for TriOS factory
-
-                        Rrs_BRDF_ds = gp.addDataset(f"{ds}_" + BRDF_option)
-                        Rrs_BRDF_ds.columns = Rrs_BRDF
-                        Rrs_BRDF_ds.columnsToDataset()
-
-                        Rrs_BRDF_unc_ds = gp.addDataset(f"{ds}_" + BRDF_option + "_unc")
-                        Rrs_BRDF_unc_ds.columns = Rrs_BRDF_unc
-                        Rrs_BRDF_unc_ds.columnsToDataset()
-
-                        nLw_BRDF_ds = gp.addDataset(f"{ds.replace('Rrs','nLw')}_" + BRDF_option)
-                        nLw_BRDF_ds.columns = nLw_BRDF
-                        nLw_BRDF_ds.columnsToDataset()
+                                    corrected = matrix * C_brdf
+                                    hyperspec[option][f"{meas}_hyper"] = corrected
+                                    hyperspec[option][f"{meas}_hyper_unc"] = np.sqrt(OC_BRDF[option]['brdf_unc']**2 * corrected**2)
+                                brdf_unc = {meas: hyperspec[option][f"{meas}_hyper_unc"] for meas in ["Rrs", "nLw"]}
+                            else:
+                                if prop is None:
+                                    from Source.PIU.Uncertainty_Analysis import Propagate
+                                    prop = Propagate(100, cores=1)  # TODO: add mDraws to config
+                                # BRDF uncertainties of all stations convolved to the satellite bands in one propagation
+                                func = prop.def_sensor_mfunc(ds.split('_')[1])
+                                brdf_unc = {meas: prop.propagate_batch(
+                                                func,
+                                                [hyperspec[option][f"{meas}_hyper"], hyperspec[option]["wvl_hyper"]],
+                                                [hyperspec[option][f"{meas}_hyper_unc"], None],
+                                                ["syst", None])
+                                            for meas in ["Rrs", "nLw"]}
+
+                            # cs1 = Rrs or nLw, cs2 = BRDF correction factor
+                            RrsUncMatrix = np.array([Rrs_unc[k] for k in wv_str], dtype=float).T
+                            nLwUncMatrix = np.array([nLw_unc[k] for k in wv_str], dtype=float).T
+                            Rrs_unc_BRDF = np.sqrt(brdf_unc["Rrs"]**2 + RrsUncMatrix**2 * C_brdf**2)
+                            nLw_unc_BRDF = np.sqrt(brdf_unc["nLw"]**2 + nLwUncMatrix**2 * C_brdf**2)
+                            for j, k in enumerate(wv_str):
+                                Rrs_BRDF_unc[k] = Rrs_unc_BRDF[:, j].tolist()
+                                nLw_BRDF_unc[k] = nLw_unc_BRDF[:, j].tolist()
+
+                            if 'HYPER' in ds:
+                                ProcessL2BRDF.saveBreakdown(root, ds, option, wv_str, brdf_unc)
+
+                        outputs[option] += [(f"{ds}_{option}", Rrs_BRDF), (f"{ds}_{option}_unc", Rrs_BRDF_unc),
+                                            (f"{ds.replace('Rrs','nLw')}_{option}", nLw_BRDF),
+                                            (f"{ds.replace('Rrs','nLw')}_{option}_unc", nLw_BRDF_unc)]
+
+                # Datasets are added option by option
+                for option in BRDF_options:
+                    for name, columns in outputs[option]:
+                        if columns is not None:
+                            BRDF_ds = gp.addDataset(name)
+                            BRDF_ds.columns = columns
+                            BRDF_ds.columnsToDataset()
 
-                        nLw_BRDF_unc_ds = gp.addDataset(f"{ds.replace('Rrs','nLw')}_" + BRDF_option + "_unc")
-                        nLw_BRDF_unc_ds.columns = nLw_BRDF_unc
-                        nLw_BRDF_unc_ds.columnsToDataset()
-                    
-                        # import matplotlib.pyplot as plt
-                        # plt.figure()
-                        # ii = 0
-                        # plt.plot(wavelength, np.array(Rrs_ds.data[ii]).tolist()[3:], label="raw rrs")
-                        # plt.plot(wavelength, np.array(Rrs_BRDF_ds.data[ii]).tolist()[3:], label="BRDF corrected rrs")
-                        # plt.legend()
-                        # plt.xlabel('wavelength [nm]')
-                        # plt.ylabel('Rrs')
-                        # plt.title('TRIOS LEE BRDF correction')
-                        # plt.figure()
-                        # plt.plot(wavelength, np.array(nLw_ds.data[ii]).tolist()[3:], label="raw nLw")
-                        # plt.plot(wavelength, np.array(nLw_BRDF_ds.data[ii]).tolist()[3:], label="BRDF corrected nLw")
-                        # plt.legend()
-                        # plt.xlabel('wavelength [nm]')
-                        # plt.ylabel('nLw')
-                        # plt.title('TRIOS LEE BRDF correction')
-                        # plt.figure()
-                        # plt.plot(wavelength, OC_BRDF.C_brdf, 'b', label="BRDF factor")
-                        # plt.plot(wavelength, OC_BRDF.C_brdf+OC_BRDF.brdf_unc, 'b--', label="BRDF factor unc")
-                        # plt.plot(wavelength, OC_BRDF.C_brdf-OC_BRDF.brdf_unc, 'b--')
-                        # plt.legend()
-                        # plt.xlabel('wavelength [nm]')
-                        # plt.ylabel('BRDF factor')
-                        # plt.title('TRIOS LEE BRDF' )
-                    else:
-                        raise ValueError('BRDF option %s not supported.' % BRDF_option)
\ No newline at end of file
+    @staticmethod
+    def saveBreakdown(root, ds, BRDF_option, wv_str, brdf_unc):
+        ''' Record the BRDF method and the hyperspectral BRDF uncertainties (stations x bands) in the BREAKDOWN group.
+            The uncertainty datasets hold the first method applied. '''
+        bd_grp = root.getGroup("BREAKDOWN")
+        if bd_grp is None:
+            writeLogFileAndPrint("BREAKDOWN group not found")
+            return
+        if 'BRDF_method' not in bd_grp.attributes or not bd_grp.attributes['BRDF_method']:
+            bd_grp.attributes['BRDF_method'] = [BRDF_option]
+        elif BRDF_option not in bd_grp.attributes['BRDF_method']:
+            bd_grp.attributes['BRDF_method'].append(BRDF_option)
+
+        for meas in ["Rrs", "nLw"]:
+            name = f"{ds.replace('Rrs', meas)}_BRDF"
+            if name in bd_grp.datasets:
+                continue
+            bd_ds = bd_grp.addDataset(name)
+            bd_ds.columns = {k: brdf_unc[meas][:, j].tolist() for j, k in enumerate(wv_str)}
+            bd_ds.columnsToDataset()
@@ -10,7 +10,7 @@ from Source.L2gocad import L2gocad
 from Source.L2kd490 import L2kd490
 from Source.L2ipar import L2ipar
 # from L2giop import L2giop
-from Source.L2qaa import L2qaa
+from Source.L2qaa import L2qaaBatch
 from Source.L2avw import L2avw
 from Source.L2wei_QA import QAscores_5Bands
 from Source.L2qwip import L2qwip
@@ -296,31 +296,18 @@ class ProcessL2OCproducts():
 
             # Maximum range based on P&F/S&B
             minMax = [380, 800]
-            waveTemp = []
-            RrsHyperTemp = []
-            for i, wl in enumerate(wavelength):
-                if wl >= minMax[0] and wl <= minMax[1]:
-                    waveTemp.append(wl)
-                    RrsHyperTemp.append(Rrs[i])
-            wavelength = np.array(waveTemp)
-            Rrs = np.array(RrsHyperTemp)
+            inRange = (wavelength >= minMax[0]) & (wavelength <= minMax[1])
+            wavelength = wavelength[inRange]
+            Rrs = Rrs[inRange]
             waveStr = [f'{x}' for x in wavelength]
 
-            a = np.empty(np.shape(Rrs))
-            adg = np.empty(np.shape(Rrs))
-            aph = np.empty(np.shape(Rrs))
-            b = np.empty(np.shape(Rrs))
-            bb = np.empty(np.shape(Rrs))
-            bbp = np.empty(np.shape(Rrs))
-            c = np.empty(np.shape(Rrs))
-            for i in range(0, len(dateTime)):
-
-                a[:,i], adg[:,i], aph[:,i], b[:,i], bb[:,i], bbp[:,i], c[:,i], msg = \
-                    L2qaa(Rrs412[i], Rrs443[i], Rrs488[i], Rrs555[i], Rrs667[i], \
-                        Rrs[:,i], wavelength, \
-                            T[i], S[i])
-                for msgs in msg:
-                    logging.writeLogFileAndPrint(msgs)
+            # All spectra at once; outputs are transposed back to one row per wavelength
+            a, adg, aph, b, bb, bbp, c, msg = \
+                L2qaaBatch(Rrs412, Rrs443, Rrs488, Rrs555, Rrs667, \
+                    Rrs.T, wavelength, T, S)
+            a, adg, aph, b, bb, bbp, c = a.T, adg.T, aph.T, b.T, bb.T, bbp.T, c.T
+            for msgs in msg:
+                logging.writeLogFileAndPrint(msgs)
 
             if ConfigFile.products["bL2ProdaQaa"]:
                 DerProd.attributes['a_UNITS'] = '1/m'
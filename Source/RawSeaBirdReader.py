@@ -1,9 +1,189 @@
 """Read raw Sea-Bird file"""
+import collections
+import mmap
+import re
 import sys
 from datetime import datetime
 
+import numpy as np
+
 import Source.utils.loggingHCP as logging
 
+
+class FrameLayout:
+    """Precompiled message frame layout for one CalibrationFile.
+        Built once per calibration file (cached on CalibrationFile.frameLayout) and used to
+        decode all frames of an instrument as one (frames x bytes) block."""
+
+    # Binary integer types: (byteorder, signed)
+    BINARY_INT = {"BU": ('>', False), "BULE": ('<', False), "BS": ('>', True), "BSLE": ('<', True)}
+    # Instruments producing additional bytes for DATETAG (3 bytes), and TIMETAG2 (4 bytes)
+    TIMETAG_IDS = ("SATHED", "SATHLD", "SATHSE", "SATHSL", "SATPYR", "SATNAV", "$GPRMC", "SATTHS", "UMTWR")
+
+    def __init__(self, cf):
+        self.cf = cf
+        self.fields = []        # (cd, byte offset) for every fixed length field in the frame
+        self.stored = []        # (field index, dataset name, column name) for fields written to datasets
+        self.attributes = collections.OrderedDict()
+        self.fixedLength = 0    # None for variable length frames, which are decoded frame by frame
+        instrumentId = ""
+
+        offset = 0
+        for i, cd in enumerate(cf.data):
+            fitType = cd.fitType.upper()
+            cdtype = cd.type.upper()
+            if cdtype in ("INSTRUMENT", "VLF_INSTRUMENT"):
+                instrumentId = cd.id
+            if fitType not in ("NONE", "DELIMITER"):
+                if cdtype not in ('INSTRUMENT', 'VLF_INSTRUMENT', 'SN', 'VLF_SN'):
+                    self.stored.append((i, cd.type, cd.id))
+                else:
+                    self.attributes[cdtype] = cd.id
+            if fitType == "NONE" and cdtype in ("SN", "DATARATE", "RATE"):
+                self.attributes[cdtype] = cd.id
+
+            if cd.fieldLength == -1 or offset is None:
+                offset = None
+            else:
+                self.fields.append((cd, offset))
+                offset += cd.fieldLength
+
+        self.hasTimeTags = instrumentId.startswith(FrameLayout.TIMETAG_IDS)
+        if offset is None or not self._blockDecodable():
+            self.fixedLength = None
+        else:
+            self.fixedLength = offset + (7 if self.hasTimeTags else 0)
+            if self.fixedLength > RawFileReader.MAX_BLOCK_READ:
+                self.fixedLength = None
+
+    def _blockDecodable(self):
+        # Repeated dataset/column pairs would interleave values within a column
+        if len({(name, col) for _, name, col in self.stored}) != len(self.stored):
+            return False
+        for i, _, _ in self.stored:
+            cd = self.cf.data[i]
+            dataType = cd.dataType.upper()
+            n = cd.fieldLength
+            if n == 0:
+                continue
+            if dataType in FrameLayout.BINARY_INT and n > 8:
+                return False
+            if dataType == "BF" and n != 4:
+                return False
+            if dataType == "BD" and n != 8:
+                return False
+            if dataType not in FrameLayout.BINARY_INT and dataType not in ("BF", "BD", "HS", "HU", "AI", "AU", "AF", "AS"):
+                return False
+        return True
+
+    def decodeFrame(self, msg):
+        ''' Decode a single frame (variable length frames, or frames truncated at the end of file).
+            Follows CalibrationFile.convertRaw, but parses the message once and raises on a bad frame
+            rather than leaving partial records behind. Returns (nRead, row). '''
+        nRead = 0
+        values = {}
+        data = self.cf.data
+        for i, cd in enumerate(data):
+            v = 0
+            if cd.fieldLength == -1:
+                delimiter = data[i+1].units
+                delimiter = delimiter.encode("utf-8").decode("unicode_escape").encode("utf-8")
+                end = msg[nRead:].find(delimiter)
+                v = cd.convertRaw(msg[nRead:nRead+end])
+                nRead += end
+            else:
+                if cd.fitType.upper() != "DELIMITER" and cd.fieldLength != 0:
+                    v = cd.convertRaw(msg[nRead:nRead+cd.fieldLength])
+                nRead += cd.fieldLength
+            values[i] = v
+
+        row = [values[i] for i, _, _ in self.stored]
+        if self.hasTimeTags:
+            row.append(int.from_bytes(msg[nRead:nRead+3], byteorder='big', signed=False))
+            row.append(int.from_bytes(msg[nRead+3:nRead+7], byteorder='big', signed=False))
+            nRead += 7
+        return nRead, row
+
+    def decodeBlock(self, buf8, offsets):
+        ''' Decode all fixed length frames starting at offsets in one pass.
+            Returns (columns, valid) where columns are lists in stored field order
+            (plus DATETAG, TIMETAG2) and valid flags the frames that parsed. '''
+        offsets = np.asarray(offsets, dtype=np.int64)
+        nFrames = offsets.shape[0]
+        block = buf8[offsets[:, None] + np.arange(self.fixedLength)]
+        valid = np.ones(nFrames, dtype=bool)
+        fieldOffset = {id(cd): offset for cd, offset in self.fields}
+
+        columns = []
+        for i, _, _ in self.stored:
+            cd = self.cf.data[i]
+            if cd.fieldLength == 0:
+                columns.append([0] * nFrames)
+                continue
+            raw = block[:, fieldOffset[id(cd)]:fieldOffset[id(cd)] + cd.fieldLength]
+            values, bad = FrameLayout._convertColumn(cd, raw)
+            valid &= ~bad
+            columns.append(values)
+
+        if self.hasTimeTags:
+            n = self.fixedLength - 7
+            columns.append(FrameLayout._bytesToInt(block[:, n:n+3], '>', False).tolist())
+            columns.append(FrameLayout._bytesToInt(block[:, n+3:n+7], '>', False).tolist())
+        return columns, valid
+
+    @staticmethod
+    def _bytesToInt(raw, byteorder, signed):
+        ''' Integer value of each row of a (frames x n) uint8 array, as int.from_bytes '''
+        n = raw.shape[1]
+        if n in (1, 2, 4, 8):
+            dtype = np.dtype(f"{byteorder}{'i' if signed else 'u'}{n}")
+            return np.ascontiguousarray(raw).view(dtype).ravel()
+        if byteorder == '<':
+            raw = raw[:, ::-1]
+        val = np.zeros(raw.shape[0], dtype=np.uint64)
+        for k in range(n):
+            val = (val << np.uint64(8)) | raw[:, k].astype(np.uint64)
+        val = val.astype(np.int64)
+        if signed:
+            val = np.where(val >= 2**(8*n-1), val - 2**(8*n), val)
+        return val
+
+    @staticmethod
+    def _convertColumn(cd, raw):
+        ''' Vectorized CalibrationData.convertRaw over a (frames x fieldLength) uint8 array '''
+        dataType = cd.dataType.upper()
+        nFrames, n = raw.shape
+        bad = np.zeros(nFrames, dtype=bool)
+        if dataType in FrameLayout.BINARY_INT:
+            byteorder, signed = FrameLayout.BINARY_INT[dataType]
+            return FrameLayout._bytesToInt(raw, byteorder, signed).tolist(), bad
+        if dataType == "BF":
+            return np.ascontiguousarray(raw).view('=f4').ravel().tolist(), bad
+        if dataType == "BD":
+            return np.ascontiguousarray(raw).view('=f8').ravel().tolist(), bad
+
+        chunks = [row.tobytes() for row in raw]
+        if dataType == "AS":
+            return chunks, bad
+        strings = np.ascontiguousarray(raw).view(f'S{n}').ravel()
+        try:
+            if dataType == "AF":
+                return strings.astype(np.float64).tolist(), bad
+            if dataType == "AU" or (dataType == "AI" and cd.type.upper() != "NMEA_CHECKSUM"):
+                return strings.astype(np.int64).tolist(), bad
+        except (ValueError, OverflowError):
+            pass
+        # Slow path: element by element, flagging frames that fail to parse
+        values = []
+        for i, chunk in enumerate(chunks):
+            try:
+                values.append(cd.convertRaw(chunk))
+            except ValueError:
+                values.append(0)
+                bad[i] = True
+        return values, bad
+
+
 class RawFileReader:
     """Read raw Sea-Bird file"""
     MAX_TAG_READ = 32
@@ -48,91 +228,148 @@ class RawFileReader:
     # Reads a raw file
     @staticmethod
     def readRawFile(filepath, calibrationMap, contextMap, root):
+        ''' Memory-maps the raw file, finds all frame tags in one regular expression pass, and
+            decodes the frames of each instrument as a block using the precompiled FrameLayout
+            of its calibration file. Columns are written whole rather than appended per frame.
+            Corrupt frames are dropped entirely (the original tag-window reader kept partial records) '''
 
-        posframe = 1
+        # Frame tags in calibrationMap order (first match wins, as in the original tag-window reader)
+        tags = [b"SATHDR"]
+        keys = [None]
+        for key, cf in calibrationMap.items():
+            tag = cf.id.upper().encode("utf-8")
+            if len(tag) > 0 and tag not in tags:
+                tags.append(tag)
+                keys.append(key)
+            if getattr(cf, 'frameLayout', None) is None:
+                cf.frameLayout = FrameLayout(cf)
+        pattern = re.compile(b"|".join(b"(" + re.escape(tag) + b")" for tag in tags), re.IGNORECASE)
 
-        # Note: Prosoft adds posframe=1 to the GPS for some reason
-        # print(contextMap.keys())
-        #gpsGroup = contextMap["$GPRMC"]
-        #ds = gpsGroup.getDataset("POSFRAME")
-        #ds.appendColumn(u"COUNT", posframe)
-        posframe += 1
+        frames = collections.OrderedDict() # key: [(offset or None, decoded row or None), ...]
+        order = [] # (key, index in frames[key]) for every frame, in file order
 
         with open(filepath, 'rb') as f:
-            while 1:
-                # Reads binary file to find message frame tag
-                pos = f.tell()
-                b = f.read(RawFileReader.MAX_TAG_READ)
-                f.seek(pos)
-
-                if "SATHSE" in str(b):
-                    pass
-                if not b:
-                    break
-
-                #print b
-                for i in range(0, RawFileReader.MAX_TAG_READ):
-                    testString = b[i:].upper()
-                    #print("test: ", testString[:6])
-
-                    # Reset file position on max read
-                    if i == RawFileReader.MAX_TAG_READ-1:
-                        #f.read(RawFileReader.MAX_TAG_READ)
-                        f.read(RawFileReader.RESET_TAG_READ)
+            try:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty file
+                buf = b""
+            try:
+                size = len(buf)
+                pos = 0
+                while True:
+                    m = pattern.search(buf, pos)
+                    if m is None:
                         break
-
-                    # Detects message type from frame tag
-                    if testString.startswith(b"SATHDR"):
-                        #print("SATHDR")
-                        if i > 0:
-                            f.read(i)
-                        hdr = f.read(RawFileReader.SATHDR_READ)
+                    start = m.start()
+                    key = keys[m.lastindex - 1]
+                    if key is None:
+                        hdr = buf[start:start + RawFileReader.SATHDR_READ]
                         (k,v) = RawFileReader.readSATHDR(hdr)
                         root.attributes[k] = v
                         print(f"{k}: {v}")
-                        break
+                        pos = start + RawFileReader.SATHDR_READ
+                        continue
+
+                    cf = calibrationMap[key]
+                    layout = cf.frameLayout
+                    gp = contextMap[cf.id]
+                    # Only the first time through
+                    if len(gp.attributes) == 0:
+                        gp.id = key
+                        gp.attributes["CalFileName"] = key
+                        gp.attributes["FrameTag"] = cf.id
+                        for k, v in layout.attributes.items():
+                            gp.attributes[k] = v
+
+                    frameList = frames.setdefault(key, [])
+                    if layout.fixedLength is not None and start + layout.fixedLength <= size:
+                        frameList.append((start, None))
+                        order.append((key, len(frameList) - 1))
+                        pos = start + layout.fixedLength
+                        continue
+
+                    msg = buf[start:start + RawFileReader.MAX_BLOCK_READ]
+                    try:
+                        num, row = layout.decodeFrame(msg)
+                    except Exception:
+                        logging.writeLogFileAndPrint(f'Unable to convert the following raw message: {msg}')
+                        num = -1
+                    if num > 0:
+                        frameList.append((None, row))
+                        order.append((key, len(frameList) - 1))
+                        pos = start + num
                     else:
-                        num = 0
-                        for key in calibrationMap:
-                            cf = calibrationMap[key]
-                            if testString.startswith(cf.id.upper().encode("utf-8")):
-                                if i > 0:
-                                    f.read(i)
-
-                                pos = f.tell()
-                                msg = f.read(RawFileReader.MAX_BLOCK_READ)
-                                f.seek(pos)
-
-                                gp = contextMap[cf.id]
-                                # Only the first time through
-                                if len(gp.attributes) == 0:
-                                    #gp.id += "_" + cf.id
-                                    gp.id = key
-                                    gp.attributes["CalFileName"] = key
-                                    gp.attributes["FrameTag"] = cf.id
-
-                                # if key.startswith('SATPYR'):
-                                #     print('curious...')
-
-                                try:
-                                    num = cf.convertRaw(msg, gp)
-                                except Exception:
-                                    logging.writeLogFileAndPrint(f'Unable to convert the following raw message: {msg}')
-
-                                if num >= 0:
-                                    # Generate POSFRAME
-                                    ds = gp.getDataset("POSFRAME")
-                                    if ds is None:
-                                        ds = gp.addDataset("POSFRAME")
-                                    ds.appendColumn("COUNT", posframe)
-                                    posframe += 1
-                                    f.read(num)
-
-                                break
-                        if num > 0:
-                            break
-
-        # Recover TIME-STAMP if not in SATHDR
+                        pos = start + 1
+
+                # Block decode of fixed length frames
+                buf8 = np.frombuffer(buf, dtype=np.uint8) if size > 0 else None
+                decoded = {}
+                for key, frameList in frames.items():
+                    layout = calibrationMap[key].frameLayout
+                    offsets = [offset for offset, _ in frameList if offset is not None]
+                    if len(offsets) > 0:
+                        decoded[key] = layout.decodeBlock(buf8, offsets)
+                del buf8
+            finally:
+                if isinstance(buf, mmap.mmap):
+                    buf.close()
+
+        # Assemble whole columns, dropping frames that failed to parse, and number POSFRAME
+        valid = {}
+        for key, frameList in frames.items():
+            cf = calibrationMap[key]
+            layout = cf.frameLayout
+            names = [(name, col) for _, name, col in layout.stored]
+            if layout.hasTimeTags:
+                names += [("DATETAG", "NONE"), ("TIMETAG2", "NONE")]
+            columns = [[] for _ in names]
+            keep = []
+            blockColumns, blockValid = decoded.get(key, ([[] for _ in names], []))
+            j = 0
+            for offset, row in frameList:
+                if offset is not None:
+                    ok = bool(blockValid[j])
+                    if ok:
+                        for c, column in enumerate(columns):
+                            column.append(blockColumns[c][j])
+                    j += 1
+                else:
+                    ok = True
+                    for c, column in enumerate(columns):
+                        column.append(row[c])
+                keep.append(ok)
+            valid[key] = keep
+
+            if len(columns[0] if columns else []) == 0:
+                continue
+            gp = contextMap[cf.id]
+            for (name, col), column in zip(names, columns):
+                ds = gp.getDataset(name)
+                if ds is None:
+                    ds = gp.addDataset(name)
+                ds.columns[col] = column
+
+        posframe = 2
+        counts = collections.OrderedDict()
+        for key, index in order:
+            if valid[key][index]:
+                counts.setdefault(key, []).append(posframe)
+                posframe += 1
+            else:
+                logging.writeLogFileAndPrint(f'Unable to convert a raw {key} message. Frame dropped.')
+        for key, count in counts.items():
+            gp = contextMap[calibrationMap[key].id]
+            ds = gp.getDataset("POSFRAME")
+            if ds is None:
+                ds = gp.addDataset("POSFRAME")
+            ds.columns["COUNT"] = count
+
+        RawFileReader.recoverTimeStamp(contextMap, root)
+
+    @staticmethod
+    def recoverTimeStamp(contextMap, root):
+        ''' Recover TIME-STAMP if not in SATHDR '''
         dt0 = None
         for v in contextMap.values():
             try:
@@ -1,4 +1,5 @@
 '''Calculate skylight reflectance factor'''
+import hashlib
 import os
 import time
 
@@ -15,9 +16,59 @@ from Source.ConfigFile import ConfigFile
 from Source.HDFRoot import HDFRoot
 import Source.utils.loggingHCP as logging
 import Source.utils.comparing as comparing
+import Source.utils.caching as caching
+import Source.utils.interpolating as interpolating
 
 class RhoCorrections:
     ''' Object for processing glint corrections '''
+    @staticmethod
+    def readM99LUT(inFilePath):
+        ''' Read the Mobley 1999 rho table as a 2D array '''
+        lut = HDFRoot.readHDF5(inFilePath)
+        lutData = lut.groups[0].datasets['LUT'].data
+        # convert to a 2D array
+        return np.array(lutData.tolist())
+
+    @staticmethod
+    def readZ17LUT(inFilePath):
+        ''' Read the Zhang 2017 glint LUT axes (wind, aot, sza, relAz, sal, SST, wavelength) and values '''
+        with xr.open_dataset(inFilePath, engine='netcdf4') as LUT:
+            return {
+                'points': tuple(LUT[axis].values for axis in ['wind', 'aot', 'sza', 'relAz', 'sal', 'SST', 'wavelength']),
+                'values': LUT.Glint.values,
+            }
+
+    @staticmethod
+    def readZ17Grid(waveBands):
+        ''' Precompute Z17 rho on the (wind, aot, sza, relAz, vza, SST, sal) grid of the Z17 LUTs at waveBands.
+            The view zenith axis holds the sensor viewing angles of the LUT files found (30 and/or 40). '''
+        waveBands = np.asarray(waveBands, dtype=np.float64)
+        tables, vzas, axes = [], [], None
+        for sva in (30, 40):
+            inFilePath = os.path.join(PATH_TO_DATA, f'Z17_LUT_{sva}.nc')
+            if not os.path.isfile(inFilePath):
+                continue
+            LUT = RhoCorrections.readZ17LUT(inFilePath)
+            wind, aot, sza, relAz, sal, SST, wavelength = LUT['points']
+            if axes is None:
+                axes = (wind, aot, sza, relAz, SST, sal)
+                if waveBands.min() < wavelength[0] or waveBands.max() > wavelength[-1]:
+                    raise InterpolationError(f'Wavebands outside the Z17 LUT range {wavelength[0]} - {wavelength[-1]} nm')
+                operator = interpolating.splineOperator(wavelength, waveBands)
+            elif not all(np.array_equal(a, b) for a, b in zip(axes, (wind, aot, sza, relAz, SST, sal))):
+                raise InterpolationError(f'Z17 LUT {inFilePath} is not on the same grid as the others')
+            # (wind, aot, sza, relAz, sal, SST, wavelength) -> (wind, aot, sza, relAz, SST, sal, waveBands)
+            tables.append((np.swapaxes(LUT['values'], 4, 5) @ operator.T).astype(np.float32))
+            vzas.append(float(sva))
+        if not tables:
+            raise InterpolationError(f'cannot find Z17 LUT netcdf files at {PATH_TO_DATA}')
+
+        return {
+            'points': axes[:4] + (np.array(vzas),) + axes[4:],
+            'values': np.stack(tables, axis=4),
+            'waveBands': waveBands,
+        }
+
     @staticmethod
     def M99Corr(windSpeedMean, SZAMean, relAzMean, Propagate = None,
                 AOD=None, cloud=None, wTemp=None, sal=None, waveBands=None):
@@ -38,18 +89,15 @@ class RhoCorrections:
         relAz_idx = comparing.find_nearest(phiViews, relAzMean)
         relAz = phiViews[relAz_idx]
 
-        # load in the LUT HDF file
+        # load in the LUT HDF file (once per process)
         inFilePath = os.path.join(PATH_TO_DATA, 'rhoTable_AO1999.hdf')
         try:
-            lut = HDFRoot.readHDF5(inFilePath)
+            lut = caching.getLUT(inFilePath, lambda: RhoCorrections.readM99LUT(inFilePath))
         except Exception as err:
             msg = f"Unable to open M99 LUT. {err}"
             logging.writeLogFileAndPrint(msg)
             logging.errorWindow("File Error", msg)
 
-        lutData = lut.groups[0].datasets['LUT'].data
-        # convert to a 2D array
-        lut = np.array(lutData.tolist())
         # match to the row
         row = lut[(lut[:,0] == wind) & (lut[:,1] == sza) & \
             (lut[:,2] == theta) & (lut[:,4] == relAz)]
@@ -216,7 +264,14 @@ class RhoCorrections:
 
         # tic = time.process_time() # CPU time
         tic = time.time()
-        rhoVector = get_sky_sun_rho(env, sensor, round4cache=True, DB=db)['rho']
+        rhoVector = None
+        if ConfigFile.settings["bL2Z17Fast"]:
+            try:
+                rhoVector = RhoCorrections.Z17GridRho(windSpeedMean, AOD, sza, wTemp, sal, relAz, sva, waveBands)
+            except InterpolationError as err:
+                logging.writeLogFileAndPrint(f'{err}: Unable to use the Z17 grid. Reverting to the full model.')
+        if rhoVector is None:
+            rhoVector = get_sky_sun_rho(env, sensor, round4cache=True, DB=db)['rho']
         # logging.writeLogFileAndPrint(f'Zhang17 Elapsed Time: {time.process_time() - tic:.1f} s')
         logging.writeLogFileAndPrint(f'Zhang17 Elapsed Time: {time.time() - tic:.1f} s')
 
@@ -255,6 +310,9 @@ class RhoCorrections:
         windSpeedMean, AOD, SZAMean, wTemp, sal, relAzMean, newWaveBands, zhang
 
         """        
+        if ConfigFile.settings["bL2Z17Fast"]:
+            return RhoCorrections.Z17GridRho(ws, aod, sza, wt, sal, rel_az, sva, nwb)
+
         logging.writeLogFileAndPrint('Calculating Zhang glint correction (LUT).')
         tic = time.time()
         if sva == 30:
@@ -264,61 +322,28 @@ class RhoCorrections:
             db_path = "Z17_LUT_40.nc"
             logging.writeLogFileAndPrint("running Z17 interpolation for instrument viewing zenith of 40",False)
 
+        inFilePath = os.path.join(PATH_TO_DATA, db_path)
         try:
-            LUT = xr.open_dataset(os.path.join(PATH_TO_DATA, db_path), engine='netcdf4')
+            LUT = caching.getLUT(inFilePath, lambda: RhoCorrections.readZ17LUT(inFilePath))
         except FileNotFoundError as err:
             raise InterpolationError(f"cannot find LUT netcdf file {db_path} at {PATH_TO_DATA}") from err
 
         try:
-            if ConfigFile.settings['SensorType'].lower() == "sorad":
-                zhang_interp = spin.interpn(
-                    points=(
-                        LUT.wind.values,
-                        LUT.aot.values,
-                        LUT.sza.values,
-                        LUT.relAz.values,
-                        LUT.sal.values,
-                        LUT.SST.values,
-                        LUT.wavelength.values
-                    ),
-                    values=LUT.Glint.values,
-                    xi=(
-                        ws,
-                        aod,
-                        sza,
-                        rel_az,
-                        sal,
-                        wt,
-                        nwb
-                    ),
-                    method="pchip", 
-                    )
-                print('Interpolating Z17 LUT')
-            else:
-                zhang_interp = spin.interpn(
-                    points=(
-                        LUT.wind.values,
-                        LUT.aot.values,
-                        LUT.sza.values,
-                        LUT.relAz.values,
-                        LUT.sal.values,
-                        LUT.SST.values,
-                        LUT.wavelength.values
-                    ),
-                    values=LUT.Glint.values,
-                    xi=(
-                        ws,
-                        aod,
-                        sza,
-                        rel_az,
-                        sal,
-                        wt,
-                        nwb
-                    ),
-                    method="pchip",
-                )
-                # print('Interpolating Z17 LUT using cubic method')
-                print('Interpolating Z17 LUT')
+            zhang_interp = spin.interpn(
+                points=LUT['points'],
+                values=LUT['values'],
+                xi=(
+                    ws,
+                    aod,
+                    sza,
+                    rel_az,
+                    sal,
+                    wt,
+                    nwb
+                ),
+                method="pchip",
+            )
+            print('Interpolating Z17 LUT')
 
             logging.writeLogFileAndPrint(f'Zhang17 LUT Elapsed Time: {time.time() - tic:.1f} s')
 
@@ -328,6 +353,91 @@ class RhoCorrections:
             return zhang_interp
 
 
+    @staticmethod
+    def getZ17Grid(waveBands) -> dict:
+        ''' The Z17 grid of readZ17Grid at waveBands, built once per process and wavelength grid '''
+        waveBands = np.asarray(waveBands, dtype=np.float64)
+        key = ('Z17Grid', len(waveBands), hashlib.sha1(waveBands.tobytes()).hexdigest())
+        return caching.getLUT(key, lambda: RhoCorrections.readZ17Grid(waveBands))
+
+    @staticmethod
+    def Z17GridRho(ws, aod, sza, wt, sal, rel_az, sva, waveBands) -> np.array:
+        """
+        Z17 rho by multilinear interpolation in the grid precomputed (once per process and wavelength grid) by
+        readZ17Grid. Inputs are scalars, or equal length arrays for a batch of conditions.
+
+        :return: rho at waveBands, (batch x waveBands) for a batch
+        """
+        grid = RhoCorrections.getZ17Grid(waveBands)
+
+        inputs = (ws, aod, sza, rel_az, sva, wt, sal)
+        xi = np.column_stack(np.broadcast_arrays(*[np.atleast_1d(np.asarray(v, dtype=np.float64)) for v in inputs]))
+        try:
+            rho = interpolating.multilinear(grid['points'], grid['values'], xi)
+        except ValueError as err:
+            raise InterpolationError(f"Interpolation of Z17 grid failed with {err}") from err
+        return rho[0] if all(np.ndim(v) == 0 for v in inputs) else rho
+
+    @staticmethod
+    def validateZ17Grid(waveBands, sva=40, n=20, seed=0, db=None) -> dict:
+        """
+        Compare Z17GridRho with the full model of ZhangCorr at n random conditions inside both the grid and the
+        full model limits, and log the differences. Run it from the repository directory with
+            python -m Source.RhoCorrections [--sva 40] [-n 20] [--seed 0]
+
+        :return: report with the conditions, both rho estimates and the largest absolute and relative differences
+        """
+        waveBands = np.asarray(waveBands, dtype=np.float64)
+        grid = RhoCorrections.getZ17Grid(waveBands)
+        wind, aot, sza, relAz, _, SST, sal = grid['points']
+
+        # Limits of the full model as applied in ProcessL2 and the Monte Carlo guardrails
+        limits = [(wind, 15), (aot, 0.5), (sza, 60), (relAz, 140), (SST, np.inf), (sal, np.inf)]
+        rng = np.random.default_rng(seed)
+        draws = [rng.uniform(axis[0], min(axis[-1], limit), n) for axis, limit in limits]
+        conditions = dict(zip(['wind', 'aod', 'sza', 'relAz', 'sst', 'sal'], draws))
+
+        fast = RhoCorrections.Z17GridRho(conditions['wind'], conditions['aod'], conditions['sza'], conditions['sst'],
+                                         conditions['sal'], conditions['relAz'], np.full(n, sva), waveBands)
+        fastSetting = ConfigFile.settings.get("bL2Z17Fast", 0)
+        ConfigFile.settings["bL2Z17Fast"] = 0
+        try:
+            full = np.array([RhoCorrections.ZhangCorr(ws, od, None, zen, wt, sl, ra, sva, waveBands, db=db)[0]
+                             for ws, od, zen, ra, wt, sl in zip(*draws)])
+        finally:
+            ConfigFile.settings["bL2Z17Fast"] = fastSetting
+
+        absDiff = np.abs(fast - full)
+        relDiff = absDiff / np.abs(full)
+        report = {
+            'conditions': conditions,
+            'fast': fast,
+            'full': full,
+            'maxAbsDiff': float(np.nanmax(absDiff)),
+            'maxRelDiff': float(np.nanmax(relDiff)),
+            'meanRelDiff': float(np.nanmean(relDiff)),
+            'worst': int(np.nanargmax(np.nanmax(relDiff, axis=1))),
+        }
+        logging.writeLogFileAndPrint(
+            f"Z17 grid vs full model at {n} conditions (SVA {sva}): max |diff| {report['maxAbsDiff']:.2e}, "
+            f"max relative diff {100 * report['maxRelDiff']:.2f}%, mean relative diff {100 * report['meanRelDiff']:.2f}%")
+        return report
+
+
 class InterpolationError(Exception):
     def __init__(self, msg):
         super().__init__(msg)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Compare the precomputed Z17 rho grid (bL2Z17Fast) with the full model')
+    parser.add_argument('--sva', type=float, default=40, help='Sensor viewing angle of the LUTs to check (30 or 40)')
+    parser.add_argument('-n', type=int, default=20, help='Number of random conditions')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random conditions')
+    parser.add_argument('--wavebands', type=float, nargs=3, default=[350, 900, 3.3], metavar=('START', 'STOP', 'STEP'),
+                        help='Wavebands to check, in nm')
+    args = parser.parse_args()
+
+    RhoCorrections.validateZ17Grid(np.arange(*args.wavebands), sva=args.sva, n=args.n, seed=args.seed)
@@ -37,10 +37,16 @@ Notes:
 #==========================================================================================================================================
 
 from os import stat
+import io
+import os
 import re
 from datetime import datetime
 from collections import OrderedDict
 
+import numpy as np
+
+import Source.utils.caching as caching
+
 #==========================================================================================================================================
 
 
@@ -56,6 +62,7 @@ class readSB:
         .missing   = fill value as a float used for missing data, read from header
         .variables = dictionary of field name and unit, keyed by field name
         .data      = dictionary of data values, keyed by field name, returned as a list
+                     (with fast=True, numeric fields are returned as int64 or float64 numpy arrays)
         .length    = number of rows in the data matrix (i.e. the length of each list in data)
         .bdl       = fill value as a float used for below detection limit, read from header (empty if missing or N/A)
         .adl       = fill value as a float used for above detection limit, read from header (empty if missing or N/A)
@@ -67,7 +74,7 @@ class readSB:
                                                           field units, and data value, handling fields & units headers and missing values
         .writeSBfile(ofile)                             - Writes headers, comments, and data into a SeaBASS file specified by ofile
     """
-    def __init__(self, filename, mask_missing=True, mask_above_detection_limit=True, mask_below_detection_limit=True, no_warn=False, mask_commented_headers = True):
+    def __init__(self, filename, mask_missing=True, mask_above_detection_limit=True, mask_below_detection_limit=True, no_warn=False, mask_commented_headers = True, fast=False):
         """
         Required arguments:
         filename = name of SeaBASS input file (string)
@@ -77,6 +84,9 @@ class readSB:
         mask_above_detection_limit = flag to set above_detection_limit values to NaN, default set to True
         mask_below_detection_limit = flag to set below_detection_limit values to NaN, default set to True
         no_warn                    = flag to suppress warnings, default set to False
+        fast                       = flag to parse the data block in bulk into typed numpy arrays, default set to False.
+                                     Fields whose values are all integers become int64 arrays (float64 if any are masked),
+                                     other numeric fields float64 arrays, and fields holding any text remain lists of strings.
         """
         self.filename          = filename
         self.headers           = OrderedDict()
@@ -93,6 +103,7 @@ class readSB:
         self.err_suffixes      = ['_cv', '_sd', '_se', '_unc','_bincount']
 
         end_header             = False
+        block                  = []
         #utility functions put here instead of outside of class because it was making it very hard to import into other classes/packages
         def is_number(s):
 
@@ -140,6 +151,43 @@ class readSB:
 
 
 
+        #==========================================================================================================================================
+        def parse_line(line):
+
+            """
+            parse_line appends the values of one data line to self.data
+            syntax: parse_line(line)
+            """
+
+            try:
+                for var,dat in zip(_vars,re.split(delim,line)):
+                    if is_number(dat):
+                        if is_int(dat):
+                            dat = int(dat)
+                        else:
+                            dat = float(dat)
+
+                        if mask_above_detection_limit and self.adl != '':
+                            if dat == float(self.adl):
+                                dat = float('nan')
+
+                        if mask_below_detection_limit and self.bdl != '':
+                            if dat == float(self.bdl):
+                                dat = float('nan')
+
+                        if mask_missing and dat == self.missing:
+                            dat = float('nan')
+
+                    self.data[var].append(dat)
+
+                self.length = self.length + 1
+
+            except Exception as e:
+                raise Exception('Unable to parse data from line in file: {:}. Error: {:}. In line: {:}'.format(self.filename,e,line))
+                return
+
+
+
         try:
             fileobj = open(self.filename,'r')
 
@@ -156,9 +204,9 @@ class readSB:
             return
 
         """ Remove any/all newline and carriage return characters """
-        lines = [re.sub("[\r\n]+",'',line).strip() for line in lines]
+        lines = [line.strip() for line in lines] # readlines already splits on any \r or \n
 
-        for line in lines:
+        for iline,line in enumerate(lines):
 
             """ Extract header """
             if not end_header \
@@ -273,36 +321,21 @@ class readSB:
                         print('Warning: No below_detection_limit in file: {:}. Unable to mask values as NaNs. Use no_warn=True to suppress this message.'.format(self.filename))
 
                 end_header = True
+
+                """ In fast mode, hand the rest of the file to _readBlock without per-line header checks """
+                if fast:
+                    block = [l for l in lines[iline+1:] if l]
+                    self.comments.extend([l[1:] for l in block if '!' in l and (not mask_commented_headers or not '!/' in l)])
+                    break
                 continue
 
             """ Extract data after headers """
             if end_header and line:
-                try:
-                    for var,dat in zip(_vars,re.split(delim,line)):
-                        if is_number(dat):
-                            if is_int(dat):
-                                dat = int(dat)
-                            else:
-                                dat = float(dat)
-
-                            if mask_above_detection_limit and self.adl != '':
-                                if dat == float(self.adl):
-                                    dat = float('nan')
-
-                            if mask_below_detection_limit and self.bdl != '':
-                                if dat == float(self.bdl):
-                                    dat = float('nan')
-
-                            if mask_missing and dat == self.missing:
-                                dat = float('nan')
-
-                        self.data[var].append(dat)
+                parse_line(line)
 
-                    self.length = self.length + 1
-
-                except Exception as e:
-                    raise Exception('Unable to parse data from line in file: {:}. Error: {:}. In line: {:}'.format(self.filename,e,line))
-                    return
+        if fast and block and not self._readBlock(block, _vars, delim, mask_missing, mask_above_detection_limit, mask_below_detection_limit):
+            for line in block:
+                parse_line(line)
 
         try:
             self.variables = OrderedDict(zip(_vars,zip(_vars,_units)))
@@ -315,6 +348,87 @@ class readSB:
 
         return
 
+#==========================================================================================================================================
+    def _readBlock(self, lines, fields, delim, mask_missing, mask_above_detection_limit, mask_below_detection_limit):
+
+        """
+        _readBlock parses the data lines of the file in one pass into typed numpy arrays (see fast in __init__)
+        returns False, leaving .data untouched, if the rows do not all have a value for every field
+        """
+
+        # Split on single delimiters (whitespace runs are split by loadtxt itself), collapsing repeats only where present
+        sep = {',+': ',', '\t+': '\t'}.get(delim)
+        text = '\n'.join(lines)
+        if sep is not None and sep+sep in text:
+            text = re.sub(delim, sep, text)
+        try:
+            values = np.loadtxt(io.StringIO(text), dtype=str, delimiter=sep, comments=None, ndmin=2)
+        except ValueError:
+            return False
+        if values.shape[1] < len(fields):
+            return False
+        values = values[:, :len(fields)]
+
+        # Numbers are read by numpy's C parser when every field is numeric, else field by field
+        try:
+            numbers = np.loadtxt(io.StringIO(text), dtype=np.float64, delimiter=sep, comments=None, ndmin=2,
+                                 usecols=range(len(fields)))
+        except ValueError:
+            numbers = None
+        integral = np.char.isdigit(np.char.lstrip(values, '+-')).all(axis=0)
+
+        fills = []
+        if mask_above_detection_limit and self.adl != '':
+            fills.append(float(self.adl))
+        if mask_below_detection_limit and self.bdl != '':
+            fills.append(float(self.bdl))
+        if mask_missing:
+            fills.append(self.missing)
+
+        for i, var in enumerate(fields):
+            if integral[i]:
+                if numbers is not None and np.abs(numbers[:, i]).max(initial=0) < 2**53:
+                    column = numbers[:, i].astype(np.int64)
+                else:
+                    column = values[:, i].astype(np.int64)
+            elif numbers is not None:
+                column = numbers[:, i]
+            else:
+                try:
+                    column = values[:, i].astype(np.float64)
+                except ValueError:
+                    # Text, possibly mixed with numbers: value by value, as the line parser does
+                    self.data[var] = [self._parseValue(dat, fills) for dat in values[:, i].tolist()]
+                    continue
+
+            masked = np.isin(column, fills)
+            if masked.any():
+                column = column.astype(np.float64)
+                column[masked] = np.nan
+            self.data[var] = column
+
+        self.length = values.shape[0]
+        return True
+
+#==========================================================================================================================================
+    @staticmethod
+    def _parseValue(dat, fills):
+
+        """
+        _parseValue converts one data value as parse_line in __init__ does: numbers to int or float,
+        NaN if they match one of fills, and any other text left as is
+        """
+
+        try:
+            number = float(dat)
+        except ValueError:
+            return dat
+        try:
+            number = int(dat)
+        except ValueError:
+            pass
+        return float('nan') if number in fills else number
+
 #==========================================================================================================================================
     #fractional seconds can have anywhere from 1 to 6 digits, but datetime will prepend 0s to number until it is 6 digits for some reason
     def millisecondToMicrosecond(self, millisecond):
@@ -849,3 +963,29 @@ class readSB:
         fout.close()
 
         return
+
+#==========================================================================================================================================
+
+_cachedKeys = {}
+
+def readSBCached(filename, **kwargs):
+
+    """
+    readSBCached returns a fast readSB of filename, parsed once per process and reused until the file is modified
+    (the key holds the path and modification time). The object is shared by all callers: its arrays are read-only,
+    and its lists and headers must not be modified either.
+    syntax: sb = readSBCached(filename, no_warn=True)
+    """
+
+    path = os.path.abspath(filename)
+    key = ('readSB', path, os.stat(path).st_mtime_ns, tuple(sorted(kwargs.items())))
+    if _cachedKeys.get(path, key) != key:
+        caching.evict(_cachedKeys[path])
+    _cachedKeys[path] = key
+    return caching.getLUT(key, lambda: _frozen(readSB(filename, fast=True, **kwargs)))
+
+def _frozen(sb):
+    for value in sb.data.values():
+        if isinstance(value, np.ndarray):
+            value.flags.writeable = False
+    return sb
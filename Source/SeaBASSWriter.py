@@ -2,6 +2,7 @@
 import os
 import time
 import numpy as np
+from numpy.lib.recfunctions import structured_to_unstructured
 
 from Source import PATH_TO_CONFIG
 from Source.HDFRoot import HDFRoot
@@ -13,6 +14,8 @@ import Source.utils.dating as dating
 class SeaBASSWriter:
     '''L2 SeaBASS file writer'''
 
+    CHUNK_ROWS = 1000 # Number of data rows written to file at once
+
     @staticmethod
     def sbFileName(fp,headerBlock,formattedData,dtype):
         version = SeaBASSHeader.settings["version"]
@@ -198,25 +201,24 @@ class SeaBASSWriter:
             unitsLine.extend([units]*lenRad)    # data uncertainty
         unitsLineStr = ','.join(unitsLine)
 
-        # Add data for each row
-        dataOut = []
-        formatStr = str('{:04d}{:02d}{:02d},{:02d}:{:02d}:{:02d},{:.4f},{:.4f},{:.1f},{:.1f}'\
-            + ',{:.4f},{:.0f},{:.1f},{:.0f}' + ',{:.6f}'*lenRad)
+        # Format each column of one numeric block at once; NaNs are written as -9999.0
+        columns = [[t.year for t in timeDT], [t.month for t in timeDT], [t.day for t in timeDT],
+                   [t.hour for t in timeDT], [t.minute for t in timeDT], [t.second for t in timeDT],
+                   lat, lon, relAz, sza, aod, cloud, wind, bincount]
+        block = [np.array(columns, dtype=float).T,
+                 structured_to_unstructured(dsCopy, dtype=float)]
+        formats = ['%04d', '%02d', '%02d', '%02d', '%02d', '%02d', '%.4f', '%.4f', '%.1f', '%.1f', '%.4f', '%.0f', '%.1f', '%.0f'] \
+            + ['%.6f']*lenRad
         if dsDelta is not None:
-            formatStr = formatStr + ',{:.6f}' * lenRad
-        for i in range(dsCopy.shape[0]):
-            subList = [lat[i],lon[i],relAz[i],sza[i],aod[i],cloud[i],wind[i],bincount[i]]
-            lineList = [timeDT[i].year,timeDT[i].month,timeDT[i].day,timeDT[i].hour,timeDT[i].minute,timeDT[i].second] +\
-                subList + list(dsCopy[i].tolist())
-
-            if dsDelta is not None:
-                lineList = lineList + list(dsDelta.data[i].tolist())
-
-            # Replace NaNs with -9999.0
-            lineList = [-9999.0 if np.isnan(element) else element for element in lineList]
-
-            lineStr = formatStr.format(*lineList)
-            dataOut.append(lineStr)
+            block.append(structured_to_unstructured(dsDelta.data, dtype=float)[:,:lenRad])
+            formats = formats + ['%.6f']*lenRad
+        block = np.hstack(block)
+        block[np.isnan(block)] = -9999.0
+
+        text = [np.char.mod(fmt, block[:,i]) for i, fmt in enumerate(formats)]
+        dateStr = np.char.add(np.char.add(text[0], text[1]), text[2])
+        timeStr = np.char.add(np.char.add(np.char.add(np.char.add(text[3], ':'), text[4]), ':'), text[5])
+        dataOut = [','.join(row) for row in np.column_stack([dateStr, timeStr] + text[6:]).tolist()]
         return dataOut, fieldsLineStr, unitsLineStr
 
     @staticmethod
@@ -249,28 +251,47 @@ class SeaBASSWriter:
         outFile.write('/units='+units+'\n')
         outFile.write('/end_header\n')
 
-        for line in formattedData:
-            outFile.write(f'{line}\n')
+        # Stream the rows in chunks rather than one write per line
+        for i in range(0, len(formattedData), SeaBASSWriter.CHUNK_ROWS):
+            outFile.write('\n'.join(formattedData[i:i+SeaBASSWriter.CHUNK_ROWS]) + '\n')
 
         outFile.close()
 
     # Convert Level 2 data to SeaBASS file
     @staticmethod
-    def outputTXT_Type2(fp):
+    def outputTXT_Type2(fp, root=None, files=None):
+        ''' Write the SeaBASS files of the L2 HDF at fp, or of its in-memory root if given (root is not modified),
+            or the files of formatTXT_Type2 if given. Returns the name of the Es file. '''
+        if files is None:
+            files = SeaBASSWriter.formatTXT_Type2(fp, root)
+        if files is None:
+            return
+        for sbFile in files:
+            SeaBASSWriter.writeSeaBASS(**sbFile)
+        return files[-1]['headerBlock']['data_file_name']
+
+    @staticmethod
+    def formatTXT_Type2(fp, root=None):
+        ''' Format the SeaBASS files of the L2 HDF at fp, or of its in-memory root if given (root is not modified),
+            without writing them. Returns the writeSeaBASS arguments of each file, the Es file last; each header
+            holds its data_file_name. '''
 
         minWave = 350
         maxWave = 750
 
-        if not os.path.isfile(fp):
+        if root is not None:
+            # Same content as the file on disk, which the formatting below is free to modify
+            root = root.snapshot()
+        elif not os.path.isfile(fp):
             print("SeaBASSWriter: no file to convert")
             return
-
-        # Make sure hdf can be read
-        try:
-            root = HDFRoot.readHDF5(fp)
-        except Exception:
-            print('SeaBassWriter: cannot open HDF. May be open in another app.')
-            return
+        else:
+            # Make sure hdf can be read
+            try:
+                root = HDFRoot.readHDF5(fp)
+            except Exception:
+                print('SeaBassWriter: cannot open HDF. May be open in another app.')
+                return
 
         if root is None:
             print("SeaBASSWriter: root is None")
@@ -605,32 +626,37 @@ class SeaBASSWriter:
             # formattedLi, fieldsLi, unitsLi  = SeaBASSWriter.formatData2(liData,'li',radianceGroup.attributes["LI_UNITS"])
             # formattedLt, fieldsLt, unitsLt  = SeaBASSWriter.formatData2(ltData,'lt',radianceGroup.attributes["LT_UNITS"])
 
-        # # Write SeaBASS files
-        if reflectanceGroup:
-            BRDF_correction = SeaBASSHeader.settings['BRDF_correction']
-            headerBlock['BRDF_correction'] = 'noBRDF'
-            SeaBASSWriter.writeSeaBASS('Rrs',fp,headerBlock,formattedRrs,fieldsRrs,unitsRrs)
-            SeaBASSWriter.writeSeaBASS('Lwn',fp,headerBlock,formattednLw,fieldsnLw,unitsnLw)
-            SeaBASSHeader.settings['BRDF_correction'] = BRDF_correction # Changes headerBlock as well.
+        def sbFile(header, dtype, formattedData, fields, units):
+            header = dict(header)
+            SeaBASSWriter.sbFileName(fp, header, formattedData, dtype)
+            return {'dtype': dtype, 'fp': fp, 'headerBlock': header,
+                    'formattedData': formattedData, 'fields': fields, 'units': units}
 
+        # # SeaBASS files
+        files = []
+        if reflectanceGroup:
+            noBRDF = dict(headerBlock, BRDF_correction='noBRDF')
+            files.append(sbFile(noBRDF,'Rrs',formattedRrs,fieldsRrs,unitsRrs))
+            files.append(sbFile(noBRDF,'Lwn',formattednLw,fieldsnLw,unitsnLw))
 
             if ConfigFile.settings['bL2BRDF']:
                 # Use M02 and L11 in filenames to avoid conflict with datatype "_IOP_"
                 if ConfigFile.settings['bL2BRDF_fQ']:
-                    SeaBASSWriter.writeSeaBASS('Lwn_M02',fp,headerBlock,formattednLw_BRDF,fieldsnLw_BRDF,unitsnLw_BRDF)
-                    SeaBASSWriter.writeSeaBASS('Rrs_M02',fp,headerBlock,formattedRrs_BRDF,fieldsRrs_BRDF,unitsRrs_BRDF)
+                    files.append(sbFile(headerBlock,'Lwn_M02',formattednLw_BRDF,fieldsnLw_BRDF,unitsnLw_BRDF))
+                    files.append(sbFile(headerBlock,'Rrs_M02',formattedRrs_BRDF,fieldsRrs_BRDF,unitsRrs_BRDF))
 
                 if ConfigFile.settings['bL2BRDF_IOP']:
-                    SeaBASSWriter.writeSeaBASS('Lwn_L11',fp,headerBlock,formattednLw_BRDF,fieldsnLw_BRDF,unitsnLw_BRDF)
-                    SeaBASSWriter.writeSeaBASS('Rrs_L11',fp,headerBlock,formattedRrs_BRDF,fieldsRrs_BRDF,unitsRrs_BRDF)
+                    files.append(sbFile(headerBlock,'Lwn_L11',formattednLw_BRDF,fieldsnLw_BRDF,unitsnLw_BRDF))
+                    files.append(sbFile(headerBlock,'Rrs_L11',formattedRrs_BRDF,fieldsRrs_BRDF,unitsRrs_BRDF))
 
                 if ConfigFile.settings['bL2BRDF_O25']:
-                    SeaBASSWriter.writeSeaBASS('Lwn_O25',fp,headerBlock,formattednLw_BRDF,fieldsnLw_BRDF,unitsnLw_BRDF)
-                    SeaBASSWriter.writeSeaBASS('Rrs_O25',fp,headerBlock,formattedRrs_BRDF,fieldsRrs_BRDF,unitsRrs_BRDF)
+                    files.append(sbFile(headerBlock,'Lwn_O25',formattednLw_BRDF,fieldsnLw_BRDF,unitsnLw_BRDF))
+                    files.append(sbFile(headerBlock,'Rrs_O25',formattedRrs_BRDF,fieldsRrs_BRDF,unitsRrs_BRDF))
 
-            # SeaBASSWriter.writeSeaBASS('LI',fp,headerBlock,formattedLi,fieldsLi,unitsLi)
-            # SeaBASSWriter.writeSeaBASS('LT',fp,headerBlock,formattedLt,fieldsLt,unitsLt)
-        del headerBlock['BRDF_correction']
-        SeaBASSWriter.writeSeaBASS('Es',fp,headerBlock,formattedEs,fieldsEs,unitsEs)
+            # files.append(sbFile(headerBlock,'LI',formattedLi,fieldsLi,unitsLi))
+            # files.append(sbFile(headerBlock,'LT',formattedLt,fieldsLt,unitsLt))
+        # Es has no BRDF_correction
+        esHeader = {k: v for k, v in headerBlock.items() if k != 'BRDF_correction'}
+        files.append(sbFile(esHeader,'Es',formattedEs,fieldsEs,unitsEs))
 
-        return headerBlock['data_file_name']
+        return files
@@ -2,7 +2,7 @@
 import numpy as np
 import scipy.interpolate
 
-from Source.SB_support import readSB
+from Source.SB_support import readSBCached
 
 def water_iops(fp, wave,T,S):
 
@@ -29,18 +29,19 @@ def water_iops(fp, wave,T,S):
     # Inputs
     #   fp (string): full file path to water absorption table in SeaBASS format
     #   wave (list): wavelengths of intended output
-    #   T (float): temperature
-    #   S (float): salinity
+    #   T (float or 1D array): temperature
+    #   S (float or 1D array): salinity
 
     # Outputs
     #   a_sw (list): absorption of seawater
-    #   bb_sw (list): backscattering of seawater'''
+    #   bb_sw (list): backscattering of seawater
+    #   With T or S as arrays, a_sw and bb_sw have one row per T/S pair'''
 
     wave = np.array(wave)
 
     #Pope and Frye pure water absorption 380-730 nm, then Smith and Baker 730-800 nm
-    aw_sb = readSB(fp, no_warn=True)
-    a_pw = scipy.interpolate.interp1d(aw_sb.data['wavelength'], aw_sb.data['aw'], \
+    aw_sb = readSBCached(fp, no_warn=True).data
+    a_pw = scipy.interpolate.interp1d(aw_sb['wavelength'], aw_sb['aw'], \
         kind='linear')(wave)
 
     # #Morel water backscattering
@@ -52,17 +53,18 @@ def water_iops(fp, wave,T,S):
     #log fit water backscattering
     bb_logfit = 0.0037000 * (380**4.3) / (wave**4.3)
 
+    T = np.asarray(T, dtype=float)
+    S = np.asarray(S, dtype=float)
+    if T.ndim or S.ndim:
+        T = T.reshape(-1, 1)
+        S = S.reshape(-1, 1)
+
     # Salinity correct:
-    if S>0:
-        bb_sw =  (1 + 0.01*S) * bb_logfit
-    else:
-        bb_sw = bb_logfit
+    bb_sw = np.where(S > 0, (1 + 0.01*S) * bb_logfit, bb_logfit)
 
     # Temp and salinity correction for water absorption (need to know at what T it was measured):
-    if S==0:
-        S = 35.0
-    if T==0:
-        T = 22.0
+    S = np.where(S == 0, 35.0, S)
+    T = np.where(T == 0, 22.0, T)
     T_pope = 22.0
 
     # Parameters for temp and salinity callibration (From Pegau et al Applied optics 1997):
@@ -72,10 +74,7 @@ def water_iops(fp, wave,T,S):
     M_T = np.array([0.0045, 0.002, 0.0045, 0.002, 0.0045, -0.004, 0.002, -0.001, 0.0045, 0.0062, -0.001, -0.001])
 
     # Computing the correction per degree C
-    phi_T = []
-    for wl in wave:
-        phi_T.append(np.sum( M_T * M / sig * np.exp( -(wl-lamda_c)**2/2.0/sig**2) ))
-    phi_T = np.array(phi_T)
+    phi_T = np.sum( M_T * M / sig * np.exp( -(wave[:, None]-lamda_c)**2/2.0/sig**2), axis=1)
 
     # Salinity correction based on Pegau and Zaneveld 1997:
     wls = np.array([400, 412, 440, 488, 510, 532, 555, 650, 676, 715, 750])
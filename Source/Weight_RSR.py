@@ -4,43 +4,77 @@ import numpy as np
 from scipy.interpolate import InterpolatedUnivariateSpline
 from itertools import compress
 
+import Source.utils.caching as caching
+
 class Weight_RSR:
     @staticmethod
-    def calculateBand(spectralDataset, wavelength, response):
-        # In the case of a dictionary of float values rather than lists (e.g. rhoVec), convert to lists
-        if isinstance(list(spectralDataset.values())[0], float):
-            temp = {}
-            for key, value in spectralDataset.items():
-                temp[key] = [value]
-            spectralDataset = temp
-
-        n = len(list(spectralDataset.values())[0])
-        result = []
-
-        # For each row of data within a band
-        for i in range(n):
-            srf_sum = 0
-            c_sum = 0.0
-
-            # For each lamda in band
-            for j in np.arange(0, len(wavelength)):
-                ld = str(wavelength[j])
-                srf = response[j]
-
-                # Check if lamda is in spectralDataset
-                if ld in spectralDataset:
-                    dataAtLambda = spectralDataset[ld][i]
-                    srf_sum += dataAtLambda*srf
-                    c_sum += response[j]
-
-            # Calculate srf value for that band
-            if c_sum == 0:
-                # For satellite bands (like 1240 nm) that have all 0 RSR in bands used for hyperspectral data
-                c = 0
-            else:
-                c = 1/c_sum
-            result.append(c * srf_sum)
-        return result
+    def readRSR(rsrFile, skiprows):
+        ''' Relative spectral response table (wavelength, band responses), read once per process '''
+        return caching.getLUT(rsrFile, lambda: np.loadtxt(rsrFile, skiprows=skiprows))
+
+    # RSR table and number of header rows for each satellite sensor
+    RSR_FILES = {
+        ('MODIS', 'A'): ('Data/HMODISA_RSRs.txt', 7),
+        ('MODIS', 'T'): ('Data/HMODIST_RSRs.txt', 7),
+        ('VIIRS', 'N'): ('Data/VIIRSN_IDPSv3_RSRs.txt', 5),
+        ('VIIRS', 'J'): ('Data/VIIRS1_RSRs.txt', 5),
+        ('Sentinel3', 'A'): ('Data/OLCIA_RSRs.txt', 10),
+        ('Sentinel3', 'B'): ('Data/OLCIB_RSRs.txt', 10),
+    }
+
+    @staticmethod
+    def bandMatrix(mission, sensor, keys):
+        ''' Band convolution of a hyperspectral wavelength grid (keys, as in the spectral datasets) for a
+            satellite sensor, built once per grid: (bands, weights, used), where weights[i] is the RSR of
+            band i interpolated to the grid and normalised over the used wavelengths. Keys that are not
+            the str of their float value are not used, as in the original per-band lookup. '''
+        keys = tuple(keys)
+        rsrFile, skiprows = Weight_RSR.RSR_FILES[(mission, sensor)]
+
+        def build():
+            wvInterp = [float(key) for key in keys]
+            fields = getattr(Weight_RSR, f'{mission}Bands')()
+            data = Weight_RSR.readRSR(rsrFile, skiprows)
+            wavelength = data[:,0]
+
+            # Only use bands that intersect hyperspectral data
+            gudBands = [min(wvInterp) <= field <= max(wvInterp) for field in fields]
+            fields = list(compress(fields,gudBands))
+            rsr = data[:,[False] + gudBands] # First one is false for the wavelength column in data
+            if mission == 'Sentinel3':
+                rsr = np.where(rsr == -999.0, 0, rsr)
+
+            # Interpolate the response functions to the wavebands of the OCR
+            order = 1
+            weights = np.empty([len(fields),len(keys)])
+            for i in np.arange(0,rsr.shape[1]):
+                fn = InterpolatedUnivariateSpline(wavelength,rsr[:,i],k=order)
+                weights[i] = fn(wvInterp)
+
+            used = np.array([str(wv) in keys for wv in wvInterp])
+            weights[:,~used] = 0
+            c_sum = weights.sum(axis=1, keepdims=True)
+            # For satellite bands (like 1240 nm) that have all 0 RSR in bands used for hyperspectral data
+            weights = np.divide(weights, c_sum, out=np.zeros_like(weights), where=c_sum != 0)
+            return [str(field) for field in fields], weights, used
+
+        return caching.getLUT(('bandMatrix', rsrFile, keys), build)
+
+    @staticmethod
+    def convolveMatrix(spectra, keys, mission, sensor):
+        ''' Convolve spectra (..., wavelengths) on the grid keys to the bands of a satellite sensor as one
+            matrix product over any leading axes (e.g. time). Returns (bands, (..., bands) array). '''
+        fields, weights, used = Weight_RSR.bandMatrix(mission, sensor, keys)
+        return fields, np.asarray(spectra, dtype=float)[...,used] @ weights[:,used].T
+
+    @staticmethod
+    def convolve(hyperspecData, mission, sensor):
+        ''' Convolve a spectral dataset ({wavelength: values or value}) to the bands of a satellite sensor.
+            Returns {band: list of values}. '''
+        keys = list(hyperspecData.keys())
+        spectra = np.array([np.atleast_1d(value) for value in hyperspecData.values()], dtype=float)
+        fields, bands = Weight_RSR.convolveMatrix(spectra.T, keys, mission, sensor)
+        return collections.OrderedDict((field, band.tolist()) for field, band in zip(fields, bands.T))
 
     @staticmethod
     def MODISBands():
@@ -50,51 +84,7 @@ class Weight_RSR:
 
     @staticmethod
     def processMODISBands(hyperspecData, sensor='A'):
-
-        keys = hyperspecData.keys()
-        wvInterp = np.empty([1,len(keys)])*0
-        for i, key in enumerate(keys):
-            wvInterp[0,i] = float(key)
-        wvInterp = wvInterp[0].tolist()
-
-        weightedBandData = collections.OrderedDict()
-        fields = Weight_RSR.MODISBands()
-
-        # Read in the RSRs from NASA
-        if sensor == 'A':
-            modisRSRFile = 'Data/HMODISA_RSRs.txt'
-        else:
-            modisRSRFile = 'Data/HMODIST_RSRs.txt'
-
-        data = np.loadtxt(modisRSRFile, skiprows=7)
-        wavelength = data[:,0].tolist()
-
-        # Only use bands that intersect hyperspectral data
-        gudBands = []
-        for field in fields:
-            if field >= min(wvInterp) and field <= max(wvInterp):
-                gudBands.append(True)
-            else:
-                gudBands.append(False)
-        fields = list(compress(fields,gudBands))
-
-        gudBands.insert(0,False) # First one is false for the wavelength column in data
-        rsr = data[:,gudBands]
-
-        rsrInterp = np.empty([len(hyperspecData),rsr.shape[1]])
-
-        # Interpolate the response functions to the wavebands of the OCR
-        order = 1
-        for i in np.arange(0,rsr.shape[1]):
-            # rsrInterp[:,i] = Utilities.interp(wavelength,rsr[:,i].tolist(),wvInterp[0].tolist())
-            fn = InterpolatedUnivariateSpline(wavelength,rsr[:,i].tolist(),k=order)
-            rsrInterp[:,i] = fn(wvInterp)
-
-        for i in np.arange(0, len(fields)):
-            weightedBandData[str(fields[i])] = \
-                Weight_RSR.calculateBand(hyperspecData, wvInterp, rsrInterp[:,i])
-
-        return weightedBandData
+        return Weight_RSR.convolve(hyperspecData, 'MODIS', 'A' if sensor == 'A' else 'T')
 
 
     @staticmethod
@@ -105,50 +95,7 @@ class Weight_RSR:
 
     @staticmethod
     def processVIIRSBands(hyperspecData, sensor='N'):
-        keys = hyperspecData.keys()
-        wvInterp = np.empty([1,len(keys)])*0
-        for i, key in enumerate(keys):
-            wvInterp[0,i] = float(key)
-        wvInterp = wvInterp[0].tolist()
-
-        weightedBandData = collections.OrderedDict()
-        fields = Weight_RSR.VIIRSBands()
-
-        # Read in the RSRs from NASA
-        if sensor == 'N':
-            modisRSRFile = 'Data/VIIRSN_IDPSv3_RSRs.txt'
-        else:
-            modisRSRFile = 'Data/VIIRS1_RSRs.txt'
-
-        data = np.loadtxt(modisRSRFile, skiprows=5)
-        wavelength = data[:,0].tolist()
-
-        # Only use bands that intersect hyperspectral data
-        gudBands = []
-        for field in fields:
-            if field >= min(wvInterp) and field <= max(wvInterp):
-                gudBands.append(True)
-            else:
-                gudBands.append(False)
-        fields = list(compress(fields,gudBands))
-
-        gudBands.insert(0,False) # First one is false for the wavelength column in data
-        rsr = data[:,gudBands]
-
-        rsrInterp = np.empty([len(hyperspecData),rsr.shape[1]])
-
-        # Interpolate the response functions to the wavebands of the OCR
-        order = 1
-        for i in np.arange(0,rsr.shape[1]):
-            # rsrInterp[:,i] = Utilities.interp(wavelength,rsr[:,i].tolist(),wvInterp[0].tolist())
-            fn = InterpolatedUnivariateSpline(wavelength,rsr[:,i].tolist(),k=order)
-            rsrInterp[:,i] = fn(wvInterp)
-
-        for i in np.arange(0, len(fields)):
-            weightedBandData[str(fields[i])] = \
-                Weight_RSR.calculateBand(hyperspecData, wvInterp, rsrInterp[:,i])
-
-        return weightedBandData
+        return Weight_RSR.convolve(hyperspecData, 'VIIRS', 'N' if sensor == 'N' else 'J')
 
 
     @staticmethod
@@ -161,49 +108,5 @@ class Weight_RSR:
 
     @staticmethod
     def processSentinel3Bands(hyperspecData, sensor='A'):
-        keys = hyperspecData.keys()
-        wvInterp = np.empty([1,len(keys)])*0
-        pass
-        for i, key in enumerate(keys):
-            wvInterp[0,i] = float(key)
-        wvInterp = wvInterp[0].tolist()
-
-        weightedBandData = collections.OrderedDict()
-        fields = Weight_RSR.Sentinel3Bands()
-
-        # Read in the RSRs from NASA
-        # OLCI Sentinel 3A
-        if sensor == 'A':
-            modisRSRFile = 'Data/OLCIA_RSRs.txt'
-        else:
-            modisRSRFile = 'Data/OLCIB_RSRs.txt'
-        data = np.loadtxt(modisRSRFile, skiprows=10)
-        wavelength = data[:,0].tolist()
-        # Only use bands that intersect hyperspectral data
-        gudBands = []
-        for field in fields:
-            if field >= min(wvInterp) and field <= max(wvInterp):
-                gudBands.append(True)
-            else:
-                gudBands.append(False)
-        fields = list(compress(fields,gudBands))
-
-        gudBands.insert(0,False) # First one is false for the wavelength column in data
-        rsr = data[:,gudBands]
-        rsr[rsr==-999.0] = 0
-
-        rsrInterp = np.empty([len(hyperspecData),rsr.shape[1]])
-
-
-        # Interpolate the response functions to the wavebands of the OCR
-        order = 1
-        for i in np.arange(0,rsr.shape[1]):
-            # rsrInterp[:,i] = Utilities.interp(wavelength,rsr[:,i].tolist(),wvInterp[0].tolist())
-            fn = InterpolatedUnivariateSpline(wavelength,rsr[:,i].tolist(),k=order)
-            rsrInterp[:,i] = fn(wvInterp)
-
-        for i in np.arange(0, len(fields)):
-            weightedBandData[str(fields[i])] = \
-                Weight_RSR.calculateBand(hyperspecData, wvInterp, rsrInterp[:,i])
-
-        return weightedBandData
\ No newline at end of file
+        return Weight_RSR.convolve(hyperspecData, 'Sentinel3', 'A' if sensor == 'A' else 'B')
+
@@ -1,5 +1,8 @@
 import os
+import errno
+import shutil
 import logging
+import tempfile
 from typing import Optional
 from functools import lru_cache
 
@@ -8,6 +11,7 @@ import xarray as xr  # Only needed to read original data
 from scipy.interpolate import interpn
 
 from Source import PATH_TO_DATA
+from Source.MainConfig import MainConfig
 
 
 logger = logging.getLogger('zhang17')
@@ -22,32 +26,120 @@ rad_boa_sca: Optional[np.ndarray] = None
 rad_boa_vec: Optional[np.ndarray] = None
 
 
-def load():
+DB_PATH = os.path.join(PATH_TO_DATA, 'Zhang_rho_db_expanded.mat')
+STORE_DIR = os.path.join(PATH_TO_DATA, 'Zhang_rho_db_store')
+# Free space required to build the store, as a multiple of its size
+STORE_MARGIN = 1.1
+# Look up tables kept on disk as memory-mappable .npy files; the small tables go together in tables.npz
+LARGE_TABLES = {'skyrad0': 'skyrad0', 'sunrad0': 'sunrad0',
+                'rad_boa_sca': 'Radiance_BOA_sca', 'rad_boa_vec': 'Radiance_BOA_vec'}
+SMALL_TABLES = {'quads': ['zen', 'azm', 'du', 'dphi', 'sun05', 'zen_num', 'azm_num', 'zen0', 'azm0'],
+                'db': ['wind', 'od', 'C', 'zen_sun', 'wv'],
+                'sdb': ['wind', 'od', 'zen_sun', 'zen_view', 'azm_view', 'wv'],
+                'vdb': ['wind', 'od', 'zen_sun', 'zen_view', 'azm_view', 'wv']}
+
+
+def _source_id(db_path):
+    stat = os.stat(db_path)
+    return f'{stat.st_size}:{stat.st_mtime_ns}'
+
+
+def _save_atomic(fp, save):
+    fd, tmp = tempfile.mkstemp(suffix=os.path.splitext(fp)[1], dir=os.path.dirname(fp))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            save(f)
+        os.replace(tmp, fp)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _save_table(fp, var):
+    """ Write a large table C-ordered to fp; only one table is held in memory at a time """
+    table = np.ascontiguousarray(var.to_numpy().T)
+    _save_atomic(fp, lambda f: np.save(f, table))
+
+
+def _read_small_tables(db_path):
+    """ The grids and sky quads of the .mat database: {group: {name: array}} """
+    tables = {}
+    for group, keys in SMALL_TABLES.items():
+        with xr.open_dataset(db_path, group=group, engine='netcdf4') as ds:
+            tables[group] = {k: ds[k].to_numpy().T if group == 'quads' else ds[k].to_numpy().T.squeeze()
+                             for k in keys}
+    return tables
+
+
+def _read_database(db_path):
+    """ All tables of the .mat database, in memory (in the form taken by assign) """
+    DB = _read_small_tables(db_path)
+    with xr.open_dataset(db_path, engine='netcdf4') as ds:
+        for name, var in LARGE_TABLES.items():
+            DB[name] = ds[var].to_numpy().T
+    return DB
+
+
+def build_store(db_path=DB_PATH, store_dir=STORE_DIR):
+    """
+    Convert the look up tables of Zhang et al. 2017 from the .mat database to the store read by load().
+    Large tables are written C-ordered so that a slab of the leading (wind/AOT/SZA) axes is contiguous on disk.
+    tables.npz is written last and records the database it came from. Raises OSError without writing the
+    tables if the disk holding store_dir has not room for them.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    with xr.open_dataset(db_path, engine='netcdf4') as ds:
+        size = sum(ds[var].nbytes for var in LARGE_TABLES.values())
+        free = shutil.disk_usage(store_dir).free
+        logger.info(f'Building Zhang LUT store {store_dir} ({size / 1e9:.1f} GB, {free / 1e9:.1f} GB free)')
+        if free < STORE_MARGIN * size:
+            raise OSError(errno.ENOSPC, f'{size / 1e9:.1f} GB needed, {free / 1e9:.1f} GB free', store_dir)
+        for name, var in LARGE_TABLES.items():
+            _save_table(os.path.join(store_dir, name + '.npy'), ds[var])
+
+    small = {f'{group}/{k}': table for group, tables in _read_small_tables(db_path).items() for k, table in tables.items()}
+    small['source'] = np.array(_source_id(db_path))
+    _save_atomic(os.path.join(store_dir, 'tables.npz'), lambda f: np.savez(f, **small))
+
+
+def load(store_dir=None, db_path=DB_PATH):
     """
     Load look up tables from Zhang et al. 2017
+
+    Given a store directory (store_dir, or else the z17StoreDir setting of MainConfig, empty by default), the large tables are
+    memory-mapped read-only from the store (see build_store, run on first use), so processes share them through
+    the page cache and only the slabs used by an interpolation are read. Without one, or if the store cannot be
+    built, the tables are read into memory.
     """
     logger.debug('Load constants')
     global db, quads, skyrad0, sunrad0, sdb, vdb, rad_boa_sca, rad_boa_vec
 
-    db_path = os.path.join(PATH_TO_DATA, 'Zhang_rho_db_expanded.mat')
-    with xr.open_dataset(db_path, engine='netcdf4') as ds:
-        skyrad0 = ds['skyrad0'].to_numpy().T
-        sunrad0 = ds['sunrad0'].to_numpy().T
-        rad_boa_sca = ds['Radiance_BOA_sca'].to_numpy().T
-        rad_boa_vec = ds['Radiance_BOA_vec'].to_numpy().T
-
-    db = xr.open_dataset(db_path, group='db', engine='netcdf4')
-    quads = xr.open_dataset(db_path, group='quads', engine='netcdf4')
-    sdb = xr.open_dataset(db_path, group='sdb', engine='netcdf4')
-    vdb = xr.open_dataset(db_path, group='vdb', engine='netcdf4')
-
-    quads = {k: quads[k].to_numpy().T for k in ['zen', 'azm', 'du', 'dphi', 'sun05',
-                                                'zen_num', 'azm_num', 'zen0', 'azm0']}
-    db = {k: db[k].to_numpy().T.squeeze() for k in ['wind', 'od', 'C', 'zen_sun', 'wv']}
-    sdb = {k: sdb[k].to_numpy().T.squeeze()
-           for k in ['wind', 'od', 'zen_sun', 'zen_view', 'azm_view', 'wv']}
-    vdb = {k: vdb[k].to_numpy().T.squeeze()
-           for k in ['wind', 'od', 'zen_sun', 'zen_view', 'azm_view', 'wv']}
+    if store_dir is None:
+        store_dir = MainConfig.settings.get('z17StoreDir', '')
+    if not store_dir:
+        assign(_read_database(db_path))
+        return
+
+    fp = os.path.join(store_dir, 'tables.npz')
+    current = os.path.isfile(fp)
+    if current and os.path.isfile(db_path):
+        with np.load(fp) as stored:
+            current = str(stored['source']) == _source_id(db_path)
+    if not current:
+        try:
+            build_store(db_path, store_dir)
+        except OSError as err:
+            logger.warning(f'Could not build Zhang LUT store ({err}); holding the tables in memory instead.')
+            assign(_read_database(db_path))
+            return
+
+    with np.load(fp) as stored:
+        tables = {group: {k: stored[f'{group}/{k}'] for k in keys} for group, keys in SMALL_TABLES.items()}
+    db, quads, sdb, vdb = tables['db'], tables['quads'], tables['sdb'], tables['vdb']
+
+    large = {name: np.load(os.path.join(store_dir, name + '.npy'), mmap_mode='r') for name in LARGE_TABLES}
+    skyrad0, rad_boa_sca, rad_boa_vec = large['skyrad0'], large['rad_boa_sca'], large['rad_boa_vec']
+    sunrad0 = np.array(large['sunrad0'])  # small enough to hold
 
 
 def assign(DB):
@@ -65,7 +157,7 @@ def assign(DB):
 
 def clear_memory():
     """
-    Remove look up tables from memory (~2.5Gb).
+    Remove look up tables from memory (~2.5Gb if they were assigned from memory rather than memory-mapped).
     """
     global db, quads, skyrad0, sunrad0, sdb, vdb, rad_boa_sca, rad_boa_vec
     db, quads, skyrad0, sunrad0, sdb, vdb, rad_boa_sca, rad_boa_vec = \
@@ -400,32 +492,59 @@ def fresnel(m, ang):
     return R  # , R12, R33
 
 
-def interpn_chunked(x, y, xi, chunked_axis=2, cache_size=(16 * 10 ** 6) / 4):
-    # x: array(arrays(0:3)) ranges of zen_sun(7), od(4), index(92476), waveband(131); x[chunked_axis=2]=index, so array(0:92475)
-    # y: skyrad0 (7x4x92746x131)
-    # xi: array(arrays(0:3)) env['zen_sun'](1), env['od'](1), db_idx(92476), sensor['wv'](depends on sensor))
-
-    ndim = len(x)
-    chunk = (y.size * y.dtype.itemsize) / cache_size  # TODO Optimize chunk size automatically based on cache size
-    if chunk > 1:
-        # Chunked
-        indices = np.append(np.arange(len(x[chunked_axis]), step=len(x[chunked_axis]) / chunk, dtype=int),
-                            len(x[chunked_axis]))
-        ys = np.split(y, indices[1:-1], axis=chunked_axis)
-        cyi = np.empty([len(v) if hasattr(v, '__iter__') else 1 for v in xi])
-        for cy, s, e in zip(ys, indices[:-1], indices[1:]):
-            cx = [v[s:e] if i == chunked_axis else v for i, v in enumerate(x)]
-            cxi = np.asarray(np.meshgrid(*[v[s:e] if i == chunked_axis else v for i, v in enumerate(xi)])).T
-            try:
-                cyi[:, :, s:e, :] = interpn(cx, cy, cxi.reshape(-1, ndim)).reshape(cxi.shape[:-1]).T
-            except ValueError as err:
-                print(err)
-
-        return cyi
-    else:
-        # One shot
-        vxi = np.asarray(np.meshgrid(*xi)).T
-        return interpn(x, y, vxi.reshape(-1, ndim)).reshape(vxi.shape[:-1]).T
+def _bracket(grid, values):
+    """ Slice of an ascending grid holding the nodes interpn uses to interpolate linearly at values """
+    if len(grid) < 2:
+        return slice(None)
+    lo = np.searchsorted(grid, np.min(values), side='left') - 1
+    hi = np.searchsorted(grid, np.max(values), side='left')
+    lo = min(max(lo, 0), len(grid) - 2)
+    hi = max(min(hi, len(grid) - 1), lo + 1)
+    return slice(lo, hi + 1)
+
+
+def interpn_slab(x, y, xi):
+    """
+    interpn(x, y, xi) for points xi (n x ndim), reading only the slab of y (e.g. a memory-mapped table)
+    between the grid nodes that bracket the points.
+    """
+    xi = np.asarray(xi, dtype=float).reshape(-1, len(x))
+    slices = tuple(_bracket(np.asarray(g), xi[:, d]) for d, g in enumerate(x))
+    return interpn(tuple(np.asarray(g)[sl] for g, sl in zip(x, slices)), np.asarray(y[slices]), xi)
+
+
+@lru_cache(maxsize=64)
+def linear_weights(grid, values):
+    """
+    Lower node index and weight of the upper node for linear interpolation on an ascending grid,
+    following interpn. Takes tuples so that the weights are cached for repeated geometries.
+    """
+    grid = np.asarray(grid)
+    values = np.asarray(values)
+    if np.any(values < grid[0]) or np.any(values > grid[-1]):
+        raise ValueError(f'One of the requested xi is out of bounds ({grid[0]} to {grid[-1]})')
+    i = np.clip(np.searchsorted(grid, values, side='left') - 1, 0, len(grid) - 2)
+    t = (values - grid[i]) / (grid[i + 1] - grid[i])
+    i.flags.writeable = False
+    t.flags.writeable = False
+    return i, t
+
+
+def interp_skyrad(zen_sun, od, wv):
+    """
+    Sky radiance of every quad interpolated to the solar zenith, aerosol optical depth and wavebands
+    (quads x wavebands), as interpn on skyrad0. Reads only the (at most four) zen_sun/od slabs involved.
+    """
+    iz, tz = linear_weights(tuple(db['zen_sun']), (float(zen_sun),))
+    io, to = linear_weights(tuple(db['od']), (float(od),))
+    iw, tw = linear_weights(tuple(db['wv']), tuple(np.atleast_1d(wv).astype(float)))
+
+    slab = 0.0
+    for i, wz in ((iz[0], 1 - tz[0]), (iz[0] + 1, tz[0])):
+        for j, wo in ((io[0], 1 - to[0]), (io[0] + 1, to[0])):
+            if wz * wo != 0:
+                slab = slab + (wz * wo) * np.asarray(skyrad0[i, j], dtype=np.float64)
+    return slab[:, iw] * (1 - tw) + slab[:, iw + 1] * tw
 
 
 def get_sky_sun_rho(env, sensor, round4cache=False, DB=None):
@@ -485,15 +604,7 @@ def get_sky_sun_rho(env, sensor, round4cache=False, DB=None):
     # TODO Check dtype of skyrad0 to lower memory footprint
     # TODO Look into numexpr, numba, dask library
     logger.debug(f"Interpolate skyrad ({env['zen_sun']}', '{env['od']}', '{sensor['wv'][0:5]}...)")
-    db_idx = np.arange(skyrad0.shape[2])
-    # xi = np.array(np.meshgrid(env['zen_sun'], env['od'], db_idx, sensor['wv'], copy=False)).T
-    # skyrad = interpn((db['zen_sun'], db['od'], db_idx, db['wv']),
-    #                  skyrad0, xi.reshape(-1, 4)).reshape(xi.shape[:-1]).T.squeeze()
-
-    #if(env['zen_sun'] > 60.0):
-    #    env['zen_sun']=59.9
-    skyrad = interpn_chunked((db['zen_sun'], db['od'], db_idx, db['wv']), skyrad0,
-                             (env['zen_sun'], env['od'], db_idx, sensor['wv']), chunked_axis=2).squeeze()
+    skyrad = interp_skyrad(env['zen_sun'], env['od'], sensor['wv']).squeeze()
 
     n0 = skyrad[sensor['loc2']]
     n = skyrad / n0
@@ -514,10 +625,10 @@ def get_sky_sun_rho(env, sensor, round4cache=False, DB=None):
     x = (sdb['wind'], sdb['od'][:, 9], sdb['zen_sun'], sdb['wv'], sdb['zen_view'], sdb['azm_view'])
     xi = np.asarray(np.meshgrid(env['wind'], env['od'], env['zen_sun'],
                               sensor['wv'], 180 - sensor['ang'][0], 180 - sensor['ang'][1])).T
-    rad_inc_sca = interpn(x, rad_boa_sca, xi.reshape(-1, 6)).reshape(xi.shape[:-1]).T.squeeze()
+    rad_inc_sca = interpn_slab(x, rad_boa_sca, xi.reshape(-1, 6)).reshape(xi.shape[:-1]).T.squeeze()
     xi = np.asarray(np.meshgrid(env['wind'], env['od'], env['zen_sun'],
                               sensor['wv'], sensor['ang'][0], 180 - sensor['ang'][1])).T
-    rad_mea_sca = interpn(x, rad_boa_sca, xi.reshape(-1, 6)).reshape(xi.shape[:-1]).T.squeeze()
+    rad_mea_sca = interpn_slab(x, rad_boa_sca, xi.reshape(-1, 6)).reshape(xi.shape[:-1]).T.squeeze()
     rho_sca = rad_mea_sca / rad_inc_sca
 
     # Radiance Inc
@@ -525,10 +636,10 @@ def get_sky_sun_rho(env, sensor, round4cache=False, DB=None):
     x = (vdb['wind'], vdb['od'][:, 9], vdb['zen_sun'], vdb['wv'], vdb['zen_view'], vdb['azm_view'])
     xi = np.asarray(np.meshgrid(env['wind'], env['od'], env['zen_sun'],
                               sensor['wv'], 180 - sensor['ang'][0], 180 - sensor['ang'][1])).T
-    rad_inc_vec = interpn(x, rad_boa_vec, xi.reshape(-1, 6)).reshape(xi.shape[:-1]).T.squeeze()
+    rad_inc_vec = interpn_slab(x, rad_boa_vec, xi.reshape(-1, 6)).reshape(xi.shape[:-1]).T.squeeze()
     xi = np.asarray(np.meshgrid(env['wind'], env['od'], env['zen_sun'],
                               sensor['wv'], sensor['ang'][0], 180 - sensor['ang'][1])).T
-    rad_mea_vec = interpn(x, rad_boa_vec, xi.reshape(-1, 6)).reshape(xi.shape[:-1]).T.squeeze()
+    rad_mea_vec = interpn_slab(x, rad_boa_vec, xi.reshape(-1, 6)).reshape(xi.shape[:-1]).T.squeeze()
     rho_vec = rad_mea_vec / rad_inc_vec
 
     rho['sca2vec'] = rho_vec / rho_sca
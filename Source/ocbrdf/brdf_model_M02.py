@@ -1,7 +1,7 @@
 import numpy as np
 import xarray as xr
 
-from .brdf_utils import ADF_OCP, solve_2nd_order_poly, drop_unused_coords
+from .brdf_utils import open_lut, solve_2nd_order_poly, drop_unused_coords, interp_pixels
 
 ''' Morel et al. (2002) BRDF correction
     R gothic included
@@ -25,9 +25,6 @@ class M02:
     """
 
     def __init__(self, bands, aot, wind, adf=None):
-        if adf is None:
-            adf = ADF_OCP
-
         # Check required bands are existing, within a 25 nm threshold
         self.bands = bands
         threshold = 25.
@@ -38,7 +35,7 @@ class M02:
         self.b442, self.b490, self.b510, self.b560 = bands_ref
 
         # Read BRDF LUT and compute default coeffs
-        LUT_OCP = xr.open_dataset(adf % 'M02',engine='netcdf4')
+        LUT_OCP = open_lut('M02', adf)
         self.LUT = xr.Dataset()
 
         # Homogeneise naming convention with other methods... (PZA --> OZA transformation comes below...)
@@ -91,8 +88,8 @@ class M02:
                                    float(np.min(self.LUT.theta_v)),
                                    float(np.max(self.LUT.theta_v)))
 
-        Rgoth = self.LUT.Rgoth.interp(theta_v_Rgoth=theta_v_Rgoth_0)
-        foq = self.LUT.foq.interp(theta_s=theta_s, theta_v=theta_v_0, delta_phi=delta_phi)
+        Rgoth = interp_pixels(self.LUT.Rgoth, theta_v_Rgoth=theta_v_Rgoth_0)
+        foq = interp_pixels(self.LUT.foq, theta_s=theta_s, theta_v=theta_v_0, delta_phi=delta_phi)
 
         return Coeffs(Rgoth, foq)
 
@@ -116,7 +113,7 @@ class M02:
         # f/Q LUT indexed with ln(CHL), i.e. log_e(CHL)
         log_chl_foq = log10_chl_foq * np.log(10)
 
-        forward_mod = coeffs.Rgoth * coeffs.foq.interp(wavelengths_FOQ=wave_foq).interp(log_chl_foq=log_chl_foq)
+        forward_mod = coeffs.Rgoth * interp_pixels(coeffs.foq.interp(wavelengths_FOQ=wave_foq), log_chl_foq=log_chl_foq)
 
         return forward_mod
 
@@ -147,7 +144,7 @@ class M02:
         log_chl_f0 = log10_chl_f0 * np.log(10)
         f0_chl = self.LUT['f0'].interp(log_chl_f0=log_chl_f0)
 
-        fQ_chl = self.coeffs.foq.interp(log_chl_foq=log10_chl_f0)
+        fQ_chl = interp_pixels(self.coeffs.foq, log_chl_foq=log10_chl_f0)
 
         # Drop unused coordinates to avoid ambiguities in indexation...
         Rrs = drop_unused_coords(Rrs)
@@ -1,7 +1,7 @@
 import numpy as np
 import xarray as xr
 
-from .brdf_utils import ADF_OCP, solve_2nd_order_poly
+from .brdf_utils import open_lut, solve_2nd_order_poly
 
 ''' Morel et al. (2002) BRDF correction
     R gothic NOT included
@@ -24,9 +24,6 @@ class M02SeaDAS:
     """
 
     def __init__(self, bands, adf=None):
-        if adf is None:
-            adf = ADF_OCP
-
         # Check required bands are existing, within a 25 nm threshold
         self.bands = bands
         threshold = 25.
@@ -37,7 +34,7 @@ class M02SeaDAS:
         self.b442, self.b490, self.b510, self.b560 = bands_ref
 
         # Read BRDF LUT and compute default coeffs
-        LUT_OCP = xr.open_dataset(adf % 'M02SeaDAS',engine='netcdf4')
+        LUT_OCP = open_lut('M02SeaDAS', adf)
         self.LUT = xr.Dataset()
 
         # Homogeneise naming convention with other methods... (PZA --> OZA transformation comes below...)
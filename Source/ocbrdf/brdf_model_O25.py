@@ -1,7 +1,7 @@
 import numpy as np
 import xarray as xr
 
-from .brdf_utils import ADF_OCP, solve_2nd_order_poly, drop_unused_coords
+from .brdf_utils import open_lut, solve_2nd_order_poly, drop_unused_coords
 from .Raman import Raman
 
 
@@ -27,9 +27,6 @@ class O25:
         Note: bands are fixed and defined at class initilization, but could be initialized in init_pixels if needed
     """
     def __init__(self, bands, adf=None):
-        if adf is None:
-            adf = ADF_OCP
-
         # Check required bands are existing, within a 10 nm threshold
         self.bands = bands
         threshold = 10.
@@ -40,7 +37,7 @@ class O25:
         self.b442, self.b490, self.b560, self.b665 = bands_ref
 
         # Read BRDF LUT and compute default coeffs
-        LUT_OCP = xr.open_dataset(adf % 'O25',engine='netcdf4')
+        LUT_OCP = open_lut('O25', adf)
         self.LUT = xr.Dataset()
         self.LUT['Gw0'] = LUT_OCP.Gw0
         self.LUT['Gw1'] = LUT_OCP.Gw1 
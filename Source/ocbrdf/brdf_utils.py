@@ -2,11 +2,25 @@ import numpy as np
 import xarray as xr
 import os
 
+import Source.utils.caching as caching
+
 # Define default auxiliary data file (OLCI OCP ADF)
 ref_path = os.path.dirname(os.path.realpath(__file__))
 # ADF_OCP = os.path.join(ref_path, '..', 'AuxiliaryData/OCP/S3A_OL_2_OCP_AX_20160216T000000_20991231T235959_20240327T100000___________________EUM_O_AL_008.SEN3/OL_2_OCP_AX.nc')
 ADF_OCP = os.path.join(ref_path, 'BRDF_LUTs','BRDF_%s.nc')
 
+def open_lut(name, adf=None):
+    """ Read the BRDF LUT adf % name (e.g. 'M02', 'UNC') into memory, once per process """
+    if adf is None:
+        adf = ADF_OCP
+    path = adf % name
+
+    def load():
+        with xr.open_dataset(path, engine='netcdf4') as LUT:
+            return LUT.load()
+
+    return caching.getLUT(path, load)
+
 def solve_2nd_order_poly(A, B, C):
     """ Solve 2nd order polynomial inversion 
     where coefficients are xr dataArray
@@ -31,6 +45,31 @@ def solve_2nd_order_poly(A, B, C):
 
     return x
 
+def interp_pixels(var, **indexers):
+    """ Linear interpolation of var at one coordinate per pixel, as var.interp(**indexers) (NaN outside the LUT),
+    for a var that already has the pixel dimension "n" shared by the indexers. Avoids xarray's element-wise loop
+    over the shared dimension.
+    """
+    if 'n' not in var.dims:
+        return var.interp(**indexers)
+
+    for dim, x in indexers.items():
+        if isinstance(x, xr.DataArray) and set(x.dims) - {'n'}:
+            var = var.interp({dim: x})
+            continue
+        grid = var[dim].values
+        x = np.broadcast_to(np.asarray(x, dtype=float), (var.sizes['n'],))
+        i = np.clip(np.searchsorted(grid, x, side='left') - 1, 0, len(grid) - 2)
+        t = (x - grid[i]) / (grid[i + 1] - grid[i])
+        t[(x < grid[0]) | (x > grid[-1])] = np.nan
+
+        template = var.isel({dim: 0}, drop=True).transpose('n', ...)
+        values = var.transpose('n', dim, *template.dims[1:]).values
+        pixels = np.arange(len(x))
+        t = t.reshape((-1,) + (1,) * (values.ndim - 2))
+        var = template.copy(data=values[pixels, i] * (1 - t) + values[pixels, i + 1] * t)
+    return var
+
 def drop_unused_coords(var):
     for coord in var.coords:
         if coord not in var.dims:
@@ -5,7 +5,7 @@ from .brdf_model_M02 import M02
 from .brdf_model_M02SeaDAS import M02SeaDAS
 from .brdf_model_L11 import L11
 from .brdf_model_O25 import O25
-from .brdf_utils import ADF_OCP, squeeze_trivial_dims
+from .brdf_utils import open_lut, squeeze_trivial_dims
 
 """
 Main BRDF correction module
@@ -129,14 +129,34 @@ def brdf_prototype(ds, adf=None, brdf_model='L11'):
 
     return ds
 
+def brdf_correct(Rw, bands, sza, vza, raa, wind, aot, brdf_models=('L11',)):
+    """ Apply several BRDF models to a (n x bands) matrix of directional marine reflectance at once
+        Geometry and ancillary inputs are arrays of length n. Model LUTs are read once per process (see open_lut).
+        Returns {model: {'C_brdf', 'nrrs', 'brdf_unc'}}, each a (n x bands) array
+    """
+    Rw = np.atleast_2d(np.asarray(Rw, dtype=float))
+    n = range(Rw.shape[0])
+    ds = xr.Dataset({
+        'Rw': xr.DataArray(data=Rw, dims=['n', 'bands'], coords={'n': n, 'bands': np.asarray(bands)}),
+        'sza': xr.DataArray(data=np.atleast_1d(sza), dims=['n']),
+        'vza': xr.DataArray(data=np.atleast_1d(vza), dims=['n']),
+        'raa': xr.DataArray(data=np.atleast_1d(raa), dims=['n']),
+        'wind': xr.DataArray(data=np.atleast_1d(wind), dims=['n']),
+        'aot': xr.DataArray(data=np.atleast_1d(aot), dims=['n']),
+    })
+
+    result = {}
+    for brdf_model in brdf_models:
+        out = brdf_prototype(ds.copy(), brdf_model=brdf_model)
+        result[brdf_model] = {k: out[k].transpose('n', 'bands').values for k in ['C_brdf', 'nrrs', 'brdf_unc']}
+    return result
+
 def brdf_uncertainty(ds, adf=None):
     ''' Compute uncertainty of BRDF factor and propagate to nrrs '''
 
     # Read LUT
-    if adf is None:
-        adf = ADF_OCP
     # LUT = xr.open_dataset(adf,group='BRDF').unc
-    LUT = xr.open_dataset(adf % 'UNC', engine='netcdf4')
+    LUT = open_lut('UNC', adf)
 
     # Interpolate relative uncertainty
     unc = LUT['unc'].interp(lambda_unc=ds.bands, theta_s_unc=ds.sza, theta_v_unc=ds.vza,
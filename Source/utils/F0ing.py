@@ -6,8 +6,29 @@ import numpy as np
 import scipy as sp
 
 from Source.HDFRoot import HDFRoot
-from Source.SB_support import readSB
+from Source.SB_support import readSBCached
 import Source.utils.loggingHCP as logging
+import Source.utils.caching as caching
+
+def readTSIS(fp):
+    ''' Read the TSIS-1 hybrid solar reference spectrum. Returns (F0, F0_unc, wavelength) or None '''
+    F0_hybrid = HDFRoot.readHDF5(fp)
+    if not F0_hybrid:
+        return None
+    F0_raw, F0_unc_raw, wv_raw = None, None, None
+    # F0_raw = np.array(thuillier.data['esun']) # uW cm^-2 nm^-1
+    # wv_raw = np.array(thuillier.data['wavelength'])
+    for ds in F0_hybrid.datasets:
+        if ds.id == 'SSI':
+            F0_raw = ds.data        #  W  m^-2 nm^-1
+            F0_raw = F0_raw * 100 # uW cm^-2 nm^-1
+        if ds.id == 'SSI_UNC':
+            F0_unc_raw = ds.data        #  W  m^-2 nm^-1
+            F0_unc_raw = F0_unc_raw * 100 # uW cm^-2 nm^-1
+        if ds.id == 'Vacuum Wavelength':
+            wv_raw =ds.data
+    return F0_raw, F0_unc_raw, wv_raw
+
 
 def TSIS_1(dateTag, wavelength, F0_raw=None, F0_unc_raw=None, wv_raw=None):
     def dop(year):
@@ -20,27 +41,16 @@ def TSIS_1(dateTag, wavelength, F0_raw=None, F0_unc_raw=None, wv_raw=None):
         return result
 
     if F0_raw is None:
-        # Only read this if we haven't already read it in
+        # Only read this if we haven't already read it in (once per process)
         fp = 'Data/hybrid_reference_spectrum_p1nm_resolution_c2020-09-21_with_unc.nc'
         # fp = 'Data/Thuillier_F0.sb'
         # print("SB_support.readSB: " + fp)
         # print("Reading : " + fp)
-        if not HDFRoot.readHDF5(fp):
+        TSIS = caching.getLUT(fp, lambda: readTSIS(fp))
+        if TSIS is None:
             logging.writeLogFileAndPrint("Unable to read TSIS-1 netcdf file.")
             return None
-        else:
-            F0_hybrid = HDFRoot.readHDF5(fp)
-            # F0_raw = np.array(thuillier.data['esun']) # uW cm^-2 nm^-1
-            # wv_raw = np.array(thuillier.data['wavelength'])
-            for ds in F0_hybrid.datasets:
-                if ds.id == 'SSI':
-                    F0_raw = ds.data        #  W  m^-2 nm^-1
-                    F0_raw = F0_raw * 100 # uW cm^-2 nm^-1
-                if ds.id == 'SSI_UNC':
-                    F0_unc_raw = ds.data        #  W  m^-2 nm^-1
-                    F0_unc_raw = F0_unc_raw * 100 # uW cm^-2 nm^-1
-                if ds.id == 'Vacuum Wavelength':
-                    wv_raw =ds.data
+        F0_raw, F0_unc_raw, wv_raw = TSIS
 
     # Earth-Sun distance
     day = int(str(dateTag)[4:7])
@@ -82,11 +92,12 @@ def Thuillier(dateTag, wavelength):
 
     fp = 'Data/Thuillier_F0.sb'
     print("SB_support.readSB: " + fp)
-    if not readSB(fp, no_warn=True):
+    try:
+        thuillier = readSBCached(fp, no_warn=True)
+    except Exception:
         logging.writeLogFileAndPrint("Unable to read Thuillier file. Make sure it is in SeaBASS format.")
         return None
     else:
-        thuillier = readSB(fp, no_warn=True)
         F0_raw = np.array(thuillier.data['esun']) # uW cm^-2 nm^-1
         wv_raw = np.array(thuillier.data['wavelength'])
         # Earth-Sun distance
@@ -44,4 +44,40 @@ def movingAverage(data, window_size):
     # return np.convolve(data, window, 'same')
 
     # Slice out one half window on either side; this requires an odd-sized window
-    return out[int(np.floor(window_size/2)):-int(np.floor(window_size/2))]
\ No newline at end of file
+    return out[int(np.floor(window_size/2)):-int(np.floor(window_size/2))]
+
+
+def movingAverage2D(data, window_size):
+    """ movingAverage applied down each column of a (time x band) matrix at once.
+    Same nan-tolerant masked convolution and half-window slicing as movingAverage, with the
+    convolution done as a sum of shifted copies of the whole matrix rather than band by band.
+    Args:
+    -----
+            data (2D array): (time x band) values
+            window_size (int): rolling window size (odd)
+    Returns:
+    --------
+            ndarray (time x band) of moving averages"""
+
+    data = np.asarray(data, dtype=np.float64)
+    mask = np.isnan(data)
+    nTime = data.shape[0]
+    nPad = int(window_size) - 1
+
+    # Zero padded on both sides so every shifted slice spans the full convolution
+    padded = np.zeros((nTime + 2*nPad,) + data.shape[1:])
+    padded[nPad:nPad+nTime] = np.where(mask, 0, data)
+    count = np.zeros(padded.shape)
+    count[nPad:nPad+nTime] = ~mask
+
+    nFull = nTime + nPad
+    num = np.zeros((nFull,) + data.shape[1:])
+    denom = np.zeros(num.shape)
+    for k in range(int(window_size)):
+        num += padded[k:k+nFull]
+        denom += count[k:k+nFull]
+    denom = np.where(denom != 0, denom, 1) # replace the 0s with 1s to block div0 error; the numerator will be zero anyway
+
+    out = num/denom
+    # Slice out one half window on either side; this requires an odd-sized window
+    return out[int(np.floor(window_size/2)):-int(np.floor(window_size/2))]
@@ -0,0 +1,125 @@
+'''################################# LOOKUP TABLE CACHING #################################'''
+import collections
+import hashlib
+import os
+import pickle
+import tempfile
+
+import numpy as np
+
+import Source.utils.loggingHCP as logging
+
+# Process-wide registry of loaded lookup tables (glint LUTs, F0 spectra, RSRs, ...) keyed on file path
+#   plus any qualifier needed to tell tables read from the same file apart.
+_tables = collections.OrderedDict()
+_stats = {}
+
+
+def _freeze(table):
+    ''' Make the numpy arrays of a table read-only so no caller can alter the cached copy '''
+    if isinstance(table, np.ndarray):
+        table.flags.writeable = False
+    elif isinstance(table, dict):
+        for value in table.values():
+            _freeze(value)
+    elif isinstance(table, (list, tuple)):
+        for value in table:
+            _freeze(value)
+    return table
+
+
+def getLUT(key, loader):
+    ''' Return the table registered under key, calling loader() to read it on the first request.
+        Arrays in cached tables are read-only; copy before modifying them.
+        Exceptions from loader propagate and a None result is not cached. '''
+    entry = _stats.setdefault(key, {'hits': 0, 'misses': 0})
+    if key in _tables:
+        entry['hits'] += 1
+        _tables.move_to_end(key)
+        return _tables[key]
+
+    entry['misses'] += 1
+    table = loader()
+    if table is not None:
+        logging.writeLogFileAndPrint(f'Cached lookup table: {key}', False)
+        _tables[key] = _freeze(table)
+    return table
+
+
+def evict(key=None):
+    ''' Drop one table (or all tables if key is None) from the registry. Returns the number evicted. '''
+    if key is None:
+        count = len(_tables)
+        _tables.clear()
+        return count
+    if key in _tables:
+        del _tables[key]
+        return 1
+    return 0
+
+
+def stats():
+    ''' Hit and miss counts per table, plus totals '''
+    result = {key: dict(entry, loaded=key in _tables) for key, entry in _stats.items()}
+    result['total'] = {'hits': sum(entry['hits'] for entry in _stats.values()),
+                       'misses': sum(entry['misses'] for entry in _stats.values()),
+                       'loaded': len(_tables)}
+    return result
+
+
+def resetStats():
+    ''' Zero the hit and miss counts '''
+    _stats.clear()
+
+
+def getStored(directory, key, compute):
+    ''' Return the arrays stored on disk under key, calling compute() and storing its result on the first request.
+        key is any value with a stable repr (e.g. a tuple of ints and strings); compute returns a dict of arrays.
+        Stores are written atomically, so concurrent processes can share a directory. '''
+    fp = os.path.join(directory, hashlib.sha1(repr(key).encode('utf-8')).hexdigest() + '.npz')
+    if os.path.isfile(fp):
+        try:
+            with np.load(fp, allow_pickle=False) as stored:
+                if str(stored['key']) == repr(key):
+                    return {name: stored[name] for name in stored.files if name != 'key'}
+        except (OSError, ValueError, KeyError) as err:
+            logging.writeLogFileAndPrint(f'Ignoring unreadable store {fp}: {err}', False)
+
+    result = compute()
+    _writeAtomic(fp, lambda f: np.savez(f, key=np.array(repr(key)), **result))
+    return result
+
+
+def _writeAtomic(fp, write):
+    ''' Call write(f) on a temporary file in the directory of fp, then move it to fp. A directory that cannot be
+        created or written is logged and nothing is stored: the caller still has its result. '''
+    directory = os.path.dirname(fp)
+    tmp = None
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(suffix=os.path.splitext(fp)[1], dir=directory)
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp, fp)
+    except OSError as err:
+        logging.writeLogFileAndPrint(f'Could not store {fp}: {err}', False)
+        if tmp is not None and os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def getPickled(directory, key, compute):
+    ''' As getStored, for results that are not a dict of arrays (e.g. parsed files mixing lists, dicts and arrays).
+        Only load stores written by this function into directories this package owns. '''
+    fp = os.path.join(directory, hashlib.sha1(repr(key).encode('utf-8')).hexdigest() + '.pkl')
+    if os.path.isfile(fp):
+        try:
+            with open(fp, 'rb') as f:
+                storedKey, result = pickle.load(f)
+            if storedKey == repr(key):
+                return result
+        except (OSError, ValueError, EOFError, pickle.UnpicklingError) as err:
+            logging.writeLogFileAndPrint(f'Ignoring unreadable store {fp}: {err}', False)
+
+    result = compute()
+    _writeAtomic(fp, lambda f: pickle.dump((repr(key), result), f, protocol=pickle.HIGHEST_PROTOCOL))
+    return result
@@ -166,6 +166,58 @@ def gpsDateToDatetime(year, gpsDate):
     return datetime(year,mon,day,0,0,0,0,tzinfo=timezone.utc)
 
 
+def tagsToDatetime64(dateTag, timeTag2):
+    ''' Convert Datetag (YYYYDOY) and TimeTag2 (HHMMSSmmm) columns to datetime64[ms] in one pass.
+        Returns the timestamps and a mask of the plausible records: Datetags in the 20th or 21st
+        centuries with a valid day of year, and TimeTag2s that are not 0.0 or NaN and give a valid
+        time of day. Implausible records are NaT. '''
+    dateTag = np.asarray(dateTag, dtype=np.float64)
+    timeTag2 = np.asarray(timeTag2, dtype=np.float64)
+    valid = (dateTag >= 1900000) & (dateTag < 2100000) & (timeTag2 > 0)
+
+    date = np.where(valid, dateTag, 1970001).astype(np.int64)
+    tt2 = np.where(valid, timeTag2, 0).astype(np.int64)
+    year, doy = np.divmod(date, 1000)
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    h = tt2 // 10**7
+    m = tt2 // 10**5 % 100
+    s = tt2 // 1000 % 100
+    valid &= (doy >= 1) & (doy <= 365 + leap) & (h < 24) & (m < 60) & (s < 60)
+
+    days = (year - 1970).astype('datetime64[Y]').astype('datetime64[D]') + (doy - 1)
+    stamps = days.astype('datetime64[ms]') + ((h*60 + m)*60 + s)*1000 + tt2 % 1000
+    stamps[~valid] = np.datetime64('NaT')
+    return stamps, valid
+
+
+def datetime64ToDatetime(stamps):
+    ''' Convert datetime64 values to a list of UTC-aware datetimes (None for NaT) '''
+    return [dt if dt is None else dt.replace(tzinfo=timezone.utc) for dt in np.asarray(stamps).astype('datetime64[us]').tolist()]
+
+
+def datetimeToDatetime64(dateTime):
+    ''' Convert (UTC) datetimes, aware or naive, to a datetime64[us] array '''
+    if isinstance(dateTime, np.ndarray) and np.issubdtype(dateTime.dtype, np.datetime64):
+        return dateTime.astype('datetime64[us]')
+    dateTime = np.asarray(dateTime, dtype=object)
+    if len(dateTime) == 0:
+        return np.array([], dtype='datetime64[us]')
+    epoch = datetime(1970, 1, 1, tzinfo=None if dateTime[0].tzinfo is None else timezone.utc)
+    return (dateTime - epoch).astype('timedelta64[us]') + np.datetime64(0, 'us')
+
+
+def screenDateTime(gp, dateTag, timeTag2):
+    ''' Timestamps for the plausible records of a group (see tagsToDatetime64). The other records
+        are deleted from every dataset of the group at once. Returns a list of datetimes. '''
+    stamps, valid = tagsToDatetime64(dateTag, timeTag2)
+    bad = np.flatnonzero(~valid)
+    if len(bad) > 0:
+        for i in bad:
+            logging.writeLogFileAndPrint(f"Bad Datetag or Timetag2 found. Eliminating record. {i} DT: {dateTag[i]} TT2: {timeTag2[i]}")
+        gp.datasetDeleteRow(bad)
+    return datetime64ToDatetime(stamps[valid])
+
+
 def rootAddDateTime(node):
     ''' Add a dataset to each group for DATETIME, as defined by TIMETAG2 and DATETAG
         Also screens for nonsense timetags like 0.0 or NaN, and datetags that are not
@@ -176,25 +228,9 @@ def rootAddDateTime(node):
         # Don't add to the following:
         noAddList = ("SOLARTRACKER_STATUS","SATMSG.tdf","CAL_COEF")
         if gp.id not in noAddList and "UNCERT" not in gp.id and ".cal.CE" not in gp.id:
-            timeData = gp.getDataset("TIMETAG2").data["NONE"].tolist()
-            dateTag = gp.getDataset("DATETAG").data["NONE"].tolist()
-            timeStamp = []
-            for i, timei in enumerate(timeData):
-                # Converts from TT2 (hhmmssmss. UTC) and Datetag (YYYYDOY UTC) to datetime
-                # Filter for aberrant Datetags
-                t = str(int(timei)).zfill(9)
-                h = int(t[:2])
-                m = int(t[2:4])
-                s = int(t[4:6])
-
-                if (str(dateTag[i]).startswith("19") or str(dateTag[i]).startswith("20")) \
-                    and timei != 0.0 and not np.isnan(timei) \
-                        and h < 60 and m < 60 and s < 60:
-                    dt = dateTagToDateTime(dateTag[i])
-                    timeStamp.append(timeTag2ToDateTime(dt, timei))
-                else:
-                    logging.writeLogFileAndPrint(f"Bad Datetag or Timetag2 found. Eliminating record. {i} DT: {dateTag[i]} TT2: {timei}")
-                    gp.datasetDeleteRow(i)
+            timeData = gp.getDataset("TIMETAG2").data["NONE"]
+            dateTag = gp.getDataset("DATETAG").data["NONE"]
+            timeStamp = screenDateTime(gp, dateTag, timeData)
 
             dateTime = gp.addDataset("DATETIME")
             dateTime.data = timeStamp
@@ -206,26 +242,9 @@ def groupAddDateTime(gp):
         Also screens for nonsense timetags like 0.0 or NaN, and datetags that are not
         in the 20th or 21st centuries '''
     if gp.id != "SOLARTRACKER_STATUS" and "UNCERT" not in gp.id and gp.id != "SATMSG.tdf": # No valid timestamps in STATUS
-        timeData = gp.getDataset("TIMETAG2").data["NONE"].tolist()
-        dateTag = gp.getDataset("DATETAG").data["NONE"].tolist()
-        timeStamp = []
-        for i, timei in enumerate(timeData):
-            # Converts from TT2 (hhmmssmss. UTC) and Datetag (YYYYDOY UTC) to datetime
-            # Filter for aberrant Datetags
-            t = str(int(timei)).zfill(9)
-            h = int(t[:2])
-            m = int(t[2:4])
-            s = int(t[4:6])
-
-            if (str(dateTag[i]).startswith("19") or str(dateTag[i]).startswith("20")) \
-                and timei != 0.0 and not np.isnan(timei) \
-                    and h < 60 and m < 60 and s < 60:
-
-                dt = dateTagToDateTime(dateTag[i])
-                timeStamp.append(timeTag2ToDateTime(dt, timei))
-            else:
-                logging.writeLogFileAndPrint(f"Bad Datetag or Timetag2 found. Eliminating record. {i} DT: {dateTag[i]} TT2: {timei}")
-                gp.datasetDeleteRow(i)
+        timeData = gp.getDataset("TIMETAG2").data["NONE"]
+        dateTag = gp.getDataset("DATETAG").data["NONE"]
+        timeStamp = screenDateTime(gp, dateTag, timeData)
 
         dateTime = gp.addDataset("DATETIME")
         dateTime.data = timeStamp
@@ -252,18 +271,10 @@ def rootAddDateTimeCol(node):
                             timeData = gp.datasets[ds].columns["Timetag2"]
                             dateTag = gp.datasets[ds].columns["Datetag"]
 
-                            timeStamp = []
-                            for i, timei in enumerate(timeData):
-                                # Converts from TT2 (hhmmssmss. UTC) and Datetag (YYYYDOY UTC) to datetime
-                                # Filter for aberrant Datetags
-                                if (str(dateTag[i]).startswith("19") or str(dateTag[i]).startswith("20")) \
-                                    and timei != 0.0 and not np.isnan(timei):
-
-                                    dt = dateTagToDateTime(dateTag[i])
-                                    timeStamp.append(timeTag2ToDateTime(dt, timei))
-                                else:
-                                    gp.datasetDeleteRow(i)
-                                    logging.writeLogFileAndPrint(f"Bad Datetag or Timetag2 found. Eliminating record. {i} DT: {dateTag[i]} TT2: {timei}")
+                            timeStamp = screenDateTime(gp, dateTag, timeData)
+                            if len(timeStamp) < len(timeData):
+                                # Records were deleted from the data
+                                gp.datasets[ds].datasetToColumns()
                             gp.datasets[ds].columns["Datetime"] = timeStamp
                             gp.datasets[ds].columns.move_to_end('Datetime', last=False)
                             gp.datasets[ds].columnsToDataset()
@@ -282,18 +293,12 @@ def rootAddDateTimeCol(node):
                 gp.datasets['Timestamp'].columns['Timetag2'] = timeData
                 gp.datasets['Timestamp'].columnsToDataset()
 
-                timeStamp = []
-                for i, timei in enumerate(timeData):
-                    # Converts from TT2 (hhmmssmss. UTC) and Datetag (YYYYDOY UTC) to datetime
-                    # Filter for aberrant Datetags
-                    if (str(dateTag[i]).startswith("19") or str(dateTag[i]).startswith("20")) \
-                        and timei != 0.0 and not np.isnan(timei):
-
-                        dt = dateTagToDateTime(dateTag[i])
-                        timeStamp.append(timeTag2ToDateTime(dt, timei))
-                    else:
-                        gp.datasetDeleteRow(i) # L1AQC datasets all have the same i
-                        logging.writeLogFileAndPrint(f"Bad Datetag or Timetag2 found. Eliminating record. {i} DT: {dateTag[i]} TT2: {timei}")
+                timeStamp = screenDateTime(gp, dateTag, timeData) # L1AQC datasets all have the same rows
+                if len(timeStamp) < len(timeData):
+                    # Records were deleted from the data
+                    for ds in gp.datasets:
+                        if ds != "DATETIME":
+                            gp.datasets[ds].datasetToColumns()
                 # This will be the only dataset structure like a higher level with time/date columns
                 gp.datasets['Timestamp'].columns["Datetime"] = timeStamp
                 gp.datasets['Timestamp'].columns.move_to_end('Datetime', last=False)
@@ -308,78 +313,67 @@ def rawDataAddDateTime(node):
     # in the 20th or 21st centuries, specifically for raw data groups - used in L2 processing.'''
     for gp in node.groups:
         if "L1AQC" in gp.id:
-            timeData = gp.getDataset("TIMETAG2").data["NONE"].tolist()
-            dateTag = gp.getDataset("DATETAG").data["NONE"].tolist()
-            timeStamp = []
-            for i, timei in enumerate(timeData):
-                # Converts from TT2 (hhmmssmss. UTC) and Datetag (YYYYDOY UTC) to datetime
-                # Filter for aberrant Datetags
-                t = str(int(timei)).zfill(9)
-                h = int(t[:2])
-                m = int(t[2:4])
-                s = int(t[4:6])
-
-                if (str(dateTag[i]).startswith("19") or str(dateTag[i]).startswith("20")) \
-                    and timei != 0.0 and not np.isnan(timei) \
-                        and h < 60 and m < 60 and s < 60:
-
-                    dt = dateTagToDateTime(dateTag[i])
-                    timeStamp.append(timeTag2ToDateTime(dt, timei))
-                else:
-                    logging.writeLogFileAndPrint(f"Bad Datetag or Timetag2 found. Eliminating record. {i} DT: {dateTag[i]} TT2: {timei}")
-                    gp.datasetDeleteRow(i)
+            timeData = gp.getDataset("TIMETAG2").data["NONE"]
+            dateTag = gp.getDataset("DATETAG").data["NONE"]
+            timeStamp = screenDateTime(gp, dateTag, timeData)
 
             dateTime = gp.addDataset("DATETIME")
             dateTime.data = timeStamp
     return node
 
 
+def increasingMask(dateTime):
+    ''' Mask of the records kept when screening for strictly increasing timestamps: each record must be
+        later than every record before it. If the second record is not later than the first, the first
+        is dropped instead (as the first of a series cannot be compared with an earlier one). '''
+    dateTime = datetimeToDatetime64(dateTime)
+    keep = np.ones(len(dateTime), dtype=bool)
+    if len(dateTime) < 2:
+        return keep
+    first = 0
+    if dateTime[1] <= dateTime[0]:
+        keep[0] = False
+        first = 1
+    latest = np.maximum.accumulate(dateTime[first:])
+    keep[first+1:] = dateTime[first+1:] > latest[:-1]
+    return keep
+
+
 def fixDateTime(gp):
     '''Remove records if values of DATETIME are not strictly increasing
     (strictly increasing values required for interpolation)'''
-    dateTime = gp.getDataset("DATETIME").data
+    dateTime = datetimeToDatetime64(gp.getDataset("DATETIME").data)
     # Test for strictly ascending values
     # Not sensitive to UTC midnight (i.e. in datetime format)
     total = len(dateTime)
-    globalTotal = total
-    if total >= 2:
-        # Check the first element prior to looping over rest
-        i = 0
-        if dateTime[i+1] <= dateTime[i]:
-            gp.datasetDeleteRow(i)
-            # del dateTime[i] # I'm fuzzy on why this is necessary; not a pointer?
-            dateTime = gp.getDataset("DATETIME").data
-            total = total - 1
-            logging.writeLogFileAndPrint(f'Out of order timestamp deleted at {i}')
-
-            #In case we went from 2 to 1 element on the first element,
-            if total == 1:
-                logging.writeLogFileAndPrint(f'************Too few records ({total}) to test for ascending timestamps. Exiting.')
-                return False
-
-        i = 1
-        while i < total:
-            if dateTime[i] <= dateTime[i-1]:
-                if dateTime[i] == dateTime[i-1]:
-                    # BUG?:Same values of consecutive TT2s are shockingly common. Confirmed
-                    #   that 1) they exist from L1A, and 2) sensor data changes while TT2 stays the same
-                    #
-                    logging.writeLogFileAndPrint(f'Duplicate row deleted at {i}')
-                else:
-                    logging.writeLogFileAndPrint(f'WARNING: Out of order row deleted at {i}; this should not happen after sortDateTime')
-
-                gp.datasetDeleteRow(i)
-                # del dateTime[i] # I'm fuzzy on why this is necessary; not a pointer?
-                dateTime = gp.getDataset("DATETIME").data
-                total = total - 1
-
-                continue # goto while test skipping i incrementation. dateTime[i] is now the next value.
-            i += 1
-    else:
+    if total < 2:
         logging.writeLogFileAndPrint(f'************Too few records ({total}) to test for ascending timestamps. Exiting.')
         return False
-    if (globalTotal - total) > 0:
-        logging.writeLogFileAndPrint(f'Data eliminated for non-increasing timestamps: {100*(globalTotal - total)/globalTotal:3.1f}%')
+
+    keep = increasingMask(dateTime)
+    first = 0 if keep[0] else 1
+    if first:
+        logging.writeLogFileAndPrint('Out of order timestamp deleted at 0')
+        #In case we went from 2 to 1 element on the first element,
+        if total == 2:
+            gp.datasetDeleteRow(0)
+            logging.writeLogFileAndPrint('************Too few records (1) to test for ascending timestamps. Exiting.')
+            return False
+
+    # BUG?:Same values of consecutive TT2s are shockingly common. Confirmed
+    #   that 1) they exist from L1A, and 2) sensor data changes while TT2 stays the same
+    later = np.flatnonzero(~keep[first+1:]) + first + 1
+    latest = np.maximum.accumulate(dateTime[first:])
+    duplicates = np.count_nonzero(dateTime[later] == latest[later - first - 1])
+    if duplicates:
+        logging.writeLogFileAndPrint(f'Duplicate rows deleted: {duplicates}')
+    if len(later) > duplicates:
+        logging.writeLogFileAndPrint(f'WARNING: Out of order rows deleted: {len(later) - duplicates}; this should not happen after sortDateTime')
+
+    dropped = np.flatnonzero(~keep)
+    if len(dropped) > 0:
+        gp.datasetDeleteRow(dropped)
+        logging.writeLogFileAndPrint(f'Data eliminated for non-increasing timestamps: {100*len(dropped)/total:3.1f}%')
 
     return True
 
@@ -403,28 +397,28 @@ def SASUTCOffset(node):
 def getDateTime(gp):
     ''' Used in deglitching routines '''
     dateTagDS = gp.getDataset('DATETAG')
-    dateTags = dateTagDS.data["NONE"].tolist()
+    dateTags = dateTagDS.data["NONE"]
     timeTagDS = gp.getDataset('TIMETAG2')
-    timeTags = timeTagDS.data["NONE"].tolist()
-    # Conversion not set up for vectors, loop it
-    dateTime=[]
-    for i, dateTag in enumerate(dateTags):
-        dt = dateTagToDateTime(dateTag)
-        dateTime.append(timeTag2ToDateTime(dt,timeTags[i]))
-
-    return dateTime
+    timeTags = timeTagDS.data["NONE"]
+    stamps, _ = tagsToDatetime64(dateTags, timeTags)
+    return datetime64ToDatetime(stamps)
 
 
 def catConsecutiveBadTimes(badTimes, dateTime):
     '''Test for the existence of consecutive, singleton records that could be 
         concatonated into a time span. This can only work after L1B cross-sensor time interpolation.'''
+    # Position of the first occurrence of each timestamp
+    position = {}
+    for i, dt in enumerate(dateTime):
+        position.setdefault(dt, i)
+
     newBadTimes = []
     for iBT, badTime in enumerate(badTimes):
         if iBT == 0:
             newBadTimes.append(badTime)
         else:
-            iDT = dateTime.index(newBadTimes[-1][1])# end time of last window
-            iDT2 = dateTime.index(badTime[0])
+            iDT = position[newBadTimes[-1][1]]# end time of last window
+            iDT2 = position[badTime[0]]
             if iDT2 == iDT +1:
                 # Consecutive
                 newBadTimes[-1][1] = badTime[1]
@@ -433,50 +427,38 @@ def catConsecutiveBadTimes(badTimes, dateTime):
     return newBadTimes
 
 
-def findGaps_dateTime(DT1,DT2,threshold):
-    ''' Test whether one DT2 datetime has a gap > threshold [seconds] 
-        relative to DT1. '''
-    bTs = []
-    start = -1
-    i, index, stop = 0,0,0
-    tThreshold = timedelta(seconds=threshold)
-
-    # See below for faster conversions
-    np_dTT = np.array(DT2, dtype=np.datetime64)
-    np_dTT.sort()
-
-    np_dTM = np.array(DT1, dtype=np.datetime64)
+def gapMask(DT1, DT2, threshold):
+    ''' Mask of the DT1 datetimes with no DT2 datetime within threshold [seconds] '''
+    np_dTT = np.sort(datetimeToDatetime64(DT2))
+    np_dTM = datetimeToDatetime64(DT1)
     pos = np.searchsorted(np_dTT, np_dTM, side='right')
 
-    # Consider the 3 items close the the position found.
-    # We can probably only consider 2 of them but this is simpler and less bug-prone.
+    # The nearest DT2 is either the last one at or before DT1 or the first one after it
     pos1 = np.maximum(pos-1, 0)
     pos2 = np.minimum(pos, np_dTT.size-1)
-    pos3 = np.minimum(pos+1, np_dTT.size-1)
-    tDiff1 = np.abs(np_dTT[pos1] - np_dTM)
-    tDiff2 = np.abs(np_dTT[pos2] - np_dTM)
-    tDiff3 = np.abs(np_dTT[pos3] - np_dTM)
-    tMin = np.minimum(tDiff1, tDiff2, tDiff3)
-
-    for index in range(len(np_dTM)):
-        if tMin[index] > tThreshold:
-            i += 1
-            if start == -1:
-                start = index
-            stop = index
-        else:
-            if start != -1:
-                startstop = [DT1[start],DT1[stop]]
-                logging.writeLogFileAndPrint(f'   Flag data from {startstop[0]} to {startstop[1]}')
-                bTs.append(startstop)
-                start = -1
+    tMin = np.minimum(np.abs(np_dTT[pos1] - np_dTM), np.abs(np_dTT[pos2] - np_dTM))
+    return tMin > np.timedelta64(timedelta(seconds=threshold))
+
 
-    if start != -1 and stop == index: # Records from a mid-point to the end are bad
+def findGaps_dateTime(DT1,DT2,threshold):
+    ''' Test whether one DT2 datetime has a gap > threshold [seconds] 
+        relative to DT1. Returns the [start, stop] DT1 datetimes of each gap,
+        or False if all records are in gaps. '''
+    gap = gapMask(DT1, DT2, threshold)
+    edges = np.diff(np.concatenate(([0], gap.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    stops = np.flatnonzero(edges == -1) - 1
+
+    bTs = []
+    for start, stop in zip(starts, stops):
         startstop = [DT1[start],DT1[stop]]
         bTs.append(startstop)
-        logging.writeLogFileAndPrint(f'   Flag additional data from {startstop[0]} to {startstop[1]}')
+        if stop == len(gap) - 1: # Records from a mid-point to the end are bad
+            logging.writeLogFileAndPrint(f'   Flag additional data from {startstop[0]} to {startstop[1]}')
+        else:
+            logging.writeLogFileAndPrint(f'   Flag data from {startstop[0]} to {startstop[1]}')
 
-    if start==0 and stop==index: # All records are bad
+    if len(gap) > 0 and gap.all(): # All records are bad
         return False
 
     return bTs
@@ -487,21 +469,19 @@ def sortDateTime(group):
 
     if group.id != "SOLARTRACKER_STATUS" and group.id != "CAL_COEF":
         timeStamp = group.getDataset("DATETIME").data
-        tz = pytz.timezone('UTC')
-        np_dT = np.array(timeStamp, dtype=np.datetime64)
-        sortIndex = np.argsort(np_dT)
-        np_dT_sorted = np_dT[sortIndex]
-        datetime_list = np_dT_sorted.astype('datetime64[us]').tolist()
-        datetime_list = [tz.localize(x) for x in datetime_list]
-        for ds in group.datasets:
-            if len(group.datasets[ds].data) == len(np_dT):
-                if ds == 'DATETIME':
-                    group.datasets[ds].data = datetime_list
-                else:
-                    group.datasets[ds].data = group.datasets[ds].data[sortIndex]
+        np_dT = datetimeToDatetime64(timeStamp)
+        if np.any(np_dT[1:] < np_dT[:-1]):
+            sortIndex = np.argsort(np_dT, kind='stable')
+            datetime_list = datetime64ToDatetime(np_dT[sortIndex])
+            for ds in group.datasets:
+                if len(group.datasets[ds].data) == len(np_dT):
+                    if ds == 'DATETIME':
+                        group.datasets[ds].data = datetime_list
+                    else:
+                        group.datasets[ds].data = group.datasets[ds].data[sortIndex]
 
         logging.writeLogFileAndPrint(f'Screening {group.id} for clean timestamps.')
         if not fixDateTime(group):
             logging.writeLogFileAndPrint(f'***********Too few records in {group.id} to continue after timestamp correction. Exiting.')
             return None
-    return group
\ No newline at end of file
+    return group
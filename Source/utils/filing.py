@@ -3,15 +3,25 @@ import os
 from datetime import datetime
 import hashlib
 import csv
+import collections
 
+import numpy as np
 from tqdm import tqdm
 import requests
 from PyQt5.QtWidgets import QMessageBox
 
 from Source import PACKAGE_DIR as dirPath
+from Source import PATH_TO_DATA
 from Source.ConfigFile import ConfigFile
 from Source.MainConfig import MainConfig
+from Source.HDFDataset import HDFDataset
 import Source.utils.loggingHCP as logging
+import Source.utils.caching as caching
+
+# Parsed characterization files, kept across runs. Entries are keyed on file path and md5,
+#   so edited files are parsed again (see read_char).
+CHAR_CACHE_DIR = os.path.join(PATH_TO_DATA, 'Char_Cache')
+CHAR_PARSER_VERSION = 1
 
 
 def downloadZhangLUT(fpfZhangLUT, force=False):
@@ -223,6 +233,81 @@ def parseLine_no_index(line: str, ds) -> None:
             except ValueError:
                 ds.columns[str(i)].append(x)
 
+def _parseCharBlock(lines: list) -> collections.OrderedDict:
+    """Columns of a data block, as parseLine_no_index builds them line by line"""
+    rows = [line.split('\t') for line in lines]
+    if rows and all(len(row) == len(rows[0]) and all(row) for row in rows):
+        try:
+            return collections.OrderedDict((str(i), [float(x) for x in column]) for i, column in enumerate(zip(*rows)))
+        except ValueError:
+            pass
+    ds = HDFDataset()
+    for line in lines:
+        parseLine_no_index(line, ds)
+    return ds.columns
+
+def _packCharColumns(columns: collections.OrderedDict) -> collections.OrderedDict:
+    """Store all-float columns as arrays, which load far faster than lists of floats"""
+    return collections.OrderedDict((k, np.array(v) if all(type(x) is float for x in v) else v) for k, v in columns.items())
+
+def _parseChar(filepath: str) -> list:
+    """Parse a characterization file into the steps read_char replays against a group:
+        ('type', CHARACTERISATION_FILE_TYPE), ('device', device) and
+        ('data', attributes, columns, data), where data is None if the block has no end line"""
+    with open(filepath, 'r', encoding="utf-8") as f:
+        # Lines as getline returns them; reading past the end gives empty lines
+        lines = f.read().split('\n') + [''] * 4
+
+    steps = []
+    begin_data = False
+    attrs = {}
+    attrsBlock = {}
+    end_count = 0
+    key = None
+    block = []
+    for line in lines:
+        if not line:
+            if end_count < 3:
+                end_count += 1
+            else:
+                break
+        elif not line.startswith('#'):
+            end_count = 0
+            if begin_data:
+                if 'end' in line.lower():
+                    begin_data = False
+                    ds = HDFDataset()
+                    ds.columns = _parseCharBlock(block)
+                    ds.columnsToDataset()
+                    steps.append(('data', attrsBlock, _packCharColumns(ds.columns), ds.data))
+                else:
+                    block.append(line)
+            elif line.startswith('!'):
+                if line != '!FRM4SOC_CP':
+                    steps.append(('type', line[1:]))
+            elif any([k in line.lower() for k in ['data', 'lsf', 'uncertainty', 'coserror']]) is True:
+                begin_data = True
+                attrs['DATA_TYPE'] = line[1:line.lower().find('data')]
+                attrsBlock = dict(attrs)
+                attrs.clear()
+                block = []
+            elif line.startswith('['):
+                key = line[1:-1]
+            elif key is not None:
+                attrs[key] = line
+                if key.lower() == "device":
+                    steps.append(('device', line.rstrip()))
+                key = None
+    if begin_data:
+        # No end line: the columns are read but never converted
+        steps.append(('data', attrsBlock, _packCharColumns(_parseCharBlock(block)), None))
+    return steps
+
+def _storedChar(filepath: str) -> list:
+    ''' Parsed steps of a characterization file from the disk store, parsing the file on the first request '''
+    key = ('char', CHAR_PARSER_VERSION, os.path.abspath(filepath), md5(filepath))
+    return caching.getPickled(CHAR_CACHE_DIR, key, lambda: _parseChar(filepath))
+
 def read_char(filepath: str, gp) -> None:
     ''' Used by 
             ProcessL1b.read_unc_coefficient_factory
@@ -230,70 +315,48 @@ def read_char(filepath: str, gp) -> None:
             ProcessL1b.read_unc_coefficient_class
             ProcessL1b.read_unc_coefficient_frm
         to read in FidRadDB files.
+        Each file is parsed once and the parsed datasets are copied into gp. Parsed files are held in memory
+        per path, size and modification time, and on disk per md5, which is only computed when the file is
+        not in memory.
         '''
-    begin_data = False  # set up data flag
-    attrs = {}
-    end_count = 0
+    stat = os.stat(filepath)
+    key = ('char', CHAR_PARSER_VERSION, os.path.abspath(filepath), stat.st_size, stat.st_mtime_ns)
+    steps = caching.getLUT(key, lambda: _storedChar(filepath))
+
     Azimuth_angle = None
     solar_zen_range = None
-
-    with open(filepath, 'r', encoding="utf-8") as f:  # open file
-        key, ds, name = None, None, None
-        while True:  # start loop
-            line = getline(f, '\n')  # reads the file until a '\n' character is reached
-            if not line:  # breaks out of loop if three empty lines in a row
-                if end_count < 3:
-                    end_count += 1
+    name = None
+    for step in steps:
+        if step[0] == 'type':
+            gp.attributes['CHARACTERISATION_FILE_TYPE'] = step[1]
+        elif step[0] == 'device':
+            name = step[1] + '_' + gp.attributes['CHARACTERISATION_FILE_TYPE']
+        else:
+            _, attrs, columns, data = step
+            ds = gp.addDataset(f"{name}_{attrs['DATA_TYPE']}")
+            if ds is None:
+                if 'AZIMUTH_ANGLE' in attrs:  # reading angular file and has identical identifiers for different az angles
+                    ds = gp.addDataset(f"{name}_{attrs['DATA_TYPE']}_AZ{attrs['AZIMUTH_ANGLE']}")
+                    Azimuth_angle = attrs['AZIMUTH_ANGLE']
+                elif 'SOLAR_ZENITH_ANGLE_RANGE' in attrs:
+                    ds = gp.addDataset(f"{name}_{attrs['DATA_TYPE']}_RANGE{attrs['SOLAR_ZENITH_ANGLE_RANGE']}")
+                    solar_zen_range = attrs['SOLAR_ZENITH_ANGLE_RANGE']
+                elif Azimuth_angle is not None:  # uncertainty also repeated so save the az angle from earlier to use here
+                    ds = gp.addDataset(f"{name}_{attrs['DATA_TYPE']}_AZ{Azimuth_angle}")
+                    Azimuth_angle = None
+                elif solar_zen_range is not None:
+                    ds = gp.addDataset(f"{name}_{attrs['DATA_TYPE']}_RANGE{solar_zen_range}")
+                    solar_zen_range = None
                 else:
-                    return "end condition reached"
-            elif not line.startswith('#'):  # not a comment
-                end_count = 0
-                if begin_data:
-                    if 'end' in line.lower():  # end conditions met
-                        begin_data = False  # set to read header data
-                        ds.columnsToDataset()  # convert read data to dataset
-                    else:
-                        parseLine_no_index(line, ds)  # add the data
-                else:  # part of header
-                    if line.startswith('!'):  # get filetype from ! comment
-                        if line != '!FRM4SOC_CP':
-                            gp.attributes['CHARACTERISATION_FILE_TYPE'] = line[1:]
-                    elif any([k in line.lower() for k in ['data', 'lsf', 'uncertainty', 'coserror']]) is True:
-                    # elif ['data', 'lsf', 'uncertainty'] in line.lower():  # begin reading data
-                        begin_data = True
-                        attrs['DATA_TYPE'] = line[1:line.lower().find('data')]
-                        ds = gp.addDataset(f"{name}_{attrs['DATA_TYPE']}")
-                        if ds is None:
-                            if 'AZIMUTH_ANGLE' in attrs:  # reading angular file and has identical identifiers for different az angles
-                                ds = gp.addDataset(f"{name}_{attrs['DATA_TYPE']}_AZ{attrs['AZIMUTH_ANGLE']}")
-                                Azimuth_angle = attrs['AZIMUTH_ANGLE']
-                            elif 'SOLAR_ZENITH_ANGLE_RANGE' in attrs:
-                                ds = gp.addDataset(f"{name}_{attrs['DATA_TYPE']}_RANGE{attrs['SOLAR_ZENITH_ANGLE_RANGE']}")
-                                solar_zen_range = attrs['SOLAR_ZENITH_ANGLE_RANGE']
-                            elif Azimuth_angle is not None:  # uncertainty also repeated so save the az angle from earlier to use here
-                                ds = gp.addDataset(f"{name}_{attrs['DATA_TYPE']}_AZ{Azimuth_angle}")
-                                Azimuth_angle = None
-                            elif solar_zen_range is not None:
-                                ds = gp.addDataset(f"{name}_{attrs['DATA_TYPE']}_RANGE{solar_zen_range}")
-                                solar_zen_range = None
-                            else:
-                                logging.writeLogFileAndPrint(f"Dataset could not be constructed. Utilties.read_char(file-path, HDFGroup) in {gp.attributes['CHARACTERISATION_FILE_TYPE']}")
-                                raise KeyError  # TODO: write custom exception for this case, with description of how to fix (SZA_range or AZ ang not in char file)
-                        # populate ds attributes with header data
-                        for k, v in attrs.items():
-                            ds.attributes[k] = v  # set the attributes
-                        attrs.clear()
-
-                    else:  # part of header, check if attribute or column names
-                        if line.startswith('['):  # if line has '[ ]' then take the next line as the attribute
-                            key = line[1:-1]
-                        elif key is not None:
-                            attrs[key] = line
-                            if key.lower() == "device":
-                                device = line.rstrip()
-                                name = device + '_' + gp.attributes['CHARACTERISATION_FILE_TYPE']
-                            key = None
-
+                    logging.writeLogFileAndPrint(f"Dataset could not be constructed. Utilties.read_char(file-path, HDFGroup) in {gp.attributes['CHARACTERISATION_FILE_TYPE']}")
+                    raise KeyError  # TODO: write custom exception for this case, with description of how to fix (SZA_range or AZ ang not in char file)
+            # populate ds attributes with header data
+            for k, v in attrs.items():
+                ds.attributes[k] = v
+            ds.columns = collections.OrderedDict((k, v.tolist() if isinstance(v, np.ndarray) else list(v)) for k, v in columns.items())
+            if data is not None:
+                ds.data = data.copy()
+    return "end condition reached"
 
 def getline(sstream, delimiter: str = '\n') -> str:
     """replicates C++ getline functionality - reads a string until delimiter character is found
@@ -1,5 +1,8 @@
 '''################################# FILTERING & DEGLITCHING ORIENTED #################################'''
 
+import datetime
+import warnings
+
 import numpy as np
 import pandas as pd
 
@@ -143,6 +146,127 @@ def deglitchBand(band, radiometry1D, windowSize, sigma, lightDark, minRad, maxRa
     return badIndex, badIndex2, badIndex3
 
 
+def _rollingStd2D(residual, windowSize):
+    ''' Rolling std of each band of the residual, with the leading window filled and rounded as in deglitchBand '''
+    residualDf = pd.DataFrame(residual)
+    rollingStd = residualDf.rolling(windowSize).std()
+    return rollingStd.fillna(rollingStd.iloc[windowSize - 1]).round(3).to_numpy()
+
+
+def _convolution2D(data, avg, std, sigma):
+    ''' darkConvolution/lightConvolution for a (time x band) matrix; std is per band or (time x band) '''
+    with np.errstate(invalid='ignore'):
+        badIndex = (data > avg + (sigma*std)) | (data < avg - (sigma*std))
+    # NaN records are not flagged; first and last avg values from convolution are not to be trusted
+    badIndex[np.isnan(data)] = False
+    badIndex[0, :] = True
+    badIndex[-1, :] = True
+    return badIndex
+
+
+def deglitchBands(bands, radiometry2D, windowSize, sigma, lightDark, minRad, maxRad, minMaxBand):
+    ''' deglitchBand for all bands of a sensor at once.
+            radiometry2D is (time x band) and bands holds the band centers of its columns.
+            Returns the first pass, second pass and threshold masks, each (time x band) boolean,
+            with column j equal to deglitchBand(bands[j], radiometry2D[:,j], ...)
+    '''
+    radiometry2D = np.asfortranarray(radiometry2D, dtype=np.float64)
+
+    # First pass
+    avg = averaging.movingAverage2D(radiometry2D, windowSize)
+    residual = np.asfortranarray(radiometry2D - avg)
+    if lightDark == 'Dark':
+        # OVERALL standard deviation of the residual over the entire file
+        stdData = np.std(residual, axis=0)
+    else:
+        # ROLLING standard deviation of the residual, where extreme outliers blow up
+        # the rolling std replace it with the median residual std
+        y = np.asfortranarray(_rollingStd2D(residual, windowSize))
+        median = np.median(y, axis=0)
+        stdData = np.where(y > median + 3*np.std(y, axis=0), median, y)
+    badIndex = _convolution2D(radiometry2D, avg, stdData, sigma)
+
+    # Second pass
+    radiometry2D2 = np.array(radiometry2D, order='F')
+    radiometry2D2[badIndex] = np.nan
+    avg2 = averaging.movingAverage2D(radiometry2D2, windowSize)
+    residual2 = np.asfortranarray(radiometry2D2 - avg2)
+    with np.errstate(invalid='ignore'):
+        if lightDark == 'Dark':
+            stdData = np.nanstd(residual2, axis=0)
+        else:
+            y = np.asfortranarray(_rollingStd2D(residual2, windowSize))
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", category=RuntimeWarning)
+                y = np.where(np.isnan(y), np.nanmedian(y, axis=0), y)
+                median = np.nanmedian(y, axis=0)
+                stdData = np.where(y > median + 3*np.nanstd(y, axis=0), median, y)
+    badIndex2 = _convolution2D(radiometry2D2, avg2, stdData, sigma)
+
+    # Threshold pass
+    # Tolerates "None" for min or max Rad. ConfigFile.setting updated directly from checkbox
+    badIndex3 = np.zeros(radiometry2D.shape, dtype=bool)
+    if ConfigFile.settings["bL1aqcThreshold"]:
+        for j, band in enumerate(bands):
+            if band == minMaxBand:
+                badIndex3[:, j] = deglitchThresholds(band, radiometry2D[:, j], minRad, maxRad, minMaxBand)
+
+    return badIndex, badIndex2, badIndex3
+
+
+def badTimeIntervals(badTimes, tolerance=None):
+    ''' Merge [start, stop] badTimes pairs into a sorted index of disjoint intervals.
+        Intervals are inclusive of start and stop unless a tolerance (timedelta) is given, in which
+        case they are widened by it on either side and exclude the widened bounds.
+        Returns (starts, stops, closed) '''
+    closed = tolerance is None
+    pairs = []
+    for badTime in badTimes:
+        start, stop = badTime[0], badTime[1]
+        if not closed:
+            start, stop = start - tolerance, stop + tolerance
+        if start < stop or (closed and start == stop):
+            pairs.append((start, stop))
+    pairs.sort(key=lambda pair: pair[0])
+
+    starts, stops = [], []
+    for start, stop in pairs:
+        if starts and (start <= stops[-1] if closed else start < stops[-1]):
+            stops[-1] = max(stops[-1], stop)
+        else:
+            starts.append(start)
+            stops.append(stop)
+
+    return np.array(starts, dtype=object), np.array(stops, dtype=object), closed
+
+
+def badTimeMask(timeStamp, intervals):
+    ''' Boolean mask of the timeStamps falling within any of the badTimeIntervals '''
+    starts, stops, closed = intervals
+    timeStamp = np.array(timeStamp, dtype=object)
+    if len(starts) == 0 or len(timeStamp) == 0:
+        return np.zeros(len(timeStamp), dtype=bool)
+
+    # The candidate for each timestamp is the last interval starting at (or before) it
+    index = np.searchsorted(starts, timeStamp, side='right' if closed else 'left') - 1
+    candidate = index >= 0
+    mask = np.zeros(len(timeStamp), dtype=bool)
+    if closed:
+        mask[candidate] = timeStamp[candidate] <= stops[index[candidate]]
+    else:
+        mask[candidate] = timeStamp[candidate] < stops[index[candidate]]
+    return mask
+
+
+def deleteBadTimes(group, timeStamp, intervals):
+    ''' Delete the rows of every dataset in the group whose timeStamp is within the badTimeIntervals.
+        Returns the number of records removed. '''
+    rowsToDelete = np.flatnonzero(badTimeMask(timeStamp, intervals))
+    if len(rowsToDelete) > 0:
+        group.datasetDeleteRow(rowsToDelete)
+    return len(rowsToDelete)
+
+
 def filterData(group, badTimes, level = None):
     ''' Called only by ProcessL1bqc. filterData for L1AQC is contained within ProcessL1aqc.py
         and for L2 within ProcessL2.py.
@@ -151,9 +275,6 @@ def filterData(group, badTimes, level = None):
         embedded CALs and BACKs with TriOS.
         All data in the group (including satellite sensors) will be deleted.
         '''
-    # NOTE: This is still very slow on long files with many badTimes, despite badTimes being filtered for
-    #   unique pairs.
-
     logging.writeLogFileAndPrint(f'Remove {group.id} Data')
 
     # Trigger for reset of CAL & BACK
@@ -183,36 +304,15 @@ def filterData(group, badTimes, level = None):
             del group.datasets['CAL_'+group.id[0:2]]
             del group.datasets['BACK_'+group.id[0:2]]
 
-    startLength = len(timeStamp)
-    logging.writeLogFileAndPrint(f'   Length of dataset prior to removal {startLength} long')
+    originalLength = len(timeStamp)
+    logging.writeLogFileAndPrint(f'   Length of dataset prior to removal {originalLength} long')
 
-    # Delete the records in badTime ranges from each dataset in the group
+    # Delete the records in badTime ranges from each dataset in the group in one pass
     finalCount = 0
-    originalLength = len(timeStamp)
-    for dateTime in badTimes:
-        # logging.writeLogFileAndPrint(f'Eliminate data between: {dateTime}'
-        # Need to reinitialize for each loop
-        startLength = len(timeStamp)
-        newTimeStamp = []
-        start = dateTime[0]
-        stop = dateTime[1]
-
-        if startLength > 0:
-            rowsToDelete = []
-            for i in range(startLength):
-                if start <= timeStamp[i] and stop >= timeStamp[i]:
-                    try:
-                        rowsToDelete.append(i)
-                        finalCount += 1
-                    except Exception:
-                        print('error')
-                else:
-                    newTimeStamp.append(timeStamp[i])
-            group.datasetDeleteRow(rowsToDelete)
-        else:
-            logging.writeLogFileAndPrint('Data group is empty. Continuing.')
-            break
-        timeStamp = newTimeStamp.copy()
+    if originalLength > 0:
+        finalCount = deleteBadTimes(group, timeStamp, badTimeIntervals(badTimes))
+    else:
+        logging.writeLogFileAndPrint('Data group is empty. Continuing.')
 
     if ConfigFile.settings['SensorType'].lower()  in ["sorad", "trios", "trios es only"]:
         # TRIOS: reset CAL and BACK as before filtering
@@ -257,46 +357,17 @@ def filterDataL2(group, badTimes, sensor = None):
         if group.id == "REFLECTANCE":
             timeStamp = group.getDataset(f"Rrs_{sensor}").data["Datetime"]
 
-    startLength = len(timeStamp)
-    logging.writeLogFileAndPrint(f'   Length of dataset prior to removal {startLength} long')
-
-    # Delete the records in badTime ranges from each dataset in the group
-    finalCount = 0
     originalLength = len(timeStamp)
-    for dateTime in badTimes:
-        # Need to reinitialize for each loop
-        startLength = len(timeStamp)
-        newTimeStamp = []
-
-        # logging.writeLogFileAndPrint(f'Eliminate data between: {dateTime}'
-
-        start = dateTime[0]
-        stop = dateTime[1]
-
-        if startLength > 0:
-            rowsToDelete = []
-            for i in range(startLength):
-                # Unclear why there are sometimes millisecond difference between groups, 
-                #   but non-equivalence of datetimes is a problem for the screening.
-                tDiffStart = abs(start - timeStamp[i]).total_seconds()
-                tDiffStop = abs(stop - timeStamp[i]).total_seconds()
-                # if start <= timeStamp[i] and stop >= timeStamp[i]:
-                if (start < timeStamp[i] or tDiffStart < 1.0) and \
-                    (stop > timeStamp[i] or tDiffStop < 1.0):
-                    try:
-                        rowsToDelete.append(i)
-                        finalCount += 1
-                    except Exception as err:
-                        print(err)
-                else:
-                    newTimeStamp.append(timeStamp[i])
-            group.datasetDeleteRow(rowsToDelete)
-        else:
-            logging.writeLogFileAndPrint('Data group is empty. Continuing.')
-        timeStamp = newTimeStamp.copy()
+    logging.writeLogFileAndPrint(f'   Length of dataset prior to removal {originalLength} long')
 
-    if len(badTimes) == 0:
-        startLength = 1 # avoids div by zero below when finalCount is 0
+    # Delete the records in badTime ranges from each dataset in the group in one pass
+    # Unclear why there are sometimes millisecond difference between groups,
+    #   but non-equivalence of datetimes is a problem for the screening, so allow 1 s either side.
+    finalCount = 0
+    if originalLength > 0:
+        finalCount = deleteBadTimes(group, timeStamp, badTimeIntervals(badTimes, tolerance=datetime.timedelta(seconds=1)))
+    else:
+        logging.writeLogFileAndPrint('Data group is empty. Continuing.')
 
     for ds in group.datasets:
         # if ds != "STATION":
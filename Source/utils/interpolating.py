@@ -1,8 +1,13 @@
 '''################################# INTERPOLATION ORIENTED #################################'''
 
-from scipy.interpolate import splev, splrep, interp1d
+import hashlib
+import time
+
+from scipy.interpolate import splev, splrep, interp1d, make_interp_spline
 import numpy as np
 
+import Source.utils.caching as caching
+
 def interp(x, y, new_x, kind='linear', fill_value=0.0):
     ''' Wrapper for scipy interp1d that works even if
         values in new_x are outside the range of values in x
@@ -27,6 +32,81 @@ def interp(x, y, new_x, kind='linear', fill_value=0.0):
     return new_y
 
 
+def interpMatrix(x, y, new_x, kind='linear', fill_value=np.nan):
+    ''' interp for a (time x band) matrix y: every column is interpolated in a single call.
+        Values beyond either end of x are filled with the nearest record, as in interp.
+        kind='cubic' gives the interpolating spline of interpSpline (no end filling). '''
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    new_x = np.asarray(new_x, dtype=np.float64)
+    if kind == 'cubic':
+        return make_interp_spline(x, y, k=3, check_finite=False)(new_x)
+
+    if new_x[-1] > x[-1]:
+        x = np.append(x, new_x[-1])
+        y = np.concatenate((y, y[-1:]))
+    if new_x[0] < x[0]:
+        x = np.insert(x, 0, new_x[0])
+        y = np.concatenate((y[:1], y))
+
+    return interp1d(x, y, kind=kind, axis=0, bounds_error=False, fill_value=fill_value)(new_x)
+
+
+def splineOperator(x, new_x, k=3):
+    ''' (len(new_x) x len(x)) matrix taking values at x to the interpolating spline of degree k
+        (as InterpolatedUnivariateSpline, extrapolating beyond x) evaluated at new_x. Spectra in the rows
+        of a (time x band) matrix are regridded with spectra @ splineOperator(x, new_x).T.
+        Operators are cached for the process; the returned array is read-only. '''
+    x = np.asarray(x, dtype=np.float64)
+    new_x = np.asarray(new_x, dtype=np.float64)
+    key = ('splineOperator', len(x), len(new_x), k, hashlib.sha1(x.tobytes() + new_x.tobytes()).hexdigest())
+    return caching.getLUT(key, lambda: make_interp_spline(x, np.eye(len(x)), k=k)(new_x))
+
+
+def multilinear(points, values, xi):
+    ''' Multilinear interpolation of values on the regular grid points (a tuple of ascending axes) at a batch of
+        coordinates xi (n x len(points)). Trailing dimensions of values beyond the grid (e.g. wavebands) are
+        carried through, giving (n x trailing dimensions). Axes with a single node need an exact match.
+        Raises ValueError for coordinates outside the grid. '''
+    xi = np.atleast_2d(np.asarray(xi, dtype=np.float64))
+    n = xi.shape[0]
+    lower, upperWeight = [], []
+    for d, axis in enumerate(points):
+        axis = np.asarray(axis, dtype=np.float64)
+        x = xi[:, d]
+        if np.any(~(x >= axis[0]) | ~(x <= axis[-1])):
+            raise ValueError(f'One of the requested xi is out of bounds in dimension {d}')
+        if len(axis) == 1:
+            lower.append(np.zeros(n, dtype=int))
+            upperWeight.append(np.zeros(n))
+            continue
+        i = np.clip(np.searchsorted(axis, x, side='left') - 1, 0, len(axis) - 2)
+        lower.append(i)
+        upperWeight.append((x - axis[i]) / (axis[i + 1] - axis[i]))
+
+    # Gather the 2 x 2 x ... cell around each point (one node on axes where no point lies between nodes)
+    #   and weight its corners
+    active = [bool(np.any(t != 0)) for t in upperWeight]
+    index = []
+    for d, i in enumerate(lower):
+        offsets = np.arange(2 if active[d] else 1)
+        shape = [n] + [1] * len(points)
+        shape[d + 1] = len(offsets)
+        index.append((i[:, None] + offsets).reshape(shape))
+    cells = values[tuple(index)].reshape((n, -1) + values.shape[len(points):])
+
+    weights = np.ones((n, 1))
+    for d, t in enumerate(upperWeight):
+        if active[d]:
+            weights = (weights[:, :, None] * np.stack([1 - t, t], axis=1)[:, None, :]).reshape(n, -1)
+    return np.einsum('nc,nc...->n...', weights, cells)
+
+
+def timeStamps(dateTimes):
+    ''' Seconds (time.mktime) of each datetime, the time axis of the L1B time interpolation '''
+    return np.array([time.mktime(dateTime.timetuple()) for dateTime in dateTimes])
+
+
 def interpAngular(x, y, new_x, fill_value="extrapolate"):
     ''' Wrapper for scipy interp1d that works even if
         values in new_x are outside the range of values in x
@@ -0,0 +1,125 @@
+'''################################# SOLAR GEOMETRY ORIENTED #################################'''
+import datetime
+
+import numpy as np
+from pysolar import solar, solartime, constants
+from pysolar.tzinfo_check import NoTimeZoneInfoError
+
+# Resolution of the optional memo. Positions within 1e-4 deg (~10 m) and times within 1 s share an
+#   entry, which moves the solar zenith by less than ~0.005 deg (azimuth more with the sun near zenith).
+MEMO_TIME_RESOLUTION = 1.0 # seconds
+MEMO_POSITION_RESOLUTION = 1e-4 # degrees
+
+_memo = {}
+_timeScales = {}
+
+
+def clearMemo():
+    ''' Empty the solar position memo '''
+    _memo.clear()
+
+
+def _julianDays(dateTime):
+    ''' UT and TT Julian days as in pysolar.solartime, for an array of aware datetimes.
+        Leap seconds and delta T only change by month, so they are looked up once per month. '''
+    timeStamp = np.empty(len(dateTime))
+    leapSeconds = np.empty(len(dateTime))
+    deltaT = np.empty(len(dateTime))
+    for i, when in enumerate(dateTime):
+        if when.tzinfo is None:
+            raise NoTimeZoneInfoError('dateTime', when)
+        timeStamp[i] = when.timestamp()
+        utc = when.utctimetuple()
+        key = (utc.tm_year, utc.tm_mon)
+        if key not in _timeScales:
+            _timeScales[key] = (solartime.get_leap_seconds(when), solartime.get_delta_t(when))
+        leapSeconds[i], deltaT[i] = _timeScales[key]
+
+    # Same order of operations as pysolar; sidereal time is sensitive to the last bit of the Julian day
+    jd = (timeStamp + leapSeconds + solartime.tt_offset - deltaT) / constants.seconds_per_day \
+        + solartime.gregorian_day_offset + solartime.julian_day_offset
+    jde = (timeStamp + leapSeconds + solartime.tt_offset) / constants.seconds_per_day \
+        + solartime.gregorian_day_offset + solartime.julian_day_offset
+    return jd, jde, timeStamp
+
+
+def _sunPosition(lat, lon, dateTime):
+    ''' pysolar get_azimuth and 90 - get_altitude at sea level, evaluated for whole arrays at once '''
+    jd, jde, _ = _julianDays(dateTime)
+
+    # Location-dependent calculations
+    projectedRadialDistance = solar.get_projected_radial_distance(0, lat)
+    projectedAxialDistance = solar.get_projected_axial_distance(0, lat)
+
+    # Time-dependent calculations
+    jce = solartime.get_julian_ephemeris_century(jde)
+    jme = solartime.get_julian_ephemeris_millennium(jce)
+    geocentricLatitude = solar.get_geocentric_latitude(jme)
+    geocentricLongitude = solar.get_geocentric_longitude(jme)
+    sunEarthDistance = solar.get_sun_earth_distance(jme)
+    aberrationCorrection = solar.get_aberration_correction(sunEarthDistance)
+    equatorialHorizontalParallax = solar.get_equatorial_horizontal_parallax(sunEarthDistance)
+    nutation = solar.get_nutation(jce)
+    apparentSiderealTime = solar.get_apparent_sidereal_time(jd, jme, nutation)
+    trueEclipticObliquity = solar.get_true_ecliptic_obliquity(jme, nutation)
+
+    # Calculations dependent on location and time
+    apparentSunLongitude = solar.get_apparent_sun_longitude(geocentricLongitude, nutation, aberrationCorrection)
+    rightAscension = solar.get_geocentric_sun_right_ascension(apparentSunLongitude, trueEclipticObliquity, geocentricLatitude)
+    declination = solar.get_geocentric_sun_declination(apparentSunLongitude, trueEclipticObliquity, geocentricLatitude)
+    localHourAngle = solar.get_local_hour_angle(apparentSiderealTime, lon, rightAscension)
+    parallaxRightAscension = solar.get_parallax_sun_right_ascension(projectedRadialDistance, equatorialHorizontalParallax, localHourAngle, declination)
+    topocentricHourAngle = solar.get_topocentric_local_hour_angle(localHourAngle, parallaxRightAscension)
+    topocentricDeclination = solar.get_topocentric_sun_declination(declination, projectedAxialDistance, equatorialHorizontalParallax, parallaxRightAscension, localHourAngle)
+
+    elevation = solar.get_topocentric_elevation_angle(lat, topocentricDeclination, topocentricHourAngle)
+    refraction = solar.get_refraction_correction(constants.standard_pressure, constants.standard_temperature, elevation)
+    azimuth = solar.get_topocentric_azimuth_angle(topocentricHourAngle, lat, topocentricDeclination)
+
+    return azimuth, 90 - (elevation + refraction)
+
+
+def sunPosition(lat, lon, dateTime, memo=False):
+    ''' Solar azimuth and zenith (degrees) for arrays of latitude, longitude and timezone-aware datetimes.
+        Scalar lat/lon are broadcast to all datetimes. Uses the same arithmetic as pysolar
+        get_azimuth and 90 - get_altitude (sea level, standard atmosphere), so results are identical.
+        With memo, inputs are rounded to MEMO_TIME_RESOLUTION and MEMO_POSITION_RESOLUTION and
+        positions already computed in this session are reused.
+        Returns (azimuth, zenith) as 1D arrays '''
+    dateTime = list(dateTime)
+    nTime = len(dateTime)
+    lat = np.broadcast_to(np.asarray(lat, dtype=np.float64), (nTime,))
+    lon = np.broadcast_to(np.asarray(lon, dtype=np.float64), (nTime,))
+    if nTime == 0:
+        return np.array([]), np.array([])
+
+    if not memo:
+        azimuth, zenith = _sunPosition(lat, lon, np.array(dateTime, dtype=object))
+        return np.asarray(azimuth, dtype=np.float64), np.asarray(zenith, dtype=np.float64)
+
+    _, _, timeStamp = _julianDays(dateTime)
+    keys = list(zip(np.round(timeStamp / MEMO_TIME_RESOLUTION).astype(np.int64).tolist(),
+                    np.round(lat / MEMO_POSITION_RESOLUTION).astype(np.int64).tolist(),
+                    np.round(lon / MEMO_POSITION_RESOLUTION).astype(np.int64).tolist()))
+
+    # Compute the missing entries at their rounded time and position
+    missing = {}
+    for i, key in enumerate(keys):
+        if key not in _memo and key not in missing:
+            missing[key] = i
+    if missing:
+        index = np.array(list(missing.values()))
+        newKeys = np.array(list(missing.keys()), dtype=np.int64)
+        roundedTime = [dateTime[i] + datetime.timedelta(seconds=key[0]*MEMO_TIME_RESOLUTION - timeStamp[i])
+                       for i, key in zip(index, missing)]
+        azimuth, zenith = _sunPosition(newKeys[:, 1]*MEMO_POSITION_RESOLUTION,
+                                       newKeys[:, 2]*MEMO_POSITION_RESOLUTION,
+                                       np.array(roundedTime, dtype=object))
+        azimuth = np.broadcast_to(azimuth, (len(missing),))
+        zenith = np.broadcast_to(zenith, (len(missing),))
+        for j, key in enumerate(missing):
+            _memo[key] = (float(azimuth[j]), float(zenith[j]))
+
+    position = np.array([_memo[key] for key in keys])
+    return position[:, 0], position[:, 1]
+
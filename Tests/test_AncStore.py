@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+import xarray as xr
+
+from Source.AncStore import AncStore
+import Source.utils.caching as caching
+import Source.utils.comparing as comparing
+
+
+class TestAncStore(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.addCleanup(caching.evict)
+        self.lat = np.arange(-90, 90.1, 0.5)
+        self.lon = np.arange(-180, 180, 0.625)
+
+    def write(self, hour, field):
+        fp = os.path.join(self.dir.name, f'GMAO_MERRA2.20210301T{hour:02d}0000.MET.nc')
+        xr.Dataset({'U10M': (('lat', 'lon'), field.astype(np.float32), {'units': 'm s-1'})},
+                   coords={'lat': self.lat, 'lon': self.lon}).to_netcdf(fp)
+        return self.ingest(hour)
+
+    def ingest(self, hour):
+        fp = os.path.join(self.dir.name, f'GMAO_MERRA2.20210301T{hour:02d}0000.MET.nc')
+        return AncStore.ingest(fp, ['U10M', 'V10M'], np.datetime64(f'2021-03-01T{hour:02d}'))
+
+    def test_nearest(self):
+        x = np.array([-91, -90, 0.25, 0.26, 45.74, 89.9, 95, np.nan])
+        for axis in (self.lat, self.lat[::-1], np.array([3.0])):
+            expected = [comparing.find_nearest(axis, v) for v in x[:-1]]
+            np.testing.assert_array_equal(AncStore.nearest(axis, x), expected + [-1])
+
+    def test_store_and_lookup(self):
+        rng = np.random.default_rng(0)
+        grids = [self.write(hour, rng.random((self.lat.size, self.lon.size))) for hour in (11, 10)]
+        self.assertEqual(list(grids[0]['variables']), ['U10M'])
+        self.assertEqual(len(os.listdir(os.path.join(self.dir.name, 'Store'))), 2)
+
+        # A later session loads the stored arrays instead of reading the model files
+        caching.evict()
+        with mock.patch.object(AncStore, '_read', side_effect=AssertionError):
+            grid = AncStore.stack([self.ingest(hour) for hour in (11, 10)])
+        np.testing.assert_array_equal(grid['U10M'], np.concatenate([grids[1]['U10M'], grids[0]['U10M']]))
+        self.assertEqual(list(grid['units']), ['m s-1'])
+
+        stamps = np.array(['2021-03-01T10:30', '2021-03-01T11:59:59', '2021-03-01T09:59', '2021-03-01T12:00', 'NaT'],
+                          dtype='datetime64[ms]')
+        lat = np.array([30.1, -12.3, 0, 0, 0])
+        lon = np.array([-70.4, 179.9, 0, 0, 0])
+        values = AncStore.lookup(grid, stamps, lat, lon)['U10M']
+        for k in range(2):
+            expected = grid['U10M'][k, comparing.find_nearest(self.lat, lat[k]), comparing.find_nearest(self.lon, lon[k])]
+            self.assertEqual(values[k], expected)
+        self.assertTrue(np.isnan(values[2:]).all())
+
+    def test_bilinear(self):
+        plane = (np.cos(np.radians(self.lon))[None, :] + 0.01 * self.lat[:, None])
+        grid = self.write(10, plane)
+        lat = np.array([30.1, -89.9, 89.8, 12.0])
+        lon = np.array([-70.4, 10.3, 179.9, -180.0])
+        values = AncStore.lookup(grid, np.full(4, np.datetime64('2021-03-01T10:30')), lat, lon, 'bilinear')['U10M']
+        # Longitude wraps across the date line; latitude is clamped at the poles
+        np.testing.assert_allclose(values, np.cos(np.radians(lon)) + 0.01 * np.clip(lat, -90, 90), atol=1e-4)
+
+
+if __name__ == '__main__':
+    unittest.main()
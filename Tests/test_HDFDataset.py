@@ -0,0 +1,62 @@
+import unittest
+import numpy as np
+
+from Source.HDFDataset import HDFDataset
+
+
+class TestHDFDatasetColumnar(unittest.TestCase):
+    def setUp(self):
+        self.ds = HDFDataset()
+        self.ds.id = 'ES'
+        self.ds.columns['Datetag'] = [2023001.0, 2023001.0, 2023001.0]
+        self.ds.columns['Timetag2'] = [120000000.0, 120001000.0, 120002000.0]
+        self.ds.columns['400.0'] = [1.5, 2.5, 3.5]
+        self.ds.columns['WINDFLAG'] = ['field', 'field', 'field']
+        self.ds.columnsToDataset()
+
+    def test_columnar_views(self):
+        self.ds.datasetToColumns(columnar=True)
+        self.assertIsInstance(self.ds.columns['400.0'], np.ndarray)
+        self.assertTrue(self.ds.isColumnarView())
+        # Untouched views whose dtypes the list rules keep do not rebuild the structured array
+        del self.ds.columns['WINDFLAG']
+        self.ds.columnsToDataset()
+        self.ds.datasetToColumns(columnar=True)
+        data = self.ds.data
+        self.assertTrue(self.ds.columnsToDataset())
+        self.assertIs(self.ds.data, data)
+
+    def test_columnar_matches_lists(self):
+        self.ds.columns['COUNT'] = [1, 2, 3]
+        self.ds.columnsToDataset()
+        data = self.ds.data
+        self.ds.data = np.empty(3, dtype=data.dtype.descr[:-2] + [('WINDFLAG', np.int64), ('COUNT', np.int64)])
+        for k in data.dtype.names:
+            self.ds.data[k] = data[k]
+        self.ds.data = self.ds.data.astype(self.ds.data.dtype.descr[:2] + [('400.0', np.float32)] + self.ds.data.dtype.descr[3:])
+
+        # Both paths give the same dtypes: the list rules, applied to the arrays
+        listDs = HDFDataset()
+        listDs.data = self.ds.data
+        listDs.datasetToColumns()
+        listDs.columns['NEW'] = (np.array(listDs.columns['400.0']) * 2).tolist()
+        listDs.columnsToDataset()
+        self.ds.datasetToColumns(columnar=True)
+        self.ds.columns['NEW'] = self.ds.columns['400.0'] * 2
+        self.ds.columnsToDataset()
+        self.assertEqual(self.ds.data.dtype, listDs.data.dtype)
+        self.assertEqual(self.ds.data.dtype['COUNT'], np.float64)
+        self.assertEqual(self.ds.data.dtype['400.0'], np.float64)
+        for k in listDs.data.dtype.names:
+            np.testing.assert_array_equal(self.ds.data[k], listDs.data[k])
+
+    def test_column_to_list(self):
+        self.ds.datasetToColumns(columnar=True)
+        col = self.ds.columnToList('400.0')
+        self.assertIsInstance(col, list)
+        self.assertEqual(col, [1.5, 2.5, 3.5])
+        self.assertFalse(self.ds.isColumnarView())
+
+
+if __name__ == '__main__':
+    unittest.main()
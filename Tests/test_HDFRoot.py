@@ -0,0 +1,120 @@
+import io
+import os
+import unittest
+import h5py
+import numpy as np
+
+from Source.HDFRoot import HDFRoot
+import Source.HDFDataset as HDFDataset
+
+
+root = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+
+def _roundTrip(node):
+    buffer = io.BytesIO()
+    node.writeHDF5(buffer)
+    return HDFRoot.readHDF5(buffer)
+
+
+class TestHDFRootSnapshot(unittest.TestCase):
+    def assertSameValue(self, a, b):
+        self.assertIs(type(a), type(b))
+        if isinstance(a, np.ndarray):
+            self.assertEqual(a.dtype, b.dtype)
+            np.testing.assert_array_equal(a, b)
+        else:
+            self.assertEqual(a, b)
+
+    def assertSameRoot(self, expected, node):
+        self.assertEqual(expected.id, node.id)
+        self.assertEqual(list(expected.attributes.keys()), list(node.attributes.keys()))
+        for k, v in expected.attributes.items():
+            self.assertSameValue(v, node.attributes[k])
+        self.assertEqual([gp.id for gp in expected.groups], [gp.id for gp in node.groups])
+        for expectedGp, gp in zip(expected.groups, node.groups):
+            self.assertEqual(list(expectedGp.attributes.items()), list(gp.attributes.items()))
+            self.assertEqual(list(expectedGp.datasets.keys()), list(gp.datasets.keys()))
+            for k, ds in expectedGp.datasets.items():
+                self.assertEqual(ds.id, gp.datasets[k].id)
+                for a, v in ds.attributes.items():
+                    self.assertSameValue(v, gp.datasets[k].attributes[a])
+                self.assertSameValue(ds.data, gp.datasets[k].data)
+                self.assertFalse(gp.datasets[k].columns)
+
+    def setUp(self):
+        self.node = HDFRoot()
+        self.node.id = "/"
+        self.node.attributes['TIME-STAMP'] = 'Fri May 20 06:00:00 2016'
+        self.node.attributes['Fail'] = 0
+        self.node.attributes['WAVELENGTHS'] = ['400.0', '412.5']
+        gp = self.node.addGroup('ES')
+        gp.attributes['FrameType'] = 'ShutterLight'
+        ds = gp.addDataset('ES')
+        ds.columns['Datetag'] = [2016141.0, 2016141.0]
+        ds.columns['400.0'] = [1.5, 2.5]
+        ds.columns['WINDFLAG'] = ['field', 'field']
+        ds.columnsToDataset()
+        ds.attributes['Units'] = 'uW/cm^2/nm'
+        gp.addDataset('EMPTY')
+        gp = self.node.addGroup('ANCILLARY')
+        ds = gp.addDataset('SZA')
+        ds.data = np.arange(4, dtype=np.float32)
+
+    def test_snapshot_matches_file(self):
+        snapshot = self.node.snapshot()
+        self.assertSameRoot(_roundTrip(self.node), snapshot)
+        # The snapshot does not share data with the original
+        snapshot.getGroup('ANCILLARY').datasets['SZA'].data[0] = 10
+        self.assertEqual(self.node.getGroup('ANCILLARY').datasets['SZA'].data[0], 0)
+
+    def test_snapshot_falls_back(self):
+        ds = self.node.getGroup('ANCILLARY').addDataset('NOTES')
+        ds.data = np.array(['unicode text'])
+        self.assertSameRoot(_roundTrip(self.node), self.node.snapshot())
+
+    def test_snapshot_of_file(self):
+        node = HDFRoot.readHDF5(os.path.join(root, 'Data', 'rhoTable_AO1999.hdf'))
+        self.assertSameRoot(_roundTrip(node), node.snapshot())
+
+
+class TestHDFWriteProfiles(unittest.TestCase):
+    def setUp(self):
+        self.node = HDFRoot()
+        self.node.id = "/"
+        gp = self.node.addGroup('LT')
+        ds = gp.addDataset('LT')
+        ds.columns['Datetag'] = [2016141.0] * 3000
+        for k in range(255):
+            ds.columns[f'{350 + 2.5*k:.1f}'] = np.linspace(0, 1, 3000).tolist()
+        ds.columnsToDataset()
+        gp.addDataset('L0').data = np.tile(np.arange(256.0), (40, 1))
+        gp.addDataset('FLAG').data = np.zeros(0)
+
+    def test_profiles_round_trip(self):
+        sizes = {}
+        for profile in HDFDataset.WRITE_PROFILES:
+            buffer = io.BytesIO()
+            self.node.writeHDF5(buffer, profile)
+            sizes[profile] = len(buffer.getvalue())
+            node = HDFRoot.readHDF5(buffer)
+            for k, ds in self.node.getGroup('LT').datasets.items():
+                np.testing.assert_array_equal(node.getGroup('LT').datasets[k].data, ds.data)
+
+            with h5py.File(buffer, 'r') as f:
+                dset = f['LT/LT']
+                if profile == 'none':
+                    self.assertIsNone(dset.chunks)
+                else:
+                    # Chunks hold whole records, split along the time axis only
+                    self.assertEqual(dset.compression, 'gzip')
+                    self.assertLess(dset.chunks[0], 3000)
+                    self.assertEqual(f['LT/L0'].chunks, (40, 256))
+                    self.assertIsNone(f['LT/FLAG'].compression)
+        self.assertLess(sizes['fast'], sizes['none'] / 2)
+        self.assertLessEqual(sizes['max'], sizes['fast'])
+        self.assertRaises(ValueError, self.node.writeHDF5, io.BytesIO(), 'lzma')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+import numpy as np
+
+from Source.L2qaa import L2qaa, L2qaaBatch
+
+
+# a, adg, aph, b, bb, bbp and c at 400, 490, 560 and 670 nm for the first three spectra of setUp, from the
+#   original per-spectrum L2qaa (before L2qaaBatch). The spectra take the 667 nm switch both ways and the third
+#   has its Rrs(667) adjusted.
+REFERENCE_WAVELENGTHS = [400.0, 490.0, 560.0, 670.0]
+REFERENCE = [
+    [[0.14289814819, 0.063266625027, 0.077174431939, 0.44346175577],
+     [0.12191352372, 0.02881663642, 0.0093850502108, 0.0016100008044],
+     [0.0058496244649, 0.020149988607, 0.0068841185699, 0.0033902165075],
+     [0.030533923517, 0.020691833855, 0.016490334075, 0.012466193381],
+     [0.015266961759, 0.010345916927, 0.0082451670375, 0.0062330966903],
+     [0.011260629211, 0.0086718924116, 0.0073024172528, 0.0057970998856],
+     [0.1734320717, 0.083958458881, 0.093664766014, 0.45592794915]],
+    [[0.15200459121, 0.063985309041, 0.076340773455, 0.43417108329],
+     [0.13159254731, 0.031110499237, 0.01013364877, 0.0017388349203],
+     [0.0052841198141, 0.019214925196, 0.0072310104513, -0.0038390225337],
+     [0.016809021003, 0.010849497615, 0.0084419401687, 0.0062362498967],
+     [0.0084045105013, 0.0054247488073, 0.0042209700843, 0.0031181249483],
+     [0.0054368567622, 0.0041847306474, 0.0035226369105, 0.0027951643523],
+     [0.16881361221, 0.074834806656, 0.084782713624, 0.44040733319]],
+    [[0.22459177322, 0.072849477876, 0.074389933238, 0.35513436256],
+     [0.21548477409, 0.05095016853, 0.016597626459, 0.002848417839],
+     [-0.0048088732541, 0.0078727099905, -0.0021297247698, -0.084974860744],
+     [0.010055262739, 0.0050240392227, 0.0033305330518, 0.002041365031],
+     [0.0050276313697, 0.0025120196113, 0.0016652665259, 0.0010206825155],
+     [0.0011696815088, 0.00089999600345, 0.00075743339991, 0.00060083374067],
+     [0.23464703596, 0.077873517098, 0.07772046629, 0.35717572759]],
+]
+
+
+class TestL2qaaBatch(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.wavelength = np.arange(350.0, 900.0, 5.0)
+        shape = 0.004 * np.exp(-((self.wavelength - 480) / 120)**2)
+        self.Rrs = shape * rng.uniform(0.3, 3, (6, 1))
+        self.bands = [self.Rrs[:, np.argmin(abs(self.wavelength - wl))] for wl in (412, 443, 488, 555, 667)]
+        # Exercise both branches of the Rrs(667) switch and the out of bounds adjustment
+        self.bands[4][1] = 0.0005
+        self.bands[4][2] = 0.02
+        self.SST = np.array([0.0, 10.0, 15.0, 20.0, 25.0, 30.0])
+        self.SAL = np.array([35.0, 0.0, 30.0, 33.0, 34.0, 36.0])
+
+    def test_batch_matches_reference(self):
+        batch = L2qaaBatch(*self.bands, self.Rrs, self.wavelength, self.SST, self.SAL)
+        wavelength = self.wavelength[(self.wavelength >= 380) & (self.wavelength <= 800)]
+        index = np.searchsorted(wavelength, REFERENCE_WAVELENGTHS)
+        for i, expected in enumerate(REFERENCE):
+            for iop, iopBatch in zip(expected, batch[:-1]):
+                np.testing.assert_allclose(iopBatch[i, index], iop, rtol=1e-9)
+
+    def test_batch_matches_single(self):
+        batch = L2qaaBatch(*self.bands, self.Rrs, self.wavelength, self.SST, self.SAL)
+        self.assertEqual(len(batch[-1]), 1)
+        for i in range(len(self.SST)):
+            single = L2qaa(*[band[i] for band in self.bands], self.Rrs[i].copy(), self.wavelength,
+                           self.SST[i], self.SAL[i])
+            for iop, iopBatch in zip(single[:-1], batch[:-1]):
+                np.testing.assert_allclose(iop, iopBatch[i], rtol=1e-12)
+        # Output is truncated to the pure water tables
+        self.assertEqual(batch[0].shape, (6, np.count_nonzero((self.wavelength >= 380) & (self.wavelength <= 800))))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import Source.MainConfig
+from Source.MainConfig import MainConfig
+
+
+class TestMainConfig(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patch = mock.patch.object(Source.MainConfig, 'PATH_TO_CONFIG', directory.name)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.fp = os.path.join(directory.name, 'main.config')
+        settings = mock.patch.object(MainConfig, 'settings', MainConfig.settings.copy())
+        settings.start()
+        self.addCleanup(settings.stop)
+
+    def load(self, **saved):
+        with open(self.fp, 'w', encoding='utf-8') as f:
+            json.dump(saved, f)
+        MainConfig.loadConfig('main.config', 'test')
+
+    def test_valid_choices_kept(self):
+        self.load(pipelineMode=2, hdfWriteProfile='max')
+        self.assertEqual((MainConfig.settings['pipelineMode'], MainConfig.settings['hdfWriteProfile']), (2, 'max'))
+
+    def test_invalid_choices_reset(self):
+        self.load(pipelineMode=3, hdfWriteProfile='gzip', outDir='./Out')
+        self.assertEqual((MainConfig.settings['pipelineMode'], MainConfig.settings['hdfWriteProfile']), (0, 'none'))
+        self.assertEqual(MainConfig.settings['outDir'], './Out')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+import numpy as np
+
+from Source.CalibrationData import CalibrationData
+from Source.CalibrationFile import CalibrationFile
+from Source.HDFGroup import HDFGroup
+from Source.ProcessL1b_FactoryCal import ProcessL1b_FactoryCal
+
+
+PARAGRAPHS = [("INTTIME LI 'sec' 2 BU 1 POLYU", '0 0.001'),
+              ("LI 400.0 'uW/cm^2/nm/sr' 2 BU 1 OPTIC3", '2048.0 1.5e-3 1.2 0.128'),
+              ("LI 402.5 'uW/cm^2/nm/sr' 2 BU 1 OPTIC3", '2050.0 2.5e-3 1.3 0.256'),
+              ("LI 405.0 'uW/cm^2/nm/sr' 2 BU 0 OPTIC3", None),
+              ("LI 407.5 'uW/cm^2/nm/sr' 2 BU 1 OPTIC3", '2049.0 3.7e-3 1.4 0.064'),
+              ("LI 410.0 'uW/cm^2/nm/sr' 2 BU 0 OPTIC3", None),
+              ("T SAT_TEMP 'C' 2 BU 1 POLYU", '-20.0 0.05')]
+
+
+def _perFrame(gp, cf, immersed):
+    ''' The per-frame path: every paragraph applied frame by frame, uncalibrated pixels dropped one at a time '''
+    inttime = gp.getDataset('INTTIME')
+    inttime.data['LI'] = inttime.data['LI'] * 0.001
+    for cd in cf.data:
+        if cd.type == 'INTTIME' or not gp.getDataset(cd.type):
+            continue
+        ds = gp.getDataset(cd.type)
+        if cd.fitType == 'POLYU':
+            ds.data[cd.id] = float(cd.coefficients[0]) + float(cd.coefficients[1]) * ds.data[cd.id]
+        elif cd.dummy == 0:
+            a1 = float(cd.coefficients[1])
+            im = float(cd.coefficients[2]) if immersed else 1.0
+            cint = float(cd.coefficients[3])
+            for x in range(ds.data.shape[0]):
+                ds.data[cd.id][x] = im * a1 * (ds.data[cd.id][x]) * (cint/inttime.data[cd.type][x])
+        else:
+            ds.datasetToColumns()
+            del ds.columns[cd.id]
+            ds.columnsToDataset()
+
+
+class TestFactoryCal(unittest.TestCase):
+    def setUp(self):
+        self.cf = CalibrationFile()
+        for line, coefficients in PARAGRAPHS:
+            cd = CalibrationData()
+            cd.read(line)
+            if coefficients is not None:
+                cd.readCoefficients(coefficients)
+            self.cf.data.append(cd)
+
+    def group(self):
+        rng = np.random.default_rng(0)
+        gp = HDFGroup()
+        gp.id = 'LI'
+        for name, columns in (('INTTIME', {'LI': rng.choice([64.0, 128.0, 512.0], 20)}),
+                              ('LI', {k: rng.uniform(1000, 60000, 20) for k in ('400.0', '402.5', '405.0', '407.5', '410.0')}),
+                              ('T', {'SAT_TEMP': rng.uniform(800, 1200, 20)})):
+            ds = gp.addDataset(name)
+            ds.columns['Datetag'] = [2021150.0] * 20
+            ds.columns['Timetag2'] = (120000000.0 + 1000 * np.arange(20)).tolist()
+            for k, v in columns.items():
+                ds.columns[k] = v.tolist()
+            ds.columnsToDataset()
+        return gp
+
+    def assertSameGroup(self, expected, gp):
+        for name, ds in expected.datasets.items():
+            self.assertEqual(gp.datasets[name].data.dtype, ds.data.dtype)
+            for k in ds.data.dtype.names:
+                np.testing.assert_array_equal(gp.datasets[name].data[k], ds.data[k])
+
+    def test_block_matches_frames(self):
+        for immersed in (False, True):
+            expected = self.group()
+            _perFrame(expected, self.cf, immersed)
+
+            gp = self.group()
+            inttime = gp.getDataset('INTTIME')
+            ProcessL1b_FactoryCal.processDataset(inttime, self.cf.data[0])
+            block = ProcessL1b_FactoryCal.compileOPTIC3(self.cf, immersed)['LI']
+            ProcessL1b_FactoryCal.processOPTIC3Block(gp.getDataset('LI'), block, inttime)
+            ProcessL1b_FactoryCal.processDataset(gp.getDataset('T'), self.cf.data[-1])
+
+            self.assertEqual(gp.getDataset('LI').data.dtype.names, ('Datetag', 'Timetag2', '400.0', '402.5', '407.5'))
+            self.assertSameGroup(expected, gp)
+
+    def test_process_group(self):
+        expected = self.group()
+        _perFrame(expected, self.cf, False)
+        gp = self.group()
+        ProcessL1b_FactoryCal.processGroup(gp, self.cf)
+        self.assertSameGroup(expected, gp)
+        # Compiled once per calibration file
+        self.assertIs(ProcessL1b_FactoryCal.compileOPTIC3(self.cf), ProcessL1b_FactoryCal.compileOPTIC3(self.cf))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,194 @@
+import datetime
+import multiprocessing
+import unittest
+from unittest import mock
+import numpy as np
+
+from Source.ConfigFile import ConfigFile
+from Source.HDFGroup import HDFGroup
+from Source.HDFRoot import HDFRoot
+from Source.ProcessL2 import ProcessL2
+
+
+def _legacyEnsembles(timeStamp, interval, process):
+    ''' The ensemble loop of stationsEnsemblesReflectance before ensembleSchedule, calling process(start, stop) '''
+    esLength = len(timeStamp)
+    if interval == 0:
+        for i in range(0, esLength-1):
+            process(i, i+1)
+        return
+
+    startEnsIndx = 0
+    stopEnsTime = timeStamp[0] + datetime.timedelta(0,interval)
+    endFileTime = timeStamp[-1]
+    EndOfFileFlag = False
+    if stopEnsTime > endFileTime:
+        stopEnsTime = endFileTime
+        EndOfFileFlag = True
+
+    for i in range(0, esLength):
+        timei = timeStamp[i]
+        if (timei > stopEnsTime) or EndOfFileFlag:
+            if EndOfFileFlag:
+                stopEnsIndx = len(timeStamp)-1
+                process(startEnsIndx, stopEnsIndx)
+                break
+            else:
+                stopEnsTime = timei + datetime.timedelta(0,interval)
+                stopEnsIndx = i
+
+            if stopEnsTime > endFileTime:
+                stopEnsTime = endFileTime
+                EndOfFileFlag = True
+
+            if not process(startEnsIndx, stopEnsIndx):
+                startEnsIndx = i
+                continue
+            startEnsIndx = i
+
+            if EndOfFileFlag:
+                break
+
+    if not EndOfFileFlag:
+        stopEnsIndx = i+1
+        process(startEnsIndx, stopEnsIndx)
+
+
+def _group(gpID, dsID, columns, n):
+    gp = HDFGroup()
+    gp.id = gpID
+    ds = gp.addDataset(dsID)
+    epoch = datetime.datetime(2021, 6, 1, 12, tzinfo=datetime.timezone.utc)
+    ds.columns['Datetime'] = [epoch + datetime.timedelta(seconds=10*i) for i in range(n)]
+    ds.columns['Datetag'] = [2021152.0] * n
+    ds.columns['Timetag2'] = [120000000.0 + 10000*i for i in range(n)]
+    ds.columns.update(columns)
+    ds.columnsToDataset()
+    return gp
+
+
+# Ensembles failing in ensembleAverages (before or after the sensor statistics) or in ensembleProducts
+FAIL_EARLY, FAIL_LATE, FAIL_PRODUCTS = {6}, {12}, {3, 33}
+
+
+def _averages(node, sasGroup, refGroup, ancGroup, uncGroup, esRawGroup, liRawGroup, ltRawGroup, sixSGroup, start, end):
+    ''' The node updates of ProcessL2.ensembleAverages on synthetic data '''
+    if 'PERCENT_LT_GLITTER_CORRECTION' not in node.attributes:
+        node.attributes.update(PERCENT_LT_GLITTER_CORRECTION='ON', PERCENT_LT='5')
+        percentLtattr = []
+    else:
+        percentLtattr = node.attributes['PERCENT_LT'].split(',')
+    if start in FAIL_EARLY:
+        return False
+    percentLtattr.append(str(start % 7))
+    node.attributes['PERCENT_LT'] = ','.join(percentLtattr)
+    grp = node.getGroup('IRRADIANCE')
+    if 'Ensemble_N' not in grp.datasets:
+        grp.addDataset('Ensemble_N')
+        grp.datasets['Ensemble_N'].columns['N'] = []
+    grp.datasets['Ensemble_N'].columns['N'].append(end - start)
+    grp.datasets['Ensemble_N'].columnsToDataset()
+    if start in FAIL_LATE:
+        return False
+    ProcessL2.sliceAveOther(node, start, end, np.arange(end - start), ancGroup, sixSGroup)
+    return {'start': start, 'end': end, 'es': np.arange(start, end, dtype=float)}
+
+
+def _products(node, sasGroup, refGroup, ancGroup, uncGroup, esRawGroup, liRawGroup, ltRawGroup, sixSGroup, ensemble):
+    ''' The node updates of ProcessL2.ensembleProducts: outputs from the ensemble and the ancillary history '''
+    ancillary = node.getGroup('ANCILLARY').getDataset('WINDSPEED')
+    ancillary.datasetToColumns()
+    if ensemble['start'] in FAIL_PRODUCTS:
+        return False
+    grp = node.getGroup('REFLECTANCE')
+    ds = grp.getDataset('Rrs_HYPER') or grp.addDataset('Rrs_HYPER')
+    ds.attributes['Units'] = '1/sr'
+    for k, v in (('Datetag', 2021152.0), ('400.0', ensemble['es'].mean()),
+                 ('WIND', ancillary.columns['WINDSPEED'][-1]), ('HISTORY', np.sum(ancillary.columns['WINDSPEED']))):
+        ds.columns.setdefault(k, []).append(v)
+    ds.columnsToDataset()
+    return True
+
+
+def _reflectance(node, *args):
+    ensemble = _averages(node, *args)
+    if ensemble is False:
+        return False
+    return _products(node, *args[:-2], ensemble)
+
+
+class TestEnsembles(unittest.TestCase):
+    def setUp(self):
+        self.settings = ConfigFile.settings
+        ConfigFile.settings = dict(self.settings, fL2MCSeed=0, fL2MCTolerance=0, fL2MCMaxDraws=0)
+        self.addCleanup(setattr, ConfigFile, 'settings', self.settings)
+        patcher = mock.patch('Source.ProcessL2.logging.writeLogFileAndPrint')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_schedule(self):
+        rng = np.random.default_rng(0)
+        epoch = datetime.datetime(2021, 6, 1, 12, tzinfo=datetime.timezone.utc)
+        for trial in range(200):
+            n = int(rng.integers(1, 40))
+            steps = rng.choice([1.0, 2.0, 5.0, 30.0, 61.0], n)
+            timeStamp = [epoch + datetime.timedelta(seconds=float(s)) for s in np.cumsum(steps)]
+            interval = float(rng.choice([0, 1, 5, 60, 300, 3600]))
+            failures = rng.random(n + 1) < rng.choice([0, 0.3, 1])
+
+            legacy = []
+            def process(start, stop):
+                legacy.append((start, stop))
+                return not failures[start]
+            _legacyEnsembles(timeStamp, interval, process)
+
+            calls = []
+            def reflectance(node, *args):
+                calls.append(args[-2:])
+                return not failures[args[-2]]
+            with mock.patch.object(ProcessL2, 'ensemblesReflectance', side_effect=reflectance):
+                ProcessL2.ensemblesSerial(None, (None,) * 8, ProcessL2.ensembleSchedule(timeStamp, interval))
+            self.assertEqual(calls, legacy, (trial, n, interval))
+
+    @unittest.skipUnless(multiprocessing.get_start_method() == 'fork', 'Patched stages need forked workers')
+    def test_parallel_merge(self):
+        n = 40
+        inputGroups = (None, None,
+                       _group('ANCILLARY', 'WINDSPEED', {'WINDSPEED': np.linspace(2, 9, n).tolist(),
+                                                         'WINDFLAG': ['field', 'model'] * (n // 2)}, n),
+                       None, None, None, None,
+                       _group('SIXS_MODEL', 'direct_ratio', {'direct_ratio': np.linspace(0.6, 0.8, n).tolist()}, n))
+        schedule = [(start, start + 3, False) for start in range(0, n - 4, 3)] + [(n - 4, n - 1, True)]
+
+        nodes = []
+        for workers in (None, 2):
+            node = HDFRoot()
+            for gpID in ('IRRADIANCE', 'REFLECTANCE', 'ES_L1AQC'):
+                node.addGroup(gpID)
+            with mock.patch.object(ProcessL2, 'ensemblesReflectance', side_effect=_reflectance), \
+                    mock.patch.object(ProcessL2, 'ensembleAverages', side_effect=_averages), \
+                    mock.patch.object(ProcessL2, 'ensembleProducts', side_effect=_products):
+                if workers is None:
+                    ProcessL2.ensemblesSerial(node, inputGroups, schedule)
+                else:
+                    ProcessL2.ensemblesParallel(node, inputGroups, schedule, workers)
+            nodes.append(node)
+
+        serial, parallel = nodes
+        self.assertEqual(serial.attributes, parallel.attributes)
+        self.assertEqual([gp.id for gp in serial.groups], [gp.id for gp in parallel.groups])
+        for expected, gp in zip(serial.groups, parallel.groups):
+            self.assertEqual(list(expected.datasets), list(gp.datasets))
+            for dsID, ds in expected.datasets.items():
+                self.assertEqual(ds.attributes, gp.datasets[dsID].attributes)
+                self.assertEqual(ds.data.dtype, gp.datasets[dsID].data.dtype)
+                for k in ds.data.dtype.names:
+                    if ds.data.dtype[k].hasobject: # Datetime
+                        self.assertEqual(ds.data[k].tolist(), gp.datasets[dsID].data[k].tolist())
+                    else:
+                        self.assertEqual(ds.data[k].tobytes(), gp.datasets[dsID].data[k].tobytes(), (gp.id, dsID, k))
+        self.assertEqual(len(serial.getGroup('REFLECTANCE').getDataset('Rrs_HYPER').data), 9)
+
+
+if __name__ == '__main__':
+    unittest.main()
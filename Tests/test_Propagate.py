@@ -0,0 +1,179 @@
+import copy
+import unittest
+from unittest import mock
+import comet_maths as cm
+import numpy as np
+
+from Source.PIU.Breakdown_CB import PlotMaths
+from Source.PIU.Uncertainty_Analysis import Propagate, AdaptiveMCPropagation
+from Source.Weight_RSR import Weight_RSR
+
+
+waves = np.arange(350.0, 900.0, 3.3)
+
+
+class TestBandConv(unittest.TestCase):
+    def test_matches_weight_rsr(self):
+        rng = np.random.default_rng(0)
+        spectra = rng.uniform(0.5, 1.5, size=(3, len(waves)))
+        for platform, process, sensor in [('S3A', Weight_RSR.processSentinel3Bands, 'A'),
+                                          ('MOD-A', Weight_RSR.processMODISBands, 'A'),
+                                          ('VIIRS-N', Weight_RSR.processVIIRSBands, 'N')]:
+            for spectrum in spectra:
+                rad_band = process({str(k): [v] for k, v in zip(waves, spectrum)}, sensor=sensor)
+                expected = np.array(list(rad_band.values()), dtype=float).flatten()
+                np.testing.assert_allclose(Propagate.band_Conv(spectrum, waves, platform), expected, rtol=1e-12)
+            # leading axes are carried through
+            self.assertEqual(Propagate.band_Conv(spectra, waves, platform).shape, (3, len(expected)))
+
+    def test_propagate_batch(self):
+        prop = Propagate(M=2000, cores=1)
+        x = np.stack([np.ones(len(waves)), 2 * np.ones(len(waves))])
+        u = 0.01 * x
+        unc = prop.propagate_batch(prop.band_Conv_Sensor_S3A, [x, waves], [u, None], ['syst', None])
+        exact = np.abs(Propagate.band_Conv(u, waves, 'S3A'))
+        self.assertEqual(unc.shape, exact.shape)
+        np.testing.assert_allclose(unc, exact, rtol=0.1)
+
+    def test_correlate_samples(self):
+        prop = Propagate(M=50, cores=1)
+        rng = np.random.default_rng(0)
+        n = 24
+        means = [rng.uniform(1, 2, size=(3, 5)) for _ in range(n)]
+        uncs = [0.01 * m for m in means]
+        uncs[7][1] = 0  # inputs without an uncertainty at some elements
+        uncs[8][:, 2] = 0
+        samples = prop.MCP.generate_MC_sample(means, uncs, Propagate.corr_x_Instruments)
+        expected = cm.correlate_sample_corr(copy.deepcopy(samples), Propagate.corr_matrix_Default_Instruments)
+        for a, b in zip(prop.correlate_samples(list(samples), Propagate.corr_matrix_Default_Instruments), expected):
+            np.testing.assert_allclose(a, b, rtol=1e-12)
+
+    def test_propagate_sets(self):
+        rng = np.random.default_rng(0)
+        n = 6
+        means = [rng.uniform(900, 1100, n), rng.uniform(10, 20, n)] * 3 + [rng.uniform(0.9, 1.1, n) for _ in range(3)] \
+            + [np.ones(n)] * 15
+        uncs = [rng.uniform(1, 5, n), rng.uniform(0.1, 1, n)] * 3 + [rng.uniform(0.005, 0.02, n) for _ in range(18)]
+        pert = [u if i in (0, 2, 4) else np.zeros(n) for i, u in enumerate(uncs)]
+        prop = Propagate(M=4000, cores=1)
+        batch = prop.propagate_Instrument_Uncertainty_Batch(means, [uncs, pert])
+        self.assertEqual(len(batch), 2)
+        for unc, result in zip([uncs, pert], batch):
+            for expected, value in zip(prop.propagate_Instrument_Uncertainty(means, unc), result):
+                np.testing.assert_allclose(value, expected, rtol=0.15)
+
+    def test_propagate_sets_ensembles(self):
+        rng = np.random.default_rng(0)
+        n = 6
+        lw_means = [rng.uniform(900, 1100, n), rng.uniform(10, 20, n), rng.uniform(0.02, 0.03, n),
+                    rng.uniform(90, 110, n), rng.uniform(10, 20, n)] + [np.ones(n)] * 12
+        lw_uncs = [rng.uniform(1, 5, n) for _ in range(5)] + [rng.uniform(0.005, 0.02, n) for _ in range(12)]
+        # a second ensemble, stacked along a leading axis of every input
+        means = [np.stack([x, 2 * x]) for x in lw_means]
+        uncs = [np.stack([u, u]) for u in lw_uncs]
+        prop = Propagate(M=4000, cores=1)
+        uncertainty = prop.Propagate_Lw_HYPER_Batch(means, [uncs])
+        self.assertEqual(uncertainty.shape, (1, 2, n))
+        for ensemble in range(2):
+            expected = prop.Propagate_Lw_HYPER([x[ensemble] for x in means], [u[ensemble] for u in uncs])
+            np.testing.assert_allclose(uncertainty[0, ensemble], expected, rtol=0.15)
+
+    def test_drop_failed_draws(self):
+        sample = np.ones((4, 2))
+        sample[1] = np.nan
+        self.assertEqual(len(Propagate.drop_failed_draws(sample)), 3)
+
+
+class TestClassBasedBreakdown(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        n = 6
+        self.means = [rng.uniform(900, 1100, n), rng.uniform(10, 20, n), rng.uniform(0.02, 0.03, n),
+                      rng.uniform(90, 110, n), rng.uniform(10, 20, n)] + [np.ones(n)] * 12
+        self.uncs = [rng.uniform(1, 5, n) for _ in range(5)] + [rng.uniform(0.005, 0.02, n) for _ in range(12)]
+        self.prop = Propagate(M=200, cores=1)
+
+    def test_failing_class(self):
+        """ A class whose inputs cannot be correlated falls back on its own, and the total keeps the correlation """
+        correlate = Propagate.correlate_samples
+
+        def rho_only(samples, corr_between):
+            # the rho class (rho is the third Lw input) of a batch is not positive-definite
+            spread = np.stack([np.ptp(x, axis=0).reshape(x.shape[1], -1).any(axis=1) for x in samples])
+            if any(list(spread[:, i]) == [k == 2 for k in range(len(samples))] for i in range(spread.shape[1])):
+                raise ValueError("matrix is not positive definite")
+            return correlate(samples, corr_between)
+
+        calls = []
+
+        def propagate(vals, sets, corr_between=True):
+            calls.append((len(sets), corr_between))
+            return self.prop.Propagate_Lw_HYPER_Batch(vals, sets, corr_between)
+
+        classes = [np.where(np.arange(len(self.uncs))[:, None] == i, self.uncs, 0) for i in (0, 2, 5)]
+        with mock.patch.object(Propagate, 'correlate_samples', side_effect=rho_only), \
+                mock.patch('Source.PIU.Breakdown_CB.writeLogFileAndPrint') as log:
+            results = PlotMaths.propagateSets(propagate, self.means, classes, ['noise', 'rho', 'radcal'],
+                                              {'total': self.uncs})
+
+        log.assert_called_once()
+        self.assertIn('rho', log.call_args[0][0])
+        # the batch of classes, then each class with the correlation, rho without it, and the total with it
+        self.assertEqual(calls, [(3, True), (1, True), (1, True), (1, False), (1, True), (1, True)])
+        self.assertEqual(list(results), ['noise', 'rho', 'radcal', 'total'])
+        for key, unc in [('noise', classes[0]), ('radcal', classes[2]), ('total', self.uncs)]:
+            np.testing.assert_allclose(results[key], self.prop.Propagate_Lw_HYPER(self.means, unc), rtol=0.3)
+
+
+class TestAdaptiveMC(unittest.TestCase):
+    def setUp(self):
+        self.prop = Propagate(M=50, cores=1)
+        self.x = np.ones(len(waves))
+        self.state = np.random.get_state()
+
+    def tearDown(self):
+        AdaptiveMCPropagation.configure()
+        np.random.set_state(self.state)
+
+    def propagate(self):
+        return self.prop.band_Conv_Uncertainty([self.x, waves], [0.01 * self.x, None], 'S3A')
+
+    def test_seeded_draws_repeat(self):
+        AdaptiveMCPropagation.configure(seed=7)
+        AdaptiveMCPropagation.seed(3)
+        first = self.propagate()
+        AdaptiveMCPropagation.seed(3)
+        np.testing.assert_array_equal(self.propagate(), first)
+        AdaptiveMCPropagation.seed(4)
+        self.assertFalse(np.array_equal(self.propagate(), first))
+
+    def test_draws_until_converged(self):
+        AdaptiveMCPropagation.configure(seed=7, tolerance=0.01, max_draws=5000)
+        AdaptiveMCPropagation.seed(0)
+        unc = self.propagate()
+        draws = AdaptiveMCPropagation.draws_used()
+        self.assertEqual(draws['propagations'], 1)
+        self.assertTrue(100 <= draws['total'] <= 5000)
+        self.assertEqual(draws['total'] % 50, 0)
+        np.testing.assert_allclose(unc, np.abs(Propagate.band_Conv(0.01 * self.x, waves, 'S3A')), rtol=0.1)
+
+    def test_batch_draws_until_converged(self):
+        AdaptiveMCPropagation.configure(seed=7, tolerance=0.01, max_draws=5000)
+        AdaptiveMCPropagation.seed(0)
+        x = np.stack([self.x, 2 * self.x])
+        unc = self.prop.propagate_batch(self.prop.band_Conv_Sensor_S3A, [x, waves], [0.01 * x, None], ['syst', None])
+        draws = AdaptiveMCPropagation.draws_used()
+        self.assertEqual(draws['propagations'], 1)
+        self.assertTrue(100 <= draws['total'] <= 5000)
+        np.testing.assert_allclose(unc, np.abs(Propagate.band_Conv(0.01 * x, waves, 'S3A')), rtol=0.1)
+
+    def test_max_draws(self):
+        AdaptiveMCPropagation.configure(tolerance=1e-9, max_draws=120)
+        AdaptiveMCPropagation.seed(0)
+        self.propagate()
+        self.assertEqual(AdaptiveMCPropagation.draws_used()['total'], 100)
+        self.assertEqual(self.prop.MCP.MCsteps, 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import os
+import math
+import collections
+import unittest
+
+from Source.CalibrationFileReader import CalibrationFileReader
+from Source.HDFRoot import HDFRoot
+from Source.HDFGroup import HDFGroup
+from Source.RawSeaBirdReader import RawFileReader
+import Source.utils.loggingHCP as logging
+
+
+root = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+
+def _readRawFileLegacy(filepath, calibrationMap, contextMap, root):
+    ''' Original reader, one tag window at a time, replaced by RawFileReader.readRawFile '''
+
+    posframe = 1
+
+    # Note: Prosoft adds posframe=1 to the GPS for some reason
+    # print(contextMap.keys())
+    #gpsGroup = contextMap["$GPRMC"]
+    #ds = gpsGroup.getDataset("POSFRAME")
+    #ds.appendColumn(u"COUNT", posframe)
+    posframe += 1
+
+    with open(filepath, 'rb') as f:
+        while 1:
+            # Reads binary file to find message frame tag
+            pos = f.tell()
+            b = f.read(RawFileReader.MAX_TAG_READ)
+            f.seek(pos)
+
+            if "SATHSE" in str(b):
+                pass
+            if not b:
+                break
+
+            #print b
+            for i in range(0, RawFileReader.MAX_TAG_READ):
+                testString = b[i:].upper()
+                #print("test: ", testString[:6])
+
+                # Reset file position on max read
+                if i == RawFileReader.MAX_TAG_READ-1:
+                    #f.read(RawFileReader.MAX_TAG_READ)
+                    f.read(RawFileReader.RESET_TAG_READ)
+                    break
+
+                # Detects message type from frame tag
+                if testString.startswith(b"SATHDR"):
+                    #print("SATHDR")
+                    if i > 0:
+                        f.read(i)
+                    hdr = f.read(RawFileReader.SATHDR_READ)
+                    (k,v) = RawFileReader.readSATHDR(hdr)
+                    root.attributes[k] = v
+                    print(f"{k}: {v}")
+                    break
+                else:
+                    num = 0
+                    for key in calibrationMap:
+                        cf = calibrationMap[key]
+                        if testString.startswith(cf.id.upper().encode("utf-8")):
+                            if i > 0:
+                                f.read(i)
+
+                            pos = f.tell()
+                            msg = f.read(RawFileReader.MAX_BLOCK_READ)
+                            f.seek(pos)
+
+                            gp = contextMap[cf.id]
+                            # Only the first time through
+                            if len(gp.attributes) == 0:
+                                #gp.id += "_" + cf.id
+                                gp.id = key
+                                gp.attributes["CalFileName"] = key
+                                gp.attributes["FrameTag"] = cf.id
+
+                            # if key.startswith('SATPYR'):
+                            #     print('curious...')
+
+                            try:
+                                num = cf.convertRaw(msg, gp)
+                            except Exception:
+                                logging.writeLogFileAndPrint(f'Unable to convert the following raw message: {msg}')
+
+                            if num >= 0:
+                                # Generate POSFRAME
+                                ds = gp.getDataset("POSFRAME")
+                                if ds is None:
+                                    ds = gp.addDataset("POSFRAME")
+                                ds.appendColumn("COUNT", posframe)
+                                posframe += 1
+                                f.read(num)
+
+                            break
+                    if num > 0:
+                        break
+
+    RawFileReader.recoverTimeStamp(contextMap, root)
+
+
+def _read(reader, calibrationMap, fp):
+    contextMap = collections.OrderedDict()
+    for cf in calibrationMap.values():
+        gp = HDFGroup()
+        gp.id = cf.instrumentType
+        contextMap[cf.id] = gp
+    node = HDFRoot()
+    reader(fp, calibrationMap, contextMap, node)
+    return node, contextMap
+
+
+def _same(a, b):
+    if len(a) != len(b):
+        return False
+    for x, y in zip(a, b):
+        if type(x) is not type(y):
+            return False
+        if isinstance(x, float) and math.isnan(x) and math.isnan(y):
+            continue
+        if x != y:
+            return False
+    return True
+
+
+class TestRawSeaBirdReader(unittest.TestCase):
+    def setUp(self):
+        self.calibrationMap = CalibrationFileReader.read(
+            os.path.join(root, 'Config', 'sample_SEABIRD_SOLARTRACKER_Calibration'))
+        self.fp = os.path.join(root, 'Data', 'Sample_Data', 'SolarTracker', 'RAW',
+                               'KORUS_KR2016_NASA_20160520_060000.RAW')
+
+    def test_block_reader_matches_legacy(self):
+        legacyRoot, legacyContext = _read(_readRawFileLegacy, self.calibrationMap, self.fp)
+        newRoot, newContext = _read(RawFileReader.readRawFile, self.calibrationMap, self.fp)
+
+        self.assertEqual(list(legacyRoot.attributes.items()), list(newRoot.attributes.items()))
+        for key, legacyGp in legacyContext.items():
+            gp = newContext[key]
+            self.assertEqual(legacyGp.id, gp.id)
+            self.assertEqual(list(legacyGp.attributes.items()), list(gp.attributes.items()))
+            self.assertEqual(list(legacyGp.datasets.keys()), list(gp.datasets.keys()))
+            for dsName, ds in legacyGp.datasets.items():
+                self.assertEqual(list(ds.columns.keys()), list(gp.datasets[dsName].columns.keys()))
+                for col, values in ds.columns.items():
+                    self.assertTrue(_same(values, gp.datasets[dsName].columns[col]), f'{key} {dsName} {col}')
+
+    def test_layout_is_cached(self):
+        _read(RawFileReader.readRawFile, self.calibrationMap, self.fp)
+        layouts = {key: cf.frameLayout for key, cf in self.calibrationMap.items()}
+        _read(RawFileReader.readRawFile, self.calibrationMap, self.fp)
+        for key, cf in self.calibrationMap.items():
+            self.assertIs(cf.frameLayout, layouts[key])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+import xarray as xr
+
+import Source.RhoCorrections as RhoCorrections
+import Source.utils.caching as caching
+
+
+AXES = {'wind': np.arange(0, 16.0, 3), 'aot': np.array([0, 0.1, 0.2, 0.5]), 'sza': np.arange(0, 70.0, 10),
+        'relAz': np.arange(80, 150.0, 15), 'sal': np.array([0, 20, 40.0]), 'SST': np.array([0, 15, 30.0]),
+        'wavelength': np.arange(350, 1001, 25.0)}
+
+
+def glint(sva, wind, aot, sza, relAz, sal, sst, wavelength):
+    ''' Linear in every input, so the grid interpolation is exact '''
+    return 0.02 + 1e-3 * wind + 0.01 * aot + 1e-4 * sza + 1e-5 * relAz + 1e-5 * sal + 2e-5 * sst + 1e-6 * wavelength + 1e-4 * sva
+
+
+class TestZ17Grid(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        for sva in (30, 40):
+            grid = np.meshgrid(*AXES.values(), indexing='ij')
+            xr.Dataset({'Glint': (tuple(AXES), glint(sva, *grid))}, coords=AXES).to_netcdf(
+                os.path.join(directory.name, f'Z17_LUT_{sva}.nc'))
+        patch = mock.patch.object(RhoCorrections, 'PATH_TO_DATA', directory.name)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.addCleanup(caching.evict)
+        self.waveBands = np.arange(352.0, 998, 3.1)
+
+    def test_scalar_and_batch(self):
+        rho = RhoCorrections.RhoCorrections.Z17GridRho(7.3, 0.13, 33, 21.0, 31.0, 101, 35, self.waveBands)
+        np.testing.assert_allclose(rho, glint(35, 7.3, 0.13, 33, 101, 31, 21, self.waveBands), rtol=1e-7)
+
+        winds = np.array([0.0, 7.3, 15.0])
+        batch = RhoCorrections.RhoCorrections.Z17GridRho(winds, 0.13, 33, 21.0, 31.0, 101, 40, self.waveBands)
+        self.assertEqual(batch.shape, (3, len(self.waveBands)))
+        np.testing.assert_allclose(batch, glint(40, winds[:, None], 0.13, 33, 101, 31, 21, self.waveBands), rtol=1e-7)
+
+        self.assertRaises(RhoCorrections.InterpolationError, RhoCorrections.RhoCorrections.Z17GridRho,
+                          17, 0.13, 33, 21.0, 31.0, 101, 40, self.waveBands)
+
+    def test_validate(self):
+        def fullModel(env, sensor, round4cache=False, DB=None):
+            return {'rho': glint(sensor['ang'][0], env['wind'], env['od'], env['zen_sun'], 180 - sensor['ang'][1],
+                                 env['sal'], env['wtem'], sensor['wv'])}
+
+        with mock.patch.object(RhoCorrections, 'get_sky_sun_rho', side_effect=fullModel) as full, \
+                mock.patch.dict(RhoCorrections.ConfigFile.settings, {'bL2Z17Fast': 1}):
+            report = RhoCorrections.RhoCorrections.validateZ17Grid(self.waveBands, sva=30, n=5, seed=1)
+            # The full model is the one ZhangCorr runs with the grid switched off, which is switched back on after
+            self.assertEqual(full.call_count, 5)
+            self.assertEqual(RhoCorrections.ConfigFile.settings['bL2Z17Fast'], 1)
+        self.assertEqual(report['full'].shape, (5, len(self.waveBands)))
+        self.assertLess(report['maxAbsDiff'], 1e-6)
+        np.testing.assert_allclose(report['fast'], report['full'], rtol=1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+
+from Source.SB_support import readSB, readSBCached
+
+
+root = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+HEADER = '/begin_header\n/missing=-9999\n/delimiter=comma\n/fields=station,year,lat\n/units=none,yyyy,degrees\n/end_header\n'
+
+
+class TestReadSB(unittest.TestCase):
+    def assertSameData(self, expected, fast):
+        self.assertEqual(expected.length, fast.length)
+        self.assertEqual(list(expected.data), list(fast.data))
+        for k, values in expected.data.items():
+            if isinstance(fast.data[k], np.ndarray):
+                np.testing.assert_array_equal(np.array(values, dtype=float), fast.data[k])
+            else:
+                self.assertEqual([type(v) for v in values], [type(v) for v in fast.data[k]])
+                np.testing.assert_equal(values, fast.data[k])
+
+    def write(self, text):
+        fd, fp = tempfile.mkstemp(suffix='.sb')
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+        self.addCleanup(os.remove, fp)
+        return fp
+
+    def test_fast_matches_lines(self):
+        fp = os.path.join(root, 'Data', 'Sample_Data', 'SoRad', 'Robot_Shakedown_Ancillary.sb')
+        expected = readSB(fp, no_warn=True)
+        fast = readSB(fp, no_warn=True, fast=True)
+        self.assertSameData(expected, fast)
+        self.assertEqual(fast.data['year'].dtype, np.int64)
+        self.assertEqual(expected.fd_datetime(), fast.fd_datetime())
+
+    def test_fast_text_and_ragged(self):
+        fp = self.write(HEADER + 'A1,2016,-9999\nB2,2017,34.5\n')
+        fast = readSB(fp, no_warn=True, fast=True)
+        self.assertSameData(readSB(fp, no_warn=True), fast)
+        self.assertEqual(fast.data['station'], ['A1', 'B2'])
+
+        # Text mixed with numbers and missing values
+        fp = self.write(HEADER + 'A1,2016,34.5\n5,2017,-9999\n-9999,2018,36\n2.5,2019,37\n')
+        fast = readSB(fp, no_warn=True, fast=True)
+        self.assertSameData(readSB(fp, no_warn=True), fast)
+        self.assertEqual(fast.data['station'][:2], ['A1', 5])
+
+        fp = self.write(HEADER + '1,2016,34.5\n2,2017\n')
+        self.assertSameData(readSB(fp, no_warn=True), readSB(fp, no_warn=True, fast=True))
+
+    def test_cached(self):
+        fp = self.write(HEADER + '1,2016,34.5\n')
+        first = readSBCached(fp, no_warn=True)
+        self.assertIs(readSBCached(fp, no_warn=True), first)
+        self.assertFalse(first.data['lat'].flags.writeable)
+
+        with open(fp, 'a') as f:
+            f.write('2,2017,35.5\n')
+        os.utime(fp, ns=(0, os.stat(fp).st_mtime_ns + 10**9))
+        self.assertEqual(readSBCached(fp, no_warn=True).length, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+import numpy as np
+
+from Source.HDFDataset import HDFDataset
+from Source.SeaBASSWriter import SeaBASSWriter
+
+
+class TestFormatData(unittest.TestCase):
+    def setUp(self):
+        self.ds = HDFDataset()
+        self.ds.columns['Datetag'] = [2021150.0, 2021150.0]
+        self.ds.columns['Timetag2'] = [120005000.0, 130510000.0]
+        self.ds.columns['400.0'] = [1.5, np.nan]
+        self.ds.columns['402.5'] = [2.25, 3.0]
+        for k, v in [('LATITUDE', 36.5), ('LONGITUDE', -75.25), ('AOD', 0.1), ('CLOUD', np.nan), ('SZA', 30.0),
+                     ('REL_AZ', 135.0), ('HEADING', 0.0), ('SOLAR_AZ', 180.0), ('WIND', 5.0), ('BINCOUNT', 12)]:
+            self.ds.columns[k] = [v, v]
+        self.ds.columnsToDataset()
+        self.delta = HDFDataset()
+        self.delta.columns['Datetag'] = [2021150.0, 2021150.0]
+        self.delta.columns['Timetag2'] = [120005000.0, 130510000.0]
+        self.delta.columns['400.0'] = [0.015, 0.02]
+        self.delta.columns['402.5'] = [0.0225, np.nan]
+        self.delta.columnsToDataset()
+        self.delta.datasetToColumns()
+
+    def test_rows(self):
+        rows, fields, units = SeaBASSWriter.formatData2(self.ds, self.delta, 'es', 'uW/cm^2/nm')
+        self.assertEqual(fields, 'date,time,lat,lon,RelAz,SZA,AOT,cloud,wind,bincount,'
+                                 'Es400.0,Es402.5,Es400.0_unc,Es402.5_unc')
+        self.assertEqual(units, 'yyyymmdd,hh:mm:ss,degrees,degrees,degrees,degrees,unitless,%,m/s,none,'
+                                'uW/cm^2/nm,uW/cm^2/nm,uW/cm^2/nm,uW/cm^2/nm')
+        self.assertEqual(rows, [
+            '20210530,12:00:05,36.5000,-75.2500,135.0,30.0,0.1000,-9999,5.0,12,1.500000,2.250000,0.015000,0.022500',
+            '20210530,13:05:10,36.5000,-75.2500,135.0,30.0,0.1000,-9999,5.0,12,-9999.000000,3.000000,0.020000,-9999.000000'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+import numpy as np
+
+from Source.PIU.UncertaintyContext import UncertaintyContext
+from Source.PIU.utils import utils
+
+
+class TestUncertaintyContext(unittest.TestCase):
+    def setUp(self):
+        self.calls = 0
+
+    def build(self):
+        self.calls += 1
+        return np.arange(3)
+
+    def tearDown(self):
+        UncertaintyContext.end()
+
+    def test_inactive_builds_every_time(self):
+        UncertaintyContext.get(('table',), self.build)
+        UncertaintyContext.get(('table',), self.build)
+        self.assertEqual(self.calls, 2)
+
+    def test_reuse_and_counters(self):
+        UncertaintyContext.begin()
+        first = UncertaintyContext.get(('table',), self.build)
+        self.assertIs(UncertaintyContext.get(('table',), self.build), first)
+        self.assertIs(UncertaintyContext.propagator(10, cores=1), UncertaintyContext.propagator(10, cores=1))
+        self.assertIsNot(UncertaintyContext.propagator(10, cores=1), UncertaintyContext.propagator(20, cores=1))
+        self.assertEqual(self.calls, 1)
+
+        stats = UncertaintyContext.end()
+        self.assertEqual((stats['table']['built'], stats['table']['reused']), (1, 1))
+        self.assertEqual((stats['Propagate']['built'], stats['Propagate']['reused']), (2, 2))
+        self.assertEqual((stats['total']['built'], stats['total']['reused']), (3, 3))
+
+    def test_collect_and_merge(self):
+        UncertaintyContext.begin()
+        first = UncertaintyContext.get(('table',), self.build)
+        UncertaintyContext.get(('table',), self.build)
+        counts = UncertaintyContext.collect()
+        # Entries are kept for the next tasks of a worker, counters start again
+        self.assertIs(UncertaintyContext.get(('table',), self.build), first)
+        self.assertEqual(UncertaintyContext.collect()['table']['reused'], 1)
+
+        UncertaintyContext.begin()
+        UncertaintyContext.merge(counts)
+        UncertaintyContext.merge(counts)
+        stats = UncertaintyContext.end()
+        self.assertEqual((stats['table']['built'], stats['table']['reused']), (2, 2))
+
+    def test_new_source_drops_entries(self):
+        UncertaintyContext.begin()
+        source = object()
+        UncertaintyContext.get(('table',), self.build, source)
+        UncertaintyContext.get(('table',), self.build, source)
+        UncertaintyContext.get(('table',), self.build, object())
+        self.assertEqual(self.calls, 2)
+
+
+class TestCosAsymmetry(unittest.TestCase):
+    def test_matches_loop(self):
+        rng = np.random.default_rng(0)
+        cos = rng.normal(scale=0.03, size=(255, 47))
+        cos_90 = rng.normal(scale=0.03, size=(255, 47))
+
+        expected = np.zeros(cos.shape, float)
+        for i in range(255):
+            for j in range(45):
+                expected[i, j] = np.std([cos[i, j], cos_90[i, j], cos[i, -j], cos_90[i, -j]])
+
+        np.testing.assert_array_equal(utils.cos_asymmetry_err(cos, cos_90), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import os
+import unittest
+import numpy as np
+from scipy.interpolate import InterpolatedUnivariateSpline
+
+from Source.Weight_RSR import Weight_RSR
+
+
+root = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+
+def _loopBand(hyperspecData, rsrFile, skiprows, field):
+    ''' Per-wavelength weighted mean of one band, as the original dictionary loop '''
+    data = np.loadtxt(os.path.join(root, rsrFile), skiprows=skiprows)
+    wvInterp = [float(k) for k in hyperspecData]
+    column = Weight_RSR.MODISBands().index(field) + 1
+    response = InterpolatedUnivariateSpline(data[:, 0], data[:, column], k=1)(wvInterp)
+    n = len(list(hyperspecData.values())[0])
+    result = []
+    for i in range(n):
+        srf_sum, c_sum = 0, 0.0
+        for j, wv in enumerate(wvInterp):
+            if str(wv) in hyperspecData:
+                srf_sum += hyperspecData[str(wv)][i] * response[j]
+                c_sum += response[j]
+        result.append(srf_sum / c_sum if c_sum else 0)
+    return result
+
+
+class TestWeightRSR(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        os.chdir(root)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+
+    def test_matches_loop(self):
+        rng = np.random.default_rng(0)
+        keys = [str(w) for w in np.round(np.arange(400, 700, 2.5), 2)] + ['705', '710.0']
+        data = {k: rng.uniform(size=3).tolist() for k in keys}
+        data['450.0'][1] = np.nan
+        bands = Weight_RSR.processMODISBands(data, sensor='A')
+        self.assertEqual(list(bands), ['412', '443', '469', '488', '531', '551', '555', '645', '667', '678'])
+        for field in [412, 443, 678]:
+            np.testing.assert_allclose(bands[str(field)], _loopBand(data, 'Data/HMODISA_RSRs.txt', 7, field), rtol=1e-12)
+
+    def test_matrix_over_time(self):
+        rng = np.random.default_rng(1)
+        keys = [str(float(w)) for w in range(350, 901)]
+        spectra = rng.uniform(size=(4, len(keys)))
+        fields, bands = Weight_RSR.convolveMatrix(spectra, keys, 'Sentinel3', 'A')
+        expected = Weight_RSR.processSentinel3Bands({k: spectra[:, i].tolist() for i, k in enumerate(keys)})
+        self.assertEqual(fields, list(expected))
+        np.testing.assert_allclose(bands.T, np.array(list(expected.values())), rtol=1e-12)
+        # a single value per wavelength, as rho
+        single = Weight_RSR.processSentinel3Bands({k: spectra[0, i] for i, k in enumerate(keys)})
+        np.testing.assert_allclose(np.array(list(single.values())).flatten(), bands[0], rtol=1e-12)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+import xarray as xr
+from scipy.interpolate import interpn
+
+from Source.MainConfig import MainConfig
+import Source.ZhangRho as ZhangRho
+
+
+class TestZhangStore(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.addCleanup(ZhangRho.clear_memory)
+
+    def database(self):
+        fp = os.path.join(self.dir.name, 'db.mat')
+        xr.Dataset({'skyrad0': (('a', 'b', 'c', 'd'), self.rng.random((4, 5, 3, 2))),
+                    'sunrad0': (('a', 'c', 'd'), self.rng.random((4, 3, 2))),
+                    'Radiance_BOA_sca': (('e', 'f'), self.rng.random((2, 3))),
+                    'Radiance_BOA_vec': (('e', 'f'), self.rng.random((2, 3)))}).to_netcdf(fp, engine='netcdf4')
+        for group, keys in ZhangRho.SMALL_TABLES.items():
+            xr.Dataset({k: (('x', 'y'), self.rng.random((1, 3))) for k in keys}).to_netcdf(
+                fp, group=group, mode='a', engine='netcdf4')
+        return fp
+
+    def test_store_round_trip(self):
+        fp = self.database()
+        store = os.path.join(self.dir.name, 'store')
+        ZhangRho.load(store, fp)
+        expected = ZhangRho._read_database(fp)
+        self.assertIsInstance(ZhangRho.skyrad0, np.memmap)
+        self.assertFalse(ZhangRho.skyrad0.flags.writeable)
+        np.testing.assert_array_equal(ZhangRho.skyrad0, expected['skyrad0'])
+        np.testing.assert_array_equal(ZhangRho.sdb['wv'], expected['sdb']['wv'])
+
+    def test_store_opt_in(self):
+        fp = self.database()
+        store = os.path.join(self.dir.name, 'store')
+        expected = ZhangRho._read_database(fp)
+        # No store unless one is configured
+        with mock.patch.dict(MainConfig.settings, {'z17StoreDir': ''}):
+            ZhangRho.load(db_path=fp)
+        self.assertNotIsInstance(ZhangRho.skyrad0, np.memmap)
+        np.testing.assert_array_equal(ZhangRho.skyrad0, expected['skyrad0'])
+
+        # Short of disk space: in memory, nothing written
+        with mock.patch.dict(MainConfig.settings, {'z17StoreDir': store}), \
+                mock.patch('shutil.disk_usage', return_value=mock.Mock(free=100)):
+            ZhangRho.load(db_path=fp)
+        self.assertNotIsInstance(ZhangRho.skyrad0, np.memmap)
+        np.testing.assert_array_equal(ZhangRho.rad_boa_vec, expected['rad_boa_vec'])
+        self.assertEqual(os.listdir(store), [])
+
+    def test_slab_interpolation(self):
+        zen_sun, od, wv = np.arange(0, 70, 10.0), np.array([0, 0.05, 0.1, 0.2, 0.3, 0.5]), np.linspace(350, 1000, 40)
+        ZhangRho.db = {'zen_sun': zen_sun, 'od': od, 'wv': wv}
+        ZhangRho.skyrad0 = self.rng.random((7, 6, 50, 40))
+        sensor_wv = np.sort(self.rng.uniform(350, 1000, 25))
+        for z, o in ((23.4, 0.07), (60, 0.5), (20, 0.1)):
+            xi = np.array([(z, o, i, w) for i in range(50) for w in sensor_wv])
+            expected = interpn((zen_sun, od, np.arange(50), wv), ZhangRho.skyrad0, xi).reshape(50, 25)
+            np.testing.assert_allclose(ZhangRho.interp_skyrad(z, o, sensor_wv), expected, rtol=1e-12)
+
+        grid = (np.linspace(0, 15, 7), od, zen_sun, wv, np.linspace(0, 80, 9), np.linspace(0, 180, 10))
+        table = self.rng.random(tuple(len(g) for g in grid))
+        xi = np.column_stack([np.full(30, 7.2), np.full(30, 0.12), np.full(30, 31.0)] +
+                             [self.rng.uniform(g[0], g[-1], 30) for g in grid[3:]])
+        np.testing.assert_array_equal(ZhangRho.interpn_slab(grid, table, xi), interpn(grid, table, xi))
+        xi[0, 0] = 16
+        self.assertRaises(ValueError, ZhangRho.interpn_slab, grid, table, xi)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+
+import Source.utils.caching as caching
+from Source.Weight_RSR import Weight_RSR
+
+
+class TestLUTCache(unittest.TestCase):
+    def setUp(self):
+        caching.evict()
+        caching.resetStats()
+        self.calls = 0
+
+    def _loader(self):
+        self.calls += 1
+        return {'values': np.arange(4.0)}
+
+    def test_loaded_once(self):
+        first = caching.getLUT('table', self._loader)
+        second = caching.getLUT('table', self._loader)
+        self.assertIs(first, second)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(caching.stats()['table'], {'hits': 1, 'misses': 1, 'loaded': True})
+        with self.assertRaises(ValueError):
+            first['values'][0] = 1.0
+
+    def test_evict(self):
+        caching.getLUT('table', self._loader)
+        self.assertEqual(caching.evict('table'), 1)
+        self.assertEqual(caching.evict('table'), 0)
+        caching.getLUT('table', self._loader)
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(caching.stats()['total']['misses'], 2)
+
+    def test_none_not_cached(self):
+        self.assertIsNone(caching.getLUT('missing', lambda: None))
+        self.assertEqual(caching.stats()['total']['loaded'], 0)
+
+    def test_rsr(self):
+        hyperspec = {str(wave): [1.0, 2.0] for wave in np.arange(400.0, 700.0, 1.0)}
+        bands = Weight_RSR.processMODISBands(hyperspec, sensor='A')
+        again = Weight_RSR.processMODISBands(hyperspec, sensor='A')
+        self.assertEqual(bands, again)
+        stats = caching.stats()
+        # The RSR table is read once, into a band matrix that the second call reuses
+        self.assertEqual(stats['Data/HMODISA_RSRs.txt']['misses'], 1)
+        self.assertEqual(stats[('bandMatrix', 'Data/HMODISA_RSRs.txt', tuple(hyperspec))]['hits'], 1)
+
+
+class TestStoredResults(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.calls = 0
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _compute(self):
+        self.calls += 1
+        return {'direct': np.linspace(0.0, 1.0, 5), 'diffuse': np.full(5, np.nan)}
+
+    def test_stored_once(self):
+        key = ('1.0', 30.1, 2, 15, (400.0, 500.0))
+        first = caching.getStored(self.tmp.name, key, self._compute)
+        second = caching.getStored(self.tmp.name, key, self._compute)
+        self.assertEqual(self.calls, 1)
+        np.testing.assert_array_equal(first['direct'], second['direct'])
+        np.testing.assert_array_equal(first['diffuse'], second['diffuse'])
+        caching.getStored(self.tmp.name, key[:-1] + ((400.0, 501.0),), self._compute)
+        self.assertEqual(self.calls, 2)
+
+    def test_unwritable_directory(self):
+        # A store directory that cannot be created still returns the computed result
+        blocker = os.path.join(self.tmp.name, 'file')
+        open(blocker, 'w', encoding='utf-8').close()
+        result = caching.getStored(os.path.join(blocker, 'store'), ('key',), self._compute)
+        np.testing.assert_array_equal(result['direct'], np.linspace(0.0, 1.0, 5))
+        self.assertEqual(os.listdir(self.tmp.name), ['file'])
+
+
+if __name__ == '__main__':
+    unittest.main()
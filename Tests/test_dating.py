@@ -0,0 +1,58 @@
+import unittest
+import datetime
+import numpy as np
+
+from Source.HDFGroup import HDFGroup
+import Source.utils.dating as dating
+
+
+class TestDateTime(unittest.TestCase):
+    def setUp(self):
+        self.t0 = datetime.datetime(2021, 5, 30, tzinfo=datetime.timezone.utc)
+
+    def group(self, dateTime):
+        gp = HDFGroup()
+        gp.id = 'ES'
+        gp.addDataset('DATETIME').data = dateTime
+        gp.addDataset('ES').data = np.arange(len(dateTime))
+        return gp
+
+    def test_tags_match_scalar(self):
+        dateTag = [2021150.0, 2020366.0, 2024001.0, 2021150.0, 1850001.0, 2021000.0, 2021366.0, 2021150.0]
+        timeTag2 = [123456789.0, 235959999.0, 1000.0, 0.0, 120000000.0, 120000000.0, 120000000.0, 246000000.0]
+        stamps, valid = dating.tagsToDatetime64(dateTag, timeTag2)
+        np.testing.assert_array_equal(valid, [True, True, True, False, False, False, False, False])
+
+        expected = [dating.timeTag2ToDateTime(dating.dateTagToDateTime(d), t) for d, t in zip(dateTag[:3], timeTag2[:3])]
+        self.assertEqual(dating.datetime64ToDatetime(stamps[valid]), expected)
+
+    def test_screen_deletes_all_bad_records(self):
+        gp = HDFGroup()
+        gp.id = 'ES'
+        for name, values in (('DATETAG', [2021150.0] * 4), ('TIMETAG2', [np.nan, 120000000.0, 0.0, 120001000.0])):
+            ds = gp.addDataset(name)
+            ds.columns['NONE'] = values
+            ds.columnsToDataset()
+        dating.groupAddDateTime(gp)
+        self.assertEqual(gp.getDataset('TIMETAG2').data['NONE'].tolist(), [120000000.0, 120001000.0])
+        self.assertEqual(len(gp.getDataset('DATETIME').data), 2)
+
+    def test_fix_and_sort(self):
+        seconds = [0, 2, 1, 2, 3, 3, 5]
+        gp = self.group([self.t0 + datetime.timedelta(seconds=s) for s in seconds])
+        self.assertTrue(dating.fixDateTime(gp))
+        np.testing.assert_array_equal(gp.getDataset('ES').data, [0, 1, 4, 6])
+
+        gp = self.group([self.t0 + datetime.timedelta(seconds=s) for s in seconds])
+        dating.sortDateTime(gp)
+        np.testing.assert_array_equal(gp.getDataset('ES').data, [0, 2, 1, 4, 6])
+
+    def test_gaps(self):
+        dt1 = [self.t0 + datetime.timedelta(seconds=s) for s in range(10)]
+        dt2 = [self.t0 + datetime.timedelta(seconds=s) for s in (0, 1, 5, 6)]
+        self.assertEqual(dating.findGaps_dateTime(dt1, dt2, 1), [[dt1[3], dt1[3]], [dt1[8], dt1[9]]])
+        self.assertFalse(dating.findGaps_dateTime(dt1, [self.t0 + datetime.timedelta(hours=1)], 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
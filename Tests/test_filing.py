@@ -0,0 +1,150 @@
+import os
+import glob
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+
+import Source.utils.caching as caching
+import Source.utils.filing as filing
+import Source.utils.loggingHCP as logging
+from Source.HDFGroup import HDFGroup
+
+
+root = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+
+def _read_char_legacy(filepath: str, gp) -> None:
+    ''' Line-by-line reader replaced by filing.read_char, the reference it is tested against '''
+    begin_data = False  # set up data flag
+    attrs = {}
+    end_count = 0
+    Azimuth_angle = None
+    solar_zen_range = None
+
+    with open(filepath, 'r', encoding="utf-8") as f:  # open file
+        key, ds, name = None, None, None
+        while True:  # start loop
+            line = filing.getline(f, '\n')  # reads the file until a '\n' character is reached
+            if not line:  # breaks out of loop if three empty lines in a row
+                if end_count < 3:
+                    end_count += 1
+                else:
+                    return "end condition reached"
+            elif not line.startswith('#'):  # not a comment
+                end_count = 0
+                if begin_data:
+                    if 'end' in line.lower():  # end conditions met
+                        begin_data = False  # set to read header data
+                        ds.columnsToDataset()  # convert read data to dataset
+                    else:
+                        filing.parseLine_no_index(line, ds)  # add the data
+                else:  # part of header
+                    if line.startswith('!'):  # get filetype from ! comment
+                        if line != '!FRM4SOC_CP':
+                            gp.attributes['CHARACTERISATION_FILE_TYPE'] = line[1:]
+                    elif any([k in line.lower() for k in ['data', 'lsf', 'uncertainty', 'coserror']]) is True:
+                    # elif ['data', 'lsf', 'uncertainty'] in line.lower():  # begin reading data
+                        begin_data = True
+                        attrs['DATA_TYPE'] = line[1:line.lower().find('data')]
+                        ds = gp.addDataset(f"{name}_{attrs['DATA_TYPE']}")
+                        if ds is None:
+                            if 'AZIMUTH_ANGLE' in attrs:  # reading angular file and has identical identifiers for different az angles
+                                ds = gp.addDataset(f"{name}_{attrs['DATA_TYPE']}_AZ{attrs['AZIMUTH_ANGLE']}")
+                                Azimuth_angle = attrs['AZIMUTH_ANGLE']
+                            elif 'SOLAR_ZENITH_ANGLE_RANGE' in attrs:
+                                ds = gp.addDataset(f"{name}_{attrs['DATA_TYPE']}_RANGE{attrs['SOLAR_ZENITH_ANGLE_RANGE']}")
+                                solar_zen_range = attrs['SOLAR_ZENITH_ANGLE_RANGE']
+                            elif Azimuth_angle is not None:  # uncertainty also repeated so save the az angle from earlier to use here
+                                ds = gp.addDataset(f"{name}_{attrs['DATA_TYPE']}_AZ{Azimuth_angle}")
+                                Azimuth_angle = None
+                            elif solar_zen_range is not None:
+                                ds = gp.addDataset(f"{name}_{attrs['DATA_TYPE']}_RANGE{solar_zen_range}")
+                                solar_zen_range = None
+                            else:
+                                logging.writeLogFileAndPrint(f"Dataset could not be constructed. Utilties.read_char(file-path, HDFGroup) in {gp.attributes['CHARACTERISATION_FILE_TYPE']}")
+                                raise KeyError  # TODO: write custom exception for this case, with description of how to fix (SZA_range or AZ ang not in char file)
+                        # populate ds attributes with header data
+                        for k, v in attrs.items():
+                            ds.attributes[k] = v  # set the attributes
+                        attrs.clear()
+
+                    else:  # part of header, check if attribute or column names
+                        if line.startswith('['):  # if line has '[ ]' then take the next line as the attribute
+                            key = line[1:-1]
+                        elif key is not None:
+                            attrs[key] = line
+                            if key.lower() == "device":
+                                device = line.rstrip()
+                                name = device + '_' + gp.attributes['CHARACTERISATION_FILE_TYPE']
+                            key = None
+
+
+def _read(reader, files):
+    gp = HDFGroup()
+    for fp in files:
+        reader(fp, gp)
+    return gp
+
+
+class TestReadChar(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cacheDir = filing.CHAR_CACHE_DIR
+        filing.CHAR_CACHE_DIR = self.tmp.name
+        caching.evict()
+        self.files = sorted(glob.glob(os.path.join(root, 'Data', 'FidRadDB', 'SeaBird', 'CP_SAT0385_*')))
+        self.files += sorted(glob.glob(os.path.join(root, 'Data', 'Class_Based_Characterizations', 'SeaBird_initial', '*')))
+
+    def tearDown(self):
+        filing.CHAR_CACHE_DIR = self.cacheDir
+        caching.evict()
+        self.tmp.cleanup()
+
+    def assertSameGroup(self, legacy, gp):
+        self.assertEqual(list(legacy.attributes.items()), list(gp.attributes.items()))
+        self.assertEqual(list(legacy.datasets.keys()), list(gp.datasets.keys()))
+        for k, ds in legacy.datasets.items():
+            self.assertEqual(list(ds.attributes.items()), list(gp.datasets[k].attributes.items()))
+            self.assertEqual(list(ds.columns.keys()), list(gp.datasets[k].columns.keys()))
+            for col, values in ds.columns.items():
+                np.testing.assert_array_equal(np.array(values), np.array(gp.datasets[k].columns[col]))
+            if ds.data is None:
+                self.assertIsNone(gp.datasets[k].data)
+            else:
+                self.assertEqual(ds.data.dtype, gp.datasets[k].data.dtype)
+                np.testing.assert_array_equal(ds.data, gp.datasets[k].data)
+
+    def test_matches_legacy(self):
+        legacy = _read(_read_char_legacy, self.files)
+        self.assertSameGroup(legacy, _read(filing.read_char, self.files))
+        # Parsed files are reused from memory, then from disk
+        self.assertSameGroup(legacy, _read(filing.read_char, self.files))
+        caching.evict()
+        self.assertSameGroup(legacy, _read(filing.read_char, self.files))
+        self.assertEqual(len(os.listdir(self.tmp.name)), len(self.files))
+
+    def test_hashed_on_miss_only(self):
+        fp = os.path.join(self.tmp.name, os.path.basename(self.files[0]))
+        shutil.copyfile(self.files[0], fp)
+        with mock.patch.object(filing, 'md5', wraps=filing.md5) as md5:
+            _read(filing.read_char, [fp])
+            _read(filing.read_char, [fp])
+            self.assertEqual(md5.call_count, 1)
+            # A touched file is looked up again, and found on disk under its md5
+            os.utime(fp, ns=(0, 0))
+            gp = _read(filing.read_char, [fp])
+            self.assertEqual(md5.call_count, 2)
+        self.assertSameGroup(_read(_read_char_legacy, [fp]), gp)
+
+    def test_copies_are_independent(self):
+        first = _read(filing.read_char, self.files[:1])
+        ds = next(iter(first.datasets.values()))
+        ds.data[0] = ds.data[1]
+        next(iter(ds.columns.values())).append(0.0)
+        self.assertSameGroup(_read(_read_char_legacy, self.files[:1]), _read(filing.read_char, self.files[:1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+import datetime
+import numpy as np
+
+from Source.ConfigFile import ConfigFile
+import Source.utils.filtering as filtering
+
+
+class TestDeglitchBands(unittest.TestCase):
+    def setUp(self):
+        ConfigFile.settings['bL1aqcThreshold'] = 1
+        rng = np.random.default_rng(0)
+        self.bands = np.linspace(350, 800, 20)
+        self.data = 100 + np.cumsum(rng.normal(0, 1, (300, len(self.bands))), axis=0)
+        self.data[rng.integers(0, 300, 20), rng.integers(0, len(self.bands), 20)] += 50
+
+    def _compare(self, lightDark, window):
+        masks = filtering.deglitchBands(self.bands, self.data, window, 2.7, lightDark, 90, 110, self.bands[5])
+        for j, band in enumerate(self.bands):
+            perBand = filtering.deglitchBand(band, self.data[:, j].tolist(), window, 2.7, lightDark, 90, 110, self.bands[5])
+            for mask, expected in zip(masks, perBand):
+                np.testing.assert_array_equal(mask[:, j], np.asarray(expected, dtype=bool))
+
+    def test_dark_matches_per_band(self):
+        self._compare('Dark', 11)
+
+    def test_light_matches_per_band(self):
+        self._compare('Light', 5)
+
+
+class TestBadTimeIntervals(unittest.TestCase):
+    def setUp(self):
+        t0 = datetime.datetime(2020, 1, 1)
+        self.timeStamp = [t0 + datetime.timedelta(seconds=i) for i in range(10)]
+        self.badTimes = [[self.timeStamp[6], self.timeStamp[7]], [self.timeStamp[2], self.timeStamp[3]],
+                         [self.timeStamp[3], self.timeStamp[4]], [self.timeStamp[9], self.timeStamp[8]]]
+
+    def test_merged_inclusive(self):
+        starts, stops, closed = filtering.badTimeIntervals(self.badTimes)
+        self.assertTrue(closed)
+        self.assertEqual(list(starts), [self.timeStamp[2], self.timeStamp[6]])
+        self.assertEqual(list(stops), [self.timeStamp[4], self.timeStamp[7]])
+        mask = filtering.badTimeMask(self.timeStamp, (starts, stops, closed))
+        self.assertEqual(np.flatnonzero(mask).tolist(), [2, 3, 4, 6, 7])
+
+    def test_tolerance_exclusive(self):
+        intervals = filtering.badTimeIntervals(self.badTimes, tolerance=datetime.timedelta(seconds=1))
+        mask = filtering.badTimeMask(self.timeStamp, intervals)
+        # Widened by 1 s but exclusive, so neighbours exactly 1 s away are kept
+        self.assertEqual(np.flatnonzero(mask).tolist(), [2, 3, 4, 6, 7])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+import numpy as np
+import scipy as sp
+
+import Source.utils.interpolating as interpolating
+
+
+class TestInterpolating(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.x = np.arange(100.0)
+        self.y = rng.normal(size=(100, 20))
+        self.y[3, 5] = np.nan
+        self.new_x = np.linspace(-2.5, 104.5, 80)
+
+    def test_matrix_matches_columns(self):
+        matrix = interpolating.interpMatrix(self.x, self.y, self.new_x)
+        for j in range(self.y.shape[1]):
+            expected = interpolating.interp(self.x.tolist(), self.y[:, j].tolist(), self.new_x.tolist(), fill_value=np.nan)
+            np.testing.assert_allclose(matrix[:, j], expected, rtol=1e-12, equal_nan=True)
+
+        spline = interpolating.interpMatrix(self.x, self.y[:, :5], self.new_x, kind='cubic')
+        for j in range(5):
+            expected = interpolating.interpSpline(self.x, self.y[:, j], self.new_x)
+            np.testing.assert_allclose(spline[:, j], expected, rtol=1e-9, atol=1e-12)
+
+    def test_spline_operator(self):
+        x = np.linspace(350, 800, 137) + np.sin(np.arange(137))
+        newWavebands = np.arange(351.0, 800.0, 2.5)
+        spectra = np.cumsum(self.y[:, :1] + np.linspace(0, 1, 137), axis=1)
+        regridded = spectra @ interpolating.splineOperator(x, newWavebands).T
+        for i in [0, 50, 99]:
+            expected = sp.interpolate.InterpolatedUnivariateSpline(x, spectra[i], k=3)(newWavebands)
+            np.testing.assert_allclose(regridded[i], expected, rtol=1e-9)
+
+    def test_multilinear(self):
+        points = tuple(np.sort(np.random.default_rng(k).uniform(0, 10, k)) for k in (4, 3, 5, 2))
+        values = np.random.default_rng(0).random((4, 3, 5, 2, 6))
+        xi = np.column_stack([np.linspace(p[0], p[-1], 30) for p in points])
+        np.testing.assert_allclose(interpolating.multilinear(points, values, xi),
+                                   sp.interpolate.interpn(points, values, xi), rtol=1e-12)
+
+        # A single-node axis is matched exactly
+        xi[:, 3] = 5.0
+        np.testing.assert_allclose(interpolating.multilinear(points[:3] + (np.array([5.0]),), values[:, :, :, :1], xi),
+                                   interpolating.multilinear(points[:3], values[:, :, :, 0], xi[:, :3]), rtol=1e-12)
+        xi[0, 1] = points[1][-1] + 1
+        self.assertRaises(ValueError, interpolating.multilinear, points, values, xi)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+import warnings
+import numpy as np
+import xarray as xr
+
+import Source.ocbrdf.ocbrdf_main as oc_brdf
+from Source.ocbrdf.brdf_utils import interp_pixels
+
+
+class TestBRDF(unittest.TestCase):
+    def setUp(self):
+        warnings.simplefilter('ignore', FutureWarning)
+        rng = np.random.default_rng(0)
+        self.n = 4
+        self.bands = np.arange(400, 701, 5.0)
+        base = 0.004 * np.exp(-((self.bands - 480) / 120) ** 2) + 0.0015 * np.exp(-((self.bands - 565) / 40) ** 2) + 0.0002
+        self.Rw = np.pi * base * rng.uniform(0.6, 1.6, (self.n, 1))
+        self.geometry = {'sza': rng.uniform(20, 60, self.n), 'vza': np.full(self.n, 40.0),
+                         'raa': rng.uniform(45, 90, self.n), 'wind': rng.uniform(0, 12, self.n),
+                         'aot': rng.uniform(0.02, 0.3, self.n)}
+
+    def test_interp_pixels(self):
+        lut = xr.DataArray(np.random.default_rng(1).random((5, 3, 4)), dims=['n', 'x', 'b'],
+                           coords={'x': [0.0, 1.0, 3.0], 'b': np.arange(4)})
+        x = xr.DataArray([0.0, 0.5, 2.9, 3.0, 3.5], dims=['n'])
+        expected = lut.interp(x=x)
+        np.testing.assert_allclose(interp_pixels(lut, x=x).transpose(*expected.dims).values, expected.values,
+                                   rtol=1e-12)
+
+    def test_batch_matches_pixels(self):
+        batch = oc_brdf.brdf_correct(self.Rw, self.bands, brdf_models=('M02', 'L11', 'O25'), **self.geometry)
+        for i in range(self.n):
+            pixel = oc_brdf.brdf_correct(self.Rw[i:i + 1], self.bands, brdf_models=('M02', 'L11', 'O25'),
+                                         **{k: v[i:i + 1] for k, v in self.geometry.items()})
+            for model, result in batch.items():
+                for k in ['C_brdf', 'nrrs', 'brdf_unc']:
+                    np.testing.assert_allclose(result[k][i], pixel[model][k][0], rtol=1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
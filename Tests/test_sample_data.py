@@ -1,7 +1,11 @@
 import os
 import glob
+import shutil
+import tempfile
 import unittest
 
+import numpy as np
+
 
 os.environ['HYPERINSPACE_CMD'] = 'TRUE'
 root = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
@@ -99,5 +103,56 @@ class TestPMLSoRad(unittest.TestCase):
             Command(self.cfg_filename, 'RAW', file, self.path_to_data,'L1A',
                     self.anc_filename, processMultiLevel=True)
 
+
+class TestSerialParallelL2(unittest.TestCase):
+    def setUp(self):
+        # Load the first SolarTracker file and process it to L1BQC in a scratch directory
+        self.path_to_data = os.path.join(root, 'Data', 'Sample_Data', 'SolarTracker')
+        self.anc_filename = os.path.join(self.path_to_data, 'KORUS_SOLARTRACKER_Ancillary.sb')
+        self.cfg_filename = os.path.join(root, 'Config', 'sample_SEABIRD_SOLARTRACKER.cfg')
+        self.file = sorted(glob.glob(os.path.join(self.path_to_data, 'RAW', '*.RAW')))[0]
+        self.out = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.out, ignore_errors=True)
+
+    def test_serial_parallel_l2(self):
+        from Main import Command
+        from Source.ConfigFile import ConfigFile
+        from Source.Controller import Controller
+        from Source.HDFRoot import HDFRoot
+        os.chdir(root)  # Need to switch to root as path in Config files are relative
+        inFile = self.file
+        for from_level, level in [('RAW', 'L1A'), ('L1A', 'L1AQC'), ('L1AQC', 'L1B'), ('L1B', 'L1BQC')]:
+            Command(self.cfg_filename, from_level, inFile, self.out, level, self.anc_filename)
+            inFile = glob.glob(os.path.join(self.out, level, '*.hdf'))[0]
+
+        # Same seed, no plots; ensembles processed in this process, then in two workers
+        calibrationMap = Controller.processCalibrationConfig(ConfigFile.filename,
+                                                             ConfigFile.settings['CalibrationFiles'])
+        ConfigFile.settings['fL2MCSeed'] = 7
+        for plot in ['bL2UncertaintyBreakdownPlot', 'bL2PlotRrs', 'bL2PlotnLw', 'bL2PlotEs', 'bL2PlotLi', 'bL2PlotLt']:
+            ConfigFile.settings[plot] = 0
+        ConfigFile.products['bL2PlotProd'] = 0
+        roots = []
+        for workers in [1, 2]:
+            ConfigFile.settings['fL2EnsembleWorkers'] = workers
+            outDir = os.path.join(self.out, f'workers_{workers}')
+            os.makedirs(outDir)
+            Controller.processSingleLevel(outDir, inFile, calibrationMap, 'L2')
+            roots.append(HDFRoot.readHDF5(glob.glob(os.path.join(outDir, 'L2', '*.hdf'))[0]))
+
+        serial, parallel = roots
+        self.assertEqual([gp.id for gp in serial.groups], [gp.id for gp in parallel.groups])
+        for gp in serial.groups:
+            other = parallel.getGroup(gp.id)
+            self.assertEqual(list(gp.datasets), list(other.datasets), gp.id)
+            for dsName, ds in gp.datasets.items():
+                data = other.getDataset(dsName).data
+                self.assertEqual(ds.data.dtype, data.dtype, f'{gp.id}/{dsName}')
+                for name in ds.data.dtype.names or [None]:
+                    np.testing.assert_array_equal(ds.data if name is None else ds.data[name],
+                                                  data if name is None else data[name],
+                                                  err_msg=f'{gp.id}/{dsName}/{name}')
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+import datetime
+import numpy as np
+from pysolar.solar import get_azimuth, get_altitude
+
+import Source.utils.solaring as solaring
+
+
+class TestSunPosition(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        t0 = datetime.datetime(2016, 5, 20, tzinfo=datetime.timezone.utc)
+        self.dateTime = [t0 + datetime.timedelta(seconds=float(s)) for s in np.sort(rng.uniform(0, 86400*30, 50))]
+        self.lat = rng.uniform(-80, 80, 50)
+        self.lon = rng.uniform(-180, 180, 50)
+
+    def test_matches_pysolar(self):
+        azimuth, zenith = solaring.sunPosition(self.lat, self.lon, self.dateTime)
+        for i, when in enumerate(self.dateTime):
+            self.assertEqual(azimuth[i], get_azimuth(self.lat[i], self.lon[i], when, 0))
+            self.assertEqual(zenith[i], 90 - get_altitude(self.lat[i], self.lon[i], when, 0))
+
+    def test_memo(self):
+        solaring.clearMemo()
+        azimuth, zenith = solaring.sunPosition(self.lat, self.lon, self.dateTime)
+        memoAzimuth, memoZenith = solaring.sunPosition(self.lat, self.lon, self.dateTime, memo=True)
+        self.assertEqual(len(solaring._memo), len(self.dateTime))
+        np.testing.assert_allclose(memoZenith, zenith, atol=0.01)
+        again = solaring.sunPosition(self.lat, self.lon, self.dateTime, memo=True)
+        np.testing.assert_array_equal(again[0], memoAzimuth)
+
+    def test_naive_datetime(self):
+        with self.assertRaises(ValueError):
+            solaring.sunPosition(0.0, 0.0, [datetime.datetime(2016, 5, 20)])
+
+
+if __name__ == '__main__':
+    unittest.main()